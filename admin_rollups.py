@@ -0,0 +1,391 @@
+"""
+Pre-aggregated tables for the admin dashboard and analytics pages.
+
+refresh() is run by refresh_admin_rollups.py on a schedule. It folds in only
+the rows added or changed since the last run, using the watermarks kept in
+analytics_rollup_state:
+- users_daily and geo_counts use append-only id watermarks on users,
+  homeowners and contractors.
+- contractor_stats, revenue_monthly and projects_by_status use
+  updated_at watermarks on bids and projects, so status changes are picked
+  up too. The affected contractors and months are recomputed from their
+  own rows, which makes re-processing an overlap harmless.
+
+rebuild() recounts everything and also catches edits that have no
+watermark, such as a profile location change. The admin pages read the
+rollups and show the oldest refreshed_at as their freshness time; when that
+is older than STALE_AFTER_SECONDS (the schedule has stopped, or was never
+installed) they warn that the figures are out of date. They never refresh
+inline: the first refresh is a full build. The tables are created by
+migrate_schema.py on deploy.
+"""
+
+from datetime import datetime
+
+# Rollups tracked in analytics_rollup_state
+ROLLUPS = ('users_daily', 'geo_counts', 'contractor_stats', 'revenue_monthly', 'projects_by_status')
+
+# Window shown on the analytics page
+USER_GROWTH_DAYS = 30
+REVENUE_MONTHS = 12
+
+# Ids folded in per batch when catching up on users/homeowners/contractors
+BATCH_SIZE = 5000
+
+# Rollups older than this are flagged as out of date by the admin pages;
+# refresh_admin_rollups.py runs every five minutes (.ebextensions/03_cron.config)
+STALE_AFTER_SECONDS = 30 * 60
+
+
+def ensure_schema(cursor):
+    """Create the rollup tables and the updated_at watermark columns"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS analytics_rollup_state (
+            rollup_name VARCHAR(50) PRIMARY KEY,
+            last_id INT NOT NULL DEFAULT 0,
+            last_homeowner_id INT NOT NULL DEFAULT 0,
+            last_contractor_id INT NOT NULL DEFAULT 0,
+            last_updated_at TIMESTAMP NULL,
+            refreshed_at TIMESTAMP NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS analytics_users_daily (
+            day DATE NOT NULL,
+            role VARCHAR(20) NOT NULL,
+            new_users INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, role)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS analytics_geo_counts (
+            role VARCHAR(20) NOT NULL,
+            location VARCHAR(255) NOT NULL,
+            user_count INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (role, location),
+            INDEX idx_role_count (role, user_count)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS analytics_contractor_stats (
+            contractor_id INT PRIMARY KEY,
+            total_bids INT NOT NULL DEFAULT 0,
+            submitted_bids INT NOT NULL DEFAULT 0,
+            accepted_bids INT NOT NULL DEFAULT 0,
+            bid_amount_total DECIMAL(14,2) NOT NULL DEFAULT 0,
+            accepted_amount_total DECIMAL(14,2) NOT NULL DEFAULT 0,
+            success_rate DECIMAL(5,2) NOT NULL DEFAULT 0,
+            FOREIGN KEY (contractor_id) REFERENCES contractors(id) ON DELETE CASCADE,
+            INDEX idx_rank (success_rate, total_bids)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS analytics_revenue_monthly (
+            month CHAR(7) PRIMARY KEY,
+            revenue DECIMAL(14,2) NOT NULL DEFAULT 0,
+            accepted_bids INT NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS analytics_projects_by_status (
+            status VARCHAR(50) PRIMARY KEY,
+            project_count INT NOT NULL DEFAULT 0
+        )
+    ''')
+
+    # Change timestamps on bids and projects drive the incremental refresh
+    for table in ('bids', 'projects'):
+        cursor.execute(f"SHOW COLUMNS FROM {table} LIKE 'updated_at'")
+        if not cursor.fetchone():
+            cursor.execute(f'''
+                ALTER TABLE {table}
+                ADD COLUMN updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                ADD INDEX idx_updated (updated_at)
+            ''')
+    cursor.execute("SHOW INDEX FROM bids WHERE Key_name = 'idx_created'")
+    if not cursor.fetchone():
+        cursor.execute('ALTER TABLE bids ADD INDEX idx_created (created_at)')
+
+
+def _state(cursor):
+    cursor.execute('SELECT * FROM analytics_rollup_state')
+    state = {row['rollup_name']: row for row in cursor.fetchall()}
+    for name in ROLLUPS:
+        state.setdefault(name, {'rollup_name': name, 'last_id': 0, 'last_homeowner_id': 0,
+                                'last_contractor_id': 0, 'last_updated_at': None, 'refreshed_at': None})
+    return state
+
+
+def _save_state(cursor, row, now):
+    cursor.execute('''
+        INSERT INTO analytics_rollup_state
+            (rollup_name, last_id, last_homeowner_id, last_contractor_id, last_updated_at, refreshed_at)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            last_id = VALUES(last_id),
+            last_homeowner_id = VALUES(last_homeowner_id),
+            last_contractor_id = VALUES(last_contractor_id),
+            last_updated_at = VALUES(last_updated_at),
+            refreshed_at = VALUES(refreshed_at)
+    ''', (row['rollup_name'], row['last_id'], row['last_homeowner_id'], row['last_contractor_id'],
+          row['last_updated_at'], now))
+
+
+def _refresh_users_daily(cursor, state):
+    while True:
+        cursor.execute('''
+            SELECT MAX(id) as max_id FROM (
+                SELECT id FROM users WHERE id > %s ORDER BY id LIMIT %s
+            ) batch
+        ''', (state['last_id'], BATCH_SIZE))
+        max_id = cursor.fetchone()['max_id']
+        if not max_id:
+            return
+        cursor.execute('''
+            INSERT INTO analytics_users_daily (day, role, new_users)
+            SELECT DATE(created_at), role, COUNT(*)
+            FROM users
+            WHERE id > %s AND id <= %s
+            GROUP BY DATE(created_at), role
+            ON DUPLICATE KEY UPDATE new_users = new_users + VALUES(new_users)
+        ''', (state['last_id'], max_id))
+        state['last_id'] = max_id
+
+
+def _refresh_geo_counts(cursor, state):
+    for role, table, key in (('homeowner', 'homeowners', 'last_homeowner_id'),
+                             ('contractor', 'contractors', 'last_contractor_id')):
+        cursor.execute(f'SELECT COALESCE(MAX(id), 0) as max_id FROM {table}')
+        max_id = cursor.fetchone()['max_id']
+        if max_id <= state[key]:
+            continue
+        cursor.execute(f'''
+            INSERT INTO analytics_geo_counts (role, location, user_count)
+            SELECT %s, COALESCE(NULLIF(location, ''), 'Unknown'), COUNT(*)
+            FROM {table}
+            WHERE id > %s AND id <= %s
+            GROUP BY COALESCE(NULLIF(location, ''), 'Unknown')
+            ON DUPLICATE KEY UPDATE user_count = user_count + VALUES(user_count)
+        ''', (role, state[key], max_id))
+        state[key] = max_id
+
+
+def _changed_since(cursor, table, state, columns):
+    """Distinct values of columns on rows changed since the watermark, and the new watermark"""
+    if state['last_updated_at'] is None:
+        where, params = '', ()
+    else:
+        where, params = 'WHERE updated_at >= %s', (state['last_updated_at'],)
+    # Watermark first: a row changed between the two reads is re-read next run
+    cursor.execute(f'SELECT MAX(updated_at) as watermark FROM {table} {where}', params)
+    watermark = cursor.fetchone()['watermark']
+    cursor.execute(f'SELECT DISTINCT {columns} FROM {table} {where}', params)
+    return cursor.fetchall(), watermark
+
+
+def _refresh_contractor_stats(cursor, state):
+    rows, watermark = _changed_since(cursor, 'bids', state, 'contractor_id')
+    contractor_ids = [row['contractor_id'] for row in rows]
+    for start in range(0, len(contractor_ids), BATCH_SIZE):
+        batch = contractor_ids[start:start + BATCH_SIZE]
+        placeholders = ', '.join(['%s'] * len(batch))
+        cursor.execute(f'''
+            INSERT INTO analytics_contractor_stats
+                (contractor_id, total_bids, submitted_bids, accepted_bids,
+                 bid_amount_total, accepted_amount_total, success_rate)
+            SELECT contractor_id,
+                   COUNT(*),
+                   SUM(status = 'Submitted'),
+                   SUM(status = 'Accepted'),
+                   COALESCE(SUM(amount), 0),
+                   COALESCE(SUM(CASE WHEN status = 'Accepted' THEN amount ELSE 0 END), 0),
+                   ROUND(SUM(status = 'Accepted') * 100.0 / COUNT(*), 2)
+            FROM bids
+            WHERE contractor_id IN ({placeholders})
+            GROUP BY contractor_id
+            ON DUPLICATE KEY UPDATE
+                total_bids = VALUES(total_bids),
+                submitted_bids = VALUES(submitted_bids),
+                accepted_bids = VALUES(accepted_bids),
+                bid_amount_total = VALUES(bid_amount_total),
+                accepted_amount_total = VALUES(accepted_amount_total),
+                success_rate = VALUES(success_rate)
+        ''', batch)
+    if watermark:
+        state['last_updated_at'] = watermark
+
+
+def _refresh_revenue_monthly(cursor, state):
+    rows, watermark = _changed_since(cursor, 'bids', state, "DATE_FORMAT(created_at, '%%Y-%%m') as month")
+    for row in rows:
+        month_start = datetime.strptime(row['month'], '%Y-%m')
+        next_month = datetime(month_start.year + month_start.month // 12, month_start.month % 12 + 1, 1)
+        cursor.execute('''
+            SELECT COALESCE(SUM(CASE WHEN status = 'Accepted' THEN amount ELSE 0 END), 0) as revenue,
+                   COUNT(CASE WHEN status = 'Accepted' THEN 1 END) as accepted_bids
+            FROM bids
+            WHERE created_at >= %s AND created_at < %s
+        ''', (month_start, next_month))
+        totals = cursor.fetchone()
+        cursor.execute('''
+            INSERT INTO analytics_revenue_monthly (month, revenue, accepted_bids)
+            VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE revenue = VALUES(revenue), accepted_bids = VALUES(accepted_bids)
+        ''', (row['month'], totals['revenue'], totals['accepted_bids']))
+    if watermark:
+        state['last_updated_at'] = watermark
+
+
+def _refresh_projects_by_status(cursor, state):
+    # A status change has no record of the old status, so any change
+    # triggers a recount (answered from idx_status alone)
+    if state['last_updated_at'] is None:
+        cursor.execute('SELECT MAX(updated_at) as watermark FROM projects')
+    else:
+        cursor.execute('SELECT MAX(updated_at) as watermark FROM projects WHERE updated_at > %s',
+                       (state['last_updated_at'],))
+    watermark = cursor.fetchone()['watermark']
+    if watermark is None and state['last_updated_at'] is not None:
+        return
+    cursor.execute('DELETE FROM analytics_projects_by_status')
+    cursor.execute('''
+        INSERT INTO analytics_projects_by_status (status, project_count)
+        SELECT status, COUNT(*) FROM projects GROUP BY status
+    ''')
+    if watermark:
+        state['last_updated_at'] = watermark
+
+
+_REFRESHERS = {
+    'users_daily': _refresh_users_daily,
+    'geo_counts': _refresh_geo_counts,
+    'contractor_stats': _refresh_contractor_stats,
+    'revenue_monthly': _refresh_revenue_monthly,
+    'projects_by_status': _refresh_projects_by_status,
+}
+
+
+def refresh(cursor):
+    """Fold changes since each rollup's watermark into the rollup tables"""
+    state = _state(cursor)
+    now = datetime.now()
+    for name in ROLLUPS:
+        _REFRESHERS[name](cursor, state[name])
+        _save_state(cursor, state[name], now)
+    return now
+
+
+def is_stale(refreshed_at, max_age_seconds=STALE_AFTER_SECONDS):
+    """True if the rollups were never refreshed, or not within max_age_seconds"""
+    if refreshed_at is None:
+        return True
+    # SQLite hands timestamps back as text
+    if isinstance(refreshed_at, str):
+        refreshed_at = datetime.fromisoformat(refreshed_at)
+    return (datetime.now() - refreshed_at).total_seconds() > max_age_seconds
+
+
+def rebuild(cursor):
+    """Empty every rollup and its watermark, then refresh from scratch"""
+    for table in ('analytics_users_daily', 'analytics_geo_counts', 'analytics_contractor_stats',
+                  'analytics_revenue_monthly', 'analytics_projects_by_status', 'analytics_rollup_state'):
+        cursor.execute(f'DELETE FROM {table}')
+    return refresh(cursor)
+
+
+def get_dashboard_stats(cursor):
+    """Admin dashboard counters in one read of the rollups, with their freshness"""
+    cursor.execute('''
+        SELECT
+            (SELECT COALESCE(SUM(new_users), 0) FROM analytics_users_daily) as total_users,
+            (SELECT COALESCE(SUM(user_count), 0) FROM analytics_geo_counts WHERE role = 'homeowner') as total_homeowners,
+            (SELECT COALESCE(SUM(user_count), 0) FROM analytics_geo_counts WHERE role = 'contractor') as total_contractors,
+            (SELECT COALESCE(SUM(project_count), 0) FROM analytics_projects_by_status) as total_projects,
+            (SELECT COALESCE(SUM(project_count), 0) FROM analytics_projects_by_status WHERE status = 'Active') as active_projects,
+            (SELECT COALESCE(SUM(project_count), 0) FROM analytics_projects_by_status WHERE status = 'Completed') as completed_projects,
+            (SELECT COALESCE(SUM(total_bids), 0) FROM analytics_contractor_stats) as total_bids,
+            (SELECT COALESCE(SUM(submitted_bids), 0) FROM analytics_contractor_stats) as pending_bids,
+            (SELECT COALESCE(SUM(accepted_bids), 0) FROM analytics_contractor_stats) as accepted_bids,
+            (SELECT COALESCE(SUM(accepted_amount_total), 0) FROM analytics_contractor_stats) as total_revenue,
+            (SELECT MIN(refreshed_at) FROM analytics_rollup_state) as refreshed_at
+    ''')
+    stats = dict(cursor.fetchone())
+    for key in stats:
+        if key not in ('total_revenue', 'refreshed_at'):
+            stats[key] = int(stats[key])
+    return stats
+
+
+def get_analytics(cursor):
+    """Everything the analytics page charts, read from the rollups"""
+    cursor.execute('''
+        SELECT day as date, SUM(new_users) as new_users
+        FROM analytics_users_daily
+        WHERE day >= DATE_SUB(CURDATE(), INTERVAL %s DAY)
+        GROUP BY day
+        ORDER BY day DESC
+    ''', (USER_GROWTH_DAYS,))
+    user_growth = cursor.fetchall()
+
+    cursor.execute('''
+        SELECT status, project_count as count,
+               ROUND(project_count * 100.0 / NULLIF((SELECT SUM(project_count) FROM analytics_projects_by_status), 0), 2)
+                   as percentage
+        FROM analytics_projects_by_status
+        WHERE project_count > 0
+    ''')
+    project_status_distribution = cursor.fetchall()
+
+    cursor.execute('''
+        SELECT CONCAT(u.first_name, ' ', u.last_name) as contractor_name,
+               c.company,
+               s.total_bids,
+               s.accepted_bids,
+               s.success_rate,
+               s.bid_amount_total / s.total_bids as avg_bid_amount
+        FROM analytics_contractor_stats s
+        JOIN contractors c ON s.contractor_id = c.id
+        JOIN users u ON c.user_id = u.id
+        WHERE s.total_bids > 0
+        ORDER BY s.success_rate DESC, s.total_bids DESC
+        LIMIT 20
+    ''')
+    contractor_performance = cursor.fetchall()
+
+    cursor.execute('''
+        SELECT month, revenue, accepted_bids as completed_projects
+        FROM analytics_revenue_monthly
+        WHERE month >= DATE_FORMAT(DATE_SUB(CURDATE(), INTERVAL %s MONTH), '%%Y-%%m')
+        ORDER BY month DESC
+    ''', (REVENUE_MONTHS,))
+    revenue_trends = cursor.fetchall()
+
+    cursor.execute('''
+        SELECT role, location, user_count FROM (
+            (SELECT role, location, user_count FROM analytics_geo_counts
+             WHERE role = 'homeowner' ORDER BY user_count DESC LIMIT 10)
+            UNION ALL
+            (SELECT role, location, user_count FROM analytics_geo_counts
+             WHERE role = 'contractor' ORDER BY user_count DESC LIMIT 10)
+        ) top_locations
+        ORDER BY user_count DESC
+    ''')
+    homeowner_distribution, contractor_distribution = [], []
+    for row in cursor.fetchall():
+        if row['role'] == 'homeowner':
+            homeowner_distribution.append({'location': row['location'], 'homeowner_count': row['user_count']})
+        else:
+            contractor_distribution.append({'location': row['location'], 'contractor_count': row['user_count']})
+
+    cursor.execute('SELECT MIN(refreshed_at) as refreshed_at FROM analytics_rollup_state')
+    refreshed_at = cursor.fetchone()['refreshed_at']
+
+    return {
+        'user_growth': user_growth,
+        'project_status_distribution': project_status_distribution,
+        'contractor_performance': contractor_performance,
+        'revenue_trends': revenue_trends,
+        'homeowner_distribution': homeowner_distribution,
+        'contractor_distribution': contractor_distribution,
+        'refreshed_at': refreshed_at,
+    }
@@ -0,0 +1,324 @@
+"""
+Admission control for the AI processing endpoints.
+
+Nothing used to limit how many audio jobs a worker ran: every
+/process_audio_async request started a thread of its own, each decoding
+its recording in memory, and a burst of uploads could run a small instance
+out of memory. An AdmissionController bounds one pool of jobs:
+
+- at most max_running jobs run at once; the others wait in a queue of at
+  most max_queued
+- a user (or, for guests, a client address) may have at most max_per_user
+  jobs running or waiting, so one account cannot fill the queue
+- waiting jobs are started round-robin across users rather than in arrival
+  order, so a user with three jobs waiting does not hold back a user with one
+
+admit() answers at once: a Ticket that is already granted, a Ticket placed
+in the queue (unless queue=False, for requests that must not wait), or
+Overloaded, which carries what the 429 response tells the
+client: why, the queue position the job would have had, and a Retry-After
+estimated from recent job durations. A queued ticket is waited for with
+wait() (threads) or wait_async() (coroutines), and release() when the job
+is done, or to give up its place.
+
+Limits are per worker process. stats() reports queue depth, running jobs,
+rejections by reason and wait times for the admin stats endpoint.
+"""
+
+import asyncio
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+
+# Jobs running at once per worker
+DEFAULT_MAX_RUNNING = 2
+
+# Jobs waiting for a slot per worker
+DEFAULT_MAX_QUEUED = 10
+
+# Jobs one user may have running or waiting
+DEFAULT_MAX_PER_USER = 2
+
+# Seconds a job is assumed to take until one has finished, for Retry-After
+INITIAL_JOB_SECONDS = 60
+
+# Weight of the latest job in the moving average of job durations
+DURATION_SMOOTHING = 0.2
+
+# Longest Retry-After ever suggested, in seconds
+MAX_RETRY_AFTER = 900
+
+# Users listed by stats(), those with the most jobs first
+STATS_TOP_USERS = 10
+
+REJECTION_REASONS = {
+    'queue_full': 'The processing queue is full. Please try again shortly.',
+    'user_limit': 'You already have the maximum number of recordings being processed. '
+                  'Please wait for them to finish.',
+    'wait_timeout': 'The server is busy processing other recordings. Please try again shortly.',
+    'busy': 'The server is busy processing other recordings. Please try again shortly.',
+}
+
+
+class Overloaded(Exception):
+    """A job was not admitted; answered with 429 and Retry-After"""
+
+    def __init__(self, reason, retry_after, queue_position, queue_depth):
+        super().__init__(REJECTION_REASONS[reason])
+        self.reason = reason
+        self.retry_after = retry_after
+        self.queue_position = queue_position
+        self.queue_depth = queue_depth
+
+    def to_dict(self):
+        return {
+            'success': False,
+            'error': str(self),
+            'reason': self.reason,
+            'retry_after': self.retry_after,
+            'queue_position': self.queue_position,
+            'queue_depth': self.queue_depth,
+        }
+
+
+class Ticket:
+    """One admitted job: granted a slot now or later, released when done"""
+
+    def __init__(self, controller, user_key):
+        self.controller = controller
+        self.user_key = user_key
+        self.admitted_at = time.monotonic()
+        self.granted_at = None
+        self.released = False
+        self._granted = threading.Event()
+        self._callbacks = []
+
+    @property
+    def granted(self):
+        return self._granted.is_set()
+
+    def position(self):
+        """1-based place in the queue, or 0 once granted"""
+        return self.controller._position(self)
+
+    def wait(self, timeout=None):
+        """Block until granted; after timeout seconds give up the place and raise Overloaded"""
+        if self._granted.wait(timeout):
+            return self
+        self.controller._give_up(self)
+        return self
+
+    async def wait_async(self):
+        """Await the grant without holding a thread"""
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(True))
+        self.controller._on_grant(self, wake)
+        await granted
+        return self
+
+    def release(self):
+        self.controller._release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class AdmissionController:
+    """Bounded concurrency and a bounded, per-user fair queue for one pool of jobs"""
+
+    def __init__(self, name, max_running=DEFAULT_MAX_RUNNING, max_queued=DEFAULT_MAX_QUEUED,
+                 max_per_user=DEFAULT_MAX_PER_USER):
+        self.name = name
+        self.max_running = max_running
+        self.max_queued = max_queued
+        self.max_per_user = max_per_user
+        self._lock = threading.Lock()
+        # user_key -> waiting tickets; users in round-robin order
+        self._queues = OrderedDict()
+        self._queued = 0
+        self._running = 0
+        # user_key -> tickets running or waiting
+        self._per_user = {}
+        self._avg_job_seconds = INITIAL_JOB_SECONDS
+        self._counters = {
+            'admitted': 0,
+            'started_at_once': 0,
+            'queued': 0,
+            'completed': 0,
+            'gave_up': 0,
+            'rejected': {reason: 0 for reason in REJECTION_REASONS},
+        }
+        self._max_queue_depth = 0
+        self._wait_seconds = {'total': 0.0, 'max': 0.0, 'count': 0}
+
+    @classmethod
+    def from_config(cls, config, prefix, max_running=DEFAULT_MAX_RUNNING, max_queued=DEFAULT_MAX_QUEUED,
+                    max_per_user=DEFAULT_MAX_PER_USER):
+        """Limits from <prefix>_MAX_JOBS, <prefix>_MAX_QUEUED_JOBS and <prefix>_MAX_JOBS_PER_USER"""
+        return cls(prefix.lower(),
+                   max_running=config.get(f'{prefix}_MAX_JOBS', max_running),
+                   max_queued=config.get(f'{prefix}_MAX_QUEUED_JOBS', max_queued),
+                   max_per_user=config.get(f'{prefix}_MAX_JOBS_PER_USER', max_per_user))
+
+    def admit(self, user_key, queue=True):
+        """A granted or queued Ticket for user_key; raises Overloaded.
+
+        With queue=False a job that cannot start at once is refused ('busy')
+        with the queue position it would have had, rather than queued.
+        """
+        with self._lock:
+            if self._per_user.get(user_key, 0) >= self.max_per_user:
+                waiting = self._queues.get(user_key)
+                position = self._position_locked(waiting[0]) if waiting else 0
+                raise self._reject('user_limit', max(position, 1))
+            ticket = Ticket(self, user_key)
+            if self._running < self.max_running and not self._queued:
+                self._grant(ticket)
+                self._counters['started_at_once'] += 1
+            elif not queue:
+                raise self._reject('busy', self._queued + 1)
+            elif self._queued >= self.max_queued:
+                raise self._reject('queue_full', self._queued + 1)
+            else:
+                self._queues.setdefault(user_key, deque()).append(ticket)
+                self._queued += 1
+                self._counters['queued'] += 1
+                self._max_queue_depth = max(self._max_queue_depth, self._queued)
+            self._per_user[user_key] = self._per_user.get(user_key, 0) + 1
+            self._counters['admitted'] += 1
+            return ticket
+
+    def retry_after(self, position):
+        """Seconds until a job at this queue position is likely to start"""
+        seconds = self._avg_job_seconds * position / max(self.max_running, 1)
+        return min(MAX_RETRY_AFTER, max(1, math.ceil(seconds)))
+
+    def _reject(self, reason, position):
+        # Called with the lock held
+        self._counters['rejected'][reason] += 1
+        return Overloaded(reason, self.retry_after(position), position, self._queued)
+
+    def _grant(self, ticket):
+        # Called with the lock held
+        self._running += 1
+        ticket.granted_at = time.monotonic()
+        waited = ticket.granted_at - ticket.admitted_at
+        self._wait_seconds['total'] += waited
+        self._wait_seconds['max'] = max(self._wait_seconds['max'], waited)
+        self._wait_seconds['count'] += 1
+        ticket._granted.set()
+        callbacks, ticket._callbacks = ticket._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def _dispatch(self):
+        # Called with the lock held: start waiting tickets round-robin across users
+        while self._running < self.max_running and self._queues:
+            user_key, waiting = next(iter(self._queues.items()))
+            ticket = waiting.popleft()
+            if waiting:
+                self._queues.move_to_end(user_key)
+            else:
+                del self._queues[user_key]
+            self._queued -= 1
+            self._grant(ticket)
+
+    def _on_grant(self, ticket, callback):
+        with self._lock:
+            if not ticket.granted:
+                ticket._callbacks.append(callback)
+                return
+        callback()
+
+    def _forget(self, ticket):
+        # Called with the lock held
+        ticket.released = True
+        remaining = self._per_user.get(ticket.user_key, 1) - 1
+        if remaining > 0:
+            self._per_user[ticket.user_key] = remaining
+        else:
+            self._per_user.pop(ticket.user_key, None)
+
+    def _unqueue(self, ticket):
+        # Called with the lock held
+        waiting = self._queues.get(ticket.user_key)
+        if waiting and ticket in waiting:
+            waiting.remove(ticket)
+            self._queued -= 1
+            if not waiting:
+                del self._queues[ticket.user_key]
+
+    def _release(self, ticket):
+        with self._lock:
+            if ticket.released:
+                return
+            self._forget(ticket)
+            if ticket.granted:
+                self._running -= 1
+                seconds = time.monotonic() - ticket.granted_at
+                self._avg_job_seconds += DURATION_SMOOTHING * (seconds - self._avg_job_seconds)
+                self._counters['completed'] += 1
+            else:
+                self._unqueue(ticket)
+                self._counters['gave_up'] += 1
+            self._dispatch()
+
+    def _give_up(self, ticket):
+        with self._lock:
+            # Granted while the waiter timed out: keep the slot
+            if ticket.granted or ticket.released:
+                return
+            position = self._position_locked(ticket)
+            self._unqueue(ticket)
+            self._forget(ticket)
+            raise self._reject('wait_timeout', position)
+
+    def _position(self, ticket):
+        with self._lock:
+            return self._position_locked(ticket)
+
+    def _position_locked(self, ticket):
+        # Tickets started before this one under round-robin dispatch, plus one
+        if ticket.granted or ticket.released:
+            return 0
+        waiting = self._queues.get(ticket.user_key)
+        if not waiting or ticket not in waiting:
+            return 0
+        index = waiting.index(ticket)
+        position = 0
+        before = True
+        for user_key, user_waiting in self._queues.items():
+            position += min(len(user_waiting), index + (1 if before else 0))
+            if user_key == ticket.user_key:
+                before = False
+        return position
+
+    def stats(self):
+        with self._lock:
+            waits = self._wait_seconds
+            top_users = sorted(self._per_user.items(), key=lambda item: -item[1])[:STATS_TOP_USERS]
+            return {
+                'name': self.name,
+                'limits': {
+                    'max_running': self.max_running,
+                    'max_queued': self.max_queued,
+                    'max_per_user': self.max_per_user,
+                },
+                'running': self._running,
+                'queue_depth': self._queued,
+                'max_queue_depth': self._max_queue_depth,
+                'users_waiting': len(self._queues),
+                'top_users': [{'user': user_key, 'jobs': jobs} for user_key, jobs in top_users],
+                'counters': {key: dict(value) if isinstance(value, dict) else value
+                             for key, value in self._counters.items()},
+                'avg_job_seconds': round(self._avg_job_seconds, 2),
+                'avg_wait_seconds': round(waits['total'] / waits['count'], 3) if waits['count'] else 0.0,
+                'max_wait_seconds': round(waits['max'], 3),
+            }
@@ -0,0 +1,427 @@
+"""
+Asynchronous path for the long-running AI endpoints.
+
+/process_audio, /process_audio_transcript and /process_transcript_ai keep
+their request open while the recording is uploaded to S3, while Transcribe
+works (polled every ten seconds, often for minutes) and while Bedrock
+answers. Almost all of that time is spent waiting on AWS, yet it holds a
+worker thread (or a whole sync worker) for the full duration.
+
+AsyncAIRunner runs the same pipelines as coroutines on one asyncio event
+loop per process, in a thread of its own. The /async/... routes hand a job
+to the loop and answer at once with a process_id; progress and the result
+are reported to a JobStatusStore (job_status), read by
+/processing_status/<id> on any worker like the jobs of /process_audio_async. A job waiting on Transcribe is a sleeping
+coroutine rather than a blocked thread, so one worker can have hundreds of
+submissions in flight. Each job holds a ticket from an AdmissionController
+(admission_control), which bounds how many run at once, how many wait and
+how many one user may have; a waiting job is a coroutine awaiting its grant.
+
+AWS calls go through AsyncAWS. With aiobotocore installed (its version must
+match the installed botocore) the clients are native asyncio clients. Without
+it each boto3 call runs in a small blocking pool for the few hundred
+milliseconds the call takes, and the long waits in between are still
+asyncio sleeps. Audio conversion and the first AudioProcessor (which checks
+credentials with STS) also run in that pool, never on the loop. Conversion
+decodes the whole recording in memory, so however many jobs are in flight
+at most max_decodes conversions (AI_MAX_JOBS, the blocking endpoints' limit)
+run at once; the rest wait for a slot as coroutines.
+
+Prompts, Transcribe settings and response parsing are AudioProcessor's, so
+both paths give the same results and fall back the same way: a mock
+transcript when Transcribe fails, text analysis when no Bedrock model
+answers.
+"""
+
+import asyncio
+import contextlib
+import functools
+import importlib.util
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import aws_clients
+
+# Threads for blocking work: boto3 calls without aiobotocore, audio conversion
+DEFAULT_BLOCKING_THREADS = 16
+
+# Audio conversions running at once per worker; follows AI_MAX_JOBS
+DEFAULT_MAX_DECODES = 2
+
+# Seconds between Transcribe status checks, as in AudioProcessor.transcribe_audio;
+# GetTranscriptionJob is rate limited per account, so hundreds of jobs must not poll faster
+TRANSCRIBE_POLL_INTERVAL = 10
+
+# Seconds to wait for a Transcribe job before falling back to the mock transcript
+TRANSCRIBE_MAX_WAIT = 300
+
+# Seconds allowed to download a finished transcript
+TRANSCRIPT_DOWNLOAD_TIMEOUT = 30
+
+
+def aiobotocore_installed():
+    return importlib.util.find_spec('aiobotocore') is not None
+
+
+class AsyncAWS:
+    """Awaitable AWS calls: aiobotocore clients when installed, else boto3 in the blocking pool"""
+
+    def __init__(self, clients):
+        self.clients = clients
+        self.native = aiobotocore_installed()
+        self._aio_clients = {}
+        self._exit_stack = contextlib.AsyncExitStack()
+        self._client_lock = None
+
+    async def _aio_client(self, service):
+        if self._client_lock is None:
+            self._client_lock = asyncio.Lock()
+        async with self._client_lock:
+            client = self._aio_clients.get(service)
+            if client is None:
+                from aiobotocore.config import AioConfig
+                from aiobotocore.session import get_session
+                client = await self._exit_stack.enter_async_context(get_session().create_client(
+                    service, region_name=self.clients.region, config=AioConfig(
+                        connect_timeout=self.clients.connect_timeout,
+                        read_timeout=self.clients.read_timeout,
+                        retries={'max_attempts': self.clients.max_attempts, 'mode': 'standard'})))
+                self._aio_clients[service] = client
+            return client
+
+    async def _blocking(self, func, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+    async def call(self, service, operation, **kwargs):
+        """The response of one API call"""
+        if self.native:
+            client = await self._aio_client(service)
+            return await getattr(client, operation)(**kwargs)
+        return await self._blocking(lambda: getattr(self.clients.client(service), operation)(**kwargs))
+
+    async def upload_file(self, path, bucket, key):
+        if self.native:
+            body = await self._blocking(_read_file, path)
+            await self.call('s3', 'put_object', Bucket=bucket, Key=key, Body=body)
+        else:
+            await self._blocking(lambda: self.clients.client('s3').upload_file(path, bucket, key))
+
+    async def invoke_model(self, **kwargs):
+        """The decoded JSON body of a Bedrock invoke_model call"""
+        if self.native:
+            response = await self.call('bedrock-runtime', 'invoke_model', **kwargs)
+            async with response['body'] as stream:
+                return json.loads(await stream.read())
+
+        def invoke():
+            response = self.clients.client('bedrock-runtime').invoke_model(**kwargs)
+            return json.loads(response['body'].read())
+        return await self._blocking(invoke)
+
+    async def fetch_json(self, url):
+        """GET a presigned URL (e.g. a transcript) and decode it"""
+        if self.native:
+            # aiohttp is a dependency of aiobotocore
+            import aiohttp
+            timeout = aiohttp.ClientTimeout(total=TRANSCRIPT_DOWNLOAD_TIMEOUT)
+            async with aiohttp.ClientSession(timeout=timeout) as http:
+                async with http.get(url) as response:
+                    response.raise_for_status()
+                    return await response.json(content_type=None)
+
+        def fetch():
+            import requests
+            response = requests.get(url, timeout=TRANSCRIPT_DOWNLOAD_TIMEOUT)
+            response.raise_for_status()
+            return response.json()
+        return await self._blocking(fetch)
+
+    async def close(self):
+        await self._exit_stack.aclose()
+        self._aio_clients = {}
+
+
+def _read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+class AsyncAIRunner:
+    """Run AI submissions as coroutines on one event loop per process"""
+
+    def __init__(self, jobs, admission, blocking_threads=DEFAULT_BLOCKING_THREADS,
+                 max_decodes=DEFAULT_MAX_DECODES):
+        self.jobs = jobs
+        self.admission = admission
+        self.blocking_threads = blocking_threads
+        self.max_decodes = max_decodes
+        self._decode_slots = None
+        self._decoding = 0
+        self._lock = threading.Lock()
+        self._loop = None
+        self._loop_pid = None
+        self._aws = None
+        self._processor = None
+        self._running = 0
+        self._queued = 0
+        self._totals = {'started': 0, 'completed': 0, 'failed': 0, 'seconds': 0.0}
+
+    @classmethod
+    def from_config(cls, config, jobs, admission):
+        return cls(jobs, admission,
+                   blocking_threads=config.get('AI_ASYNC_BLOCKING_THREADS', DEFAULT_BLOCKING_THREADS),
+                   max_decodes=config.get('AI_MAX_JOBS', DEFAULT_MAX_DECODES))
+
+    def _get_loop(self):
+        with self._lock:
+            # A loop inherited through fork has no thread running it in the child
+            if self._loop is None or self._loop_pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                loop.set_default_executor(ThreadPoolExecutor(max_workers=self.blocking_threads,
+                                                             thread_name_prefix='ai-async-blocking'))
+                threading.Thread(target=loop.run_forever, name='ai-async-loop', daemon=True).start()
+                self._loop, self._loop_pid = loop, os.getpid()
+                self._aws = None
+                self._processor = None
+                self._decode_slots = asyncio.Semaphore(self.max_decodes)
+                self._running = self._queued = self._decoding = 0
+            return self._loop
+
+    def start(self, job, *args, ticket, owner=None, shape=None):
+        """Queue job(progress, *args) on the loop and return its process_id.
+
+        The job runs once ticket (from self.admission.admit()) is granted, and
+        releases it when done. Its result dict becomes the status result,
+        passed through shape() first if given; a result with an 'error' fails
+        the job.
+        """
+        process_id = str(uuid.uuid4())
+        self.jobs.create(process_id, owner=owner, ticket=ticket, status='queued', progress=0,
+                         message='Waiting to start...', queue_position=ticket.position())
+        loop = self._get_loop()
+        with self._lock:
+            self._queued += 1
+            self._totals['started'] += 1
+        asyncio.run_coroutine_threadsafe(self._run(process_id, job, args, ticket, shape), loop)
+        return process_id
+
+    async def _run(self, process_id, job, args, ticket, shape):
+        def progress_callback(message, percentage):
+            self.jobs.update(process_id, message=message, progress=percentage, status='processing')
+
+        await ticket.wait_async()
+        self.jobs.update(process_id, status='processing', message='Starting...', queue_position=0)
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+        started = time.monotonic()
+        failed = True
+        try:
+            result = await job(progress_callback, *args)
+            if result and not result.get('error'):
+                final = {
+                    'status': 'completed',
+                    'progress': 100,
+                    'message': 'Processing complete!',
+                    'result': shape(result) if shape else result
+                }
+                failed = False
+            else:
+                error = (result or {}).get('error') or 'Unknown error occurred'
+                final = {'status': 'error', 'progress': -1, 'message': 'Processing failed', 'error': error}
+        except Exception as e:
+            print(f"Error in async AI job {process_id}: {e}")
+            final = {'status': 'error', 'progress': -1, 'message': f'Error: {str(e)}', 'error': str(e)}
+        finally:
+            ticket.release()
+            self.jobs.finish(process_id, **final)
+            with self._lock:
+                self._running -= 1
+                self._totals['failed' if failed else 'completed'] += 1
+                self._totals['seconds'] = round(self._totals['seconds'] + time.monotonic() - started, 3)
+
+    async def _blocking(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    async def _audio_processor(self):
+        # Its constructor checks credentials with STS on first use, so it is built off the loop
+        if self._processor is None:
+            from audio_processor import AudioProcessor
+            processor = await self._blocking(AudioProcessor)
+            self._aws = AsyncAWS(aws_clients.shared(processor.aws_region))
+            self._processor = processor
+        return self._processor
+
+    # Jobs: each mirrors the AudioProcessor method named in its docstring
+
+    async def process_audio(self, progress, file_path):
+        """process_audio_file(): transcript plus project details"""
+        processor = await self._audio_processor()
+        progress("Starting audio processing...", 0)
+        transcribed = await self._upload_and_transcribe(progress, processor, file_path, (10, 25, 40))
+        if transcribed.get('error'):
+            return transcribed
+
+        progress("Analyzing project details...", 70)
+        project_details = await self._extract_project_details(processor, transcribed['transcript'])
+
+        progress("Finalizing results...", 90)
+        if isinstance(project_details, dict):
+            project_details['transcript'] = transcribed['transcript']
+            project_details['processing_status'] = 'success'
+            project_details['s3_uri'] = transcribed['s3_uri']
+            project_details['s3_key'] = transcribed['s3_key']
+            if project_details.get('confidence', 0.5) < 0.3:
+                project_details['warning'] = 'Low confidence in extraction. Please review results.'
+        return project_details
+
+    async def transcribe_audio(self, progress, file_path):
+        """transcribe_audio_only(): the transcript without Bedrock analysis"""
+        processor = await self._audio_processor()
+        progress("Starting audio transcription...", 0)
+        transcribed = await self._upload_and_transcribe(progress, processor, file_path, (20, 40, 70))
+        if not transcribed.get('error'):
+            transcribed.update({'processing_status': 'transcription_complete', 'confidence': 1.0})
+        return transcribed
+
+    async def analyze_transcript(self, progress, transcript, filename='', s3_key=''):
+        """extract_project_details_with_bedrock() on a reviewed transcript"""
+        processor = await self._audio_processor()
+        progress("Analyzing project details...", 50)
+        project_details = await self._extract_project_details(processor, transcript)
+        if project_details and not project_details.get('error'):
+            project_details.update({
+                'transcript': transcript,
+                'filename': filename,
+                's3_key': s3_key,
+                'processing_status': 'ai_analysis_complete'
+            })
+        return project_details
+
+    async def _upload_and_transcribe(self, progress, processor, file_path, percentages):
+        convert_at, upload_at, transcribe_at = percentages
+        progress("Converting audio format...", convert_at)
+        async with self._decode_slots:
+            with self._lock:
+                self._decoding += 1
+            try:
+                converted_path = await self._blocking(processor.convert_audio_format, file_path, 'wav')
+            finally:
+                with self._lock:
+                    self._decoding -= 1
+        if not converted_path:
+            return {"error": "Failed to convert audio format", "confidence": 0.0}
+        try:
+            progress("Uploading to AWS S3...", upload_at)
+            s3_uri = await self._upload_to_s3(processor, converted_path)
+            if not s3_uri:
+                return {"error": "Failed to upload to S3", "confidence": 0.0}
+
+            progress("Transcribing audio...", transcribe_at)
+            transcript_text = await self._transcribe(processor, s3_uri, file_path)
+            if not transcript_text:
+                return {"error": "Failed to transcribe audio", "confidence": 0.0}
+            return {
+                'transcript': transcript_text,
+                's3_uri': s3_uri,
+                's3_key': s3_uri.replace(f"s3://{processor.s3_bucket}/", "")
+            }
+        finally:
+            processor._cleanup_temp_files(converted_path, file_path)
+
+    async def _upload_to_s3(self, processor, file_path):
+        if not processor.aws_available:
+            return None
+        try:
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            s3_key = f"projects/audios/new/{timestamp}_{os.path.basename(file_path)}"
+            await self._aws.upload_file(file_path, processor.s3_bucket, s3_key)
+            return f"s3://{processor.s3_bucket}/{s3_key}"
+        except Exception as e:
+            print(f"S3 upload failed: {e}")
+            return None
+
+    async def _transcribe(self, processor, s3_uri, original_file_path):
+        job_name = f"transcribe_job_{uuid.uuid4().hex}"
+        try:
+            await self._aws.call('transcribe', 'start_transcription_job',
+                                 **processor.transcription_params(s3_uri, job_name))
+            waited = 0
+            while waited < TRANSCRIBE_MAX_WAIT:
+                job = (await self._aws.call('transcribe', 'get_transcription_job',
+                                            TranscriptionJobName=job_name))['TranscriptionJob']
+                if job['TranscriptionJobStatus'] == 'COMPLETED':
+                    transcript_text = await self._download_transcript(processor, job['Transcript']['TranscriptFileUri'])
+                    try:
+                        await self._aws.call('transcribe', 'delete_transcription_job', TranscriptionJobName=job_name)
+                    except Exception:
+                        pass
+                    return transcript_text
+                if job['TranscriptionJobStatus'] == 'FAILED':
+                    print(f"Transcription job {job_name} failed: {job.get('FailureReason')}")
+                    return processor._mock_transcription(original_file_path)
+                await asyncio.sleep(TRANSCRIBE_POLL_INTERVAL)
+                waited += TRANSCRIBE_POLL_INTERVAL
+            print(f"Transcription job {job_name} timed out after {TRANSCRIBE_MAX_WAIT}s")
+        except Exception as e:
+            print(f"Transcription failed: {e}")
+        return processor._mock_transcription(original_file_path)
+
+    async def _download_transcript(self, processor, transcript_uri):
+        try:
+            transcript_data = await self._aws.fetch_json(transcript_uri)
+            return transcript_data['results']['transcripts'][0]['transcript']
+        except Exception as e:
+            print(f"Failed to download transcript: {e}")
+            return processor._mock_transcription(None)
+
+    async def _extract_project_details(self, processor, transcript_text):
+        from audio_processor import BEDROCK_MODELS
+        if not processor.aws_available:
+            return processor._extract_project_details_fallback(transcript_text)
+
+        access_denied_count = 0
+        other_errors = []
+        for model in BEDROCK_MODELS:
+            try:
+                response_body = await self._aws.invoke_model(**processor.bedrock_request(transcript_text, model))
+                result = processor.parse_bedrock_response(transcript_text, model, response_body)
+                if result:
+                    return result
+            except Exception as e:
+                if "AccessDeniedException" in str(e):
+                    access_denied_count += 1
+                else:
+                    other_errors.append(f"{model['name']}: {e}")
+        return processor.bedrock_fallback(transcript_text, access_denied_count, len(BEDROCK_MODELS), other_errors)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'loop_running': self._loop is not None and self._loop_pid == os.getpid(),
+                'native_clients': aiobotocore_installed(),
+                'max_jobs': self.admission.max_running,
+                'blocking_threads': self.blocking_threads,
+                'max_decodes': self.max_decodes,
+                'decoding': self._decoding,
+                'running': self._running,
+                'queued': self._queued,
+                'totals': dict(self._totals),
+            }
+
+    def close(self):
+        with self._lock:
+            loop, self._loop = self._loop, None
+            aws = self._aws
+        if loop is not None and self._loop_pid == os.getpid():
+            if aws is not None:
+                try:
+                    asyncio.run_coroutine_threadsafe(aws.close(), loop).result(timeout=5)
+                except Exception as e:
+                    print(f"Error closing async AWS clients: {e}")
+            loop.call_soon_threadsafe(loop.stop)
@@ -4,6 +4,7 @@ from functools import wraps
 from werkzeug.utils import secure_filename
 import os
 import json
+import atexit
 from datetime import datetime, timedelta
 # Optional imports for development
 try:
@@ -12,32 +13,40 @@ try:
 except ImportError:
     print("Warning: python-dotenv not installed. Environment variables from .env file will not be loaded.")
 
-import pymysql
-try:
-    import boto3
-    from botocore.exceptions import ClientError, NoCredentialsError
-    # Check if AWS credentials are available
-    try:
-        # Try to create a session and check credentials
-        boto3_session = boto3.Session()
-        credentials = boto3_session.get_credentials()
-        if credentials is None:
-            raise NoCredentialsError()
-        # Test if credentials work by making a simple call
-        sts_client = boto3.client('sts')
-        sts_client.get_caller_identity()
-        AWS_AVAILABLE = True
-        print("AWS credentials are available and valid")
-    except (NoCredentialsError, ClientError, Exception) as e:
-        AWS_AVAILABLE = False
-        print(f"AWS credentials not available or invalid: {e}")
-except ImportError:
-    AWS_AVAILABLE = False
-    print("Warning: boto3 not installed. AWS features will be disabled.")
-
 # Import configuration
 from config import config
-
+from database import get_db_connection
+import aws_clients
+import notification_inbox
+import event_stream
+import bid_conversations
+import message_history
+import project_search
+import geo_location
+import project_matching
+import project_facets
+import admin_rollups
+import audit_log
+import admin_export
+import pdf_cache
+import pdf_service
+import file_serving
+import blob_store
+import file_registry
+import presigned_urls
+import image_derivatives
+import resumable_uploads
+import evidence_routes
+import server_sessions
+import ai_async
+import admission_control
+import job_status
+
+# The app is a module-level object rather than built by a create_app() factory: the
+# route groups, services and atexit hooks below are set up at import on this object,
+# and gunicorn (Procfile app:app), application.py and the scripts import it by name.
+# What a factory would buy at startup is had by building AWS clients, pools and
+# threads lazily (aws_clients, database), so importing the app makes no network calls.
 app = Flask(__name__)
 
 # Load configuration based on environment
@@ -49,17 +58,11 @@ os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
 
 
-# AWS Configuration
-if AWS_AVAILABLE:
-    try:
-        transcribe_client = boto3.client('transcribe', region_name=app.config.get('AWS_REGION', 'us-east-1'))
-        comprehend_client = boto3.client('comprehend', region_name=app.config.get('AWS_REGION', 'us-east-1'))
-        s3_client = boto3.client('s3', region_name=app.config.get('AWS_REGION', 'us-east-1'))
-    except Exception as e:
-        print(f"Warning: AWS client initialization failed: {e}")
-        AWS_AVAILABLE = False
-else:
-    transcribe_client = comprehend_client = s3_client = None
+# AWS Configuration: clients are built on first use, so importing the app makes no AWS calls
+aws = aws_clients.shared(app.config.get('AWS_REGION', 'us-east-1'))
+transcribe_client = aws.lazy('transcribe')
+comprehend_client = aws.lazy('comprehend')
+s3_client = aws.lazy('s3')
 
 
 # Helper functions
@@ -570,6 +573,7 @@ def register():
                     INSERT INTO contractors (user_id, location, company, specialties, business_info, onboarding_completed)
                     VALUES (?, ?, ?, ?, ?, ?)
                 ''', (user_id, location, company, specialties, business_info, False))
+                geo_location.set_contractor_point(cursor, user_id, location)
             
             # Check onboarding status for contractors before committing
             onboarding_completed = False
@@ -683,24 +687,13 @@ def get_admin_level(user_id):
         return None
 
 def log_admin_activity(admin_user_id, action, target_type, target_id=None, details=None):
-    """Log admin activity for audit trail"""
+    """Queue admin activity for the audit trail (written in batches by admin_audit_log)"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
         ip_address = request.environ.get('HTTP_X_FORWARDED_FOR', request.environ.get('REMOTE_ADDR'))
         user_agent = request.environ.get('HTTP_USER_AGENT', '')
         
-        cursor.execute('''
-            INSERT INTO admin_activity_logs 
-            (admin_user_id, action, target_type, target_id, details, ip_address, user_agent)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (admin_user_id, action, target_type, target_id, json.dumps(details) if details else None, ip_address, user_agent))
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
-        return True
+        return admin_audit_log.log(admin_user_id, action, target_type, target_id,
+                                   json.dumps(details) if details else None, ip_address, user_agent)
     except Exception as e:
         print(f"Error logging admin activity: {e}")
         return False
@@ -813,6 +806,9 @@ def guest_register():
                       homeowner_id, guest_project['created_at']))
                 
                 project_id = cursor.lastrowid
+                geo_location.index_project(cursor, project_id, guest_project['location'], location)
+                project_matching.on_project_changed(cursor, project_id)
+                project_facets.on_project_changed(cursor, project_id)
                 
                 # Mark guest project as claimed
                 cursor.execute('''
@@ -1025,6 +1021,8 @@ def send_bid_message(bid_id):
         homeowner_user = cursor.fetchone()
         receiver_id = homeowner_user['user_id']
     
+    homeowner_user_id = user['id'] if user['role'] == 'homeowner' else receiver_id
+    
     # Insert message
     cursor.execute('''
         INSERT INTO bid_messages (bid_id, sender_id, receiver_id, message_type, message_text, proposed_amount, proposed_timeline)
@@ -1033,6 +1031,10 @@ def send_bid_message(bid_id):
     
     message_id = cursor.lastrowid
     
+    # Keep the conversation summary in step with the new message
+    bid_conversations.record_message(cursor, bid_id, message_id, receiver_id, bid['contractor_id'],
+                                     bid['contractor_user_id'], homeowner_user_id, message_text)
+    
     # Update bid activity timestamp
     cursor.execute('UPDATE bids SET last_activity_at = NOW() WHERE id = ?', (bid_id,))
     
@@ -1041,15 +1043,33 @@ def send_bid_message(bid_id):
     title = f"New {message_type.replace('_', ' ').title()} on Bid"
     notification_message = f"{user['first_name']} {user['last_name']} sent you a {message_type.replace('_', ' ')}"
     
-    cursor.execute('''
-        INSERT INTO bid_notifications (bid_id, user_id, notification_type, title, message)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (bid_id, receiver_id, notification_type, title, notification_message))
+    notification_id = notification_inbox.create_notification(cursor, bid_id, receiver_id, notification_type, title, notification_message)
     
     conn.commit()
     cursor.close()
     conn.close()
     
+    # Push the new message and notification to open streams
+    message_event = {
+        'bid_id': bid_id,
+        'message_id': message_id,
+        'sender_id': user['id'],
+        'message_type': message_type,
+        'message_text': message_text,
+        'proposed_amount': proposed_amount,
+        'proposed_timeline': proposed_timeline,
+        'created_at': datetime.now().isoformat()
+    }
+    event_stream.publish(receiver_id, 'bid_message', message_event)
+    event_stream.publish(user['id'], 'bid_message', message_event)
+    event_stream.publish(receiver_id, 'notification', {
+        'id': notification_id,
+        'bid_id': bid_id,
+        'notification_type': notification_type,
+        'title': title,
+        'message': notification_message
+    })
+    
     return jsonify({'success': True, 'message': 'Message sent successfully', 'message_id': message_id})
 
 @app.route('/api/bids/<int:bid_id>')
@@ -1118,7 +1138,7 @@ def get_bid_details(bid_id):
 @app.route('/api/bid_messages/<int:bid_id>')
 @login_required
 def get_bid_messages(bid_id):
-    """Get all messages for a bid"""
+    """Get a page of messages for a bid (since_id / before_id / limit cursor)"""
     user = session['user']
     
     conn = get_db_connection()
@@ -1155,30 +1175,18 @@ def get_bid_messages(bid_id):
         conn.close()
         return jsonify({'success': False, 'message': 'Access denied'}), 403
     
-    # Get messages
-    cursor.execute('''
-        SELECT bm.*, 
-               u.first_name, u.last_name, u.role
-        FROM bid_messages bm
-        JOIN users u ON bm.sender_id = u.id
-        WHERE bm.bid_id = ?
-        ORDER BY bm.created_at ASC
-    ''', (bid_id,))
-    
-    messages = cursor.fetchall()
-    
-    # Mark messages as read for current user
-    cursor.execute('''
-        UPDATE bid_messages 
-        SET is_read = TRUE 
-        WHERE bid_id = ? AND receiver_id = ? AND is_read = FALSE
-    ''', (bid_id, user['id']))
+    # Get messages, marking them read only if the page brought new ones
+    since_id, before_id, limit = message_history.parse_cursor(request.args)
+    page = message_history.fetch_page(cursor, 'bid_messages', bid_id, user['id'],
+                                      since_id=since_id, before_id=before_id, limit=limit)
+    if page['marked_read']:
+        bid_conversations.mark_read(cursor, bid_id, user['id'])
+        conn.commit()
     
-    conn.commit()
     cursor.close()
     conn.close()
     
-    return jsonify({'success': True, 'messages': messages})
+    return jsonify({'success': True, **page})
 
 @app.route('/api/notifications')
 @login_required
@@ -1189,21 +1197,31 @@ def get_notifications():
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    cursor.execute('''
-        SELECT bn.*, b.amount, p.title as project_title
-        FROM bid_notifications bn
-        JOIN bids b ON bn.bid_id = b.id
-        JOIN projects p ON b.project_id = p.id
-        WHERE bn.user_id = %s
-        ORDER BY bn.created_at DESC
-        LIMIT 20
-    ''', (user['id'],))
+    notifications = notification_inbox.get_latest(cursor, user['id'])
+    unread_count = notification_inbox.get_unread_count(cursor, user['id'])
     
-    notifications = cursor.fetchall()
+    conn.commit()
     cursor.close()
     conn.close()
     
-    return jsonify({'success': True, 'notifications': notifications})
+    return jsonify({'success': True, 'notifications': notifications, 'unread_count': unread_count})
+
+@app.route('/api/notifications/unread_count')
+@login_required
+def get_notification_unread_count():
+    """Get the unread notification count for the navbar badge"""
+    user = session['user']
+    
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    unread_count = notification_inbox.get_unread_count(cursor, user['id'])
+    
+    conn.commit()
+    cursor.close()
+    conn.close()
+    
+    return jsonify({'success': True, 'unread_count': unread_count})
 
 @app.route('/api/notifications/<int:notification_id>/mark_read', methods=['POST'])
 @login_required
@@ -1214,11 +1232,7 @@ def mark_notification_read(notification_id):
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    cursor.execute('''
-        UPDATE bid_notifications 
-        SET is_read = TRUE 
-        WHERE id = ? AND user_id = ?
-    ''', (notification_id, user['id']))
+    notification_inbox.mark_read(cursor, user['id'], notification_id)
     
     conn.commit()
     cursor.close()
@@ -1226,6 +1240,55 @@ def mark_notification_read(notification_id):
     
     return jsonify({'success': True, 'message': 'Notification marked as read'})
 
+@app.route('/api/notifications/mark_all_read', methods=['POST'])
+@login_required
+def mark_all_notifications_read():
+    """Mark all notifications as read for the current user"""
+    user = session['user']
+    
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    updated = notification_inbox.mark_all_read(cursor, user['id'])
+    
+    conn.commit()
+    cursor.close()
+    conn.close()
+    
+    return jsonify({'success': True, 'message': f'{updated} notifications marked as read', 'updated': updated})
+
+# Seconds a client refused a stream waits before asking again
+EVENT_STREAM_RETRY_SECONDS = 60
+
+@app.route('/api/events')
+@login_required
+def stream_events():
+    """Server-Sent Events stream of notifications and messages for the current user"""
+    from flask import Response
+    
+    user_id = session['user']['id']
+    
+    # EventSource sends Last-Event-ID on reconnect; the query param covers a fresh page load
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+    
+    try:
+        # Takes this worker's stream slot now; Response closes the stream and frees it
+        frames = event_stream.stream(user_id, last_event_id)
+    except event_stream.TooManyStreams:
+        # Each stream holds a request thread (and sync workers allow none); the page
+        # falls back to refetching on the retry interval and tries the stream again
+        response = jsonify({'success': False, 'message': 'Too many open event streams'})
+        response.headers['Retry-After'] = str(EVENT_STREAM_RETRY_SECONDS)
+        return response, 503
+    
+    return Response(frames,
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/api/contractor/message_stats')
 @login_required
 def get_contractor_message_stats():
@@ -1245,25 +1308,8 @@ def get_contractor_message_stats():
         return jsonify({'success': False, 'message': 'Contractor not found'}), 404
     contractor_id = contractor_result['id']
     
-    # Get total conversations (bids with messages)
-    cursor.execute('''
-        SELECT COUNT(DISTINCT b.id) as total
-        FROM bids b
-        WHERE b.contractor_id = ?
-        AND EXISTS (SELECT 1 FROM bid_messages bm WHERE bm.bid_id = b.id)
-    ''', (contractor_id,))
-    total_conversations = cursor.fetchone()['total']
-    
-    # Get unread messages count
-    cursor.execute('''
-        SELECT COUNT(*) as unread
-        FROM bid_messages bm
-        JOIN bids b ON bm.bid_id = b.id
-        WHERE b.contractor_id = ?
-        AND bm.receiver_id = ?
-        AND bm.is_read = FALSE
-    ''', (contractor_id, user['id']))
-    unread_messages = cursor.fetchone()['unread']
+    # Get total conversations and unread messages from the conversation summaries
+    total_conversations, unread_messages = bid_conversations.get_contractor_stats(cursor, contractor_id)
     
     # Get active negotiations (bids with recent activity)
     cursor.execute('''
@@ -1310,25 +1356,22 @@ def get_contractor_messages():
     sort_by = request.args.get('sort', 'recent')
     search_term = request.args.get('search', '')
     
-    # Build query
+    # Build query over the conversation summaries (one row per bid with messages)
     query = '''
-        SELECT DISTINCT b.id as bid_id, b.amount as bid_amount, b.status as bid_status,
-               b.timeline, b.last_activity_at,
+        SELECT bc.bid_id, b.amount as bid_amount, b.status as bid_status,
+               b.timeline, bc.last_activity_at, bc.last_activity_at as last_activity,
                p.title as project_title,
                CONCAT(u.first_name, ' ', u.last_name) as homeowner_name,
-               (SELECT COUNT(*) FROM bid_messages bm 
-                WHERE bm.bid_id = b.id AND bm.receiver_id = ? AND bm.is_read = FALSE) as unread_count,
-               (SELECT bm2.message_text FROM bid_messages bm2 
-                WHERE bm2.bid_id = b.id ORDER BY bm2.created_at DESC LIMIT 1) as last_message
-        FROM bids b
+               bc.contractor_unread as unread_count,
+               bc.last_message_preview as last_message
+        FROM bid_conversations bc
+        JOIN bids b ON bc.bid_id = b.id
         JOIN projects p ON b.project_id = p.id
-        JOIN homeowners h ON p.homeowner_id = h.id
-        JOIN users u ON h.user_id = u.id
-        WHERE b.contractor_id = ?
-        AND EXISTS (SELECT 1 FROM bid_messages bm WHERE bm.bid_id = b.id)
+        JOIN users u ON bc.homeowner_user_id = u.id
+        WHERE bc.contractor_id = ?
     '''
     
-    params = [user['id'], contractor_id]
+    params = [contractor_id]
     
     # Add status filter
     if status_filter:
@@ -1351,15 +1394,15 @@ def get_contractor_messages():
     
     # Add sorting
     if sort_by == 'recent':
-        query += " ORDER BY b.last_activity_at DESC"
+        query += " ORDER BY bc.last_activity_at DESC"
     elif sort_by == 'oldest':
-        query += " ORDER BY b.last_activity_at ASC"
+        query += " ORDER BY bc.last_activity_at ASC"
     elif sort_by == 'project':
         query += " ORDER BY p.title ASC"
     elif sort_by == 'amount':
         query += " ORDER BY b.amount DESC"
     else:
-        query += " ORDER BY b.last_activity_at DESC"
+        query += " ORDER BY bc.last_activity_at DESC"
     
     cursor.execute(query, params)
     messages = cursor.fetchall()
@@ -1415,6 +1458,8 @@ def mark_bid_messages_read(bid_id):
         SET is_read = TRUE 
         WHERE bid_id = ? AND receiver_id = ? AND is_read = FALSE
     ''', (bid_id, user['id']))
+    if cursor.rowcount:
+        bid_conversations.mark_read(cursor, bid_id, user['id'])
     
     conn.commit()
     cursor.close()
@@ -1476,6 +1521,10 @@ def send_bid_message_api():
         
         message_id = cursor.lastrowid
         
+        # Keep the conversation summary in step with the new message
+        bid_conversations.record_message(cursor, bid_id, message_id, receiver_id, bid['contractor_id'],
+                                         bid['contractor_user_id'], bid['homeowner_user_id'], message)
+        
         # Update bid activity
         cursor.execute('''
             UPDATE bids SET last_activity_at = NOW() WHERE id = ?
@@ -1490,14 +1539,33 @@ def send_bid_message_api():
         elif message_type == 'negotiation':
             notification_title = "Bid negotiation message"
         
-        cursor.execute('''
-            INSERT INTO bid_notifications (bid_id, user_id, notification_type, title, message)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (bid_id, receiver_id, 'new_message', notification_title, 
-              f'New message: {message[:100]}...'))
+        notification_message = f'New message: {message[:100]}...'
+        notification_id = notification_inbox.create_notification(cursor, bid_id, receiver_id, 'new_message',
+                                                                 notification_title, notification_message)
         
         conn.commit()
         
+        # Push the new message and notification to open streams
+        message_event = {
+            'bid_id': bid_id,
+            'message_id': message_id,
+            'sender_id': user['id'],
+            'message_type': message_type,
+            'message_text': message,
+            'proposed_amount': price_adjustment,
+            'proposed_timeline': timeline_adjustment,
+            'created_at': datetime.now().isoformat()
+        }
+        event_stream.publish(receiver_id, 'bid_message', message_event)
+        event_stream.publish(user['id'], 'bid_message', message_event)
+        event_stream.publish(receiver_id, 'notification', {
+            'id': notification_id,
+            'bid_id': bid_id,
+            'notification_type': 'new_message',
+            'title': notification_title,
+            'message': notification_message
+        })
+        
         return jsonify({
             'success': True, 
             'message': 'Message sent successfully',
@@ -1514,7 +1582,7 @@ def send_bid_message_api():
 @app.route('/api/project_messages/<int:project_id>')
 @login_required
 def get_project_messages(project_id):
-    """Get all general messages for a project between homeowner and contractors"""
+    """Get a page of general messages for a project (since_id / before_id / limit cursor)"""
     user = session['user']
     
     conn = get_db_connection()
@@ -1552,30 +1620,17 @@ def get_project_messages(project_id):
         conn.close()
         return jsonify({'success': False, 'message': 'Access denied'}), 403
     
-    # Get messages
-    cursor.execute('''
-        SELECT pm.*, 
-               u.first_name, u.last_name, u.role
-        FROM project_messages pm
-        JOIN users u ON pm.sender_id = u.id
-        WHERE pm.project_id = ?
-        ORDER BY pm.created_at ASC
-    ''', (project_id,))
-    
-    messages = cursor.fetchall()
-    
-    # Mark messages as read for current user
-    cursor.execute('''
-        UPDATE project_messages 
-        SET is_read = TRUE 
-        WHERE project_id = %s AND receiver_id = %s AND is_read = FALSE
-    ''', (project_id, user['id']))
+    # Get messages, marking them read only if the page brought new ones
+    since_id, before_id, limit = message_history.parse_cursor(request.args)
+    page = message_history.fetch_page(cursor, 'project_messages', project_id, user['id'],
+                                      since_id=since_id, before_id=before_id, limit=limit)
+    if page['marked_read']:
+        conn.commit()
     
-    conn.commit()
     cursor.close()
     conn.close()
     
-    return jsonify({'success': True, 'messages': messages})
+    return jsonify({'success': True, **page})
 
 @app.route('/api/project_messages', methods=['POST'])
 @login_required
@@ -1641,6 +1696,18 @@ def send_project_message():
         
         conn.commit()
         
+        # Push the new message to open streams
+        message_event = {
+            'project_id': project_id,
+            'message_id': message_id,
+            'sender_id': user['id'],
+            'message_type': message_type,
+            'message_text': message,
+            'created_at': datetime.now().isoformat()
+        }
+        event_stream.publish(receiver_id, 'project_message', message_event)
+        event_stream.publish(user['id'], 'project_message', message_event)
+        
         return jsonify({
             'success': True, 
             'message': 'Message sent successfully',
@@ -1699,6 +1766,7 @@ def expire_old_bids():
         
         expired_bids = cursor.fetchall()
         expired_count = len(expired_bids)
+        pending_events = []
         
         if expired_count > 0:
             # Update bid statuses to expired
@@ -1720,11 +1788,10 @@ def expire_old_bids():
                 contractor_user = cursor.fetchone()
                 
                 if contractor_user:
-                    cursor.execute('''
-                        INSERT INTO bid_notifications (bid_id, user_id, notification_type, title, message)
-                        VALUES (?, ?, ?, ?, ?)
-                    ''', (bid['id'], contractor_user['user_id'], 'bid_expired', 
-                          'Bid Expired', f'Your bid of ${bid["amount"]:,.2f} has expired'))
+                    message = f'Your bid of ${bid["amount"]:,.2f} has expired'
+                    notification_id = notification_inbox.create_notification(cursor, bid['id'], contractor_user['user_id'],
+                                                                             'bid_expired', 'Bid Expired', message)
+                    pending_events.append((contractor_user['user_id'], notification_id, bid['id'], message))
                 
                 # Notify homeowner
                 cursor.execute('''
@@ -1735,13 +1802,23 @@ def expire_old_bids():
                 homeowner_user = cursor.fetchone()
                 
                 if homeowner_user:
-                    cursor.execute('''
-                        INSERT INTO bid_notifications (bid_id, user_id, notification_type, title, message)
-                        VALUES (?, ?, ?, ?, ?)
-                    ''', (bid['id'], homeowner_user['user_id'], 'bid_expired', 
-                          'Bid Expired', f'A bid of ${bid["amount"]:,.2f} on your project has expired'))
+                    message = f'A bid of ${bid["amount"]:,.2f} on your project has expired'
+                    notification_id = notification_inbox.create_notification(cursor, bid['id'], homeowner_user['user_id'],
+                                                                             'bid_expired', 'Bid Expired', message)
+                    pending_events.append((homeowner_user['user_id'], notification_id, bid['id'], message))
         
         conn.commit()
+        
+        # Push expiry notifications only once they are committed
+        for user_id, notification_id, bid_id, message in pending_events:
+            event_stream.publish(user_id, 'notification', {
+                'id': notification_id,
+                'bid_id': bid_id,
+                'notification_type': 'bid_expired',
+                'title': 'Bid Expired',
+                'message': message
+            })
+        
         return expired_count
         
     except Exception as e:
@@ -1755,29 +1832,6 @@ def expire_old_bids():
 # def create_demo_users():
 #     """Adapted for Cognito - run manually or via script"""
 
-def get_db_connection():
-    # Check if we're in local development (SQLite) or production (MySQL)
-    if os.path.exists('homepro.db') or os.getenv('FLASK_ENV') == 'development':
-        # Use SQLite for local development
-        import sqlite3
-        conn = sqlite3.connect('homepro.db')
-        conn.row_factory = sqlite3.Row
-        return conn
-    else:
-        # MySQL for production. Fail fast if misconfigured or unreachable.
-        required = ['DB_HOST', 'DB_USERNAME', 'DB_PASSWORD', 'DB_NAME']
-        missing = [k for k in required if not os.getenv(k)]
-        if missing:
-            raise RuntimeError(f"Missing required DB env vars: {', '.join(missing)}")
-        return pymysql.connect(
-            host=os.getenv('DB_HOST'),
-            user=os.getenv('DB_USERNAME'),
-            password=os.getenv('DB_PASSWORD'),
-            db=os.getenv('DB_NAME'),
-            port=int(os.getenv('DB_PORT', 3306)),
-            cursorclass=pymysql.cursors.DictCursor
-        )
-
 def safe_close(cursor=None, conn=None):
     """Close DB cursor/connection safely without raising if already closed."""
     try:
@@ -1795,6 +1849,66 @@ def safe_close(cursor=None, conn=None):
     except Exception:
         pass
 
+# Batched audit trail writer; whatever is still queued is written at shutdown
+admin_audit_log = audit_log.AuditLogWriter(get_db_connection)
+atexit.register(admin_audit_log.close)
+
+# Rendered quote/invoice PDFs, keyed by document version (see pdf_cache),
+# rendered in a process pool (see pdf_service)
+document_pdf_cache = pdf_cache.PDFCache.from_config(app.config, s3_client)
+pdf_renderer = pdf_service.PDFRenderService.from_config(app.config)
+atexit.register(pdf_renderer.close)
+
+# Presigned S3 GET URLs, reused until shortly before they expire
+s3_url_cache = presigned_urls.PresignedURLCache.from_config(app.config, s3_client)
+
+# Resized WebP/AVIF/JPEG copies of uploaded images, generated after the upload returns
+image_pipeline = image_derivatives.DerivativePipeline.from_config(app.config, get_db_connection)
+atexit.register(image_pipeline.close)
+app.extensions['image_pipeline'] = image_pipeline
+
+# Resumable chunked uploads (see upload_routes), claimed by the forms that take files
+resumable_upload_store = resumable_uploads.UploadStore.from_config(app.config, s3_client)
+app.extensions['upload_store'] = resumable_upload_store
+
+# Push events go through the stream_events table so a stream on any worker receives them
+event_stream.configure(get_db_connection, max_streams=app.config.get('EVENT_STREAM_MAX_STREAMS', 4))
+
+# Session data is kept server-side and loaded on first use; the cookie only carries a signed id
+if app.config.get('SESSION_BACKEND', 'sql') != 'cookie':
+    app.session_interface = server_sessions.ServerSessionInterface.from_config(app.config, get_db_connection)
+
+def find_resumable_upload(upload_id, purpose):
+    """The current user's completed upload session for a form, not yet claimed, or None"""
+    conn = get_db_connection()
+    try:
+        return resumable_uploads.completed(conn.cursor(), upload_id, session['user']['id'], purpose)
+    finally:
+        conn.close()
+
+def claim_resumable_upload(upload_id, purpose):
+    """Take the current user's completed upload session for a form, or None"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        upload = resumable_upload_store.claim(cursor, upload_id, session['user']['id'], purpose)
+        conn.commit()
+        return upload
+    finally:
+        conn.close()
+
+def unclaim_resumable_upload(upload):
+    """Hand a claimed upload session back, so the form can be submitted again"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        resumable_upload_store.unclaim(cursor, upload)
+        conn.commit()
+    except Exception as e:
+        print(f"Error returning upload {upload['id']}: {e}")
+    finally:
+        conn.close()
+
 def init_database():
     """Initialize database tables if they don't exist"""
     try:
@@ -1889,13 +2003,47 @@ def init_database():
                 ai_processed_text TEXT,
                 homeowner_id INT NOT NULL,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
                 FOREIGN KEY (homeowner_id) REFERENCES homeowners(id) ON DELETE CASCADE,
                 INDEX idx_status (status),
                 INDEX idx_homeowner (homeowner_id),
-                INDEX idx_created (created_at)
+                INDEX idx_created (created_at),
+                INDEX idx_updated (updated_at),
+                FULLTEXT INDEX ft_projects_search (title, description, ai_processed_text)
             )
         ''')
         
+        # Add the keyword search index to projects tables created before it existed
+        project_search.ensure_index(cursor)
+        
+        # Create project_locations table with a spatial index for radius search
+        geo_location.ensure_schema(cursor)
+        
+        # Create project_facet_counts rollup (and its membership table) for dashboard filter counts
+        project_facets.ensure_schema(cursor)
+        
+        # Create stored_files registry of uploads and the image_derivatives generated from them
+        file_registry.ensure_schema(cursor)
+        image_derivatives.ensure_schema(cursor)
+        
+        # Create evidence_files table (files of milestone evidence submissions)
+        evidence_routes.ensure_schema(cursor)
+        
+        # Create blobs table (reference counts of content-addressed evidence files)
+        blob_store.ensure_schema(cursor)
+        
+        # Create upload_sessions table for resumable chunked uploads
+        resumable_uploads.ensure_schema(cursor)
+        
+        # Create server_sessions table for server-side session data
+        server_sessions.ensure_schema(cursor)
+        
+        # Create stream_events table that carries push events between workers
+        event_stream.ensure_schema(cursor)
+        
+        # Create processing_jobs table of background AI job status
+        job_status.ensure_schema(cursor)
+        
         # Create guest_projects table for unregistered users
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS guest_projects (
@@ -1938,12 +2086,15 @@ def init_database():
                 expires_at TIMESTAMP NULL,
                 withdrawn_at TIMESTAMP NULL,
                 withdrawal_reason TEXT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
                 FOREIGN KEY (project_id) REFERENCES projects(id) ON DELETE CASCADE,
                 FOREIGN KEY (contractor_id) REFERENCES contractors(id) ON DELETE CASCADE,
                 INDEX idx_project (project_id),
                 INDEX idx_contractor (contractor_id),
                 INDEX idx_status (status),
-                INDEX idx_expires (expires_at)
+                INDEX idx_expires (expires_at),
+                INDEX idx_created (created_at),
+                INDEX idx_updated (updated_at)
             )
         ''')
         
@@ -2064,6 +2215,9 @@ def init_database():
             )
         ''')
         
+        # Create analytics rollup tables for the admin dashboard and analytics pages
+        admin_rollups.ensure_schema(cursor)
+        
         # Create project_images table for storing project images (up to 4 per project)
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS project_images (
@@ -2155,6 +2309,9 @@ def init_database():
             )
         ''')
         
+        # Create contractor_recommendations table for precomputed top-N project matches
+        project_matching.ensure_schema(cursor)
+        
         # Create quotes table
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS quotes (
@@ -2300,6 +2457,18 @@ def init_database():
         except Exception as e:
             print(f"Projects status migration error: {e}")
         
+        # Create bid_conversations table summarising each bid's message thread
+        bid_conversations.ensure_schema(cursor)
+        try:
+            rebuilt = bid_conversations.backfill(cursor)
+            if rebuilt:
+                print(f"Built {rebuilt} bid conversation summaries from bid_messages")
+        except Exception as e:
+            print(f"Bid conversation backfill error: {e}")
+        
+        # Create notification_counters table for per-user unread badge counts
+        notification_inbox.ensure_schema(cursor)
+        
         # Create contact_submissions table for contact form submissions
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS contact_submissions (
@@ -2372,7 +2541,7 @@ def login():
                         
                         if guest_project:
                             # Get homeowner ID
-                            cursor.execute('SELECT id FROM homeowners WHERE user_id = %s', (user['id'],))
+                            cursor.execute('SELECT id, location FROM homeowners WHERE user_id = %s', (user['id'],))
                             homeowner_result = cursor.fetchone()
                             
                             if homeowner_result:
@@ -2387,6 +2556,11 @@ def login():
                                       guest_project['location'], guest_project['budget_min'], guest_project['budget_max'],
                                       guest_project['timeline'], guest_project['original_file_path'], guest_project['ai_processed_text'],
                                       homeowner_id, guest_project['created_at']))
+                                project_id = cursor.lastrowid
+                                geo_location.index_project(cursor, project_id, guest_project['location'],
+                                                           homeowner_result['location'])
+                                project_matching.on_project_changed(cursor, project_id)
+                                project_facets.on_project_changed(cursor, project_id)
                                 
                                 # Mark guest project as claimed
                                 cursor.execute('UPDATE guest_projects SET status = "Claimed" WHERE id = %s', (guest_project_id,))
@@ -2477,7 +2651,10 @@ def dashboard():
         render_args = {'projects': projects, 'recent_bids': recent_bids}
     else:
         # Get contractor ID from contractors table
-        cursor.execute('SELECT id FROM contractors WHERE user_id = %s', (user['id'],))
+        cursor.execute('''
+            SELECT id, service_area_lat, service_area_lng, service_radius
+            FROM contractors WHERE user_id = %s
+        ''', (user['id'],))
         contractor_result = cursor.fetchone()
         if not contractor_result:
             flash('Contractor profile not found. Please contact support.')
@@ -2493,12 +2670,20 @@ def dashboard():
         project_type_filter = request.args.get('type', '')
         budget_filter = request.args.get('budget', '')
         location_filter = request.args.get('location', '')
-        sort_by = request.args.get('sort', 'newest')
+        region_filter = request.args.get('region', '').strip().upper()
+        radius_filter = request.args.get('radius', 0, type=int)
+        search_query = request.args.get('q', '').strip()
+        search = project_search.build_search(cursor, search_query) if search_query else None
+        sort_by = request.args.get('sort', 'relevance' if search else 'newest')
         
         # Build WHERE clause for filters
         where_conditions = ["status = 'Active'"]
         params = [contractor_id]
         
+        if search:
+            where_conditions.append(search['where'])
+            params.extend(search['where_params'])
+        
         if project_type_filter:
             where_conditions.append("p.project_type = %s")
             params.append(project_type_filter)
@@ -2513,10 +2698,29 @@ def dashboard():
             elif budget_filter == '50000+':
                 where_conditions.append("(p.budget_min >= 50000 OR p.budget_max >= 50000)")
         
-        if location_filter:
+        # Radius search around the typed location, or the contractor's own service area
+        geo = None
+        if radius_filter > 0:
+            if location_filter:
+                center = geo_location.geocode(location_filter)
+            elif contractor_result['service_area_lat'] is not None:
+                center = (float(contractor_result['service_area_lat']), float(contractor_result['service_area_lng']))
+            else:
+                center = None
+            if center:
+                geo = geo_location.radius_filter(cursor, center[0], center[1], radius_filter)
+                where_conditions.append(geo['where'])
+                params.extend(geo['where_params'])
+        
+        if location_filter and not geo:
             where_conditions.append("h.location LIKE %s")
             params.append(f'%{location_filter}%')
         
+        region = project_facets.region_filter(cursor, region_filter) if region_filter else None
+        if region:
+            where_conditions.append(region['where'])
+            params.extend(region['where_params'])
+        
         # Build ORDER BY clause
         if sort_by == 'oldest':
             order_by = "p.created_at ASC"
@@ -2526,16 +2730,22 @@ def dashboard():
             order_by = "COALESCE(p.budget_min, p.budget_max, 999999) ASC"
         elif sort_by == 'bids':
             order_by = "bid_count DESC"
+        elif sort_by == 'relevance' and search:
+            order_by = "relevance DESC, p.created_at DESC"
+        elif sort_by == 'distance' and geo:
+            order_by = "distance_miles ASC, p.created_at DESC"
         else:  # newest
             order_by = "p.created_at DESC"
         
         where_clause = " AND ".join(where_conditions)
+        extra_joins = ' '.join(f['join'] for f in (search, geo, region) if f)
         
         # Get total count for pagination
         count_query = f'''
             SELECT COUNT(*) as total
             FROM projects p 
             JOIN homeowners h ON p.homeowner_id = h.id
+            {extra_joins}
             WHERE {where_clause}
         '''
         cursor.execute(count_query, params[1:])  # Skip contractor_id for count query
@@ -2547,17 +2757,27 @@ def dashboard():
         has_next = page < total_pages
         
         # Get projects with pagination
+        extra_columns = ''
+        extra_params = []
+        if search:
+            extra_columns += f", {search['score']} as relevance"
+            extra_params += search['score_params']
+        if geo:
+            extra_columns += f", {geo['distance']} as distance_miles"
+            extra_params += geo['distance_params']
         projects_query = f'''
             SELECT p.*, h.location,
                    (SELECT COUNT(*) FROM bids b WHERE b.project_id = p.id) as bid_count, 
-                   (SELECT COUNT(*) FROM bids b WHERE b.project_id = p.id AND b.contractor_id = %s) as has_user_bid 
+                   (SELECT COUNT(*) FROM bids b WHERE b.project_id = p.id AND b.contractor_id = %s) as has_user_bid
+                   {extra_columns}
             FROM projects p 
             JOIN homeowners h ON p.homeowner_id = h.id
+            {extra_joins}
             WHERE {where_clause}
             ORDER BY {order_by}
             LIMIT %s OFFSET %s
         '''
-        cursor.execute(projects_query, params + [per_page, offset])
+        cursor.execute(projects_query, params[:1] + extra_params + params[1:] + [per_page, offset])
         projects = cursor.fetchall()
         
         cursor.execute('''
@@ -2569,11 +2789,20 @@ def dashboard():
         ''', (contractor_id,))
         bids = cursor.fetchall()
         
+        # Precomputed matches for this contractor (maintained by project_matching)
+        recommended_projects = project_matching.get_recommendations(cursor, contractor_id, limit=6)
+        
+        # Per-option counts for the type/budget/region filters from the facet rollup
+        facets = project_facets.get_facets(cursor, project_type_filter, budget_filter, region_filter)
+        
         template = 'contractor_dashboard.html'
         render_args = {
             'projects': projects, 
             'bids': bids, 
             'contractor_id': contractor_id,
+            'recommended_projects': recommended_projects,
+            'facets': facets,
+            'radius_choices': geo_location.RADIUS_CHOICES,
             'pagination': {
                 'page': page,
                 'per_page': per_page,
@@ -2588,6 +2817,10 @@ def dashboard():
                 'type': project_type_filter,
                 'budget': budget_filter,
                 'location': location_filter,
+                'region': region_filter,
+                'radius': radius_filter or '',
+                'geo_active': bool(geo),
+                'q': search_query,
                 'sort': sort_by
             }
         }
@@ -2596,8 +2829,47 @@ def dashboard():
     conn.close()
     return render_template(template, **render_args)
 
-# Global dictionary to store processing progress (in production, use Redis or database)
-processing_progress = {}
+# Status of background AI jobs, kept in processing_jobs so a poll can land on any worker
+ai_jobs = job_status.JobStatusStore.from_config(app.config, get_db_connection)
+atexit.register(ai_jobs.close)
+
+# Admission control for AI processing (see admission_control): the blocking endpoints and
+# /process_audio_async share a small pool per worker; the /async/... endpoints, whose jobs
+# mostly wait on AWS, have a larger one
+ai_admission = admission_control.AdmissionController.from_config(app.config, 'AI')
+ai_async_admission = admission_control.AdmissionController.from_config(
+    app.config, 'AI_ASYNC', max_running=200, max_queued=500, max_per_user=5)
+
+# The /async/... AI endpoints run their jobs as coroutines on one event loop per worker
+ai_runner = ai_async.AsyncAIRunner.from_config(app.config, ai_jobs, ai_async_admission)
+atexit.register(ai_runner.close)
+
+@app.errorhandler(admission_control.Overloaded)
+def ai_overloaded(e):
+    response = jsonify(e.to_dict())
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 429
+
+def ai_user_key():
+    """Who an AI job counts against: the signed-in user, else the client address"""
+    if 'user' in session:
+        return f"user:{session['user']['id']}"
+    # The load balancer appends the address it saw to X-Forwarded-For
+    return f"ip:{request.access_route[-1] if request.access_route else request.remote_addr}"
+
+def ai_admission_required(f):
+    """Run a blocking AI endpoint only if ai_admission has a slot free now; 429 otherwise.
+
+    Waiting here would hold a request thread for the whole wait, so a busy
+    worker answers at once with the queue position and Retry-After; the
+    /async/... endpoints are the ones that queue.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        ticket = ai_admission.admit(ai_user_key(), queue=False)
+        with ticket:
+            return f(*args, **kwargs)
+    return decorated_function
 
 @app.route('/process_audio_async', methods=['POST'])
 @login_required
@@ -2608,67 +2880,95 @@ def process_audio_async():
     import threading
     import uuid
     
-    if 'file' not in request.files:
-        return jsonify({'error': 'No file provided'}), 400
-    
-    file = request.files['file']
-    if not file or not file.filename:
-        return jsonify({'error': 'No file selected'}), 400
-    
-    filename = secure_filename(file.filename)
+    # Large recordings arrive through the resumable upload API instead of the form
+    upload = None
+    if request.form.get('upload_id'):
+        upload = find_resumable_upload(request.form['upload_id'], 'audio')
+        if not upload:
+            return jsonify({'error': 'Upload not found or not complete'}), 400
+        filename = secure_filename(upload['filename'])
+    else:
+        if 'file' not in request.files:
+            return jsonify({'error': 'No file provided'}), 400
+        
+        file = request.files['file']
+        if not file or not file.filename:
+            return jsonify({'error': 'No file selected'}), 400
+        
+        filename = secure_filename(file.filename)
     if not allowed_file(filename, 'audio'):
         return jsonify({'error': 'Invalid file type'}), 400
     
+    # Refuse before the recording is saved, or its upload session claimed, if this
+    # worker cannot take another job; an admitted job may still wait in the queue for a slot
+    ticket = ai_admission.admit(ai_user_key())
+    if upload:
+        upload = claim_resumable_upload(upload['id'], 'audio')
+        if not upload:
+            ticket.release()
+            return jsonify({'error': 'Upload not found or not complete'}), 400
+    
     # Generate unique processing ID
     process_id = str(uuid.uuid4())
     
     # Save file
     file_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{process_id}_{filename}")
-    file.save(file_path)
+    try:
+        if upload:
+            resumable_upload_store.move_to(upload, file_path)
+        else:
+            file.save(file_path)
+    except Exception:
+        ticket.release()
+        if upload:
+            unclaim_resumable_upload(upload)
+        raise
     
     # Initialize progress tracking
-    processing_progress[process_id] = {
-        'status': 'starting',
-        'progress': 0,
-        'message': 'Initializing...',
-        'result': None,
-        'error': None
-    }
+    ai_jobs.create(process_id, owner=session['user']['id'], ticket=ticket,
+                   status='starting' if ticket.granted else 'queued',
+                   progress=0,
+                   message='Initializing...' if ticket.granted else 'Waiting for other recordings to finish...',
+                   queue_position=ticket.position())
     
     def progress_callback(message, progress):
-        processing_progress[process_id].update({
-            'message': message,
-            'progress': progress,
-            'status': 'processing' if progress >= 0 else 'error'
-        })
+        ai_jobs.update(process_id,
+                       message=message,
+                       progress=progress,
+                       status='processing' if progress >= 0 else 'error')
         if progress < 0:
-            processing_progress[process_id]['error'] = message
+            ai_jobs.update(process_id, error=message)
     
     def process_in_background():
+        final = {}
         try:
+            ticket.wait()
+            ai_jobs.update(process_id, status='starting', message='Initializing...', queue_position=0)
             result = process_ai_submission(file_path, 'audio', progress_callback=progress_callback)
             if result:
-                processing_progress[process_id].update({
+                final = {
                     'status': 'completed',
                     'progress': 100,
                     'message': 'Processing complete!',
                     'result': result
-                })
+                }
             else:
-                processing_progress[process_id].update({
+                final = {
                     'status': 'error',
                     'progress': -1,
                     'message': 'Processing failed',
                     'error': 'Unknown error occurred'
-                })
+                }
         except Exception as e:
-            processing_progress[process_id].update({
+            final = {
                 'status': 'error',
                 'progress': -1,
                 'message': f'Error: {str(e)}',
                 'error': str(e)
-            })
+            }
         finally:
+            ticket.release()
+            ai_jobs.finish(process_id, **final)
             # Clean up file
             try:
                 if os.path.exists(file_path):
@@ -2684,19 +2984,31 @@ def process_audio_async():
     return jsonify({
         'process_id': process_id,
         'status': 'started',
-        'message': 'Processing started'
+        'message': 'Processing started',
+        'queue_position': ticket.position()
     })
 
 @app.route('/processing_status/<process_id>')
-@login_required
 def get_processing_status(process_id):
     """
     Get the current status of audio processing
+    Guests poll the /async/... jobs they started by their unguessable process id;
+    a job started by a signed-in user is only shown to that user
     """
-    if process_id not in processing_progress:
+    status = ai_jobs.get(process_id)
+    if status is None:
         return jsonify({'error': 'Process not found'}), 404
     
-    status = processing_progress[process_id].copy()
+    owner = status.pop('owner', None)
+    ticket = status.pop('ticket', None)
+    status.pop('finished_at', None)
+    if owner is not None and owner != session.get('user', {}).get('id'):
+        return jsonify({'error': 'Process not found'}), 404
+    # The worker holding the job reports its live position; others the last one written
+    if status['status'] != 'queued':
+        status.pop('queue_position', None)
+    elif ticket is not None:
+        status['queue_position'] = ticket.position()
     
     # Clean up completed processes after returning status
     if status['status'] in ['completed', 'error']:
@@ -2705,7 +3017,36 @@ def get_processing_status(process_id):
     
     return jsonify(status)
 
+def audio_preview_data(project_data, filename):
+    """Preview form fields from an audio submission's project details"""
+    return {
+        'title': project_data.get('title', ''),
+        'description': project_data.get('description', ''),
+        'project_type': project_data.get('project_type', 'General'),
+        'location': project_data.get('location', ''),
+        'budget_min': project_data.get('budget_min'),
+        'budget_max': project_data.get('budget_max'),
+        'timeline': project_data.get('timeline', ''),
+        'transcribed_text': project_data.get('transcribed_text', ''),
+        'confidence': project_data.get('confidence', 0.0),
+        'extraction_method': project_data.get('extraction_method', 'unknown'),
+        's3_key': project_data.get('s3_key'),
+        'filename': filename
+    }
+
+def transcript_response_data(transcript_data, filename):
+    """Transcript review fields from a transcription result"""
+    return {
+        'transcript': transcript_data.get('transcript', ''),
+        'processing_status': transcript_data.get('processing_status', 'transcription_complete'),
+        'confidence': transcript_data.get('confidence', 1.0),
+        's3_key': transcript_data.get('s3_key'),
+        's3_uri': transcript_data.get('s3_uri'),
+        'filename': filename
+    }
+
 @app.route('/process_audio', methods=['POST'])
+@ai_admission_required
 def process_audio():
     """
     New route to handle audio processing and return JSON data for preview
@@ -2737,6 +3078,7 @@ def process_audio():
         # Save the file
         file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
         file.save(file_path)
+        file_registry.register_upload(get_db_connection, file_path, file.filename)
         logger.info(f"💾 File saved to: {file_path}")
         
         # Process the audio file with AI
@@ -2757,20 +3099,7 @@ def process_audio():
         # Return the processed data for preview
         return jsonify({
             'success': True,
-            'data': {
-                'title': project_data.get('title', ''),
-                'description': project_data.get('description', ''),
-                'project_type': project_data.get('project_type', 'General'),
-                'location': project_data.get('location', ''),
-                'budget_min': project_data.get('budget_min'),
-                'budget_max': project_data.get('budget_max'),
-                'timeline': project_data.get('timeline', ''),
-                'transcribed_text': project_data.get('transcribed_text', ''),
-                'confidence': project_data.get('confidence', 0.0),
-                'extraction_method': project_data.get('extraction_method', 'unknown'),
-                's3_key': project_data.get('s3_key'),
-                'filename': filename
-            }
+            'data': audio_preview_data(project_data, filename)
         })
         
     except Exception as e:
@@ -2784,6 +3113,7 @@ def process_audio():
          }), 500
 
 @app.route('/process_audio_transcript', methods=['POST'])
+@ai_admission_required
 def process_audio_transcript():
     """
     New route to handle audio transcription only (no Bedrock analysis)
@@ -2815,6 +3145,7 @@ def process_audio_transcript():
         # Save the file
         file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
         file.save(file_path)
+        file_registry.register_upload(get_db_connection, file_path, file.filename)
         logger.info(f"💾 File saved to: {file_path}")
         
         # Process the audio file for transcription only
@@ -2838,14 +3169,7 @@ def process_audio_transcript():
         # Return the transcript data
         return jsonify({
             'success': True,
-            'data': {
-                'transcript': transcript_data.get('transcript', ''),
-                'processing_status': transcript_data.get('processing_status', 'transcription_complete'),
-                'confidence': transcript_data.get('confidence', 1.0),
-                's3_key': transcript_data.get('s3_key'),
-                's3_uri': transcript_data.get('s3_uri'),
-                'filename': filename
-            }
+            'data': transcript_response_data(transcript_data, filename)
         })
         
     except Exception as e:
@@ -2859,6 +3183,7 @@ def process_audio_transcript():
          }), 500
 
 @app.route('/process_transcript_ai', methods=['POST'])
+@ai_admission_required
 def process_transcript_ai():
     """
     Process transcript with Bedrock AI for project detail extraction
@@ -2919,6 +3244,110 @@ def process_transcript_ai():
              'error': f'AI analysis error: {str(e)}'
          }), 500
 
+def save_async_audio():
+    """Admit and save the recording of an /async/... request.
+
+    Returns (ticket, filename, file_path), or (None, error response, None)
+    when the request is invalid; raises Overloaded when it is not admitted.
+    """
+    import uuid
+    
+    upload = None
+    if request.form.get('upload_id') and 'user' in session:
+        upload = find_resumable_upload(request.form['upload_id'], 'audio')
+        if not upload:
+            return None, (jsonify({'success': False, 'error': 'Upload not found or not complete'}), 400), None
+        filename = secure_filename(upload['filename'])
+    else:
+        file = request.files.get('file')
+        if not file or not file.filename:
+            return None, (jsonify({'success': False, 'error': 'No audio file provided'}), 400), None
+        filename = secure_filename(file.filename)
+    
+    if not allowed_file(filename, 'audio'):
+        return None, (jsonify({
+            'success': False,
+            'error': 'Invalid file type. Please upload an audio file in supported formats (MP3, WAV, M4A, AAC, FLAC, OGG, WMA, WebM).'
+        }), 400), None
+    
+    # The upload session is only claimed once the job is admitted
+    ticket = ai_async_admission.admit(ai_user_key())
+    if upload:
+        upload = claim_resumable_upload(upload['id'], 'audio')
+        if not upload:
+            ticket.release()
+            return None, (jsonify({'success': False, 'error': 'Upload not found or not complete'}), 400), None
+    file_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{uuid.uuid4().hex}_{filename}")
+    try:
+        if upload:
+            resumable_upload_store.move_to(upload, file_path)
+            original_name = upload['filename']
+        else:
+            file.save(file_path)
+            original_name = file.filename
+    except Exception:
+        ticket.release()
+        if upload:
+            unclaim_resumable_upload(upload)
+        raise
+    file_registry.register_upload(get_db_connection, file_path, original_name)
+    return ticket, filename, file_path
+
+def async_job_started(process_id, ticket):
+    return jsonify({
+        'success': True,
+        'process_id': process_id,
+        'status': 'started',
+        'queue_position': ticket.position(),
+        'status_url': url_for('get_processing_status', process_id=process_id)
+    }), 202
+
+@app.route('/async/process_audio', methods=['POST'])
+def process_audio_nonblocking():
+    """
+    /process_audio on the async path: answers at once with a process_id;
+    /processing_status/<process_id> reports progress and the preview data
+    """
+    ticket, filename, file_path = save_async_audio()
+    if ticket is None:
+        return filename
+    process_id = ai_runner.start(ai_runner.process_audio, file_path, ticket=ticket,
+                                 owner=session.get('user', {}).get('id'),
+                                 shape=lambda project_data: audio_preview_data(project_data, filename))
+    return async_job_started(process_id, ticket)
+
+@app.route('/async/process_audio_transcript', methods=['POST'])
+def process_audio_transcript_nonblocking():
+    """
+    /process_audio_transcript on the async path: the transcript is the status result
+    """
+    ticket, filename, file_path = save_async_audio()
+    if ticket is None:
+        return filename
+    process_id = ai_runner.start(ai_runner.transcribe_audio, file_path, ticket=ticket,
+                                 owner=session.get('user', {}).get('id'),
+                                 shape=lambda transcript_data: transcript_response_data(transcript_data, filename))
+    return async_job_started(process_id, ticket)
+
+@app.route('/async/process_transcript_ai', methods=['POST'])
+def process_transcript_ai_nonblocking():
+    """
+    /process_transcript_ai on the async path: the project details are the status result
+    """
+    data = request.get_json(silent=True) or {}
+    transcript = data.get('transcript', '')
+    if not transcript:
+        return jsonify({
+            'success': False,
+            'error': 'No transcript provided for AI analysis'
+        }), 400
+    
+    ticket = ai_async_admission.admit(ai_user_key())
+    process_id = ai_runner.start(ai_runner.analyze_transcript, transcript,
+                                 data.get('filename', ''), data.get('s3_key', ''), ticket=ticket,
+                                 owner=session.get('user', {}).get('id'))
+    return async_job_started(process_id, ticket)
+
 @app.route('/submit_preview', methods=['POST'])
 @login_required
 def submit_preview():
@@ -2984,7 +3413,7 @@ def submit_preview():
         cursor = conn.cursor()
         
         # Get homeowner ID from homeowners table
-        cursor.execute('SELECT id FROM homeowners WHERE user_id = ?', (user['id'],))
+        cursor.execute('SELECT id, location FROM homeowners WHERE user_id = ?', (user['id'],))
         homeowner_result = cursor.fetchone()
         if not homeowner_result:
             return jsonify({
@@ -3012,14 +3441,37 @@ def submit_preview():
         ))
         
         project_id = cursor.lastrowid
+        geo_location.index_project(cursor, project_id, location, homeowner_result['location'])
+        project_matching.on_project_changed(cursor, project_id)
+        project_facets.on_project_changed(cursor, project_id)
+        if file_path:
+            file_registry.attach_reference(cursor, file_path, 'project', project_id)
         
         # Handle image uploads
         import os
         from werkzeug.utils import secure_filename
         
+        image_file_ids = []
         for i in range(1, 5):  # Handle up to 4 images
             image_key = f'project_image_{i}'
-            if image_key in request.files:
+            upload_id = request.form.get(f'{image_key}_upload_id')
+            if upload_id:
+                # Sent through the resumable upload API
+                upload = resumable_upload_store.claim(cursor, upload_id, user['id'], 'project_image')
+                if upload:
+                    import time
+                    filename = f"project_{project_id}_{int(time.time())}_{i}_{secure_filename(upload['filename'])}"
+                    upload_dir = os.path.join(os.getcwd(), 'static', 'uploads', 'projects')
+                    os.makedirs(upload_dir, exist_ok=True)
+                    file_path = os.path.join(upload_dir, filename)
+                    resumable_upload_store.move_to(upload, file_path)
+                    cursor.execute("""
+                        INSERT INTO project_images (project_id, image_path, image_order, created_at)
+                        VALUES (?, ?, ?, NOW())
+                    """, (project_id, f"uploads/projects/{filename}", i))
+                    image_file_ids.append(file_registry.register(cursor, file_path, upload['filename'],
+                                                                 'project_image', cursor.lastrowid))
+            elif image_key in request.files:
                 image_file = request.files[image_key]
                 if image_file and image_file.filename:
                     # Validate file type
@@ -3050,11 +3502,17 @@ def submit_preview():
                             INSERT INTO project_images (project_id, image_path, image_order, created_at)
                             VALUES (?, ?, ?, NOW())
                         """, (project_id, relative_path, i))
+                        image_file_ids.append(file_registry.register(cursor, file_path, image_file.filename,
+                                                                     'project_image', cursor.lastrowid))
         
         conn.commit()
         cursor.close()
         conn.close()
         
+        # Resized copies are made in the background; the originals are already saved
+        for file_id in image_file_ids:
+            image_pipeline.submit(file_id)
+        
         logger.info(f"✅ Project created successfully with ID: {project_id}")
         
         return jsonify({
@@ -3101,6 +3559,7 @@ def submit_project():
             
             file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
             file.save(file_path)
+            file_registry.register_upload(get_db_connection, file_path, file.filename)
             print(f'File saved to: {file_path}')
             
             # Process the audio file for transcription only
@@ -3134,6 +3593,7 @@ def submit_project():
             
             file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
             file.save(file_path)
+            file_registry.register_upload(get_db_connection, file_path, file.filename)
             print(f'File saved to: {file_path}')
             
             # Process the video file
@@ -3234,7 +3694,7 @@ def confirm_project():
     cursor = conn.cursor()
     
     # Get homeowner ID from homeowners table
-    cursor.execute('SELECT id FROM homeowners WHERE user_id = ?', (user['id'],))
+    cursor.execute('SELECT id, location FROM homeowners WHERE user_id = ?', (user['id'],))
     homeowner_result = cursor.fetchone()
     if not homeowner_result:
         flash('Homeowner profile not found. Please contact support.')
@@ -3245,6 +3705,14 @@ def confirm_project():
         INSERT INTO projects (title, description, project_type, location, budget_min, budget_max, timeline, status, original_file_path, ai_processed_text, created_at, homeowner_id)
         VALUES (?, ?, ?, ?, ?, ?, ?, 'Active', ?, ?, NOW(), ?)
     ''', (title, description, project_type, location, budget_min, budget_max, timeline, original_file_path, ai_results.get('transcribed_text'), homeowner_id))
+    project_id = cursor.lastrowid
+    geo_location.index_project(cursor, project_id, location, homeowner_result['location'])
+    project_matching.on_project_changed(cursor, project_id)
+    project_facets.on_project_changed(cursor, project_id)
+    if original_file_path:
+        # S3 keys from AI processing are registered here; local files were registered on upload
+        file_registry.attach_reference(cursor, original_file_path, 'project', project_id,
+                                       bucket=file_registry.s3_bucket(ai_results.get('s3_uri')))
     conn.commit()
     cursor.close()
     conn.close()
@@ -3288,33 +3756,22 @@ def view_project(project_id):
     # Add homeowner_user_id for template permission checking
     project['homeowner_user_id'] = project['homeowner_user_id']
     
+    # S3 objects are collected here and signed together with the images below
     audio_url = None
-    if project['original_file_path']:
-        # Check if this is a local file path (starts with 'uploads/')
-        if project['original_file_path'].startswith('uploads/'):
-            # For locally stored files, generate URL using our uploaded_file route
-            import os
+    audio_object = None
+    stored_audio = file_registry.resolve(cursor, project['original_file_path'])
+    if stored_audio and stored_audio['backend'] == 'local' and stored_audio['url_path']:
+        audio_url = url_for('uploaded_file', filename=stored_audio['url_path'])
+    elif stored_audio and stored_audio['backend'] == 's3':
+        audio_object = (stored_audio['bucket'], stored_audio['storage_path'])
+    elif project['original_file_path']:
+        # Projects stored before the file registry: local if under uploads/, else an S3 key
+        if project['original_file_path'].startswith('uploads/') or not s3_client:
             filename = os.path.basename(project['original_file_path'])
             audio_url = url_for('uploaded_file', filename=filename)
-        elif s3_client:
-            # For S3 stored files
-            # Determine the correct bucket based on the file path
-            if (project['original_file_path'].startswith('projects/audios/') or 
-                project['original_file_path'].startswith('projects/audios/new/')):
-                # This is an S3 key for audio files uploaded to homepro0723 bucket
-                bucket_name = 'homepro0723'
-            else:
-                # Use the default configured bucket for other files
-                bucket_name = app.config.get('AWS_S3_BUCKET', 'homepro-uploads')
-            
-            audio_url = s3_client.generate_presigned_url('get_object',
-                Params={'Bucket': bucket_name, 'Key': project['original_file_path']},
-                ExpiresIn=3600)
         else:
-            # Fallback: try to serve as local file
-            import os
-            filename = os.path.basename(project['original_file_path'])
-            audio_url = url_for('uploaded_file', filename=filename)
+            key = project['original_file_path']
+            audio_object = (presigned_urls.bucket_for_key(app.config, key), key)
     
     bids = []
     show_bids = 'user' in session
@@ -3440,6 +3897,25 @@ def view_project(project_id):
     ''', (project_id,))
     project_images = cursor.fetchall()
     
+    stored_images = file_registry.resolve_many(cursor, [image['image_path'] for image in project_images])
+    pictures = image_derivatives.srcsets(cursor, [row['id'] for row in stored_images.values()],
+                                         lambda row: url_for('uploaded_file', filename=row['url_path']))
+    image_objects = {}
+    for image in project_images:
+        stored = stored_images.get(image['image_path'])
+        image['picture'] = pictures.get(stored['id']) if stored else None
+        if stored and stored['backend'] == 's3':
+            image_objects[image['id']] = (stored['bucket'], stored['storage_path'])
+        else:
+            image['url'] = url_for('uploaded_file', filename=image['image_path'])
+    
+    signed_urls = s3_url_cache.urls(list(image_objects.values()) + ([audio_object] if audio_object else []))
+    if audio_object:
+        audio_url = signed_urls.get(audio_object)
+    for image in project_images:
+        if image['id'] in image_objects:
+            image['url'] = signed_urls.get(image_objects[image['id']])
+    
     cursor.close()
     conn.close()
     
@@ -3882,6 +4358,9 @@ def update_project_progress(project_id):
             cursor.execute("UPDATE projects SET status = 'Completed' WHERE id = ?", (project_id,))
         elif progress_percentage > 0:
             cursor.execute("UPDATE projects SET status = 'In Progress' WHERE id = ?", (project_id,))
+        if progress_percentage > 0:
+            project_matching.on_project_changed(cursor, project_id)
+            project_facets.on_project_changed(cursor, project_id)
         
         conn.commit()
         
@@ -3942,6 +4421,8 @@ def complete_project(project_id):
         return jsonify({'success': False, 'message': 'Project must have an accepted bid before it can be completed'}), 400
     
     cursor.execute("UPDATE projects SET status = 'Completed' WHERE id = ?", (project_id,))
+    project_matching.on_project_changed(cursor, project_id)
+    project_facets.on_project_changed(cursor, project_id)
     conn.commit()
     cursor.close()
     conn.close()
@@ -4065,6 +4546,8 @@ def close_project(project_id):
         return redirect(url_for('dashboard'))
     
     cursor.execute("UPDATE projects SET status = 'Closed' WHERE id = ?", (project_id,))
+    project_matching.on_project_changed(cursor, project_id)
+    project_facets.on_project_changed(cursor, project_id)
     conn.commit()
     cursor.close()
     conn.close()
@@ -4074,56 +4557,29 @@ def close_project(project_id):
 
 @app.route('/uploads/<path:filename>')
 def uploaded_file(filename):
-    """Stream uploaded files from the uploads directory or static/uploads"""
-    import os
-    import mimetypes
-    from flask import Response
-    
-    # Try multiple possible paths
-    possible_paths = [
-        os.path.join(app.config['UPLOAD_FOLDER'], filename),  # uploads/filename
-        os.path.join(os.getcwd(), 'static', 'uploads', filename),  # static/uploads/filename
-        os.path.join(os.getcwd(), 'static', filename)  # static/filename (for paths like uploads/projects/filename)
-    ]
+    """Serve uploaded files from the uploads directory or static/uploads (ranges, ETag, sendfile)"""
+    stored = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        stored = file_registry.lookup(cursor, filename)
+        cursor.close()
+        conn.close()
+    except Exception as e:
+        print(f"Error looking up stored file {filename}: {e}")
     
-    file_path = None
-    for path in possible_paths:
-        if os.path.exists(path):
-            file_path = path
-            break
+    if stored:
+        stored_path = file_registry.absolute_path(stored)
+        if os.path.isfile(stored_path) and file_registry.is_served(stored_path):
+            return file_serving.send_local_file(stored_path, mime_type=stored['mime_type'])
     
+    # Files stored before the registry (cleanup_stored_files.py --backfill registers them):
+    # uploads/, static/uploads/ or static/, never outside them
+    file_path = file_registry.served_file(filename)
     if not file_path:
         abort(404)
     
-    # Determine MIME type based on file extension
-    mime_type, _ = mimetypes.guess_type(file_path)
-    if mime_type is None:
-        # Default fallback based on common file extensions
-        ext = filename.lower().split('.')[-1] if '.' in filename else ''
-        if ext in ['jpg', 'jpeg']:
-            mime_type = 'image/jpeg'
-        elif ext == 'png':
-            mime_type = 'image/png'
-        elif ext == 'gif':
-            mime_type = 'image/gif'
-        elif ext == 'webp':
-            mime_type = 'image/webp'
-        elif ext in ['mp3', 'mpeg']:
-            mime_type = 'audio/mpeg'
-        elif ext == 'wav':
-            mime_type = 'audio/wav'
-        elif ext == 'webm':
-            mime_type = 'audio/webm'
-        else:
-            mime_type = 'application/octet-stream'
-    
-    def generate():
-        with open(file_path, "rb") as f:
-            data = f.read(1024)
-            while data:
-                yield data
-                data = f.read(1024)
-    return Response(generate(), mimetype=mime_type)
+    return file_serving.send_local_file(file_path)
 
 # ============================================================================
 # CONTRACTOR MANAGEMENT SYSTEM ROUTES
@@ -4203,6 +4659,11 @@ def complete_simple_onboarding():
             calculate_simple_profile_completion_score(company, location, skills, bio, years_experience),
             user['id']
         ))
+        geo_location.set_contractor_point(cursor, user['id'], location)
+        cursor.execute('SELECT id FROM contractors WHERE user_id = ?', (user['id'],))
+        contractor_result = cursor.fetchone()
+        if contractor_result:
+            project_matching.refresh_contractor(cursor, contractor_result['id'])
         
         conn.commit()
         
@@ -4325,6 +4786,8 @@ def update_contractor_profile():
                 years_experience = ?, business_info = ?, portfolio = ?, hourly_rate = ?
             WHERE id = ?
         ''', (company, location, specialties, bio, years_experience, business_info, portfolio, hourly_rate, contractor_id))
+        geo_location.set_contractor_point(cursor, user['id'], location)
+        project_matching.refresh_contractor(cursor, contractor_id)
         
         conn.commit()
         
@@ -4417,6 +4880,7 @@ def update_contractor_availability():
             VALUES (?, ?, ?, ?)
             ON DUPLICATE KEY UPDATE status = ?, notes = ?, updated_at = CURRENT_TIMESTAMP
         ''', (contractor_id, date_obj, status, notes, status, notes))
+        project_matching.refresh_contractor(cursor, contractor_id)
         
         conn.commit()
         
@@ -4818,6 +5282,8 @@ def create_quote():
         cursor.close()
         conn.close()
         
+        pdf_cache.prerender_quote(document_pdf_cache, pdf_renderer, get_db_connection, quote_id)
+        
         return jsonify({
             'success': True, 
             'message': 'Quote created successfully',
@@ -4865,6 +5331,8 @@ def send_quote(quote_id):
         cursor.close()
         conn.close()
         
+        pdf_cache.prerender_quote(document_pdf_cache, pdf_renderer, get_db_connection, quote_id)
+        
         return jsonify({'success': True, 'message': 'Quote sent successfully'})
         
     except Exception as e:
@@ -4960,6 +5428,8 @@ def delete_quote(quote_id):
         cursor.close()
         conn.close()
         
+        document_pdf_cache.invalidate(f'quote-{quote_id}-')
+        
         return jsonify({'success': True, 'message': 'Quote deleted successfully'})
         
     except Exception as e:
@@ -4968,10 +5438,40 @@ def delete_quote(quote_id):
         conn.close()
         return jsonify({'success': False, 'message': f'Failed to delete quote: {str(e)}'}), 500
 
+def send_document_pdf(template, document, contractor, download_name):
+    """Serve a document PDF from the cache (rendering on a miss), revalidated by ETag"""
+    from flask import send_file
+    from io import BytesIO
+    
+    # The browser's copy is current: skip the cache and the render
+    _, etag = pdf_cache.cache_name(template, document, contractor)
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response
+    
+    pdf, etag, render_seconds = pdf_cache.get_pdf(document_pdf_cache, pdf_renderer, template, document, contractor)
+    response = send_file(pdf if isinstance(pdf, str) else BytesIO(pdf),
+                         mimetype='application/pdf',
+                         as_attachment=True,
+                         download_name=download_name,
+                         etag=etag,
+                         conditional=True,
+                         max_age=None)
+    response.cache_control.public = False
+    response.cache_control.private = True
+    if render_seconds is not None:
+        response.headers['Server-Timing'] = f'render;dur={render_seconds * 1000:.1f}'
+    else:
+        response.headers['Server-Timing'] = 'cache;desc="hit"'
+    return response
+
 @app.route('/api/contractor/quotes/<int:quote_id>/pdf')
 @login_required
 def download_quote_pdf(quote_id):
-    """Generate and download quote PDF"""
+    """Download quote PDF (cached per quote version, revalidated by ETag)"""
     if session['user']['role'] != 'contractor':
         return jsonify({'success': False, 'message': 'Unauthorized'}), 403
     
@@ -4982,32 +5482,14 @@ def download_quote_pdf(quote_id):
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        # Get contractor ID and info
-        cursor.execute('''
-            SELECT c.*, u.first_name, u.last_name, u.email
-            FROM contractors c
-            JOIN users u ON c.user_id = u.id
-            WHERE c.user_id = ?
-        ''', (session['user']['id'],))
+        # Get contractor ID
+        cursor.execute('SELECT id FROM contractors WHERE user_id = ?', (session['user']['id'],))
         contractor = cursor.fetchone()
         if not contractor:
             return jsonify({'success': False, 'message': 'Contractor not found'}), 404
         
         # Get quote details with project and client info
-        cursor.execute('''
-            SELECT q.*, p.title as project_title, p.description as project_description,
-                   p.location as project_location,
-                   CONCAT(u.first_name, ' ', u.last_name) as client_name,
-                   u.email as client_email,
-                   h.location as client_location
-            FROM quotes q
-            JOIN projects p ON q.project_id = p.id
-            JOIN homeowners h ON p.homeowner_id = h.id
-            JOIN users u ON h.user_id = u.id
-            WHERE q.id = ? AND q.contractor_id = ?
-        ''', (quote_id, contractor['id']))
-        quote = cursor.fetchone()
-        
+        quote, contractor = pdf_cache.load_quote(cursor, quote_id, contractor['id'])
         if not quote:
             return jsonify({'success': False, 'message': 'Quote not found'}), 404
         
@@ -5015,278 +5497,7 @@ def download_quote_pdf(quote_id):
         safe_close(cursor, conn)
         cursor, conn = None, None
         
-        # Generate PDF using reportlab
-        from reportlab.lib.pagesizes import letter
-        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image, KeepTogether
-        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-        from reportlab.lib.units import inch
-        from reportlab.lib import colors
-        from io import BytesIO
-        from xml.sax.saxutils import escape
-        import datetime
-
-        def _xml_escape(s):
-            return escape(s or '')
-
-        def _pdf_safe(s):
-            try:
-                return _xml_escape(s).encode('latin-1', 'replace').decode('latin-1')
-            except Exception:
-                return _xml_escape(str(s))
-
-        def _br(s):
-            return _pdf_safe(s).replace('\n', '<br/>')
-        
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=letter, rightMargin=50, leftMargin=50, topMargin=50, bottomMargin=50)
-        
-        # Container for the 'Flowable' objects
-        elements = []
-        styles = getSampleStyleSheet()
-        
-        # Professional color scheme
-        primary_color = colors.HexColor('#2C3E50')  # Dark blue-gray
-        secondary_color = colors.HexColor('#34495E')  # Lighter blue-gray
-        accent_color = colors.HexColor('#3498DB')  # Blue
-        light_gray = colors.HexColor('#ECF0F1')  # Light gray
-        dark_gray = colors.HexColor('#7F8C8D')  # Medium gray
-        
-        # Custom styles for professional document
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=32,
-            spaceAfter=8,
-            alignment=0,  # Left alignment
-            textColor=primary_color,
-            fontName='Helvetica-Bold',
-            letterSpacing=3
-        )
-        
-        subtitle_style = ParagraphStyle(
-            'CustomSubtitle',
-            parent=styles['Normal'],
-            fontSize=16,
-            spaceAfter=30,
-            alignment=0,  # Left alignment
-            textColor=dark_gray,
-            fontName='Helvetica',
-            letterSpacing=2
-        )
-
-        project_title_style = ParagraphStyle(
-            'ProjectTitle',
-            parent=styles['Heading2'],
-            fontSize=16,
-            leading=18,
-            spaceAfter=0,
-            alignment=0,
-            textColor=dark_gray,
-            fontName='Helvetica-Bold'
-        )
-        
-        header_style = ParagraphStyle(
-            'CustomHeader',
-            parent=styles['Heading2'],
-            fontSize=12,
-            spaceAfter=8,
-            spaceBefore=15,
-            textColor=secondary_color,
-            fontName='Helvetica-Bold',
-            letterSpacing=1
-        )
-        
-        info_style = ParagraphStyle(
-            'InfoStyle',
-            parent=styles['Normal'],
-            fontSize=11,
-            spaceAfter=6,
-            textColor=primary_color,
-            fontName='Helvetica'
-        )
-        
-        bold_info_style = ParagraphStyle(
-            'BoldInfoStyle',
-            parent=styles['Normal'],
-            fontSize=11,
-            spaceAfter=6,
-            textColor=primary_color,
-            fontName='Helvetica-Bold'
-        )
-        
-        # Professional header with logo placeholder and title
-        # Compose left header with big 'Quote' and a separate, smaller project title below
-        left_header = KeepTogether([
-            Paragraph('<b>Quote</b>', title_style),
-            Spacer(1, 2),
-            Paragraph(_br(quote['project_title']), project_title_style),
-        ])
-
-        header_data = [[
-            left_header,
-            Paragraph('<b>Your Company</b><br/><font size="10">LOGO HERE</font>', ParagraphStyle(
-                'LogoStyle',
-                parent=styles['Normal'],
-                fontSize=20,
-                alignment=2,  # Right alignment
-                textColor=dark_gray,
-                fontName='Helvetica-Bold'
-            ))
-        ]]
-        
-        header_table = Table(header_data, colWidths=[4*inch, 3*inch])
-        header_table.setStyle(TableStyle([
-            ('ALIGN', (0, 0), (0, 0), 'LEFT'),
-            ('ALIGN', (1, 0), (1, 0), 'RIGHT'),
-            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 20),
-        ]))
-        elements.append(header_table)
-        elements.append(Spacer(1, 20))
-        
-        # Client and Business Information Section
-        client_info = f"""
-        <b>CLIENT NAME INFORMATION:</b><br/><br/>
-        Client Name: {_pdf_safe(quote['client_name'])}<br/><br/>
-        Address: {_pdf_safe((quote['client_location'] or quote['project_location']))}<br/><br/>
-        Phone: ___________________________
-        """
-        
-        business_info = f"""
-        <b>YOUR BUSINESS NAME HERE</b><br/><br/>
-        Company Address Here<br/>
-        City, Province/State<br/>
-        Phone: 555-555-5555<br/>
-        www.yourbusinessnamehere.com
-        """
-        
-        info_data = [[
-            Paragraph(client_info, info_style),
-            Paragraph(business_info, info_style)
-        ]]
-        
-        info_table = Table(info_data, colWidths=[3.5*inch, 3.5*inch])
-        info_table.setStyle(TableStyle([
-            ('ALIGN', (0, 0), (0, 0), 'LEFT'),
-            ('ALIGN', (1, 0), (1, 0), 'RIGHT'),
-            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 20),
-        ]))
-        elements.append(info_table)
-        elements.append(Spacer(1, 30))
-        
-        # Professional Service Details Table
-        service_data = [
-            ['SERVICE', 'PRICE', 'QTY', 'TOTAL'],
-            ['ITEM ONE', '$1000.00', '1', '$1000.00'],
-            ['ITEM TWO', '$1000.00', '1', '$1000.00'],
-            ['ITEM THREE', '$1000.00', '1', '$1000.00'],
-            ['ITEM FOUR', '$1000.00', '1', '$1000.00'],
-            ['ITEM FIVE', '$1000.00', '1', '$1000.00']
-        ]
-        
-        service_table = Table(service_data, colWidths=[2.8*inch, 1.3*inch, 0.7*inch, 1.2*inch])
-        service_table.setStyle(TableStyle([
-            # Header row styling
-            ('BACKGROUND', (0, 0), (-1, 0), secondary_color),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 11),
-            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-            
-            # Data rows styling
-            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 1), (-1, -1), 10),
-            ('ALIGN', (0, 1), (0, -1), 'LEFT'),  # Service column left-aligned
-            ('ALIGN', (1, 1), (-1, -1), 'CENTER'),  # Price, Qty, Total centered
-            
-            # Table styling
-            ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#BDC3C7')),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('TOPPADDING', (0, 0), (-1, -1), 12),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-            ('LEFTPADDING', (0, 0), (-1, -1), 8),
-            ('RIGHTPADDING', (0, 0), (-1, -1), 8),
-            
-            # Alternating row colors
-            ('BACKGROUND', (0, 1), (-1, 1), light_gray),
-            ('BACKGROUND', (0, 3), (-1, 3), light_gray),
-            ('BACKGROUND', (0, 5), (-1, 5), light_gray),
-        ]))
-        elements.append(service_table)
-        elements.append(Spacer(1, 25))
-        
-        # Quote details and totals section
-        quote_details_data = [[
-            Paragraph(f'Quote Number: ___________________________<br/><br/>Quote Prepared By: ___________________________<br/><br/>Quote Date: ___________________________<br/><br/>Valid Until Date: ___________________________', info_style),
-            Paragraph('SUBTOTAL<br/>TAXES<br/>TOTAL', bold_info_style)
-        ]]
-        
-        quote_details_table = Table(quote_details_data, colWidths=[3*inch, 2*inch])
-        quote_details_table.setStyle(TableStyle([
-            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-            ('ALIGN', (0, 0), (0, 0), 'LEFT'),
-            ('ALIGN', (1, 0), (1, 0), 'RIGHT'),
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('LEFTPADDING', (0, 0), (-1, -1), 0),
-            ('RIGHTPADDING', (0, 0), (-1, -1), 0),
-        ]))
-        elements.append(quote_details_table)
-        elements.append(Spacer(1, 30))
-        
-        # Additional notes
-        if quote['notes']:
-            elements.append(Paragraph('ADDITIONAL NOTES:', header_style))
-            elements.append(Paragraph(_br(quote['notes']), styles['Normal']))
-            elements.append(Spacer(1, 20))
-        
-        # Terms and Conditions
-        elements.append(Paragraph('TERMS AND CONDITIONS:', header_style))
-        terms_text = """
-        1. This quotation is valid for the period specified above and subject to acceptance within that timeframe.<br/>
-        2. All work will be performed in accordance with industry standards and applicable building codes.<br/>
-        3. Payment terms: 50% deposit required upon acceptance, balance due upon completion.<br/>
-        4. Any changes to the scope of work may result in additional charges.<br/>
-        5. Contractor is licensed and insured. Proof of insurance available upon request.<br/>
-        6. This quotation does not constitute a contract until formally accepted by both parties.
-        """
-        elements.append(Paragraph(terms_text, styles['Normal']))
-        elements.append(Spacer(1, 20))
-        
-        # Professional footer
-        elements.append(Spacer(1, 20))
-        footer_style = ParagraphStyle(
-            'Footer',
-            parent=styles['Normal'],
-            fontSize=10,
-            alignment=1,  # Center alignment
-            textColor=colors.HexColor('#666666')
-        )
-        footer_text = "Thank you for considering our professional services. We look forward to working with you."
-        elements.append(Paragraph(footer_text, footer_style))
-        
-        # Build PDF with page numbers and fail-safe canvas ops
-        def _add_page_number(canvas, doc):
-            canvas.saveState()
-            canvas.setFont('Helvetica', 9)
-            page_num_text = f"Page {canvas.getPageNumber()}"
-            canvas.drawRightString(LETTER[0] - 50, 30, page_num_text) if False else None
-            canvas.restoreState()
-        
-        doc.build(elements)
-        
-        # Get PDF data
-        buffer.seek(0)
-        pdf_data = buffer.getvalue()
-        buffer.close()
-        
-        # Return PDF as download
-        from flask import make_response
-        response = make_response(pdf_data)
-        response.headers['Content-Type'] = 'application/pdf'
-        response.headers['Content-Disposition'] = f'attachment; filename=quote_{quote["quote_number"]}.pdf'
-        return response
+        return send_document_pdf('quote', quote, contractor, f'quote_{quote["quote_number"]}.pdf')
         
     except Exception as e:
         # Log full traceback for debugging
@@ -5298,6 +5509,108 @@ def download_quote_pdf(quote_id):
         safe_close(cursor, conn)
         return jsonify({'success': False, 'message': f'Failed to generate PDF: {str(e)}'}), 500
 
+@app.route('/api/contractor/invoices/<int:invoice_id>/pdf')
+@login_required
+def download_invoice_pdf(invoice_id):
+    """Download invoice PDF (cached per invoice version, revalidated by ETag)"""
+    if session['user']['role'] != 'contractor':
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+    
+    conn = None
+    cursor = None
+    
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        
+        # Get contractor ID
+        cursor.execute('SELECT id FROM contractors WHERE user_id = ?', (session['user']['id'],))
+        contractor = cursor.fetchone()
+        if not contractor:
+            return jsonify({'success': False, 'message': 'Contractor not found'}), 404
+        
+        invoice, contractor = pdf_cache.load_invoice(cursor, invoice_id, contractor['id'])
+        if not invoice:
+            return jsonify({'success': False, 'message': 'Invoice not found'}), 404
+        
+        safe_close(cursor, conn)
+        cursor, conn = None, None
+        
+        return send_document_pdf('invoice', invoice, contractor, f'invoice_{invoice["invoice_number"]}.pdf')
+        
+    except Exception as e:
+        print(f"Error generating invoice PDF: {e}")
+        safe_close(cursor, conn)
+        return jsonify({'success': False, 'message': f'Failed to generate PDF: {str(e)}'}), 500
+
+@app.route('/api/contractor/invoices/pdf_batch')
+@login_required
+def download_invoice_pdf_batch():
+    """Download all of a month's invoices (?month=YYYY-MM) as one zip of PDFs"""
+    if session['user']['role'] != 'contractor':
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+    
+    try:
+        month = datetime.strptime(request.args.get('month', ''), '%Y-%m')
+    except ValueError:
+        return jsonify({'success': False, 'message': 'month must be YYYY-MM'}), 400
+    
+    conn = None
+    cursor = None
+    
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        
+        # Get contractor ID
+        cursor.execute('SELECT id FROM contractors WHERE user_id = ?', (session['user']['id'],))
+        contractor = cursor.fetchone()
+        if not contractor:
+            return jsonify({'success': False, 'message': 'Contractor not found'}), 404
+        
+        invoices = pdf_cache.load_invoices_for_month(cursor, contractor['id'], month.year, month.month)
+        contractor = pdf_cache.load_contractor(cursor, contractor['id'])
+        safe_close(cursor, conn)
+        cursor, conn = None, None
+        
+        if not invoices:
+            return jsonify({'success': False, 'message': 'No invoices in that month'}), 404
+        
+        import tempfile
+        import zipfile
+        from flask import send_file
+        
+        pdfs = pdf_cache.get_pdfs(document_pdf_cache, pdf_renderer, 'invoice', invoices, contractor)
+        
+        # PDF streams are already compressed, so store them as-is
+        archive = tempfile.SpooledTemporaryFile(max_size=32 * 1024 * 1024)
+        with zipfile.ZipFile(archive, 'w', zipfile.ZIP_STORED) as bundle:
+            for invoice, pdf, _ in pdfs:
+                name = f'invoice_{invoice["invoice_number"]}.pdf'
+                if isinstance(pdf, str):
+                    bundle.write(pdf, name)
+                else:
+                    bundle.writestr(name, pdf)
+        archive.seek(0)
+        
+        response = send_file(archive,
+                             mimetype='application/zip',
+                             as_attachment=True,
+                             download_name=f'invoices_{month.strftime("%Y-%m")}.zip',
+                             max_age=None)
+        response.cache_control.public = False
+        response.cache_control.private = True
+        # Render time per document (cache hits are omitted)
+        response.headers['Server-Timing'] = ', '.join(
+            f'invoice-{invoice["id"]};dur={seconds * 1000:.1f}' for invoice, _, seconds in pdfs if seconds is not None
+        ) or 'cache;desc="hit"'
+        return response
+        
+    except Exception as e:
+        print(f"Error generating invoice PDF batch: {e}")
+        safe_close(cursor, conn)
+        return jsonify({'success': False, 'message': f'Failed to generate PDFs: {str(e)}'}), 500
+
 # ============================================================================
 # ADMIN PORTAL ROUTES
 # ============================================================================
@@ -5305,50 +5618,18 @@ def download_quote_pdf(quote_id):
 @app.route('/admin')
 @admin_required
 def admin_dashboard():
-    """Admin Dashboard Overview with real-time platform statistics"""
+    """Admin Dashboard Overview with platform statistics"""
     user = session['user']
     admin_level = get_admin_level(user['id'])
     
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    # Get platform statistics
-    stats = {}
-    
-    # User statistics
-    cursor.execute('SELECT COUNT(*) as total_users FROM users')
-    stats['total_users'] = cursor.fetchone()['total_users']
-    
-    cursor.execute('SELECT COUNT(*) as total_homeowners FROM homeowners')
-    stats['total_homeowners'] = cursor.fetchone()['total_homeowners']
-    
-    cursor.execute('SELECT COUNT(*) as total_contractors FROM contractors')
-    stats['total_contractors'] = cursor.fetchone()['total_contractors']
-    
-    # Project statistics
-    cursor.execute('SELECT COUNT(*) as total_projects FROM projects')
-    stats['total_projects'] = cursor.fetchone()['total_projects']
-    
-    cursor.execute("SELECT COUNT(*) as active_projects FROM projects WHERE status = 'Active'")
-    stats['active_projects'] = cursor.fetchone()['active_projects']
-    
-    cursor.execute("SELECT COUNT(*) as completed_projects FROM projects WHERE status = 'Completed'")
-    stats['completed_projects'] = cursor.fetchone()['completed_projects']
-    
-    # Bid statistics
-    cursor.execute('SELECT COUNT(*) as total_bids FROM bids')
-    stats['total_bids'] = cursor.fetchone()['total_bids']
-    
-    cursor.execute("SELECT COUNT(*) as pending_bids FROM bids WHERE status = 'Submitted'")
-    stats['pending_bids'] = cursor.fetchone()['pending_bids']
-    
-    cursor.execute("SELECT COUNT(*) as accepted_bids FROM bids WHERE status = 'Accepted'")
-    stats['accepted_bids'] = cursor.fetchone()['accepted_bids']
-    
-    # Revenue statistics (mock data for now)
-    cursor.execute('SELECT SUM(amount) as total_bid_value FROM bids WHERE status = "Accepted"')
-    result = cursor.fetchone()
-    stats['total_revenue'] = result['total_bid_value'] if result['total_bid_value'] else 0
+    # Platform statistics from the analytics rollups (refreshed by refresh_admin_rollups.py)
+    # Stale figures are shown with a warning; refreshing them here could take minutes
+    stats = admin_rollups.get_dashboard_stats(cursor)
+    rollups_stale = admin_rollups.is_stale(stats['refreshed_at'], app.config.get('ADMIN_ROLLUP_MAX_AGE_SECONDS',
+                                                                                 admin_rollups.STALE_AFTER_SECONDS))
     
     # Recent activity
     cursor.execute('''
@@ -5370,21 +5651,13 @@ def admin_dashboard():
     ''')
     recent_projects = cursor.fetchall()
     
-    # Pending verifications
+    # Review queues stay live so admins never act on a stale backlog
     cursor.execute('''
-        SELECT COUNT(*) as pending_verifications 
-        FROM user_verification 
-        WHERE status = 'pending'
+        SELECT
+            (SELECT COUNT(*) FROM user_verification WHERE status = 'pending') as pending_verifications,
+            (SELECT COUNT(*) FROM content_moderation WHERE status = 'pending') as pending_moderation
     ''')
-    stats['pending_verifications'] = cursor.fetchone()['pending_verifications']
-    
-    # Pending content moderation
-    cursor.execute('''
-        SELECT COUNT(*) as pending_moderation 
-        FROM content_moderation 
-        WHERE status = 'pending'
-    ''')
-    stats['pending_moderation'] = cursor.fetchone()['pending_moderation']
+    stats.update(cursor.fetchone())
     
     cursor.close()
     conn.close()
@@ -5394,6 +5667,7 @@ def admin_dashboard():
     
     return render_template('admin/dashboard.html', 
                          stats=stats, 
+                         rollups_stale=rollups_stale,
                          recent_users=recent_users,
                          recent_projects=recent_projects,
                          admin_level=admin_level)
@@ -5411,20 +5685,8 @@ def admin_users():
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    # Build query with filters
-    where_conditions = []
-    params = []
-    
-    if search:
-        where_conditions.append('(u.first_name LIKE ? OR u.last_name LIKE ? OR u.email LIKE ?)')
-        search_param = f'%{search}%'
-        params.extend([search_param, search_param, search_param])
-    
-    if role_filter:
-        where_conditions.append('u.role = ?')
-        params.append(role_filter)
-    
-    where_clause = 'WHERE ' + ' AND '.join(where_conditions) if where_conditions else ''
+    # Build query with filters (shared with the user export)
+    where_clause, params = admin_export.user_filters(request.args, '?')
     
     # Get total count
     cursor.execute(f'SELECT COUNT(*) as total FROM users u {where_clause}', params)
@@ -5480,19 +5742,8 @@ def admin_projects():
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    # Build query with filters
-    where_conditions = []
-    params = []
-    
-    if status_filter:
-        where_conditions.append('p.status = ?')
-        params.append(status_filter)
-    
-    if project_type_filter:
-        where_conditions.append('p.project_type = ?')
-        params.append(project_type_filter)
-    
-    where_clause = 'WHERE ' + ' AND '.join(where_conditions) if where_conditions else ''
+    # Build query with filters (shared with the project export)
+    where_clause, params = admin_export.project_filters(request.args, '?')
     
     # Get total count
     cursor.execute(f'SELECT COUNT(*) as total FROM projects p {where_clause}', params)
@@ -5541,83 +5792,10 @@ def admin_analytics():
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    # User engagement analytics
-    cursor.execute('''
-        SELECT 
-            DATE(created_at) as date,
-            COUNT(*) as new_users
-        FROM users 
-        WHERE created_at >= DATE_SUB(NOW(), INTERVAL 30 DAY)
-        GROUP BY DATE(created_at)
-        ORDER BY date DESC
-    ''')
-    user_growth = cursor.fetchall()
-    
-    # Project success rate metrics
-    cursor.execute('''
-        SELECT 
-            p.status,
-            COUNT(*) as count,
-            ROUND(COUNT(*) * 100.0 / (SELECT COUNT(*) FROM projects), 2) as percentage
-        FROM projects p
-        GROUP BY p.status
-    ''')
-    project_status_distribution = cursor.fetchall()
-    
-    # Contractor performance analytics
-    cursor.execute('''
-        SELECT 
-            CONCAT(u.first_name, ' ', u.last_name) as contractor_name,
-            c.company,
-            COUNT(b.id) as total_bids,
-            COUNT(CASE WHEN b.status = 'Accepted' THEN 1 END) as accepted_bids,
-            ROUND(COUNT(CASE WHEN b.status = 'Accepted' THEN 1 END) * 100.0 / COUNT(b.id), 2) as success_rate,
-            AVG(b.amount) as avg_bid_amount
-        FROM contractors c
-        JOIN users u ON c.user_id = u.id
-        LEFT JOIN bids b ON c.id = b.contractor_id
-        GROUP BY c.id, u.first_name, u.last_name, c.company
-        HAVING COUNT(b.id) > 0
-        ORDER BY success_rate DESC, total_bids DESC
-        LIMIT 20
-    ''')
-    contractor_performance = cursor.fetchall()
-    
-    # Revenue tracking
-    cursor.execute('''
-        SELECT 
-            DATE_FORMAT(b.created_at, '%Y-%m') as month,
-            SUM(CASE WHEN b.status = 'Accepted' THEN b.amount ELSE 0 END) as revenue,
-            COUNT(CASE WHEN b.status = 'Accepted' THEN 1 END) as completed_projects
-        FROM bids b
-        WHERE b.created_at >= DATE_SUB(NOW(), INTERVAL 12 MONTH)
-        GROUP BY DATE_FORMAT(b.created_at, '%Y-%m')
-        ORDER BY month DESC
-    ''')
-    revenue_trends = cursor.fetchall()
-    
-    # Geographic distribution
-    cursor.execute('''
-        SELECT 
-            COALESCE(h.location, 'Unknown') as location,
-            COUNT(*) as homeowner_count
-        FROM homeowners h
-        GROUP BY h.location
-        ORDER BY homeowner_count DESC
-        LIMIT 10
-    ''')
-    homeowner_distribution = cursor.fetchall()
-    
-    cursor.execute('''
-        SELECT 
-            COALESCE(c.location, 'Unknown') as location,
-            COUNT(*) as contractor_count
-        FROM contractors c
-        GROUP BY c.location
-        ORDER BY contractor_count DESC
-        LIMIT 10
-    ''')
-    contractor_distribution = cursor.fetchall()
+    # Read the analytics rollups (refreshed by refresh_admin_rollups.py)
+    analytics = admin_rollups.get_analytics(cursor)
+    rollups_stale = admin_rollups.is_stale(analytics['refreshed_at'], app.config.get('ADMIN_ROLLUP_MAX_AGE_SECONDS',
+                                                                                     admin_rollups.STALE_AFTER_SECONDS))
     
     cursor.close()
     conn.close()
@@ -5625,13 +5803,101 @@ def admin_analytics():
     # Log admin activity
     log_admin_activity(user['id'], 'Viewed Analytics Dashboard', 'system')
     
-    return render_template('admin/analytics.html',
-                         user_growth=user_growth,
-                         project_status_distribution=project_status_distribution,
-                         contractor_performance=contractor_performance,
-                         revenue_trends=revenue_trends,
-                         homeowner_distribution=homeowner_distribution,
-                         contractor_distribution=contractor_distribution)
+    return render_template('admin/analytics.html', rollups_stale=rollups_stale, **analytics)
+
+@app.route('/admin/export/<kind>')
+@admin_required
+def admin_export_data(kind):
+    """Stream users, projects or bids as CSV or NDJSON, honouring the list filters"""
+    from flask import Response, stream_with_context
+    export_format = request.args.get('format', 'csv')
+    if kind not in admin_export.EXPORTS or export_format not in admin_export.FORMATS:
+        abort(404)
+    
+    log_admin_activity(session['user']['id'], f'Exported {kind}', 'system',
+                       details={'format': export_format, 'filters': request.args.to_dict()})
+    
+    filename = f"homepro_{kind}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format}"
+    response = Response(stream_with_context(admin_export.stream(get_db_connection, kind, export_format, request.args.to_dict())),
+                        mimetype=admin_export.FORMATS[export_format])
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/admin/api/export_stats')
+@admin_required
+def admin_export_stats():
+    """Row counts and throughput of this worker's recent exports"""
+    return jsonify({'success': True, 'exports': admin_export.recent_exports()})
+
+@app.route('/admin/api/audit_log_stats')
+@admin_required
+def admin_audit_log_stats():
+    """Queue depth and write/drop counters of this worker's audit log writer"""
+    return jsonify({'success': True, 'stats': admin_audit_log.stats()})
+
+@app.route('/admin/api/pdf_render_stats')
+@admin_required
+def admin_pdf_render_stats():
+    """Per-document render times and PDF cache counters of this worker"""
+    return jsonify({'success': True, 'renders': pdf_renderer.stats(), 'cache': document_pdf_cache.stats()})
+
+@app.route('/admin/api/image_derivative_stats')
+@admin_required
+def admin_image_derivative_stats():
+    """Image derivative jobs of this worker"""
+    return jsonify({'success': True, 'pipeline': image_pipeline.stats()})
+
+@app.route('/admin/api/presigned_url_stats')
+@admin_required
+def admin_presigned_url_stats():
+    """Presigned S3 URL cache counters of this worker"""
+    return jsonify({'success': True, 'cache': s3_url_cache.stats()})
+
+@app.route('/admin/api/geocode_stats')
+@admin_required
+def admin_geocode_stats():
+    """Gazetteer size and the locations this worker could not geocode"""
+    return jsonify({'success': True, 'geocode': geo_location.stats()})
+
+@app.route('/admin/api/aws_client_stats')
+@admin_required
+def admin_aws_client_stats():
+    """AWS clients built by this worker and how long each took"""
+    return jsonify({'success': True, 'aws': aws.stats()})
+
+@app.route('/admin/api/ai_async_stats')
+@admin_required
+def admin_ai_async_stats():
+    """Jobs of this worker's async AI event loop, and its job status store"""
+    return jsonify({'success': True, 'ai_async': ai_runner.stats(), 'job_status': ai_jobs.stats()})
+
+@app.route('/admin/api/ai_admission_stats')
+@admin_required
+def admin_ai_admission_stats():
+    """Running jobs, queue depth and rejections of this worker's AI admission pools"""
+    return jsonify({
+        'success': True,
+        'blocking': ai_admission.stats(),
+        'async': ai_async_admission.stats()
+    })
+
+@app.route('/admin/api/request_budget_stats')
+@admin_required
+def admin_request_budget_stats():
+    """Requests of this worker by timeout class, and those over budget"""
+    budgets = app.extensions.get('request_budgets')
+    if budgets is None:
+        return jsonify({'success': True, 'message': 'Request budgets are installed by gunicorn_config'})
+    return jsonify({'success': True, 'budgets': budgets.stats()})
+
+@app.route('/admin/api/session_stats')
+@admin_required
+def admin_session_stats():
+    """Server-side session store counters of this worker"""
+    if not isinstance(app.session_interface, server_sessions.ServerSessionInterface):
+        return jsonify({'success': True, 'backend': 'cookie'})
+    return jsonify({'success': True, 'sessions': app.session_interface.stats()})
 
 @app.route('/admin/moderation')
 @admin_required
@@ -5719,6 +5985,10 @@ def admin_toggle_user_status(user_id):
     # For now, we'll use a simple approach since we don't have an 'active' column
     # In a production system, you'd add an 'is_active' column to the users table
     
+    # A deactivated user is signed out everywhere
+    if action == 'deactivate' and isinstance(app.session_interface, server_sessions.ServerSessionInterface):
+        app.session_interface.revoke_user(user_id)
+    
     # Log the action
     log_admin_activity(admin_user['id'], f'User {action.title()}', 'user', user_id, {
         'target_user_email': user['email'],
@@ -5807,6 +6077,10 @@ register_dispute_routes(app, get_db_connection, login_required)
 from completion_routes import register_completion_routes
 register_completion_routes(app, get_db_connection, login_required)
 
+# Import and register resumable upload routes
+from upload_routes import register_upload_routes
+register_upload_routes(app, get_db_connection, login_required, resumable_upload_store)
+
 if __name__ == '__main__':
     # Startup health check: ensure MySQL is reachable before proceeding
     try:
@@ -5,7 +5,6 @@ Handles audio transcription and intelligent project detail extraction
 
 import os
 import json
-import boto3
 import time
 from datetime import datetime
 from botocore.exceptions import ClientError, NoCredentialsError
@@ -13,10 +12,61 @@ from pydub import AudioSegment
 import tempfile
 import uuid
 
+import aws_clients
+
+# STS caller identity per region, checked once per process rather than per request
+_verified_identities = {}
+
+# Bedrock models tried in order of preference (newest and most capable first)
+BEDROCK_MODELS = [
+    {
+        "id": "us.anthropic.claude-3-5-sonnet-20241022-v2:0",
+        "name": "Claude 3.5 Sonnet v2",
+        "type": "anthropic",
+        "priority": "highest"
+    },
+    {
+        "id": "us.anthropic.claude-3-5-sonnet-20240620-v1:0",
+        "name": "Claude 3.5 Sonnet",
+        "type": "anthropic",
+        "priority": "highest"
+    },
+    {
+        "id": "anthropic.claude-3-sonnet-20240229-v1:0",
+        "name": "Claude 3 Sonnet",
+        "type": "anthropic",
+        "priority": "high"
+    },
+    {
+        "id": "anthropic.claude-3-haiku-20240307-v1:0", 
+        "name": "Claude 3 Haiku",
+        "type": "anthropic",
+        "priority": "medium"
+    },
+    {
+        "id": "anthropic.claude-v2:1",
+        "name": "Claude v2.1",
+        "type": "anthropic",
+        "priority": "low"
+    },
+    {
+        "id": "anthropic.claude-v2",
+        "name": "Claude v2",
+        "type": "anthropic",
+        "priority": "low"
+    },
+    {
+        "id": "amazon.titan-text-express-v1",
+        "name": "Amazon Titan Text Express",
+        "type": "amazon",
+        "priority": "fallback"
+    }
+]
+
 class AudioProcessor:
-    def __init__(self, aws_region='us-east-1', s3_bucket='homepro0723'):
+    def __init__(self, aws_region='us-east-1', s3_bucket=None):
         self.aws_region = aws_region
-        self.s3_bucket = s3_bucket
+        self.s3_bucket = s3_bucket or os.environ.get('AWS_AUDIO_BUCKET', 'homepro0723')
         self.aws_available = False
         
         # Initialize logging
@@ -31,31 +81,29 @@ class AudioProcessor:
         
         self.logger.info("🎵 Initializing AudioProcessor...")
         
-        # Initialize AWS clients
+        # Initialize AWS clients (shared by every processor in this process, see aws_clients)
+        first_check = self.aws_region not in _verified_identities
         try:
-            self.logger.info("🔑 Checking AWS credentials...")
-            self.session = boto3.Session()
-            credentials = self.session.get_credentials()
-            
-            if credentials is None:
+            clients = aws_clients.shared(self.aws_region)
+            if not clients.available():
                 self.logger.warning("❌ No AWS credentials found")
                 raise NoCredentialsError()
             
-            self.logger.info("✅ AWS credentials found, testing access...")
-            
             # Test credentials
-            sts_client = boto3.client('sts')
-            identity = sts_client.get_caller_identity()
-            self.logger.info(f"✅ AWS credentials validated - Account: {identity.get('Account', 'Unknown')}")
+            if first_check:
+                self.logger.info("✅ AWS credentials found, testing access...")
+                _verified_identities[self.aws_region] = clients.verify()
+                identity = _verified_identities[self.aws_region]
+                self.logger.info(f"✅ AWS credentials validated - Account: {identity.get('Account', 'Unknown')}")
             
-            # Initialize clients
-            self.s3_client = boto3.client('s3', region_name=self.aws_region)
-            self.transcribe_client = boto3.client('transcribe', region_name=self.aws_region)
-            self.bedrock_client = boto3.client('bedrock-runtime', region_name=self.aws_region)
+            self.s3_client = clients.client('s3')
+            self.transcribe_client = clients.client('transcribe')
+            self.bedrock_client = clients.client('bedrock-runtime')
             
             self.aws_available = True
-            self.logger.info("🚀 AWS Bedrock Audio Processor initialized successfully")
-            self.logger.info(f"📍 Region: {self.aws_region}, S3 Bucket: {self.s3_bucket}")
+            if first_check:
+                self.logger.info("🚀 AWS Bedrock Audio Processor initialized successfully")
+                self.logger.info(f"📍 Region: {self.aws_region}, S3 Bucket: {self.s3_bucket}")
             
         except Exception as e:
             self.logger.error(f"❌ AWS initialization failed: {e}")
@@ -63,13 +111,13 @@ class AudioProcessor:
             self.aws_available = False
             
         # Log available Bedrock models for debugging
-        if self.aws_available:
+        if self.aws_available and first_check:
             self._log_available_bedrock_models()
     
     def _log_available_bedrock_models(self):
         """Log available Bedrock models for debugging"""
         try:
-            bedrock_client = boto3.client('bedrock', region_name=self.aws_region)
+            bedrock_client = aws_clients.shared(self.aws_region).client('bedrock')
             response = bedrock_client.list_foundation_models()
             
             available_models = []
@@ -161,33 +209,7 @@ class AudioProcessor:
             if job_name is None:
                 job_name = f"transcribe_job_{uuid.uuid4().hex}"
             
-            # Enhanced transcription settings for home improvement projects
-            transcribe_settings = {
-                'ShowSpeakerLabels': True,
-                'MaxSpeakerLabels': 3,  # Support up to 3 speakers
-                'ShowAlternatives': True,
-                'MaxAlternatives': 2,
-                'VocabularyFilterMethod': 'remove',  # Remove profanity
-                'ChannelIdentification': False
-            }
-            
-            # Create custom vocabulary for home improvement terms
-            custom_vocabulary = self._get_home_improvement_vocabulary()
-            
-            # Start transcription job with enhanced settings
-            transcribe_params = {
-                'TranscriptionJobName': job_name,
-                'Media': {'MediaFileUri': s3_uri},
-                'MediaFormat': self._detect_media_format(s3_uri),
-                'LanguageCode': 'en-US',
-                'Settings': transcribe_settings
-            }
-            
-            # Add custom vocabulary if available
-            if custom_vocabulary:
-                transcribe_params['Settings']['VocabularyName'] = custom_vocabulary
-            
-            response = self.transcribe_client.start_transcription_job(**transcribe_params)
+            response = self.transcribe_client.start_transcription_job(**self.transcription_params(s3_uri, job_name))
             
             self.logger.info(f"🚀 AWS Transcription job started: {job_name}")
             
@@ -238,6 +260,36 @@ class AudioProcessor:
             self.logger.warning("⚠️  Falling back to filename-based mock transcription")
             return self._mock_transcription(original_file_path)
     
+    def transcription_params(self, s3_uri, job_name):
+        """Arguments of start_transcription_job for an uploaded recording"""
+        # Enhanced transcription settings for home improvement projects
+        transcribe_settings = {
+            'ShowSpeakerLabels': True,
+            'MaxSpeakerLabels': 3,  # Support up to 3 speakers
+            'ShowAlternatives': True,
+            'MaxAlternatives': 2,
+            'VocabularyFilterMethod': 'remove',  # Remove profanity
+            'ChannelIdentification': False
+        }
+        
+        # Create custom vocabulary for home improvement terms
+        custom_vocabulary = self._get_home_improvement_vocabulary()
+        
+        # Start transcription job with enhanced settings
+        transcribe_params = {
+            'TranscriptionJobName': job_name,
+            'Media': {'MediaFileUri': s3_uri},
+            'MediaFormat': self._detect_media_format(s3_uri),
+            'LanguageCode': 'en-US',
+            'Settings': transcribe_settings
+        }
+        
+        # Add custom vocabulary if available
+        if custom_vocabulary:
+            transcribe_params['Settings']['VocabularyName'] = custom_vocabulary
+        
+        return transcribe_params
+    
     def _download_transcript(self, transcript_uri):
         """Download and parse transcript from S3"""
         try:
@@ -363,51 +415,7 @@ class AudioProcessor:
         
         self.logger.info("🤖 Using AWS Bedrock for project detail extraction")
         
-        # List of models to try in order of preference (newest and most capable first)
-        models_to_try = [
-            {
-                "id": "us.anthropic.claude-3-5-sonnet-20241022-v2:0",
-                "name": "Claude 3.5 Sonnet v2",
-                "type": "anthropic",
-                "priority": "highest"
-            },
-            {
-                "id": "us.anthropic.claude-3-5-sonnet-20240620-v1:0",
-                "name": "Claude 3.5 Sonnet",
-                "type": "anthropic",
-                "priority": "highest"
-            },
-            {
-                "id": "anthropic.claude-3-sonnet-20240229-v1:0",
-                "name": "Claude 3 Sonnet",
-                "type": "anthropic",
-                "priority": "high"
-            },
-            {
-                "id": "anthropic.claude-3-haiku-20240307-v1:0", 
-                "name": "Claude 3 Haiku",
-                "type": "anthropic",
-                "priority": "medium"
-            },
-            {
-                "id": "anthropic.claude-v2:1",
-                "name": "Claude v2.1",
-                "type": "anthropic",
-                "priority": "low"
-            },
-            {
-                "id": "anthropic.claude-v2",
-                "name": "Claude v2",
-                "type": "anthropic",
-                "priority": "low"
-            },
-            {
-                "id": "amazon.titan-text-express-v1",
-                "name": "Amazon Titan Text Express",
-                "type": "amazon",
-                "priority": "fallback"
-            }
-        ]
+        models_to_try = BEDROCK_MODELS
         
         access_denied_count = 0
         other_errors = []
@@ -430,8 +438,12 @@ class AudioProcessor:
                     self.logger.warning(f"❌ Model {model['name']} failed: {e}")
                 continue
         
+        return self.bedrock_fallback(transcript_text, access_denied_count, len(models_to_try), other_errors)
+    
+    def bedrock_fallback(self, transcript_text, access_denied_count, models_tried, other_errors):
+        """Log why no Bedrock model answered and extract the details without Bedrock"""
         # Provide helpful guidance based on error types
-        if access_denied_count == len(models_to_try):
+        if access_denied_count == models_tried:
             self.logger.error("🚫 All Bedrock models are not enabled in your AWS account!")
             self.logger.error("📋 To enable Bedrock models:")
             self.logger.error("   1. Go to AWS Bedrock Console")
@@ -440,7 +452,7 @@ class AudioProcessor:
             self.logger.error("   4. Optionally enable Claude models (may require approval)")
             self.logger.error("   5. See BEDROCK_SETUP_GUIDE.md for detailed instructions")
         elif access_denied_count > 0:
-            self.logger.warning(f"🔒 {access_denied_count}/{len(models_to_try)} models not enabled")
+            self.logger.warning(f"🔒 {access_denied_count}/{models_tried} models not enabled")
             self.logger.warning("💡 Consider enabling more models for better performance")
         
         if other_errors:
@@ -455,6 +467,13 @@ class AudioProcessor:
         """
         Try a specific Bedrock model for project detail extraction
         """
+        response = self.bedrock_client.invoke_model(**self.bedrock_request(transcript_text, model_config))
+        
+        response_body = json.loads(response['body'].read())
+        return self.parse_bedrock_response(transcript_text, model_config, response_body)
+    
+    def bedrock_request(self, transcript_text, model_config):
+        """Arguments of invoke_model asking one model for the project details"""
         # Enhanced prompt with confidence scoring and validation
         prompt = f"""
         You are an expert home improvement project analyst. Analyze this transcript and extract project details with high accuracy.
@@ -514,15 +533,15 @@ class AudioProcessor:
         else:
             raise ValueError(f"Unsupported model type: {model_config['type']}")
         
-        response = self.bedrock_client.invoke_model(
-            modelId=model_config["id"],
-            body=body,
-            contentType="application/json",
-            accept="application/json"
-        )
-        
-        response_body = json.loads(response['body'].read())
-        
+        return {
+            'modelId': model_config["id"],
+            'body': body,
+            'contentType': "application/json",
+            'accept': "application/json"
+        }
+    
+    def parse_bedrock_response(self, transcript_text, model_config, response_body):
+        """Project details from a decoded invoke_model response body"""
         # Extract text based on model type
         if model_config["type"] == "anthropic":
             extracted_text = response_body['content'][0]['text']
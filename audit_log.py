@@ -0,0 +1,179 @@
+"""
+Buffered writer for the admin activity audit trail.
+
+log_admin_activity() used to open a connection and INSERT on every admin
+page view. It now hands the entry to an AuditLogWriter, which queues it in
+memory. A background thread writes the queue to admin_activity_logs in
+multi-row INSERTs, once FLUSH_BATCH_SIZE entries are waiting or
+FLUSH_INTERVAL_SECONDS have passed. The queue is bounded: during a burst
+that outruns the database, new entries are dropped and counted rather than
+blocking requests. close() (registered with atexit) drains the queue on
+shutdown.
+
+Each entry carries the time it was logged, so created_at reflects the
+request rather than the flush.
+"""
+
+import queue
+import threading
+import time
+from datetime import datetime
+
+# Flush once this many entries are waiting...
+FLUSH_BATCH_SIZE = 100
+
+# ...or once the oldest waiting entry is this old
+FLUSH_INTERVAL_SECONDS = 2.0
+
+# Entries held in memory before new ones are dropped
+MAX_QUEUE_SIZE = 10000
+
+# Seconds close() waits for the final flush
+SHUTDOWN_TIMEOUT_SECONDS = 10
+
+COLUMNS = ('admin_user_id', 'action', 'target_type', 'target_id', 'details',
+           'ip_address', 'user_agent', 'created_at')
+
+
+class AuditLogWriter:
+    """Queue audit entries and write them to admin_activity_logs in batches"""
+
+    def __init__(self, get_db_connection, batch_size=FLUSH_BATCH_SIZE,
+                 flush_interval=FLUSH_INTERVAL_SECONDS, max_queue_size=MAX_QUEUE_SIZE):
+        self._get_db_connection = get_db_connection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopping = threading.Event()
+        self._counters = {'enqueued': 0, 'written': 0, 'dropped': 0, 'failed': 0, 'batches': 0}
+        self._last_flush_at = None
+        self._last_error = None
+
+    def log(self, admin_user_id, action, target_type, target_id=None, details=None,
+            ip_address=None, user_agent=None):
+        """Queue one entry; returns False if it was dropped"""
+        self._ensure_started()
+        entry = (admin_user_id, action, target_type, target_id, details,
+                 ip_address, user_agent, datetime.now())
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self._count('dropped')
+            return False
+        self._count('enqueued')
+        return True
+
+    def stats(self):
+        """Queue depth and counters for monitoring"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['last_flush_at'] = self._last_flush_at.isoformat() if self._last_flush_at else None
+            stats['last_error'] = self._last_error
+        stats['queue_depth'] = self._queue.qsize()
+        stats['queue_capacity'] = self._queue.maxsize
+        stats['running'] = bool(self._thread and self._thread.is_alive())
+        return stats
+
+    def close(self, timeout=SHUTDOWN_TIMEOUT_SECONDS):
+        """Stop the background thread after writing everything still queued"""
+        self._stopping.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout)
+        # Entries queued after the thread stopped (or if it never started)
+        while True:
+            batch = self._drain(self.batch_size)
+            if not batch:
+                break
+            self._flush(batch)
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def _ensure_started(self):
+        if self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            # A forked worker inherits the object but not the thread
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='audit-log-writer', daemon=True)
+            self._thread.start()
+
+    def _drain(self, limit):
+        batch = []
+        while len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            # Give the batch until the interval runs out to fill up
+            deadline = time.monotonic() + self.flush_interval
+            batch = [first]
+            while len(batch) < self.batch_size and not self._stopping.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=min(remaining, 0.1)))
+                except queue.Empty:
+                    continue
+            self._flush(batch)
+
+    def _flush(self, batch):
+        if not batch:
+            return
+        conn = None
+        try:
+            conn = self._get_db_connection()
+            cursor = conn.cursor()
+            placeholder = '?' if hasattr(conn, 'row_factory') else '%s'
+            row = f"({', '.join([placeholder] * len(COLUMNS))})"
+            sql = f"INSERT INTO admin_activity_logs ({', '.join(COLUMNS)}) VALUES "
+            try:
+                cursor.execute(sql + ', '.join([row] * len(batch)),
+                               [value for entry in batch for value in entry])
+                conn.commit()
+                self._count('written', len(batch))
+            except Exception as e:
+                # One bad row fails the whole statement; keep the good ones
+                conn.rollback()
+                self._record_error(e)
+                for entry in batch:
+                    try:
+                        cursor.execute(sql + row, entry)
+                        conn.commit()
+                        self._count('written')
+                    except Exception as row_error:
+                        conn.rollback()
+                        self._count('failed')
+                        self._record_error(row_error)
+            self._count('batches')
+            cursor.close()
+        except Exception as e:
+            self._count('failed', len(batch))
+            self._record_error(e)
+            print(f"Error writing admin activity logs: {e}")
+        finally:
+            if conn:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            with self._lock:
+                self._last_flush_at = datetime.now()
+
+    def _record_error(self, error):
+        with self._lock:
+            self._last_error = str(error)
@@ -7,6 +7,8 @@ import pymysql
 import os
 from dotenv import load_dotenv
 
+import project_facets
+
 # Load environment variables
 load_dotenv()
 
@@ -56,10 +58,14 @@ def auto_cleanup_generic_projects():
                 for project in projects:
                     print(f"  - Deleting Project ID: {project['id']} | {project['title'][:50]}...")
                 
-                # Delete related bids first (foreign key constraint)
                 project_ids = [project['id'] for project in projects]
                 placeholders = ','.join(['%s'] * len(project_ids))
                 
+                # Take them out of the dashboard filter counts, which do not cascade
+                for project_id in project_ids:
+                    project_facets.remove(cursor, project_id)
+                
+                # Delete related bids first (foreign key constraint)
                 cursor.execute(f"DELETE FROM bids WHERE project_id IN ({placeholders})", project_ids)
                 deleted_bids = cursor.rowcount
                 total_deleted_bids += deleted_bids
@@ -19,7 +19,7 @@ def get_db_connection():
     try:
         # Try to import pymysql for MySQL connection
         import pymysql
-        from app import get_db_connection as app_get_db_connection
+        from database import get_db_connection as app_get_db_connection
         return app_get_db_connection()
     except ImportError:
         # Fall back to SQLite
@@ -40,6 +40,8 @@ logging.basicConfig(
 
 def expire_old_bids():
     """Expire bids that have passed their expiration date"""
+    import notification_inbox
+    
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
@@ -86,31 +88,25 @@ def expire_old_bids():
             if project_data:
                 project_title, homeowner_user_id, contractor_user_id, contractor_first, contractor_last = project_data
                 
-                # Create notification for contractor
-                cursor.execute("""
-                    INSERT INTO bid_notifications (user_id, bid_id, title, message, type, created_at)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                """, (
-                    contractor_user_id,
+                # Create notification for contractor (through the inbox, so unread counters stay right)
+                notification_inbox.create_notification(
+                    cursor,
                     bid_id,
-                    "Bid Expired",
-                    f"Your bid of ${amount:.0f} for '{project_title}' has expired.",
+                    contractor_user_id,
                     "bid_expired",
-                    current_time
-                ))
+                    "Bid Expired",
+                    f"Your bid of ${amount:.0f} for '{project_title}' has expired."
+                )
                 
                 # Create notification for homeowner
-                cursor.execute("""
-                    INSERT INTO bid_notifications (user_id, bid_id, title, message, type, created_at)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                """, (
-                    homeowner_user_id,
+                notification_inbox.create_notification(
+                    cursor,
                     bid_id,
-                    "Bid Expired",
-                    f"A bid from {contractor_first} {contractor_last} for '{project_title}' has expired.",
+                    homeowner_user_id,
                     "bid_expired",
-                    current_time
-                ))
+                    "Bid Expired",
+                    f"A bid from {contractor_first} {contractor_last} for '{project_title}' has expired."
+                )
                 
                 logging.info(f"Expired bid {bid_id} for project '{project_title}' (${amount:.0f})")
         
@@ -140,6 +136,12 @@ def cleanup_old_notifications():
         """, (cutoff_date,))
         
         deleted_count = cursor.rowcount
+        
+        # Deleted rows may have been unread, so rebuild the badge counters
+        if deleted_count > 0:
+            import notification_inbox
+            notification_inbox.recount_unread(cursor)
+        
         conn.commit()
         
         if deleted_count > 0:
@@ -0,0 +1,175 @@
+"""
+AWS clients built on first use.
+
+Importing app.py used to create a boto3 session, prove the credentials with
+an STS get_caller_identity call and build the Transcribe, Comprehend and S3
+clients. On a host without network the STS call hangs until botocore gives
+up, and every gunicorn worker boot and every script that imports from app
+waited for it. AudioProcessor repeated the STS call, plus a Bedrock
+list_foundation_models call, for every request.
+
+AWSClients defers all of that:
+
+- nothing is imported from boto3 until a client is first used
+- available() checks once per process whether credentials are configured,
+  without resolving them: botocore's lookup would ask the EC2 instance
+  metadata service over the network when nothing local is set. Instance
+  role credentials are announced with AWS_INSTANCE_ROLE=true (set in
+  .ebextensions/01_environment.config) and fetched on first client use
+- client() builds each service client once per process; a process forked
+  after a client was built (gunicorn --preload) builds its own, since the
+  parent's connection pool must not be shared
+- clients get explicit connect/read timeouts and retry limits, so an
+  unreachable endpoint fails a request instead of hanging a worker
+
+lazy() hands out a LazyClient that stands in for a client wherever one is
+expected: attribute access builds the real client, and its truth value is
+available(), so `if not s3_client` keeps meaning "AWS is not configured".
+verify() makes the STS call for diagnostics. shared() gives every module
+of the process the same AWSClients per region.
+"""
+
+import importlib.util
+import os
+import threading
+import time
+
+# Seconds to wait for an AWS endpoint to accept a connection
+DEFAULT_CONNECT_TIMEOUT = 5
+
+# Seconds to wait for a response
+DEFAULT_READ_TIMEOUT = 60
+
+# Attempts per API call, including the first
+DEFAULT_MAX_ATTEMPTS = 3
+
+# Environment variables that each mean a credential source is configured
+CREDENTIAL_ENV_VARS = (
+    'AWS_ACCESS_KEY_ID', 'AWS_PROFILE', 'AWS_DEFAULT_PROFILE', 'AWS_WEB_IDENTITY_TOKEN_FILE',
+    'AWS_CONTAINER_CREDENTIALS_RELATIVE_URI', 'AWS_CONTAINER_CREDENTIALS_FULL_URI',
+)
+
+
+def boto3_installed():
+    return importlib.util.find_spec('boto3') is not None
+
+
+def credentials_configured():
+    """Whether a credential source is set up, judged from the environment and files only"""
+    if os.environ.get('AWS_INSTANCE_ROLE', '').lower() in ('1', 'true', 'yes'):
+        return True
+    if any(os.environ.get(name) for name in CREDENTIAL_ENV_VARS):
+        return True
+    shared_files = (os.environ.get('AWS_SHARED_CREDENTIALS_FILE', '~/.aws/credentials'),
+                    os.environ.get('AWS_CONFIG_FILE', '~/.aws/config'))
+    return any(os.path.isfile(os.path.expanduser(path)) for path in shared_files)
+
+
+class AWSClients:
+    """Per-process AWS clients for one region, created when first used"""
+
+    def __init__(self, region='us-east-1', connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout=DEFAULT_READ_TIMEOUT, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.region = region
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._pid = None
+        self._session = None
+        self._available = None
+        self._clients = {}
+        self._init_seconds = {}
+
+    def _reset_after_fork(self):
+        # Called with the lock held
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._session = None
+            self._clients = {}
+
+    def _get_session(self):
+        if self._session is None:
+            import boto3
+            self._session = boto3.session.Session(region_name=self.region)
+        return self._session
+
+    def available(self):
+        """Whether boto3 is installed and credentials are configured; never a network call"""
+        if self._available is None:
+            started = time.perf_counter()
+            self._available = boto3_installed() and credentials_configured()
+            self._init_seconds['credentials'] = round(time.perf_counter() - started, 4)
+            if not self._available:
+                print("AWS credentials not configured; AWS features are disabled")
+        return self._available
+
+    def client(self, service):
+        """The boto3 client for a service, built on first use"""
+        with self._lock:
+            self._reset_after_fork()
+            client = self._clients.get(service)
+            if client is None:
+                from botocore.config import Config as BotoConfig
+                started = time.perf_counter()
+                client = self._get_session().client(service, config=BotoConfig(
+                    connect_timeout=self.connect_timeout,
+                    read_timeout=self.read_timeout,
+                    retries={'max_attempts': self.max_attempts, 'mode': 'standard'}))
+                self._clients[service] = client
+                self._init_seconds[service] = round(time.perf_counter() - started, 4)
+            return client
+
+    def lazy(self, service):
+        """Stand-in for a service client, or None when boto3 is not installed"""
+        return LazyClient(self, service) if boto3_installed() else None
+
+    def verify(self):
+        """Caller identity from STS; raises if the credentials are rejected"""
+        return self.client('sts').get_caller_identity()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'region': self.region,
+                'available': self._available,
+                'clients': sorted(self._clients),
+                'init_seconds': dict(self._init_seconds),
+            }
+
+
+class LazyClient:
+    """Behaves like a boto3 client, which is only built when first used"""
+
+    def __init__(self, clients, service):
+        self._clients = clients
+        self._service = service
+
+    def __getattr__(self, name):
+        return getattr(self._clients.client(self._service), name)
+
+    def __bool__(self):
+        return self._clients.available()
+
+    def __repr__(self):
+        return f"<LazyClient {self._service} ({self._clients.region})>"
+
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def shared(region='us-east-1'):
+    """AWSClients for a region shared by the whole process"""
+    with _shared_lock:
+        if region not in _shared:
+            _shared[region] = AWSClients(region)
+        return _shared[region]
+
+
+def reset_after_fork():
+    """Drop sessions and clients inherited from the parent (gunicorn post_fork)"""
+    with _shared_lock:
+        for clients in _shared.values():
+            with clients._lock:
+                clients._reset_after_fork()
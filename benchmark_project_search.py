@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Benchmark keyword search over projects: LIKE scans vs the project_search index.
+
+Builds a throwaway SQLite database with synthetic projects (1,000,000 by
+default), indexes it with project_search.ensure_index and times the same
+keyword + type/budget/status queries both ways. Each timing covers the
+dashboard's COUNT for pagination plus the first page of 20.
+
+Only the SQLite FTS5 path is measured. Production runs the MySQL FULLTEXT
+path, which has not been benchmarked; its numbers need a MySQL server
+loaded with the same rows.
+
+Usage: python benchmark_project_search.py [--rows 1000000] [--runs 20]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+import project_search
+
+PROJECT_TYPES = ['Kitchen Renovation', 'Bathroom Repair', 'Plumbing', 'Electrical',
+                 'Painting', 'Flooring', 'Roofing', 'General Repair']
+STATUSES = ['Active'] * 6 + ['Completed', 'Closed']
+WORDS = ('cabinet countertop granite sink faucet drain pipe leak water heater toilet shower tile '
+         'grout vanity mirror outlet breaker panel wiring fixture lighting switch ceiling wall drywall '
+         'primer paint trim hardwood laminate carpet vinyl subfloor shingle gutter flashing skylight '
+         'chimney deck fence railing window door insulation attic basement garage patio concrete '
+         'remodel replace repair install upgrade inspect estimate urgent weekend budget quality').split()
+FILLER = ('the and for with need needs looking someone help home house room area new old work job '
+          'would like please soon this that our some also about around want done good quick').split()
+
+QUERIES = [
+    ('granite countertop', {}),
+    ('water heat', {'type': 'Plumbing'}),
+    ('shingle gutter', {'status': 'Active'}),
+    ('hardwood', {'type': 'Flooring', 'budget_min': 5000}),
+    ('paint trim ceiling', {'status': 'Active', 'budget_min': 1000}),
+]
+
+
+def create_schema(cursor):
+    cursor.execute('''
+        CREATE TABLE projects (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            description TEXT NOT NULL,
+            project_type TEXT NOT NULL,
+            budget_min REAL,
+            budget_max REAL,
+            status TEXT DEFAULT 'Active',
+            ai_processed_text TEXT
+        )
+    ''')
+    cursor.execute('CREATE INDEX idx_status ON projects (status)')
+
+
+def generate_rows(count, seed=42):
+    rng = random.Random(seed)
+    for _ in range(count):
+        budget_min = rng.choice([500, 1000, 2500, 5000, 10000, 25000, 50000])
+        # Mostly filler text with a few specific trade terms, so query terms are selective
+        terms = rng.sample(WORDS, 4)
+        yield (
+            ' '.join(terms[:2]).capitalize(),
+            ' '.join(rng.choices(FILLER, k=36) + terms),
+            rng.choice(PROJECT_TYPES),
+            budget_min,
+            budget_min * rng.choice([1.5, 2, 3]),
+            rng.choice(STATUSES),
+            ' '.join(rng.choices(FILLER, k=22) + terms[1:3]),
+        )
+
+
+def like_query(text, filters):
+    conditions, params = [], []
+    for term in project_search.parse_terms(text):
+        conditions.append('(p.title LIKE ? OR p.description LIKE ? OR p.ai_processed_text LIKE ?)')
+        params.extend([f'%{term}%'] * 3)
+    return _feed_queries('', '', [], conditions, params, filters, 'p.id DESC')
+
+
+def indexed_query(cursor, text, filters):
+    search = project_search.build_search(cursor, text)
+    return _feed_queries(f", {search['score']} as relevance", search['join'], search['score_params'],
+                         [search['where']], list(search['where_params']), filters, 'relevance DESC')
+
+
+def _feed_queries(score, join, score_params, conditions, params, filters, order_by):
+    """The dashboard's pair of queries: a COUNT for pagination and the first page"""
+    if 'type' in filters:
+        conditions.append('p.project_type = ?')
+        params.append(filters['type'])
+    if 'status' in filters:
+        conditions.append('p.status = ?')
+        params.append(filters['status'])
+    if 'budget_min' in filters:
+        conditions.append('p.budget_min >= ?')
+        params.append(filters['budget_min'])
+    where = ' AND '.join(conditions)
+    return [
+        (f"SELECT COUNT(*) FROM projects p {join} WHERE {where}", params),
+        (f"SELECT p.id{score} FROM projects p {join} WHERE {where} ORDER BY {order_by} LIMIT 20",
+         score_params + params),
+    ]
+
+
+def time_query(cursor, queries, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        for sql, params in queries:
+            cursor.execute(sql, params)
+            cursor.fetchall()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[max(int(len(timings) * 0.95) - 1, 0)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--like-runs', type=int, default=3, help='runs for the (slow) LIKE baseline')
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'search_benchmark.db')
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    create_schema(cursor)
+
+    print(f"Inserting {args.rows:,} projects...")
+    start = time.perf_counter()
+    cursor.executemany('''
+        INSERT INTO projects (title, description, project_type, budget_min, budget_max, status, ai_processed_text)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', generate_rows(args.rows))
+    conn.commit()
+    print(f"  inserted in {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    project_search.ensure_index(cursor)
+    conn.commit()
+    print(f"  search index built in {time.perf_counter() - start:.1f}s")
+
+    print(f"\n{'query':<40} {'LIKE p50':>10} {'index p50':>10} {'index p95':>10} {'speedup':>9}")
+    for text, filters in QUERIES:
+        label = text + (f" {filters}" if filters else '')
+        like_p50, _ = time_query(cursor, like_query(text, filters), args.like_runs)
+        index_p50, index_p95 = time_query(cursor, indexed_query(cursor, text, filters), args.runs)
+        print(f"{label[:40]:<40} {like_p50:>8.1f}ms {index_p50:>8.1f}ms {index_p95:>8.1f}ms "
+              f"{like_p50 / max(index_p50, 0.001):>8.0f}x")
+
+    # Incremental sync cost: inserts and updates go through the FTS triggers
+    start = time.perf_counter()
+    cursor.executemany('''
+        INSERT INTO projects (title, description, project_type, budget_min, budget_max, status, ai_processed_text)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', generate_rows(1000, seed=7))
+    cursor.execute("UPDATE projects SET description = description || ' skylight' WHERE id % 1000 = 0")
+    conn.commit()
+    print(f"\n1,000 inserts + {args.rows // 1000:,} updates with index sync: {time.perf_counter() - start:.2f}s")
+
+    conn.close()
+    os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
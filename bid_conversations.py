@@ -0,0 +1,125 @@
+"""
+Conversation summaries for bid messaging.
+
+bid_conversations holds one row per bid that has messages: the last message,
+a short preview, the last activity time and an unread count for each side.
+It is maintained on message insert and mark-read so the contractor message
+center reads summaries by index instead of scanning bid_messages per bid.
+"""
+
+# Characters of the last message kept for the conversation list
+PREVIEW_LENGTH = 255
+
+
+def ensure_schema(cursor):
+    """Create bid_conversations if it is missing"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS bid_conversations (
+            bid_id INT PRIMARY KEY,
+            contractor_id INT NOT NULL,
+            contractor_user_id INT NOT NULL,
+            homeowner_user_id INT NOT NULL,
+            last_message_id INT NULL,
+            last_message_preview VARCHAR(255),
+            last_activity_at TIMESTAMP NULL,
+            message_count INT NOT NULL DEFAULT 0,
+            contractor_unread INT NOT NULL DEFAULT 0,
+            homeowner_unread INT NOT NULL DEFAULT 0,
+            FOREIGN KEY (bid_id) REFERENCES bids(id) ON DELETE CASCADE,
+            INDEX idx_contractor_activity (contractor_id, last_activity_at),
+            INDEX idx_homeowner_activity (homeowner_user_id, last_activity_at)
+        )
+    ''')
+
+
+def record_message(cursor, bid_id, message_id, receiver_id, contractor_id,
+                   contractor_user_id, homeowner_user_id, message_text):
+    """Update the conversation summary for a newly inserted bid message"""
+    preview = (message_text or '')[:PREVIEW_LENGTH]
+    contractor_unread = 1 if receiver_id == contractor_user_id else 0
+    homeowner_unread = 1 if receiver_id == homeowner_user_id else 0
+
+    cursor.execute('''
+        INSERT INTO bid_conversations
+            (bid_id, contractor_id, contractor_user_id, homeowner_user_id,
+             last_message_id, last_message_preview, last_activity_at,
+             message_count, contractor_unread, homeowner_unread)
+        VALUES (%s, %s, %s, %s, %s, %s, NOW(), 1, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            last_message_id = VALUES(last_message_id),
+            last_message_preview = VALUES(last_message_preview),
+            last_activity_at = VALUES(last_activity_at),
+            message_count = message_count + 1,
+            contractor_unread = contractor_unread + VALUES(contractor_unread),
+            homeowner_unread = homeowner_unread + VALUES(homeowner_unread)
+    ''', (bid_id, contractor_id, contractor_user_id, homeowner_user_id,
+          message_id, preview, contractor_unread, homeowner_unread))
+
+
+def mark_read(cursor, bid_id, user_id):
+    """Clear the unread count for whichever participant user_id is"""
+    cursor.execute('''
+        UPDATE bid_conversations
+        SET contractor_unread = CASE WHEN contractor_user_id = %s THEN 0 ELSE contractor_unread END,
+            homeowner_unread = CASE WHEN homeowner_user_id = %s THEN 0 ELSE homeowner_unread END
+        WHERE bid_id = %s
+    ''', (user_id, user_id, bid_id))
+
+
+def get_contractor_stats(cursor, contractor_id):
+    """Total conversations and unread messages for a contractor in one read"""
+    cursor.execute('''
+        SELECT COUNT(*) as total, COALESCE(SUM(contractor_unread), 0) as unread
+        FROM bid_conversations
+        WHERE contractor_id = %s
+    ''', (contractor_id,))
+    row = cursor.fetchone()
+    return int(row['total'] or 0), int(row['unread'] or 0)
+
+
+def backfill(cursor):
+    """Rebuild the summaries if bid_conversations is empty but bid messages exist.
+
+    A freshly created table would otherwise hide every existing thread from
+    the message center until its next message. Returns the rows built.
+    """
+    cursor.execute('SELECT 1 FROM bid_conversations LIMIT 1')
+    if cursor.fetchone():
+        return 0
+    cursor.execute('SELECT 1 FROM bid_messages LIMIT 1')
+    if not cursor.fetchone():
+        return 0
+    return rebuild(cursor)
+
+
+def rebuild(cursor):
+    """Rebuild every summary from bid_messages (migration / repair)"""
+    cursor.execute('DELETE FROM bid_conversations')
+    cursor.execute('''
+        INSERT INTO bid_conversations
+            (bid_id, contractor_id, contractor_user_id, homeowner_user_id,
+             last_message_id, last_message_preview, last_activity_at,
+             message_count, contractor_unread, homeowner_unread)
+        SELECT b.id, b.contractor_id, c.user_id, h.user_id,
+               stats.last_message_id, LEFT(last_bm.message_text, %s), last_bm.created_at,
+               stats.message_count, stats.contractor_unread, stats.homeowner_unread
+        FROM (
+            SELECT bm.bid_id,
+                   MAX(bm.id) as last_message_id,
+                   COUNT(*) as message_count,
+                   SUM(CASE WHEN bm.receiver_id = c.user_id AND bm.is_read = FALSE THEN 1 ELSE 0 END) as contractor_unread,
+                   SUM(CASE WHEN bm.receiver_id = h.user_id AND bm.is_read = FALSE THEN 1 ELSE 0 END) as homeowner_unread
+            FROM bid_messages bm
+            JOIN bids b ON bm.bid_id = b.id
+            JOIN contractors c ON b.contractor_id = c.id
+            JOIN projects p ON b.project_id = p.id
+            JOIN homeowners h ON p.homeowner_id = h.id
+            GROUP BY bm.bid_id
+        ) stats
+        JOIN bid_messages last_bm ON last_bm.id = stats.last_message_id
+        JOIN bids b ON stats.bid_id = b.id
+        JOIN contractors c ON b.contractor_id = c.id
+        JOIN projects p ON b.project_id = p.id
+        JOIN homeowners h ON p.homeowner_id = h.id
+    ''', (PREVIEW_LENGTH,))
+    return cursor.rowcount
@@ -0,0 +1,241 @@
+"""
+Content-addressed store for evidence and dispute files.
+
+A blob is a file named by the SHA-256 of its content, in directories
+sharded by the first two byte pairs of the hash (blobs/ab/cd/abcd...), so
+no directory grows past a few thousand entries. The same photo uploaded
+for several milestones or disputes is stored once; every record that uses
+it holds a reference, counted in the blobs table.
+
+Uploads are copied into the store in BLOCK_SIZE blocks, hashing as they
+go, and abandoned as soon as they exceed the size limit (BlobTooLarge),
+so an oversized upload is never written out in full.
+
+Records point at blobs by path (the file_path column of evidence_files /
+dispute_evidence holds blobs/ab/cd/<sha256>), so code serving those rows
+works unchanged. Blobs live outside static/, so they are only reachable
+through the routes that check access.
+
+Deleting a record calls release(). gc() removes blobs that have had no
+references for GC_GRACE_HOURS; recount() rebuilds the counts from the
+referencing tables first, catching records removed by ON DELETE CASCADE.
+The database row is what serialises store() against gc(): store() takes
+the row before moving the file in, and gc() deletes the row before the
+file, both inside the caller's transaction.
+"""
+
+import hashlib
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from database import is_sqlite, placeholder
+import file_serving
+
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Root of the store, relative to the app directory
+BLOB_ROOT = 'blobs'
+
+# Bytes read per block while copying an upload
+BLOCK_SIZE = 64 * 1024
+
+# Largest blob accepted by default
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+
+# Unreferenced blobs are kept this long in case a record is re-created
+GC_GRACE_HOURS = 24
+
+# Columns that hold blob paths, for recount()
+REFERENCES = (
+    ('evidence_files', 'file_path'),
+    ('dispute_evidence', 'file_path'),
+)
+
+
+class BlobTooLarge(Exception):
+    """Raised while storing an upload that exceeds the size limit"""
+
+    def __init__(self, max_bytes):
+        super().__init__(f'File is too large. Maximum size is {max_bytes // (1024 * 1024)}MB.')
+        self.max_bytes = max_bytes
+
+
+def ensure_schema(cursor):
+    """Create the blobs table for the connected database if it is missing"""
+    if is_sqlite(cursor):
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS blobs (
+                sha256 TEXT PRIMARY KEY,
+                size_bytes INTEGER NOT NULL,
+                mime_type TEXT,
+                ref_count INTEGER NOT NULL DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                released_at TIMESTAMP
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_blobs_unreferenced ON blobs (ref_count, released_at)')
+        return
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS blobs (
+            sha256 CHAR(64) PRIMARY KEY,
+            size_bytes BIGINT NOT NULL,
+            mime_type VARCHAR(100) NULL,
+            ref_count INT NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            released_at TIMESTAMP NULL,
+            INDEX idx_unreferenced (ref_count, released_at)
+        )
+    ''')
+
+
+def blob_path(sha256):
+    """Path of a blob relative to the app directory, as stored in records"""
+    return '/'.join((BLOB_ROOT, sha256[:2], sha256[2:4], sha256))
+
+
+def absolute_path(sha256):
+    return os.path.join(APP_ROOT, *blob_path(sha256).split('/'))
+
+
+def sha256_of(path):
+    """The hash a stored path points at, or None if it is not a blob path"""
+    if not path:
+        return None
+    parts = path.replace(os.sep, '/').split('/')
+    if len(parts) != 4 or parts[0] != BLOB_ROOT or len(parts[3]) != 64:
+        return None
+    return parts[3]
+
+
+def is_blob(path):
+    return sha256_of(path) is not None
+
+
+def store(cursor, stream, filename=None, max_bytes=DEFAULT_MAX_BYTES):
+    """Copy an upload into the store and take a reference to it.
+
+    Returns (sha256, size). Raises BlobTooLarge without keeping anything
+    if the stream holds more than max_bytes.
+    """
+    temp_dir = os.path.join(APP_ROOT, BLOB_ROOT, 'tmp')
+    os.makedirs(temp_dir, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, temp_path = tempfile.mkstemp(dir=temp_dir)
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for block in iter(lambda: stream.read(BLOCK_SIZE), b''):
+                size += len(block)
+                if size > max_bytes:
+                    raise BlobTooLarge(max_bytes)
+                digest.update(block)
+                out.write(block)
+        sha256 = digest.hexdigest()
+        _reference(cursor, sha256, size, file_serving.guess_mime_type(filename or ''))
+        final_path = absolute_path(sha256)
+        if os.path.isfile(final_path):
+            os.remove(temp_path)
+        else:
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.replace(temp_path, final_path)
+        return sha256, size
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _reference(cursor, sha256, size, mime_type):
+    ph = placeholder(cursor)
+    if is_sqlite(cursor):
+        cursor.execute(f'''
+            INSERT INTO blobs (sha256, size_bytes, mime_type, ref_count) VALUES ({ph}, {ph}, {ph}, 1)
+            ON CONFLICT (sha256) DO UPDATE SET ref_count = ref_count + 1, released_at = NULL
+        ''', (sha256, size, mime_type))
+    else:
+        cursor.execute(f'''
+            INSERT INTO blobs (sha256, size_bytes, mime_type, ref_count) VALUES ({ph}, {ph}, {ph}, 1)
+            ON DUPLICATE KEY UPDATE ref_count = ref_count + 1, released_at = NULL
+        ''', (sha256, size, mime_type))
+
+
+def get(cursor, sha256):
+    """Row of one blob, or None"""
+    cursor.execute(f'SELECT * FROM blobs WHERE sha256 = {placeholder(cursor)}', (sha256,))
+    return cursor.fetchone()
+
+
+def release(cursor, paths):
+    """Drop one reference per blob path (other paths are ignored)"""
+    ph = placeholder(cursor)
+    for path in paths:
+        sha256 = sha256_of(path)
+        if sha256:
+            cursor.execute(f'''
+                UPDATE blobs SET ref_count = ref_count - 1, released_at = {ph}
+                WHERE sha256 = {ph} AND ref_count > 0
+            ''', (datetime.now(), sha256))
+
+
+def recount(cursor):
+    """Rebuild reference counts from the referencing tables; returns blobs corrected"""
+    counts = {}
+    for table, column in REFERENCES:
+        cursor.execute(f"SELECT {column} AS path FROM {table} WHERE {column} LIKE '{BLOB_ROOT}/%'")
+        for row in cursor.fetchall():
+            sha256 = sha256_of(row['path'])
+            if sha256:
+                counts[sha256] = counts.get(sha256, 0) + 1
+    ph = placeholder(cursor)
+    cursor.execute('SELECT sha256, ref_count FROM blobs')
+    corrected = 0
+    for row in cursor.fetchall():
+        count = counts.get(row['sha256'], 0)
+        if count != row['ref_count']:
+            cursor.execute(f'''
+                UPDATE blobs SET ref_count = {ph}, released_at = CASE WHEN {ph} = 0 THEN {ph} ELSE NULL END
+                WHERE sha256 = {ph}
+            ''', (count, count, datetime.now(), row['sha256']))
+            corrected += 1
+    return corrected
+
+
+def gc(cursor, grace_hours=GC_GRACE_HOURS):
+    """Delete blobs unreferenced for the grace period; returns [(sha256, size)] deleted"""
+    ph = placeholder(cursor)
+    cutoff = datetime.now() - timedelta(hours=grace_hours)
+    cursor.execute(f'''
+        SELECT sha256, size_bytes FROM blobs
+        WHERE ref_count = 0 AND (released_at IS NULL OR released_at < {ph}) AND created_at < {ph}
+    ''', (cutoff, cutoff))
+    deleted = []
+    for row in cursor.fetchall():
+        # Conditional, so a blob referenced again since the SELECT survives
+        cursor.execute(f'DELETE FROM blobs WHERE sha256 = {ph} AND ref_count = 0', (row['sha256'],))
+        if cursor.rowcount != 1:
+            continue
+        try:
+            os.remove(absolute_path(row['sha256']))
+        except FileNotFoundError:
+            pass
+        deleted.append((row['sha256'], row['size_bytes']))
+    return deleted
+
+
+def sweep_untracked(cursor, grace_hours=GC_GRACE_HOURS):
+    """Remove files left by uploads whose transaction rolled back; returns files removed"""
+    cutoff = time.time() - grace_hours * 3600
+    removed = 0
+    root = os.path.join(APP_ROOT, BLOB_ROOT)
+    for directory, _, names in os.walk(root):
+        for name in names:
+            path = os.path.join(directory, name)
+            if os.path.getmtime(path) > cutoff:
+                continue
+            if os.path.basename(directory) == 'tmp' or get(cursor, name) is None:
+                os.remove(path)
+                removed += 1
+    return removed
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Build the geocoding gazetteer in data/ from the US Census Gazetteer files.
+The city_centroids.csv kept in the repository only lists the largest
+US cities and no ZIP codes, so most typed locations fall back to a LIKE
+match. Download the national ZCTA and places files from
+https://www.census.gov/geographies/reference-files/time-series/geo/gazetteer-files.html
+(e.g. 2023_Gaz_zcta_national.txt and 2023_Gaz_place_national.txt,
+unzipped) and run:
+
+    python build_gazetteer.py 2023_Gaz_zcta_national.txt 2023_Gaz_place_national.txt
+
+This writes data/zip_centroids.csv (about 33,000 ZIP codes) and replaces
+data/city_centroids.csv (about 32,000 places). Restart the app (or
+re-run migrate_geo_locations.py to geocode existing rows) afterwards.
+"""
+
+import csv
+import os
+import re
+import sys
+
+import geo_location
+
+# Census place names end in their legal description ("Austin city", "Paradise CDP")
+_PLACE_SUFFIX_RE = re.compile(
+    r'\s+(city and borough|consolidated government|metropolitan government|unified government|'
+    r'urban county|city|town|village|borough|township|municipality|CDP|comunidad|zona urbana)'
+    r'(\s*\(.*\))?$')
+
+
+def _rows(path):
+    """Rows of a tab-separated Census gazetteer file, with the header names stripped"""
+    with open(path, newline='', encoding='latin-1') as f:
+        reader = csv.reader(f, delimiter='\t')
+        header = [name.strip() for name in next(reader)]
+        for values in reader:
+            yield dict(zip(header, (value.strip() for value in values)))
+
+
+def build_zip_centroids(zcta_path, out_path):
+    count = 0
+    with open(out_path, 'w', newline='', encoding='utf-8') as out:
+        writer = csv.writer(out)
+        writer.writerow(['zip', 'lat', 'lng'])
+        for row in _rows(zcta_path):
+            writer.writerow([row['GEOID'].zfill(5), row['INTPTLAT'], row['INTPTLONG']])
+            count += 1
+    return count
+
+
+def build_city_centroids(place_path, out_path):
+    """One row per (city, state); of places sharing a name, the largest by land area is kept"""
+    places = {}
+    for row in _rows(place_path):
+        state = row['USPS']
+        if state not in geo_location.STATE_ABBREVIATIONS.values():
+            continue
+        city = _PLACE_SUFFIX_RE.sub('', row['NAME'])
+        land = int(row.get('ALAND') or 0)
+        key = (city.lower(), state)
+        if key not in places or land > places[key][0]:
+            places[key] = (land, city, state, row['INTPTLAT'], row['INTPTLONG'])
+    with open(out_path, 'w', newline='', encoding='utf-8') as out:
+        writer = csv.writer(out)
+        writer.writerow(['city', 'state', 'lat', 'lng'])
+        for _, city, state, lat, lng in sorted(places.values(), key=lambda p: (p[2], p[1])):
+            writer.writerow([city, state, lat, lng])
+    return len(places)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print(__doc__)
+        sys.exit(2)
+    zcta_path, place_path = sys.argv[1:]
+    os.makedirs(geo_location.DATA_DIR, exist_ok=True)
+
+    zips = build_zip_centroids(zcta_path, geo_location.ZIP_CENTROIDS_PATH)
+    print(f"✓ Wrote {zips} ZIP codes to {geo_location.ZIP_CENTROIDS_PATH}")
+    cities = build_city_centroids(place_path, geo_location.CITY_CENTROIDS_PATH)
+    print(f"✓ Wrote {cities} places to {geo_location.CITY_CENTROIDS_PATH}")
@@ -7,6 +7,8 @@ import pymysql
 import os
 from dotenv import load_dotenv
 
+import project_facets
+
 # Load environment variables
 load_dotenv()
 
@@ -64,6 +66,10 @@ def cleanup_generic_projects():
                     project_ids = [str(p['id']) for p in projects]
                     placeholders = ','.join(['%s'] * len(project_ids))
                     
+                    # Take them out of the dashboard filter counts, which do not cascade
+                    for project_id in project_ids:
+                        project_facets.remove(cursor, project_id)
+                    
                     # Delete related bids first (foreign key constraint)
                     cursor.execute(f"DELETE FROM bids WHERE project_id IN ({placeholders})", project_ids)
                     deleted_bids = cursor.rowcount
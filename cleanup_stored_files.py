@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Cleanup Stored Files Script
+Maintains the stored_files registry of uploads. Hashes files that were
+registered lazily, hard-links identical uploads to one copy and reports
+orphans: uploads still unattached to a project, image or evidence record
+after the grace period (e.g. abandoned audio submissions). Orphans are
+only deleted with --delete-orphans. Also garbage-collects evidence blobs
+no record has referenced for a day, aborts resumable upload sessions
+left unfinished or unclaimed past their TTL, and moves resized copies of
+evidence images out of static/ (see image_derivatives). Run nightly as a
+cron job; run once with --backfill to register every file already on disk
+as legacy.
+"""
+
+import sys
+import os
+import time
+import logging
+import sqlite3
+
+# Add the project directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import blob_store
+import file_registry
+import image_derivatives
+import resumable_uploads
+
+# Directories scanned by --backfill
+UPLOAD_DIRS = [
+    os.path.join(file_registry.APP_ROOT, 'uploads'),
+    os.path.join(file_registry.APP_ROOT, 'static', 'uploads'),
+    os.path.join(file_registry.APP_ROOT, blob_store.BLOB_ROOT),
+]
+
+def get_db_connection():
+    """Get database connection - simplified version for standalone script"""
+    try:
+        # Try to import pymysql for MySQL connection
+        import pymysql
+        from database import get_db_connection as app_get_db_connection
+        return app_get_db_connection()
+    except ImportError:
+        # Fall back to SQLite
+        db_path = os.path.join(os.path.dirname(__file__), 'homepro.db')
+        conn = sqlite3.connect(db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler('cleanup_stored_files.log'),
+        logging.StreamHandler()
+    ]
+)
+
+def backfill(cursor):
+    """Register files on disk the registry does not know yet"""
+    registered = 0
+    for upload_dir in UPLOAD_DIRS:
+        for root, _, names in os.walk(upload_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                if os.path.basename(root) == 'tmp' or file_registry.lookup_path(cursor, path):
+                    continue
+                file_registry.register(cursor, path, owner_type=file_registry.LEGACY_OWNER)
+                registered += 1
+    return registered
+
+def upload_store():
+    """UploadStore configured like the app's"""
+    from config import config
+    settings = config[os.environ.get('FLASK_ENV', 'default')]
+    s3_client = None
+    if getattr(settings, 'RESUMABLE_UPLOAD_S3_BUCKET', None):
+        import boto3
+        s3_client = boto3.client('s3')
+    return resumable_uploads.UploadStore.from_config(
+        {name: getattr(settings, name) for name in dir(settings) if name.isupper()}, s3_client)
+
+def cleanup_stored_files(run_backfill=False, delete_orphans=False):
+    """Hash, deduplicate and report (or delete) orphaned uploads"""
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+        start = time.time()
+        file_registry.ensure_schema(cursor)
+        if run_backfill:
+            logging.info(f"Registered {backfill(cursor)} existing files")
+            conn.commit()
+
+        hashed = file_registry.fill_missing_hashes(cursor)
+        conn.commit()
+        saved = file_registry.dedup_local(cursor)
+        logging.info(f"Hashed {hashed} files, deduplication saved {saved / (1024 * 1024):.1f} MB")
+
+        image_derivatives.ensure_schema(cursor)
+        relocated = image_derivatives.relocate_private(cursor)
+        conn.commit()
+        logging.info(f"Moved {relocated} derivatives of private files out of static/")
+
+        orphans = file_registry.find_orphans(cursor)
+        orphan_bytes = sum(row['size_bytes'] or 0 for row in orphans)
+        for row in orphans:
+            logging.info(f"Orphan {row['id']}: {row['backend']} {row['storage_path']} ({row['size_bytes']} bytes)")
+        if delete_orphans:
+            s3_client = None
+            if any(row['backend'] == 's3' for row in orphans):
+                import boto3
+                s3_client = boto3.client('s3')
+            deleted = sum(1 for row in orphans if file_registry.delete(cursor, row, s3_client))
+            logging.info(f"Deleted {deleted} orphaned files ({orphan_bytes} bytes)")
+        else:
+            logging.info(f"Found {len(orphans)} orphaned files ({orphan_bytes} bytes); "
+                         f"run with --delete-orphans to remove them")
+        conn.commit()
+
+        blob_store.ensure_schema(cursor)
+        corrected = blob_store.recount(cursor)
+        conn.commit()
+        deleted = blob_store.gc(cursor)
+        for sha256, _ in deleted:
+            row = file_registry.lookup_path(cursor, blob_store.absolute_path(sha256))
+            if row:
+                file_registry.delete(cursor, row)
+        swept = blob_store.sweep_untracked(cursor)
+        conn.commit()
+        logging.info(f"Corrected {corrected} blob reference counts, collected {len(deleted)} blobs "
+                     f"({sum(size for _, size in deleted)} bytes), removed {swept} untracked files")
+
+        resumable_uploads.ensure_schema(cursor)
+        expired = upload_store().expire(cursor)
+        conn.commit()
+        logging.info(f"Expired {expired} resumable upload sessions")
+
+        logging.info(f"Stored file cleanup took {time.time() - start:.2f}s")
+        return True
+
+    except Exception as e:
+        logging.error(f"Error cleaning up stored files: {e}")
+        if conn:
+            conn.rollback()
+        return False
+    finally:
+        if conn:
+            conn.close()
+
+if __name__ == "__main__":
+    logging.info("Starting stored file cleanup")
+    cleanup_stored_files(run_backfill='--backfill' in sys.argv,
+                         delete_orphans='--delete-orphans' in sys.argv)
+    logging.info("Stored file cleanup completed")
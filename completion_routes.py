@@ -8,6 +8,9 @@ from flask import request, jsonify, session, render_template, redirect, url_for,
 from datetime import datetime
 import json
 
+import project_matching
+import project_facets
+
 # login_required and get_db_connection will be passed as parameters from app.py
 
 def register_completion_routes(app, get_db_connection, login_required):
@@ -176,6 +179,8 @@ def register_completion_routes(app, get_db_connection, login_required):
                     SET status = 'Completed', completion_date = ?
                     WHERE id = ?
                 """, (datetime.now().isoformat(), project_id))
+                project_matching.on_project_changed(cursor, project_id)
+                project_facets.on_project_changed(cursor, project_id)
             
             conn.commit()
             conn.close()
@@ -257,6 +262,8 @@ def register_completion_routes(app, get_db_connection, login_required):
                 SET status = 'Completed', completion_date = ?
                 WHERE id = ?
             """, (datetime.now().isoformat(), project_id))
+            project_matching.on_project_changed(cursor, project_id)
+            project_facets.on_project_changed(cursor, project_id)
             
             conn.commit()
             conn.close()
@@ -6,14 +6,81 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
+
+    # Upload serving: read block size, cache lifetime of uuid/hash-named files,
+    # and an optional nginx internal location (aliased to this directory) for X-Accel-Redirect
+    UPLOAD_BLOCK_SIZE = int(os.environ.get('UPLOAD_BLOCK_SIZE', 64 * 1024))
+    UPLOAD_IMMUTABLE_MAX_AGE = int(os.environ.get('UPLOAD_IMMUTABLE_MAX_AGE', 365 * 24 * 3600))
+    UPLOAD_X_ACCEL_REDIRECT = os.environ.get('UPLOAD_X_ACCEL_REDIRECT')
     
     # AWS Configuration
     AWS_REGION = os.environ.get('AWS_REGION', 'us-east-1')
     AWS_S3_BUCKET = os.environ.get('AWS_S3_BUCKET', 'homepro-uploads')
+    # Bucket the audio processor uploads recordings to
+    AWS_AUDIO_BUCKET = os.environ.get('AWS_AUDIO_BUCKET', 'homepro0723')
+    # Bucket of S3 keys stored before the file registry, by key prefix (AWS_S3_BUCKET otherwise)
+    S3_KEY_BUCKETS = {'projects/audios/': AWS_AUDIO_BUCKET}
+
+    # Presigned S3 URLs: lifetime, and how long before expiry a cached URL is re-signed
+    S3_PRESIGN_EXPIRES = int(os.environ.get('S3_PRESIGN_EXPIRES', 3600))
+    S3_PRESIGN_MARGIN = int(os.environ.get('S3_PRESIGN_MARGIN', 300))
+    S3_PRESIGN_CACHE_ENTRIES = int(os.environ.get('S3_PRESIGN_CACHE_ENTRIES', 10000))
+
+    # Rendered PDF cache (S3 when PDF_CACHE_S3_BUCKET is set, local directory otherwise)
+    PDF_CACHE_DIR = os.environ.get('PDF_CACHE_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pdf_cache')
+    PDF_CACHE_MAX_BYTES = int(os.environ.get('PDF_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+    PDF_CACHE_S3_BUCKET = os.environ.get('PDF_CACHE_S3_BUCKET')
+
+    # PDF render process pool per worker (0 renders in the request thread)
+    PDF_RENDER_WORKERS = int(os.environ.get('PDF_RENDER_WORKERS', min(4, os.cpu_count() or 1)))
+    PDF_RENDER_TIMEOUT = int(os.environ.get('PDF_RENDER_TIMEOUT', 30))
+
+    # Resumable chunked uploads: assembled in RESUMABLE_UPLOAD_DIR, or as S3 multipart uploads
+    # when RESUMABLE_UPLOAD_S3_BUCKET is set. Chunks must stay under MAX_CONTENT_LENGTH.
+    RESUMABLE_UPLOAD_DIR = os.environ.get('RESUMABLE_UPLOAD_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'upload_sessions')
+    RESUMABLE_UPLOAD_S3_BUCKET = os.environ.get('RESUMABLE_UPLOAD_S3_BUCKET')
+    RESUMABLE_UPLOAD_CHUNK_SIZE = int(os.environ.get('RESUMABLE_UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))
+
+    # Admission control for AI processing, per worker (see admission_control): jobs running
+    # at once, jobs waiting for a slot, and jobs one user may have running or waiting.
+    # Beyond these limits requests get 429 with Retry-After. The blocking endpoints never
+    # queue: they get 429 at once when no slot is free. AI_MAX_JOBS also bounds the audio
+    # conversions the /async/... jobs run at once.
+    AI_MAX_JOBS = int(os.environ.get('AI_MAX_JOBS', 2))
+    AI_MAX_QUEUED_JOBS = int(os.environ.get('AI_MAX_QUEUED_JOBS', 10))
+    AI_MAX_JOBS_PER_USER = int(os.environ.get('AI_MAX_JOBS_PER_USER', 2))
+
+    # The same limits for the /async/... AI endpoints, whose jobs mostly wait on AWS, and the
+    # threads they use for blocking work (see ai_async)
+    AI_ASYNC_MAX_JOBS = int(os.environ.get('AI_ASYNC_MAX_JOBS', 200))
+    AI_ASYNC_MAX_QUEUED_JOBS = int(os.environ.get('AI_ASYNC_MAX_QUEUED_JOBS', 500))
+    AI_ASYNC_MAX_JOBS_PER_USER = int(os.environ.get('AI_ASYNC_MAX_JOBS_PER_USER', 5))
+    AI_ASYNC_BLOCKING_THREADS = int(os.environ.get('AI_ASYNC_BLOCKING_THREADS', 16))
+
+    # Admin pages warn that the analytics rollups are out of date when they are older than this
+    ADMIN_ROLLUP_MAX_AGE_SECONDS = int(os.environ.get('ADMIN_ROLLUP_MAX_AGE_SECONDS', 30 * 60))
+
+    # Seconds a finished AI job's status stays readable at /processing_status (see job_status)
+    AI_JOB_STATUS_RETENTION = int(os.environ.get('AI_JOB_STATUS_RETENTION', 900))
+
+    # Open /api/events streams per worker; each holds a request thread (set by gunicorn_config)
+    EVENT_STREAM_MAX_STREAMS = int(os.environ.get('EVENT_STREAM_MAX_STREAMS', 4))
+
+    # Threads per worker generating resized WebP/AVIF/JPEG copies of uploaded images (0 = in the request)
+    IMAGE_DERIVATIVE_WORKERS = int(os.environ.get('IMAGE_DERIVATIVE_WORKERS', 2))
     
     # Session Configuration
     PERMANENT_SESSION_LIFETIME = timedelta(hours=24)
 
+    # Where session data is kept: 'sql' (server_sessions table), 'file' (SESSION_FILE_DIR)
+    # or 'cookie' (Flask's signed cookie). The server-side backends only put a signed id in the cookie.
+    SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'sql')
+    SESSION_FILE_DIR = os.environ.get('SESSION_FILE_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'flask_sessions')
+    # Per-worker read cache of server-side sessions; a revoked session can be used
+    # by another worker for up to SESSION_CACHE_SECONDS
+    SESSION_CACHE_ENTRIES = int(os.environ.get('SESSION_CACHE_ENTRIES', 10000))
+    SESSION_CACHE_SECONDS = int(os.environ.get('SESSION_CACHE_SECONDS', 30))
+
     # Authentication Configuration (using simple password hashing)
     # No external authentication service needed
 
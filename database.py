@@ -0,0 +1,44 @@
+"""
+Database connections for the app and the standalone scripts.
+
+Cron and migration scripts only need a connection; importing it from here
+instead of app.py spares them building the Flask app, its services and
+every route.
+"""
+
+import os
+
+
+def get_db_connection():
+    # Check if we're in local development (SQLite) or production (MySQL)
+    if os.path.exists('homepro.db') or os.getenv('FLASK_ENV') == 'development':
+        # Use SQLite for local development
+        import sqlite3
+        conn = sqlite3.connect('homepro.db')
+        conn.row_factory = sqlite3.Row
+        return conn
+    else:
+        # MySQL for production. Fail fast if misconfigured or unreachable.
+        import pymysql
+        required = ['DB_HOST', 'DB_USERNAME', 'DB_PASSWORD', 'DB_NAME']
+        missing = [k for k in required if not os.getenv(k)]
+        if missing:
+            raise RuntimeError(f"Missing required DB env vars: {', '.join(missing)}")
+        return pymysql.connect(
+            host=os.getenv('DB_HOST'),
+            user=os.getenv('DB_USERNAME'),
+            password=os.getenv('DB_PASSWORD'),
+            db=os.getenv('DB_NAME'),
+            port=int(os.getenv('DB_PORT', 3306)),
+            cursorclass=pymysql.cursors.DictCursor
+        )
+
+
+def is_sqlite(cursor):
+    """True for a cursor of the local SQLite database, False for MySQL"""
+    return hasattr(cursor, 'row_factory')
+
+
+def placeholder(cursor):
+    """The query parameter marker for the cursor's database"""
+    return '?' if is_sqlite(cursor) else '%s'
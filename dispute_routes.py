@@ -4,11 +4,21 @@ Dispute Management Routes
 Handles project dispute filing, tracking, and resolution
 """
 
-from flask import request, jsonify, session, render_template, redirect, url_for, flash
+from flask import request, jsonify, session, render_template, redirect, url_for, flash, current_app, abort
 from datetime import datetime
+import contextlib
 import os
+
+import blob_store
+import evidence_bundle
+import file_registry
+import image_derivatives
+import resumable_uploads
 # login_required and get_db_connection will be passed as parameters from app.py
 
+# Largest evidence file accepted (same limit as milestone evidence)
+MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+
 def register_dispute_routes(app, get_db_connection, login_required):
     """Register all dispute-related routes"""
     
@@ -194,10 +204,38 @@ def register_dispute_routes(app, get_db_connection, login_required):
             flash(f'Error loading disputes: {str(e)}', 'error')
             return redirect(url_for('project_detail', project_id=project_id))
     
+    @app.route('/api/disputes/<int:dispute_id>/evidence/bundle.zip')
+    @login_required
+    def download_dispute_evidence_bundle(dispute_id):
+        """Stream every evidence file of a dispute as one zip, checking access once"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                SELECT d.id
+                FROM project_disputes d
+                JOIN projects p ON d.project_id = p.id
+                WHERE d.id = ? AND (
+                    d.filed_by = ? OR p.homeowner_id = ? OR
+                    EXISTS (SELECT 1 FROM bids b WHERE b.project_id = p.id AND b.contractor_id = ? AND b.status = 'Accepted')
+                )
+            """, (dispute_id, session['user']['id'], session['user']['id'], session['user']['id']))
+            if not cursor.fetchone():
+                abort(403)
+            entries = evidence_bundle.dispute_entries(cursor, dispute_id)
+        finally:
+            conn.close()
+        
+        if not entries:
+            abort(404)
+        return evidence_bundle.zip_response(entries, f'dispute_{dispute_id}_evidence.zip')
+    
     @app.route('/api/disputes/<int:dispute_id>/evidence', methods=['POST'])
     @login_required
     def upload_dispute_evidence(dispute_id):
         """Upload evidence for a dispute"""
+        # Closes the streams opened over resumable uploads, however the request ends
+        open_files = contextlib.ExitStack()
         try:
             conn = get_db_connection()
             cursor = conn.cursor()
@@ -217,53 +255,76 @@ def register_dispute_routes(app, get_db_connection, login_required):
             if not dispute:
                 return jsonify({'error': 'Access denied'}), 403
             
-            # Handle file uploads (similar to evidence_routes.py)
-            if 'files' not in request.files:
+            # Handle file uploads (similar to evidence_routes.py); large files may instead
+            # have been sent beforehand through the resumable upload API
+            upload_ids = request.form.getlist('upload_ids')
+            if 'files' not in request.files and not upload_ids:
                 return jsonify({'error': 'No files provided'}), 400
             
             files = request.files.getlist('files')
-            if not files or files[0].filename == '':
+            if not upload_ids and (not files or files[0].filename == ''):
                 return jsonify({'error': 'No files selected'}), 400
             
+            # (original name, stream, size limit) per file
+            sources = [(file.filename, file.stream, MAX_FILE_SIZE) for file in files if file and file.filename]
+            upload_store = current_app.extensions['upload_store']
+            uploads = []
+            for upload_id in upload_ids:
+                upload = upload_store.claim(cursor, upload_id, session['user']['id'], 'evidence')
+                if not upload:
+                    return jsonify({'error': f'Upload {upload_id} not found or not complete'}), 400
+                uploads.append(upload)
+                source = upload_store.open_upload(upload)
+                open_files.callback(source.close)
+                sources.append((upload['filename'], source, resumable_uploads.PURPOSES['evidence'][0]))
+            
             evidence_type = request.form.get('evidence_type', 'document')
             title = request.form.get('title', '')
             description = request.form.get('description', '')
             
-            # Create uploads directory if it doesn't exist
-            upload_dir = os.path.join('static', 'uploads', 'disputes')
-            os.makedirs(upload_dir, exist_ok=True)
-            
             uploaded_files = []
-            
-            for file in files:
-                if file and file.filename:
-                    # Generate unique filename
-                    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                    filename = f"dispute_{dispute_id}_{timestamp}_{file.filename}"
-                    file_path = os.path.join(upload_dir, filename)
-                    
-                    # Save file
-                    file.save(file_path)
-                    
-                    # Insert evidence record
-                    cursor.execute("""
-                        INSERT INTO dispute_evidence (
-                            dispute_id, evidence_type, file_path, original_filename,
-                            file_size, title, description, uploaded_by, upload_date
-                        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """, (
-                        dispute_id, evidence_type, file_path, file.filename,
-                        os.path.getsize(file_path), title, description,
-                        session['user']['id'], datetime.now().isoformat()
-                    ))
-                    
-                    uploaded_files.append({
-                        'filename': file.filename,
-                        'stored_filename': filename
-                    })
+            image_file_ids = []
+            
+            for original_filename, stream, max_bytes in sources:
+                # Generate unique filename
+                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+                filename = f"dispute_{dispute_id}_{timestamp}_{original_filename}"
+                
+                # Copy into the blob store, stopping as soon as the limit is passed
+                try:
+                    sha256, file_size = blob_store.store(cursor, stream, original_filename, max_bytes)
+                except blob_store.BlobTooLarge as e:
+                    return jsonify({'error': f'File {original_filename}: {e}'}), 400
+                file_path = blob_store.blob_path(sha256)
+                
+                # Insert evidence record
+                cursor.execute("""
+                    INSERT INTO dispute_evidence (
+                        dispute_id, evidence_type, file_path, original_filename,
+                        file_size, title, description, uploaded_by, upload_date
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, (
+                    dispute_id, evidence_type, file_path, original_filename,
+                    file_size, title, description,
+                    session['user']['id'], datetime.now().isoformat()
+                ))
+                file_id = file_registry.register(cursor, file_path, original_filename, 'dispute_evidence', cursor.lastrowid)
+                if image_derivatives.is_image(original_filename):
+                    image_file_ids.append(file_id)
+                
+                uploaded_files.append({
+                    'filename': original_filename,
+                    'stored_filename': filename
+                })
             
             conn.commit()
             conn.close()
+            open_files.close()
+            
+            for upload in uploads:
+                upload_store.discard(upload)
+            for file_id in image_file_ids:
+                current_app.extensions['image_pipeline'].submit(file_id)
             
             return jsonify({
                 'success': True,
@@ -272,4 +333,6 @@ def register_dispute_routes(app, get_db_connection, login_required):
             })
             
         except Exception as e:
-            return jsonify({'error': str(e)}), 500
\ No newline at end of file
+            return jsonify({'error': str(e)}), 500
+        finally:
+            open_files.close()
\ No newline at end of file
@@ -10,7 +10,8 @@ import mysql.connector
 import sqlite3
 import os
 from datetime import datetime, timedelta
-from app import get_db_connection
+from database import get_db_connection
+import bid_conversations
 
 def enhance_bidding_system():
     """Add new tables and features for advanced bidding"""
@@ -88,13 +89,61 @@ def enhance_bidding_system():
                     INDEX idx_user (user_id),
                     INDEX idx_type (notification_type),
                     INDEX idx_read (is_read),
-                    INDEX idx_created (created_at)
+                    INDEX idx_created (created_at),
+                    INDEX idx_user_created (user_id, created_at)
                 )
             ''')
             print("✓ Created bid_notifications table")
         except Exception as e:
             print(f"Note: bid_notifications table may already exist: {e}")
         
+        # Inbox reads filter by user and sort by created_at
+        try:
+            cursor.execute("SHOW INDEX FROM bid_notifications WHERE Key_name = 'idx_user_created'")
+            if not cursor.fetchone():
+                cursor.execute("ALTER TABLE bid_notifications ADD INDEX idx_user_created (user_id, created_at)")
+                print("✓ Added idx_user_created index to bid_notifications table")
+        except Exception as e:
+            print(f"Note: idx_user_created index may already exist: {e}")
+        
+        # Create notification_counters table for cached unread counts
+        try:
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS notification_counters (
+                    user_id INT PRIMARY KEY,
+                    unread_count INT NOT NULL DEFAULT 0,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+                )
+            ''')
+            print("✓ Created notification_counters table")
+        except Exception as e:
+            print(f"Note: notification_counters table may already exist: {e}")
+
+        # Create bid_conversations summary table and backfill it from bid_messages
+        try:
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS bid_conversations (
+                    bid_id INT PRIMARY KEY,
+                    contractor_id INT NOT NULL,
+                    contractor_user_id INT NOT NULL,
+                    homeowner_user_id INT NOT NULL,
+                    last_message_id INT NULL,
+                    last_message_preview VARCHAR(255),
+                    last_activity_at TIMESTAMP NULL,
+                    message_count INT NOT NULL DEFAULT 0,
+                    contractor_unread INT NOT NULL DEFAULT 0,
+                    homeowner_unread INT NOT NULL DEFAULT 0,
+                    FOREIGN KEY (bid_id) REFERENCES bids(id) ON DELETE CASCADE,
+                    INDEX idx_contractor_activity (contractor_id, last_activity_at),
+                    INDEX idx_homeowner_activity (homeowner_user_id, last_activity_at)
+                )
+            ''')
+            rebuilt = bid_conversations.rebuild(cursor)
+            print(f"✓ Created bid_conversations table ({rebuilt} conversations)")
+        except Exception as e:
+            print(f"Note: bid_conversations table may already exist: {e}")
+
         # Add new columns to bids table if they don't exist
         try:
             # Check if negotiation_allowed column exists
@@ -0,0 +1,367 @@
+"""
+Server-Sent Events hub for per-user push updates.
+
+Insert paths (bid messages, project messages, notifications) call publish()
+after their transaction commits; every open /api/events stream for that user
+receives the event, whichever worker holds it.
+
+gunicorn runs several worker processes, so publish() does not hand events
+to streams directly. It appends them to the stream_events table, and one
+poller thread per process reads new rows every POLL_SECONDS and passes
+them to the streams that process holds. Event ids are the row ids, so a
+reconnecting client resumes from its Last-Event-ID on any worker: the
+events it missed are read back from the table. Rows older than
+RETENTION_SECONDS are deleted by the poller. A client whose last event is
+older than that is sent a single 'resync' event and should refetch once
+before continuing on the stream.
+
+Until configure() is called (scripts that import the senders) events are
+delivered within the process only, with no replay.
+
+Each open stream holds a request thread, so a worker accepts at most
+max_streams of them (EVENT_STREAM_MAX_STREAMS); stream() raises
+TooManyStreams beyond that and the client retries later. stream() takes
+the slot before it returns, so concurrent requests cannot overshoot the
+limit, and the slot is given back when the response is closed, whether or
+not its frames were ever read. Under gunicorn's sync worker class a
+stream would pin the worker's only thread, so gunicorn_config.py sets
+max_streams to 0 there: every /api/events request is refused and pages
+keep themselves current by refetching on the retry interval instead.
+"""
+
+import json
+import queue
+import threading
+import time
+from collections import deque
+
+from database import is_sqlite, placeholder
+
+# Seconds between keep-alive comments on an idle stream
+HEARTBEAT_SECONDS = 15
+
+# A stream is closed after this long so a sync worker is never pinned
+# forever; EventSource reconnects automatically with Last-Event-ID.
+MAX_STREAM_SECONDS = 300
+
+# Client reconnect delay advertised in the stream, in milliseconds
+RETRY_MS = 3000
+
+# Open streams per worker process
+DEFAULT_MAX_STREAMS = 4
+
+# Events queued per stream before newer ones are dropped
+STREAM_QUEUE_SIZE = 100
+
+# Seconds between polls of stream_events for events published by any worker
+POLL_SECONDS = 1.0
+
+# Rows read per poll
+POLL_BATCH = 500
+
+# Ids below the newest seen are read again for this many rows, so an insert
+# that committed after a higher id was already read is still delivered
+POLL_LOOKBACK = 100
+
+# Events kept in stream_events for Last-Event-ID replay
+RETENTION_SECONDS = 3600
+
+# Seconds between deletions of expired events
+PURGE_INTERVAL_SECONDS = 600
+
+_lock = threading.Lock()
+_subscribers = {}
+_get_db_connection = None
+_max_streams = DEFAULT_MAX_STREAMS
+_poller = None
+_poll_cursor = None
+# Newest id when the poller started; the lookback never reaches below it
+_poll_floor = 0
+_recent_ids = deque(maxlen=POLL_BATCH + POLL_LOOKBACK)
+_local_event_id = 0
+
+
+class TooManyStreams(Exception):
+    """This worker already holds max_streams open streams"""
+
+
+def ensure_schema(cursor):
+    """Create stream_events for the connected database if it is missing"""
+    if is_sqlite(cursor):
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stream_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                event_type TEXT NOT NULL,
+                data TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_stream_events_user ON stream_events (user_id, id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_stream_events_created ON stream_events (created_at)')
+        return
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stream_events (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            user_id INT NOT NULL,
+            event_type VARCHAR(50) NOT NULL,
+            data TEXT NOT NULL,
+            created_at DOUBLE NOT NULL,
+            INDEX idx_user (user_id, id),
+            INDEX idx_created (created_at)
+        )
+    ''')
+
+
+def configure(get_db_connection, max_streams=DEFAULT_MAX_STREAMS):
+    """Deliver events through stream_events, so every worker sees them"""
+    global _get_db_connection, _max_streams
+    _get_db_connection = get_db_connection
+    _max_streams = max_streams
+
+
+def _execute(get_db_connection, work):
+    """Run work(cursor) and commit; creates stream_events if it is missing"""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        try:
+            result = work(cursor)
+        except Exception as e:
+            if 'stream_events' not in str(e):
+                raise
+            conn.rollback()
+            ensure_schema(cursor)
+            result = work(cursor)
+        conn.commit()
+        return result
+    finally:
+        conn.close()
+
+
+def publish(user_id, event_type, data):
+    """Deliver an event to every open stream for a user, on any worker"""
+    if not user_id:
+        return None
+    get_db_connection = _get_db_connection
+    if get_db_connection is not None:
+        def insert(cursor):
+            ph = placeholder(cursor)
+            cursor.execute(f'''
+                INSERT INTO stream_events (user_id, event_type, data, created_at)
+                VALUES ({ph}, {ph}, {ph}, {ph})
+            ''', (user_id, event_type, json.dumps(data, default=str), time.time()))
+            return cursor.lastrowid
+        try:
+            return _execute(get_db_connection, insert)
+        except Exception as e:
+            print(f"Error publishing {event_type} event to user {user_id}; delivering on this worker only: {e}")
+
+    global _local_event_id
+    with _lock:
+        _local_event_id = max(_local_event_id + 1, int(time.time() * 1000))
+        event = {'id': _local_event_id, 'event': event_type, 'data': data}
+    _deliver(user_id, event)
+    return event['id']
+
+
+def _deliver(user_id, event, advance_cursor=False):
+    global _poll_cursor
+    with _lock:
+        # Moving the cursor and picking the streams together keeps a stream that starts
+        # meanwhile from getting the event both replayed and delivered
+        if advance_cursor:
+            _poll_cursor = max(_poll_cursor, event['id'])
+        subscribers = list(_subscribers.get(user_id, ()))
+    for subscriber in subscribers:
+        try:
+            subscriber.put_nowait(event)
+        except queue.Full:
+            pass
+
+
+def subscriber_count(user_id=None):
+    """Number of open streams, for one user or in total"""
+    with _lock:
+        if user_id is not None:
+            return len(_subscribers.get(user_id, ()))
+        return sum(len(s) for s in _subscribers.values())
+
+
+def _event(row):
+    return {'id': row['id'], 'event': row['event_type'], 'data': json.loads(row['data'])}
+
+
+def _newest_id(cursor):
+    cursor.execute('SELECT MAX(id) AS newest FROM stream_events')
+    row = cursor.fetchone()
+    return (row['newest'] if row else None) or 0
+
+
+def _poll(cursor, last_purge):
+    """Deliver events published since the last poll; returns the time of the last purge"""
+    ph = placeholder(cursor)
+    cursor.execute(f'''
+        SELECT id, user_id, event_type, data FROM stream_events
+        WHERE id > {ph} ORDER BY id LIMIT {POLL_BATCH}
+    ''', (max(_poll_cursor - POLL_LOOKBACK, _poll_floor),))
+    rows = cursor.fetchall()
+    for row in rows:
+        if row['id'] in _recent_ids:
+            continue
+        _recent_ids.append(row['id'])
+        _deliver(row['user_id'], _event(row), advance_cursor=True)
+
+    if time.time() - last_purge > PURGE_INTERVAL_SECONDS:
+        cursor.execute(f'DELETE FROM stream_events WHERE created_at < {ph}',
+                       (time.time() - RETENTION_SECONDS,))
+        last_purge = time.time()
+    return last_purge
+
+
+def _run_poller(get_db_connection):
+    global _poller
+    last_purge = 0
+    conn = None
+    while True:
+        with _lock:
+            if not _subscribers:
+                # Restarted by the next stream; it replays what it missed
+                _poller = None
+                break
+        try:
+            if conn is None:
+                conn = get_db_connection()
+            cursor = conn.cursor()
+            last_purge = _poll(cursor, last_purge)
+            # Ends the transaction, so the next poll sees new rows
+            conn.commit()
+            cursor.close()
+        except Exception as e:
+            print(f"Error polling stream events: {e}")
+            try:
+                conn.close()
+            except Exception:
+                pass
+            conn = None
+        time.sleep(POLL_SECONDS)
+    if conn is not None:
+        conn.close()
+
+
+def _start_poller(get_db_connection, newest_id):
+    """Start this process's poller at newest_id if it is not running; called with the lock held"""
+    global _poller, _poll_cursor, _poll_floor
+    if _poller is not None:
+        return
+    _poll_cursor = _poll_floor = newest_id
+    _recent_ids.clear()
+    _poller = threading.Thread(target=_run_poller, args=(get_db_connection,),
+                               name='event-stream-poller', daemon=True)
+    _poller.start()
+
+
+def _replay(get_db_connection, user_id, last_event_id, up_to):
+    """Events for a user after last_event_id up to up_to, or None if some have expired"""
+    def read(cursor):
+        ph = placeholder(cursor)
+        cursor.execute('SELECT MIN(id) AS oldest FROM stream_events')
+        row = cursor.fetchone()
+        oldest = row['oldest'] if row else None
+        if oldest is None or oldest > last_event_id + 1:
+            return None
+        cursor.execute(f'''
+            SELECT id, user_id, event_type, data FROM stream_events
+            WHERE user_id = {ph} AND id > {ph} AND id <= {ph} ORDER BY id
+        ''', (user_id, last_event_id, up_to))
+        return [_event(row) for row in cursor.fetchall()]
+    return _execute(get_db_connection, read)
+
+
+class _Stream:
+    """SSE frames for one client connection; holds its stream slot until close()"""
+
+    def __init__(self, user_id, subscriber, frames):
+        self.user_id = user_id
+        self.subscriber = subscriber
+        self.frames = frames
+
+    def __iter__(self):
+        return self.frames
+
+    def close(self):
+        # WSGI servers call this when the response ends, even if it was never iterated
+        self.frames.close()
+        _unsubscribe(self.user_id, self.subscriber)
+
+
+def _unsubscribe(user_id, subscriber):
+    with _lock:
+        subscribers = _subscribers.get(user_id)
+        if subscribers:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                _subscribers.pop(user_id, None)
+
+
+def stream(user_id, last_event_id=None):
+    """Iterable of SSE frames for one client connection, already subscribed; raises TooManyStreams"""
+    if subscriber_count() >= _max_streams:
+        raise TooManyStreams()
+
+    get_db_connection = _get_db_connection
+    try:
+        # The newest id is only needed when this stream starts the poller
+        newest_id = _execute(get_db_connection, _newest_id) if get_db_connection and _poller is None else None
+    except Exception as e:
+        print(f"Error reading stream events: {e}")
+        get_db_connection = None
+
+    subscriber = queue.Queue(maxsize=STREAM_QUEUE_SIZE)
+    up_to = None
+    with _lock:
+        # Checked again with the lock held: the slot is taken here, not when the frames start
+        if sum(len(s) for s in _subscribers.values()) >= _max_streams:
+            raise TooManyStreams()
+        _subscribers.setdefault(user_id, set()).add(subscriber)
+        if get_db_connection is not None:
+            if _poller is None:
+                _start_poller(get_db_connection, newest_id if newest_id is not None else 0)
+            # Events up to the poller's position are replayed, later ones come from the poller
+            up_to = _poll_cursor
+
+    return _Stream(user_id, subscriber, _frames(user_id, subscriber, last_event_id, get_db_connection, up_to))
+
+
+def _format(event):
+    return (f"id: {event['id']}\n"
+            f"event: {event['event']}\n"
+            f"data: {json.dumps(event['data'], default=str)}\n\n")
+
+
+def _frames(user_id, subscriber, last_event_id, get_db_connection, up_to):
+    backlog = None if last_event_id is not None else []
+    try:
+        if get_db_connection is not None and last_event_id is not None:
+            try:
+                backlog = _replay(get_db_connection, user_id, last_event_id, up_to)
+            except Exception as e:
+                print(f"Error replaying stream events for user {user_id}: {e}")
+        yield f"retry: {RETRY_MS}\n\n"
+        if backlog is None:
+            yield _format({'id': last_event_id, 'event': 'resync', 'data': {}})
+        else:
+            for event in backlog:
+                yield _format(event)
+
+        deadline = time.time() + MAX_STREAM_SECONDS
+        while time.time() < deadline:
+            try:
+                event = subscriber.get(timeout=HEARTBEAT_SECONDS)
+            except queue.Empty:
+                yield ": keep-alive\n\n"
+                continue
+            yield _format(event)
+    finally:
+        _unsubscribe(user_id, subscriber)
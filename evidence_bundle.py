@@ -0,0 +1,171 @@
+"""
+Streaming zip bundles of milestone, dispute and project evidence.
+
+Reviewing evidence used to mean opening files one at a time through
+serve_evidence_file, repeating its access-check join for every file. The
+bundle routes check access once, list every file of the milestone, dispute
+or project with one query each, and stream them as a single zip.
+
+The archive is produced while it is sent. zipfile writes to a sink that
+cannot seek, so each member is followed by a data descriptor instead of a
+rewritten local header, and the response body is whatever the sink holds
+after each block. Nothing larger than one BLOCK_SIZE read is buffered.
+
+Photos, video, audio and Office/PDF documents are already compressed;
+deflating them again costs CPU and saves nothing, so they are stored.
+Anything else (text, legacy .doc) is deflated.
+"""
+
+import os
+import zipfile
+from datetime import datetime
+
+from flask import Response, stream_with_context
+
+from database import placeholder
+
+# Bytes read from each file per block
+BLOCK_SIZE = 64 * 1024
+
+# Extensions whose content is already compressed
+STORED_EXTENSIONS = {
+    'jpg', 'jpeg', 'png', 'gif', 'webp', 'avif', 'heic',
+    'mp3', 'm4a', 'aac', 'ogg', 'webm', 'mp4', 'mov', 'mkv', 'avi',
+    'zip', 'gz', 'docx', 'xlsx', 'pptx', 'pdf',
+}
+
+
+class _Sink:
+    """Write-only file object that hands back what was written since the last take()"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def compress_type(filename):
+    extension = filename.lower().rsplit('.', 1)[-1] if '.' in filename else ''
+    return zipfile.ZIP_STORED if extension in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+
+
+def _unique(name, used):
+    # Two files with the same original name in one folder
+    if name not in used:
+        used.add(name)
+        return name
+    stem, dot, extension = name.rpartition('.')
+    if not dot:
+        stem, extension = name, ''
+    counter = 2
+    while True:
+        candidate = f"{stem} ({counter}){dot}{extension}"
+        if candidate not in used:
+            used.add(candidate)
+            return candidate
+        counter += 1
+
+
+def _safe(name):
+    # Folder and file names come from user input
+    return ''.join('_' if c in '/\\:*?"<>|' else c for c in (name or '')).strip() or 'file'
+
+
+def stream_zip(entries):
+    """Yield a zip archive of (archive name, path on disk) entries, block by block.
+
+    Files that have gone missing from disk are skipped.
+    """
+    sink = _Sink()
+    used = set()
+    with zipfile.ZipFile(sink, 'w') as archive:
+        for name, path in entries:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            info = zipfile.ZipInfo(_unique(name, used), date_time=datetime.fromtimestamp(stat.st_mtime).timetuple()[:6])
+            info.compress_type = compress_type(name)
+            info.file_size = stat.st_size
+            with open(path, 'rb') as source, archive.open(info, 'w') as member:
+                for block in iter(lambda: source.read(BLOCK_SIZE), b''):
+                    member.write(block)
+                    data = sink.take()
+                    if data:
+                        yield data
+            yield sink.take()
+    yield sink.take()
+
+
+def _evidence_entries(rows, folder):
+    return [(f"{folder(row)}/{_safe(row['original_filename'])}", row['file_path']) for row in rows]
+
+
+def milestone_entries(cursor, milestone_id):
+    """Archive entries for every evidence file of one milestone, one folder per submission"""
+    ph = placeholder(cursor)
+    cursor.execute(f'''
+        SELECT me.id AS evidence_id, ef.original_filename, ef.file_path
+        FROM evidence_files ef
+        JOIN milestone_evidence me ON ef.evidence_id = me.id
+        WHERE me.milestone_id = {ph}
+        ORDER BY me.id, ef.id
+    ''', (milestone_id,))
+    return _evidence_entries(cursor.fetchall(), lambda row: f"evidence_{row['evidence_id']}")
+
+
+def dispute_entries(cursor, dispute_id):
+    """Archive entries for every evidence file of one dispute"""
+    ph = placeholder(cursor)
+    cursor.execute(f'''
+        SELECT id, original_filename, file_path
+        FROM dispute_evidence
+        WHERE dispute_id = {ph}
+        ORDER BY id
+    ''', (dispute_id,))
+    return _evidence_entries(cursor.fetchall(), lambda row: f"dispute_{dispute_id}")
+
+
+def project_entries(cursor, project_id):
+    """Archive entries for all milestone and dispute evidence of a project"""
+    ph = placeholder(cursor)
+    cursor.execute(f'''
+        SELECT pm.id AS milestone_id, pm.title AS milestone_title, me.id AS evidence_id,
+               ef.original_filename, ef.file_path
+        FROM evidence_files ef
+        JOIN milestone_evidence me ON ef.evidence_id = me.id
+        JOIN project_milestones pm ON me.milestone_id = pm.id
+        WHERE pm.project_id = {ph}
+        ORDER BY pm.id, me.id, ef.id
+    ''', (project_id,))
+    entries = _evidence_entries(cursor.fetchall(), lambda row: (
+        f"milestones/{row['milestone_id']} {_safe(row['milestone_title'])}/evidence_{row['evidence_id']}"))
+    cursor.execute(f'''
+        SELECT de.dispute_id, de.original_filename, de.file_path
+        FROM dispute_evidence de
+        JOIN project_disputes d ON de.dispute_id = d.id
+        WHERE d.project_id = {ph}
+        ORDER BY de.dispute_id, de.id
+    ''', (project_id,))
+    entries += _evidence_entries(cursor.fetchall(), lambda row: f"disputes/dispute_{row['dispute_id']}")
+    return entries
+
+
+def zip_response(entries, download_name):
+    """Streaming response for stream_zip(entries)"""
+    response = Response(stream_with_context(stream_zip(entries)), mimetype='application/zip')
+    response.headers.set('Content-Disposition', 'attachment', filename=download_name)
+    response.headers['Cache-Control'] = 'private, no-store'
+    # Let nginx pass blocks through as they are produced
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
@@ -1,12 +1,17 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, abort, send_file
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, abort, send_file, current_app
 from functools import wraps
 from datetime import datetime, timedelta
 import json
 import os
 import uuid
 from werkzeug.utils import secure_filename
-from PIL import Image
-import io
+
+import file_serving
+import blob_store
+import evidence_bundle
+import file_registry
+import image_derivatives
+import resumable_uploads
 
 # Allowed file extensions for evidence uploads
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'pdf', 'doc', 'docx', 'txt'}
@@ -59,46 +64,49 @@ def register_evidence_routes(app, get_db_connection, login_required):
                 
                 for file in files:
                     if file and file.filename and allowed_file(file.filename):
-                        # Check file size
-                        file.seek(0, os.SEEK_END)
-                        file_size = file.tell()
-                        file.seek(0)
-                        
-                        if file_size > MAX_FILE_SIZE:
-                            return jsonify({'error': f'File {file.filename} is too large. Maximum size is 10MB.'}), 400
-                        
-                        # Generate unique filename
+                        # Unique handle for this record; the content is stored once per SHA-256
                         filename = secure_filename(file.filename)
                         unique_filename = f"{uuid.uuid4()}_{filename}"
                         
-                        # Create evidence directory if it doesn't exist
-                        evidence_dir = os.path.join('static', 'uploads', 'evidence')
-                        os.makedirs(evidence_dir, exist_ok=True)
-                        
-                        # Save file
-                        file_path = os.path.join(evidence_dir, unique_filename)
-                        file.save(file_path)
-                        
-                        # If it's an image, create a thumbnail
-                        thumbnail_path = None
-                        if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif')):
-                            try:
-                                with Image.open(file_path) as img:
-                                    img.thumbnail((300, 300), Image.Resampling.LANCZOS)
-                                    thumbnail_filename = f"thumb_{unique_filename}"
-                                    thumbnail_path = os.path.join(evidence_dir, thumbnail_filename)
-                                    img.save(thumbnail_path)
-                            except Exception as e:
-                                print(f"Error creating thumbnail: {e}")
+                        # Copy into the blob store, stopping as soon as the limit is passed
+                        try:
+                            sha256, file_size = blob_store.store(cursor, file.stream, filename, MAX_FILE_SIZE)
+                        except blob_store.BlobTooLarge:
+                            return jsonify({'error': f'File {file.filename} is too large. Maximum size is 10MB.'}), 400
+                        file_path = blob_store.blob_path(sha256)
                         
+                        # Thumbnails are generated in the background (image_derivatives)
                         uploaded_files.append({
                             'filename': filename,
                             'unique_filename': unique_filename,
                             'file_path': file_path,
-                            'thumbnail_path': thumbnail_path,
+                            'thumbnail_path': None,
                             'file_size': file_size
                         })
             
+            # Files sent beforehand through the resumable upload API
+            upload_store = current_app.extensions['upload_store']
+            uploads = []
+            for upload_id in request.form.getlist('upload_ids'):
+                upload = upload_store.claim(cursor, upload_id, session['user']['id'], 'evidence')
+                if not upload:
+                    return jsonify({'error': f'Upload {upload_id} not found or not complete'}), 400
+                filename = secure_filename(upload['filename'])
+                source = upload_store.open_upload(upload)
+                try:
+                    sha256, file_size = blob_store.store(cursor, source, filename,
+                                                         resumable_uploads.PURPOSES['evidence'][0])
+                finally:
+                    source.close()
+                uploads.append(upload)
+                uploaded_files.append({
+                    'filename': filename,
+                    'unique_filename': f"{uuid.uuid4()}_{filename}",
+                    'file_path': blob_store.blob_path(sha256),
+                    'thumbnail_path': None,
+                    'file_size': file_size
+                })
+            
             # Insert evidence record
             cursor.execute("""
                 INSERT INTO milestone_evidence 
@@ -114,6 +122,7 @@ def register_evidence_routes(app, get_db_connection, login_required):
             evidence_id = cursor.lastrowid
             
             # Insert file records
+            image_file_ids = []
             for file_info in uploaded_files:
                 cursor.execute("""
                     INSERT INTO evidence_files 
@@ -129,6 +138,10 @@ def register_evidence_routes(app, get_db_connection, login_required):
                     file_info['file_size'],
                     datetime.now().isoformat()
                 ))
+                file_id = file_registry.register(cursor, file_info['file_path'], file_info['filename'],
+                                                 'milestone_evidence', evidence_id)
+                if image_derivatives.is_image(file_info['filename']):
+                    image_file_ids.append(file_id)
             
             # Update milestone status to 'submitted' if not already
             if milestone[2] == 'pending':
@@ -141,6 +154,11 @@ def register_evidence_routes(app, get_db_connection, login_required):
             conn.commit()
             conn.close()
             
+            for upload in uploads:
+                upload_store.discard(upload)
+            for file_id in image_file_ids:
+                current_app.extensions['image_pipeline'].submit(file_id)
+            
             return jsonify({
                 'success': True,
                 'evidence_id': evidence_id,
@@ -208,6 +226,16 @@ def register_evidence_routes(app, get_db_connection, login_required):
                         'file_size': file_row[4]
                     })
                 
+                # Resized copies, served through serve_evidence_file with its access check
+                stored_files = file_registry.lookup_paths(cursor, [f['file_path'] for f in files])
+                stored_names = {stored_files[f['file_path']]['id']: f['stored_filename']
+                                for f in files if f['file_path'] in stored_files}
+                pictures = image_derivatives.srcsets(cursor, list(stored_names), lambda d: url_for(
+                    'serve_evidence_file', filename=stored_names[d['stored_file_id']], w=d['width'], format=d['format']))
+                for f in files:
+                    stored = stored_files.get(f['file_path'])
+                    f['picture'] = pictures.get(stored['id']) if stored else None
+                
                 evidence = {
                     'id': evidence_id,
                     'evidence_type': row[1],
@@ -226,6 +254,61 @@ def register_evidence_routes(app, get_db_connection, login_required):
         except Exception as e:
             return jsonify({'error': str(e)}), 500
     
+    @app.route('/api/milestone/<int:milestone_id>/evidence/bundle.zip')
+    @login_required
+    def download_milestone_evidence_bundle(milestone_id):
+        """Stream every evidence file of a milestone as one zip, checking access once"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            if session['user']['role'] == 'contractor':
+                cursor.execute("""
+                    SELECT pm.id FROM project_milestones pm
+                    JOIN projects p ON pm.project_id = p.id
+                    JOIN bids b ON p.id = b.project_id
+                    WHERE pm.id = ? AND b.contractor_id = ? AND b.status = 'Accepted'
+                """, (milestone_id, session['user']['id']))
+            else:  # homeowner
+                cursor.execute("""
+                    SELECT pm.id FROM project_milestones pm
+                    JOIN projects p ON pm.project_id = p.id
+                    WHERE pm.id = ? AND p.homeowner_id = ?
+                """, (milestone_id, session['user']['id']))
+            if not cursor.fetchone():
+                abort(403)
+            entries = evidence_bundle.milestone_entries(cursor, milestone_id)
+        finally:
+            conn.close()
+        
+        if not entries:
+            abort(404)
+        return evidence_bundle.zip_response(entries, f'milestone_{milestone_id}_evidence.zip')
+    
+    @app.route('/api/project/<int:project_id>/evidence/bundle.zip')
+    @login_required
+    def download_project_evidence_bundle(project_id):
+        """Stream all milestone and dispute evidence of a project as one zip"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            if session['user']['role'] == 'contractor':
+                cursor.execute("""
+                    SELECT id FROM bids 
+                    WHERE project_id = ? AND contractor_id = ? AND status = 'Accepted'
+                """, (project_id, session['user']['id']))
+            else:  # homeowner
+                cursor.execute('SELECT id FROM projects WHERE id = ? AND homeowner_id = ?',
+                               (project_id, session['user']['id']))
+            if not cursor.fetchone():
+                abort(403)
+            entries = evidence_bundle.project_entries(cursor, project_id)
+        finally:
+            conn.close()
+        
+        if not entries:
+            abort(404)
+        return evidence_bundle.zip_response(entries, f'project_{project_id}_evidence.zip')
+    
     @app.route('/api/evidence/<int:evidence_id>/review', methods=['POST'])
     @login_required
     def review_evidence(evidence_id):
@@ -327,7 +410,15 @@ def register_evidence_routes(app, get_db_connection, login_required):
             if not file_info:
                 abort(404)
             
-            file_path, project_id = file_info
+            file_path, project_id = file_info['file_path'], file_info['project_id']
+            
+            # ?w=<width>&format=<webp|avif|jpeg> asks for a resized copy
+            derivative = None
+            if request.args.get('w', type=int) and request.args.get('format'):
+                stored = file_registry.lookup_path(cursor, file_path)
+                if stored:
+                    derivative = image_derivatives.find(cursor, stored['id'], request.args.get('w', type=int),
+                                                        request.args.get('format'))
             
             # Verify user has access to this project
             has_access = False
@@ -348,8 +439,12 @@ def register_evidence_routes(app, get_db_connection, login_required):
                 abort(403)
             
             # Serve the file
-            if os.path.exists(file_path):
-                return send_file(file_path)
+            if derivative:
+                return file_serving.send_local_file(file_registry.absolute_path(derivative), private=True)
+            if os.path.isfile(file_path):
+                # Blob paths carry no extension; the type comes from the stored name
+                return file_serving.send_local_file(file_path, mime_type=file_serving.guess_mime_type(filename),
+                                                    private=True)
             else:
                 abort(404)
                 
@@ -411,47 +506,36 @@ def register_evidence_routes(app, get_db_connection, login_required):
             flash(f'Error loading evidence page: {str(e)}', 'error')
             return redirect(url_for('homeowner_dashboard' if session['user']['role'] == 'homeowner' else 'contractor_dashboard'))
 
-    # Initialize evidence_files table if it doesn't exist
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Detect database type for proper SQL syntax
-        is_sqlite = hasattr(conn, 'row_factory')
-        
-        if is_sqlite:
-            # SQLite version
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS evidence_files (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    evidence_id INTEGER NOT NULL,
-                    original_filename TEXT NOT NULL,
-                    stored_filename TEXT NOT NULL,
-                    file_path TEXT NOT NULL,
-                    thumbnail_path TEXT,
-                    file_size INTEGER NOT NULL,
-                    uploaded_at TIMESTAMP NOT NULL,
-                    FOREIGN KEY (evidence_id) REFERENCES milestone_evidence (id) ON DELETE CASCADE
-                )
-            """)
-        else:
-            # MySQL version
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS evidence_files (
-                    id INTEGER PRIMARY KEY AUTO_INCREMENT,
-                    evidence_id INTEGER NOT NULL,
-                    original_filename VARCHAR(255) NOT NULL,
-                    stored_filename VARCHAR(255) NOT NULL,
-                    file_path VARCHAR(500) NOT NULL,
-                    thumbnail_path VARCHAR(500),
-                    file_size INTEGER NOT NULL,
-                    uploaded_at DATETIME NOT NULL,
-                    FOREIGN KEY (evidence_id) REFERENCES milestone_evidence (id) ON DELETE CASCADE
-                )
-            """)
-        
-        conn.commit()
-        conn.close()
-        print("Evidence files table initialized successfully")
-    except Exception as e:
-        print(f"Error creating evidence_files table: {e}")
\ No newline at end of file
+
+def ensure_schema(cursor):
+    """Create the evidence_files table for the connected database if it is missing"""
+    if hasattr(cursor, 'row_factory'):
+        # SQLite version
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS evidence_files (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                evidence_id INTEGER NOT NULL,
+                original_filename TEXT NOT NULL,
+                stored_filename TEXT NOT NULL,
+                file_path TEXT NOT NULL,
+                thumbnail_path TEXT,
+                file_size INTEGER NOT NULL,
+                uploaded_at TIMESTAMP NOT NULL,
+                FOREIGN KEY (evidence_id) REFERENCES milestone_evidence (id) ON DELETE CASCADE
+            )
+        """)
+    else:
+        # MySQL version
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS evidence_files (
+                id INTEGER PRIMARY KEY AUTO_INCREMENT,
+                evidence_id INTEGER NOT NULL,
+                original_filename VARCHAR(255) NOT NULL,
+                stored_filename VARCHAR(255) NOT NULL,
+                file_path VARCHAR(500) NOT NULL,
+                thumbnail_path VARCHAR(500),
+                file_size INTEGER NOT NULL,
+                uploaded_at DATETIME NOT NULL,
+                FOREIGN KEY (evidence_id) REFERENCES milestone_evidence (id) ON DELETE CASCADE
+            )
+        """)
@@ -0,0 +1,418 @@
+"""
+Registry of stored files (stored_files table).
+
+Every upload is recorded once, with its storage backend ('local' or 's3'),
+bucket, path (relative to the app directory) or S3 key, the name it is
+served under at /uploads/<url_path>, size, MIME type and SHA-256. The row
+id is the file's logical id.
+
+uploaded_file() resolves a URL with one indexed lookup on url_path instead
+of probing directories. view_project() finds a project's audio from its
+row instead of matching path prefixes. Files that predate the registry are
+found by probing the served directories (served_file) until
+cleanup_stored_files.py --backfill registers them; only paths inside
+SERVED_ROOTS are ever served.
+
+Uploads are attached to what owns them (owner_type, owner_id). A row that
+is still unattached ORPHAN_GRACE_HOURS after upload, such as an audio file
+whose submission was abandoned, is an orphan. Rows registered for files
+that predate the registry are owned by LEGACY_OWNER and are never treated
+as orphans. Local files with the same SHA-256 and never-reused (uuid)
+names can be collapsed into hard links of one copy (see dedup_local), so
+every path stays valid.
+"""
+
+import hashlib
+import os
+from datetime import datetime, timedelta
+
+from werkzeug.security import safe_join
+
+import blob_store
+from database import is_sqlite, placeholder
+import file_serving
+
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Unattached uploads younger than this are not orphans yet
+ORPHAN_GRACE_HOURS = 24
+
+# Owner of rows registered for files that were stored before the registry
+LEGACY_OWNER = 'legacy'
+
+# Directories uploads are served from, with the /uploads/ prefix each maps to.
+# Project images live in static/uploads/projects and are requested as
+# /uploads/uploads/projects/<name>, so static maps with no prefix.
+SERVED_ROOTS = (
+    ('uploads', ''),
+    ('static', ''),
+)
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def ensure_schema(cursor):
+    """Create stored_files for the connected database if it is missing"""
+    if is_sqlite(cursor):
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stored_files (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                backend TEXT NOT NULL DEFAULT 'local',
+                bucket TEXT,
+                storage_path TEXT NOT NULL,
+                url_path TEXT,
+                original_name TEXT,
+                size_bytes INTEGER,
+                mime_type TEXT,
+                sha256 TEXT,
+                owner_type TEXT,
+                owner_id INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_stored_files_url_path ON stored_files (url_path)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_stored_files_storage_path ON stored_files (storage_path)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_stored_files_sha256 ON stored_files (sha256)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_stored_files_owner ON stored_files (owner_type, owner_id)')
+        return
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stored_files (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            backend VARCHAR(10) NOT NULL DEFAULT 'local',
+            bucket VARCHAR(255) NULL,
+            storage_path VARCHAR(500) NOT NULL,
+            url_path VARCHAR(500) NULL,
+            original_name VARCHAR(255) NULL,
+            size_bytes BIGINT NULL,
+            mime_type VARCHAR(100) NULL,
+            sha256 CHAR(64) NULL,
+            owner_type VARCHAR(50) NULL,
+            owner_id INT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_url_path (url_path(191)),
+            INDEX idx_storage_path (storage_path(191)),
+            INDEX idx_sha256 (sha256),
+            INDEX idx_owner (owner_type, owner_id),
+            INDEX idx_created (created_at)
+        )
+    ''')
+
+
+def file_sha256(path):
+    """Hex SHA-256 of a file, read in blocks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def storage_path(local_path):
+    """Path relative to the app directory, as stored in the registry"""
+    return os.path.relpath(os.path.abspath(local_path), APP_ROOT).replace(os.sep, '/')
+
+
+def is_served(local_path):
+    """True if a path on disk lies inside one of SERVED_ROOTS (symlinks resolved)"""
+    real = os.path.realpath(local_path)
+    for root, _ in SERVED_ROOTS:
+        root = os.path.realpath(os.path.join(APP_ROOT, root))
+        if real.startswith(root + os.sep):
+            return True
+    return False
+
+
+def served_file(served_name):
+    """Unregistered file on disk served at /uploads/<served_name>, or None.
+
+    Looks in uploads/, static/uploads/ and static/, as /uploads/ did before
+    the registry. Names with '..' or an absolute path never leave those
+    directories.
+    """
+    for directory in ('uploads', os.path.join('static', 'uploads'), 'static'):
+        path = safe_join(os.path.join(APP_ROOT, directory), served_name)
+        if path and os.path.isfile(path) and is_served(path):
+            return path
+    return None
+
+
+def url_path(local_path):
+    """Name the file is served under at /uploads/, or None if it is not served there"""
+    relative = storage_path(local_path)
+    for root, prefix in SERVED_ROOTS:
+        root = root.replace(os.sep, '/') + '/'
+        if relative.startswith(root):
+            return prefix + relative[len(root):]
+    return None
+
+
+def absolute_path(row):
+    """Local filesystem path of a registry row"""
+    return os.path.join(APP_ROOT, row['storage_path'])
+
+
+def _find(cursor, column, value, backend='local'):
+    ph = placeholder(cursor)
+    cursor.execute(f'''
+        SELECT * FROM stored_files WHERE {column} = {ph} AND backend = {ph}
+        ORDER BY id DESC LIMIT 1
+    ''', (value, backend))
+    return cursor.fetchone()
+
+
+def register(cursor, local_path, original_name=None, owner_type=None, owner_id=None, hash_contents=True,
+             served_name=None):
+    """Record a file saved on local disk; returns its logical id.
+
+    Re-registering a path (same-name uploads overwrite each other) refreshes
+    size and hash and keeps an existing owner. served_name overrides the
+    /uploads/ name derived from the path.
+    """
+    ph = placeholder(cursor)
+    path = storage_path(local_path)
+    size = os.path.getsize(local_path)
+    sha256 = file_sha256(local_path) if hash_contents else None
+    mime_type = file_serving.guess_mime_type(local_path)
+    existing = _find(cursor, 'storage_path', path)
+    if existing:
+        cursor.execute(f'''
+            UPDATE stored_files
+            SET size_bytes = {ph}, sha256 = {ph}, mime_type = {ph},
+                original_name = COALESCE({ph}, original_name),
+                owner_type = COALESCE(owner_type, {ph}), owner_id = COALESCE(owner_id, {ph})
+            WHERE id = {ph}
+        ''', (size, sha256, mime_type, original_name, owner_type, owner_id, existing['id']))
+        return existing['id']
+    cursor.execute(f'''
+        INSERT INTO stored_files (backend, storage_path, url_path, original_name, size_bytes,
+                                  mime_type, sha256, owner_type, owner_id)
+        VALUES ('local', {ph}, {ph}, {ph}, {ph}, {ph}, {ph}, {ph}, {ph})
+    ''', (path, served_name or url_path(local_path), original_name, size, mime_type, sha256, owner_type, owner_id))
+    return cursor.lastrowid
+
+
+def s3_bucket(uri):
+    """Bucket of an s3://bucket/key URI, or None"""
+    if not uri or not uri.startswith('s3://'):
+        return None
+    return uri[len('s3://'):].split('/', 1)[0] or None
+
+
+def register_s3(cursor, bucket, key, size=None, mime_type=None, sha256=None, owner_type=None, owner_id=None):
+    """Record an object stored in S3; returns its logical id"""
+    existing = _find(cursor, 'storage_path', key, backend='s3')
+    if existing:
+        return existing['id']
+    ph = placeholder(cursor)
+    cursor.execute(f'''
+        INSERT INTO stored_files (backend, bucket, storage_path, original_name, size_bytes,
+                                  mime_type, sha256, owner_type, owner_id)
+        VALUES ('s3', {ph}, {ph}, {ph}, {ph}, {ph}, {ph}, {ph}, {ph})
+    ''', (bucket, key, os.path.basename(key), size, mime_type or file_serving.guess_mime_type(key),
+          sha256, owner_type, owner_id))
+    return cursor.lastrowid
+
+
+def register_upload(get_db_connection, local_path, original_name=None):
+    """register() on its own connection, for upload handlers without one.
+
+    Registry failures are logged and never fail the upload.
+    """
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        file_id = register(cursor, local_path, original_name)
+        conn.commit()
+        cursor.close()
+        return file_id
+    except Exception as e:
+        print(f"Error registering stored file {local_path}: {e}")
+        return None
+    finally:
+        if conn:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+
+def get(cursor, file_id):
+    """Row of one stored file by its logical id, or None"""
+    cursor.execute(f'SELECT * FROM stored_files WHERE id = {placeholder(cursor)}', (file_id,))
+    return cursor.fetchone()
+
+
+def lookup(cursor, served_name):
+    """Row of the local file served at /uploads/<served_name>, or None"""
+    return _find(cursor, 'url_path', served_name)
+
+
+def lookup_path(cursor, local_path):
+    """Row of a file on local disk, or None if it is not registered"""
+    return _find(cursor, 'storage_path', storage_path(local_path))
+
+
+def lookup_paths(cursor, local_paths):
+    """{local_path: row} for the registered files among local_paths, in one query"""
+    paths = {storage_path(path): path for path in local_paths if path}
+    if not paths:
+        return {}
+    ph = placeholder(cursor)
+    cursor.execute(f'''
+        SELECT * FROM stored_files
+        WHERE backend = 'local' AND storage_path IN ({', '.join([ph] * len(paths))})
+        ORDER BY id
+    ''', list(paths))
+    return {paths[row['storage_path']]: row for row in cursor.fetchall()}
+
+
+def resolve(cursor, reference):
+    """Row for a path as other tables store it: S3 key, 'uploads/<name>' or bare name"""
+    if not reference:
+        return None
+    row = _find(cursor, 'storage_path', reference, backend='s3')
+    if row:
+        return row
+    for candidate in (reference, reference[len('uploads/'):] if reference.startswith('uploads/') else None,
+                      os.path.basename(reference)):
+        if candidate:
+            row = lookup(cursor, candidate)
+            if row:
+                return row
+    return None
+
+
+def resolve_many(cursor, references):
+    """{reference: row} for stored S3 keys and served names, in one query"""
+    references = [r for r in dict.fromkeys(references) if r]
+    if not references:
+        return {}
+    ph = placeholder(cursor)
+    marks = ', '.join([ph] * len(references))
+    cursor.execute(f'''
+        SELECT * FROM stored_files
+        WHERE (backend = 's3' AND storage_path IN ({marks}))
+           OR (backend = 'local' AND url_path IN ({marks}))
+        ORDER BY id
+    ''', references + references)
+    rows = {}
+    for row in cursor.fetchall():
+        reference = row['storage_path'] if row['backend'] == 's3' else row['url_path']
+        rows[reference] = row
+    return {reference: rows[reference] for reference in references if reference in rows}
+
+
+def attach(cursor, file_id, owner_type, owner_id):
+    """Mark a stored file as owned (no longer an orphan candidate)"""
+    ph = placeholder(cursor)
+    cursor.execute(f'''
+        UPDATE stored_files SET owner_type = {ph}, owner_id = {ph}
+        WHERE id = {ph}
+    ''', (owner_type, owner_id, file_id))
+
+
+def attach_reference(cursor, reference, owner_type, owner_id, bucket=None):
+    """attach() the file a stored path refers to; S3 keys not yet known are registered"""
+    row = resolve(cursor, reference)
+    if row:
+        attach(cursor, row['id'], owner_type, owner_id)
+        return row['id']
+    if bucket and reference and '/' in reference and not reference.startswith('uploads/'):
+        return register_s3(cursor, bucket, reference, owner_type=owner_type, owner_id=owner_id)
+    return None
+
+
+def find_orphans(cursor, grace_hours=ORPHAN_GRACE_HOURS):
+    """Unattached uploads older than the grace period"""
+    ph = placeholder(cursor)
+    cursor.execute(f'''
+        SELECT * FROM stored_files
+        WHERE owner_type IS NULL AND created_at < {ph}
+        ORDER BY id
+    ''', (datetime.now() - timedelta(hours=grace_hours),))
+    return cursor.fetchall()
+
+
+def delete(cursor, row, s3_client=None):
+    """Remove a registry row and its file, unless another row shares the file"""
+    ph = placeholder(cursor)
+    cursor.execute(f'''
+        SELECT COUNT(*) as count FROM stored_files
+        WHERE backend = {ph} AND storage_path = {ph} AND id <> {ph}
+    ''', (row['backend'], row['storage_path'], row['id']))
+    shared = cursor.fetchone()['count'] > 0
+    # Blobs are shared by content and removed by blob_store.gc()
+    if not shared and not blob_store.is_blob(row['storage_path']):
+        if row['backend'] == 's3':
+            if s3_client is None:
+                return False
+            s3_client.delete_object(Bucket=row['bucket'], Key=row['storage_path'])
+        else:
+            try:
+                os.remove(absolute_path(row))
+            except FileNotFoundError:
+                pass
+    cursor.execute(f'DELETE FROM stored_files WHERE id = {ph}', (row['id'],))
+    return True
+
+
+def fill_missing_hashes(cursor, limit=500):
+    """Hash local rows registered without one (lazily registered legacy files)"""
+    ph = placeholder(cursor)
+    cursor.execute(f'''
+        SELECT id, storage_path FROM stored_files
+        WHERE backend = 'local' AND sha256 IS NULL
+        ORDER BY id LIMIT {ph}
+    ''', (limit,))
+    hashed = 0
+    for row in cursor.fetchall():
+        path = absolute_path(row)
+        if not os.path.isfile(path):
+            continue
+        cursor.execute(f'UPDATE stored_files SET sha256 = {ph} WHERE id = {ph}', (file_sha256(path), row['id']))
+        hashed += 1
+    return hashed
+
+
+def dedup_local(cursor):
+    """Hard-link local files with identical content to one copy; returns bytes saved"""
+    cursor.execute('''
+        SELECT sha256 FROM stored_files
+        WHERE backend = 'local' AND sha256 IS NOT NULL
+        GROUP BY sha256 HAVING COUNT(DISTINCT storage_path) > 1
+    ''')
+    ph = placeholder(cursor)
+    saved = 0
+    for group in cursor.fetchall():
+        cursor.execute(f'''
+            SELECT DISTINCT storage_path, size_bytes FROM stored_files
+            WHERE backend = 'local' AND sha256 = {ph}
+            ORDER BY storage_path
+        ''', (group['sha256'],))
+        paths = [(os.path.join(APP_ROOT, row['storage_path']), row['size_bytes'] or 0) for row in cursor.fetchall()]
+        # Only names that are never reused: an upload saved over one link of a
+        # shared inode would rewrite every copy
+        existing = [(path, size) for path, size in paths
+                    if file_serving.is_immutable(path) and os.path.isfile(path)]
+        if len(existing) < 2:
+            continue
+        canonical = existing[0][0]
+        canonical_inode = os.stat(canonical).st_ino
+        for path, size in existing[1:]:
+            if os.stat(path).st_ino == canonical_inode:
+                continue
+            # Re-check the content: the file may have been overwritten since it was hashed
+            if file_sha256(path) != group['sha256'] or file_sha256(canonical) != group['sha256']:
+                continue
+            temp_path = f'{path}.dedup'
+            try:
+                os.link(canonical, temp_path)
+                os.replace(temp_path, path)
+                saved += size
+            except OSError as e:
+                print(f"Error deduplicating {path}: {e}")
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+    return saved
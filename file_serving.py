@@ -0,0 +1,130 @@
+"""
+Serve files from local disk with HTTP caching, byte ranges and offload.
+
+send_local_file() answers a request for one file on disk:
+
+- ETag (mtime, size, path) and Last-Modified, so If-None-Match /
+  If-Modified-Since revalidations get a 304 without reading the file.
+- Range / If-Range, so audio and video players can seek without
+  downloading from byte 0 (206 Partial Content, 416 when out of range).
+- Cache-Control: files whose names carry a uuid4 or SHA-256 are never
+  rewritten under the same name, so they are cached for a year as
+  immutable. Anything else is revalidated on every use (cheap with ETag).
+- The body is read in UPLOAD_BLOCK_SIZE blocks through wsgi.file_wrapper,
+  which gunicorn turns into a zero-copy sendfile() for whole-file responses.
+- With UPLOAD_X_ACCEL_REDIRECT set (an nginx internal location aliased to
+  the app directory), the response carries only headers and nginx sends
+  the file itself, handling ranges too. Flask's USE_X_SENDFILE does the
+  same for Apache / lighttpd.
+"""
+
+import mimetypes
+import os
+import re
+import zlib
+
+from flask import current_app, request
+from werkzeug.http import is_resource_modified
+from werkzeug.wsgi import wrap_file
+
+# Bytes read per block when Python streams the file
+DEFAULT_BLOCK_SIZE = 64 * 1024
+
+# Cache lifetime of files with content-addressed / random unique names
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# A uuid4 or SHA-256 hex digest at the start of a path component
+IMMUTABLE_NAME = re.compile(
+    r'(?:^|/)(?:[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}|[0-9a-f]{64})[^/]*$',
+    re.IGNORECASE)
+
+# Extensions mimetypes does not know on every platform
+FALLBACK_MIME_TYPES = {
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'png': 'image/png',
+    'gif': 'image/gif',
+    'webp': 'image/webp',
+    'avif': 'image/avif',
+    'mp3': 'audio/mpeg',
+    'mpeg': 'audio/mpeg',
+    'wav': 'audio/wav',
+    'webm': 'audio/webm',
+    'm4a': 'audio/mp4',
+}
+
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def guess_mime_type(filename):
+    """MIME type from the file extension, application/octet-stream if unknown"""
+    mime_type, _ = mimetypes.guess_type(filename)
+    if mime_type:
+        return mime_type
+    ext = filename.lower().rsplit('.', 1)[-1] if '.' in filename else ''
+    return FALLBACK_MIME_TYPES.get(ext, 'application/octet-stream')
+
+
+def is_immutable(filename):
+    """True if the name is unique to its content (uuid4 / SHA-256 prefixed)"""
+    return bool(IMMUTABLE_NAME.search(filename.replace(os.sep, '/')))
+
+
+def _etag(path, stat):
+    return f"{int(stat.st_mtime)}-{stat.st_size}-{zlib.adler32(path.encode('utf-8')) & 0xffffffff}"
+
+
+def _accel_path(path):
+    location = current_app.config.get('UPLOAD_X_ACCEL_REDIRECT')
+    if not location:
+        return None
+    relative = os.path.relpath(path, APP_ROOT)
+    if relative.startswith('..'):
+        return None
+    return location.rstrip('/') + '/' + relative.replace(os.sep, '/')
+
+
+def send_local_file(path, mime_type=None, download_name=None, private=False, immutable=None):
+    """Response for a file on disk, honouring conditional and Range requests"""
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    mime_type = mime_type or guess_mime_type(path)
+    if immutable is None:
+        immutable = is_immutable(path)
+
+    etag = _etag(path, stat)
+    response = current_app.response_class(mimetype=mime_type, direct_passthrough=True)
+    response.last_modified = int(stat.st_mtime)
+    response.set_etag(etag)
+    if download_name:
+        response.headers.set('Content-Disposition', 'attachment', filename=download_name)
+
+    if immutable:
+        response.cache_control.max_age = current_app.config.get('UPLOAD_IMMUTABLE_MAX_AGE', IMMUTABLE_MAX_AGE)
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    if private:
+        response.cache_control.private = True
+    else:
+        response.cache_control.public = True
+
+    accel_path = _accel_path(path)
+    if accel_path:
+        # nginx serves the body (and ranges); the app only authorises
+        response.headers['X-Accel-Redirect'] = accel_path
+        return response
+    if current_app.config.get('USE_X_SENDFILE'):
+        response.headers['X-Sendfile'] = path
+        return response
+
+    if not is_resource_modified(request.environ, etag=etag, last_modified=response.last_modified):
+        # A revalidation is answered from the stat alone; the file is never opened
+        return response.make_conditional(request.environ)
+
+    block_size = current_app.config.get('UPLOAD_BLOCK_SIZE', DEFAULT_BLOCK_SIZE)
+    response.response = wrap_file(request.environ, open(path, 'rb'), buffer_size=block_size)
+    response.content_length = stat.st_size
+    # Advertised on full responses too, or media players will not seek
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response.make_conditional(request.environ, accept_ranges=True, complete_length=stat.st_size)
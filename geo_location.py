@@ -0,0 +1,387 @@
+"""
+Geocoded locations for "projects near me" discovery.
+
+Free-text locations ("Austin, TX", "78701") are resolved offline against
+gazetteer files in data/: city_centroids.csv (city,state,lat,lng) and, if
+present, zip_centroids.csv (zip,lat,lng). No external geocoding service is
+called. The city file kept in the repository only lists the largest US
+cities and there is no ZIP file, so most small towns and every ZIP code
+miss and fall back to a LIKE match on the location text; build both files
+from the Census gazetteer with build_gazetteer.py for full coverage.
+Misses are counted, the first of each location is logged, and stats()
+reports the most frequent ones.
+
+Each geocoded project has a row in project_locations. On MySQL the row holds
+a SRID 4326 POINT under a SPATIAL index. On SQLite it holds a geohash under
+a B-tree index, and radius queries scan the covering geohash prefixes.
+Contractors store their point in contractors.service_area_lat/lng.
+"""
+
+import csv
+import math
+import os
+import re
+import threading
+
+from database import is_sqlite, placeholder
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+CITY_CENTROIDS_PATH = os.environ.get('GEO_CITY_CENTROIDS', os.path.join(DATA_DIR, 'city_centroids.csv'))
+ZIP_CENTROIDS_PATH = os.environ.get('GEO_ZIP_CENTROIDS', os.path.join(DATA_DIR, 'zip_centroids.csv'))
+
+# Radius choices offered on the contractor dashboard, in miles
+RADIUS_CHOICES = (10, 25, 50, 100)
+
+EARTH_RADIUS_MILES = 3958.8
+METERS_PER_MILE = 1609.344
+
+# Stored geohash length (~5m cells); radius queries use a shorter prefix
+GEOHASH_PRECISION = 9
+
+_GEOHASH_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+_ZIP_RE = re.compile(r'\b(\d{5})(?:-\d{4})?\b')
+
+STATE_ABBREVIATIONS = {
+    'alabama': 'AL', 'alaska': 'AK', 'arizona': 'AZ', 'arkansas': 'AR', 'california': 'CA',
+    'colorado': 'CO', 'connecticut': 'CT', 'delaware': 'DE', 'district of columbia': 'DC',
+    'florida': 'FL', 'georgia': 'GA', 'hawaii': 'HI', 'idaho': 'ID', 'illinois': 'IL',
+    'indiana': 'IN', 'iowa': 'IA', 'kansas': 'KS', 'kentucky': 'KY', 'louisiana': 'LA',
+    'maine': 'ME', 'maryland': 'MD', 'massachusetts': 'MA', 'michigan': 'MI', 'minnesota': 'MN',
+    'mississippi': 'MS', 'missouri': 'MO', 'montana': 'MT', 'nebraska': 'NE', 'nevada': 'NV',
+    'new hampshire': 'NH', 'new jersey': 'NJ', 'new mexico': 'NM', 'new york': 'NY',
+    'north carolina': 'NC', 'north dakota': 'ND', 'ohio': 'OH', 'oklahoma': 'OK', 'oregon': 'OR',
+    'pennsylvania': 'PA', 'rhode island': 'RI', 'south carolina': 'SC', 'south dakota': 'SD',
+    'tennessee': 'TN', 'texas': 'TX', 'utah': 'UT', 'vermont': 'VT', 'virginia': 'VA',
+    'washington': 'WA', 'west virginia': 'WV', 'wisconsin': 'WI', 'wyoming': 'WY',
+}
+_STATE_CODES = set(STATE_ABBREVIATIONS.values())
+
+# Distinct missed locations tracked by stats()
+MISS_TRACK_SIZE = 500
+
+# Missed locations listed by stats(), most frequent first
+STATS_TOP_MISSES = 20
+
+_gazetteer = None
+_gazetteer_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_hits = 0
+_misses = {}
+_untracked_misses = 0
+
+
+def _normalize_city(name):
+    name = name.strip().lower().replace('.', '')
+    return re.sub(r'^saint\s+', 'st ', re.sub(r'\s+', ' ', name))
+
+
+def _load_gazetteer():
+    """Read the centroid files once per process"""
+    global _gazetteer
+    with _gazetteer_lock:
+        if _gazetteer is not None:
+            return _gazetteer
+
+        cities, city_names, zips = {}, {}, {}
+        if os.path.exists(CITY_CENTROIDS_PATH):
+            with open(CITY_CENTROIDS_PATH, newline='', encoding='utf-8') as f:
+                for row in csv.DictReader(f):
+                    city = _normalize_city(row['city'])
+                    point = (float(row['lat']), float(row['lng']))
+                    cities[(city, row['state'].strip().upper())] = point
+                    city_names.setdefault(city, []).append(point)
+        if os.path.exists(ZIP_CENTROIDS_PATH):
+            with open(ZIP_CENTROIDS_PATH, newline='', encoding='utf-8') as f:
+                for row in csv.DictReader(f):
+                    zips[row['zip'].strip().zfill(5)] = (float(row['lat']), float(row['lng']))
+
+        # A bare city name is only used when it is unambiguous
+        unique_cities = {name: points[0] for name, points in city_names.items() if len(points) == 1}
+        _gazetteer = {'cities': cities, 'unique_cities': unique_cities, 'zips': zips}
+        if not zips:
+            print(f"Geocoding with {len(cities)} cities and no ZIP codes; "
+                  f"run build_gazetteer.py to fill {DATA_DIR}")
+        return _gazetteer
+
+
+def geocode(location):
+    """Resolve a free-text location to (lat, lng), or None if it isn't known"""
+    if not location or not location.strip():
+        return None
+    point = _lookup(location, _load_gazetteer())
+    _count(location, point)
+    return point
+
+
+def _lookup(location, gazetteer):
+    zip_match = _ZIP_RE.search(location)
+    if zip_match and zip_match.group(1) in gazetteer['zips']:
+        return gazetteer['zips'][zip_match.group(1)]
+
+    text = _ZIP_RE.sub('', location)
+    parts = [p.strip() for p in text.split(',') if p.strip()]
+    if not parts:
+        return None
+    city = _normalize_city(parts[0])
+    if len(parts) > 1:
+        state = _state_abbreviation(parts[1])
+        if state and (city, state) in gazetteer['cities']:
+            return gazetteer['cities'][(city, state)]
+    return gazetteer['unique_cities'].get(city)
+
+
+def _count(location, point):
+    global _hits, _untracked_misses
+    key = ' '.join(location.lower().split())
+    with _stats_lock:
+        if point is not None:
+            _hits += 1
+            return
+        if key in _misses:
+            _misses[key] += 1
+            return
+        if len(_misses) >= MISS_TRACK_SIZE:
+            _untracked_misses += 1
+            return
+        _misses[key] = 1
+    print(f"Geocode miss: {location.strip()!r} is unknown or ambiguous; matching it as text")
+
+
+def stats():
+    """Gazetteer size and this worker's geocode hits and misses"""
+    gazetteer = _load_gazetteer()
+    with _stats_lock:
+        misses = sum(_misses.values()) + _untracked_misses
+        top = sorted(_misses.items(), key=lambda item: -item[1])[:STATS_TOP_MISSES]
+        return {
+            'cities': len(gazetteer['cities']),
+            'zips': len(gazetteer['zips']),
+            'hits': _hits,
+            'misses': misses,
+            'top_misses': [{'location': location, 'count': count} for location, count in top],
+        }
+
+
+def _state_abbreviation(text):
+    text = text.strip()
+    if text.upper() in _STATE_CODES:
+        return text.upper()
+    return STATE_ABBREVIATIONS.get(text.lower())
+
+
+def state_code(location):
+    """Two-letter state from "City, ST" or "City, State" text, or None"""
+    if not location:
+        return None
+    parts = [p.strip() for p in _ZIP_RE.sub('', location).split(',') if p.strip()]
+    for part in reversed(parts[1:]):
+        state = _state_abbreviation(part)
+        if state:
+            return state
+    return None
+
+
+def distance_miles(lat1, lng1, lat2, lng2):
+    """Great-circle (haversine) distance in miles"""
+    if None in (lat1, lng1, lat2, lng2):
+        return None
+    lat1, lng1, lat2, lng2 = map(math.radians, (float(lat1), float(lng1), float(lat2), float(lng2)))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + \
+        math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * math.asin(min(1.0, math.sqrt(a)))
+
+
+def geohash_encode(lat, lng, precision=GEOHASH_PRECISION):
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bit, ch, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, value = (lng_range, lng) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            ch |= 1 << (4 - bit)
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bit += 1
+        if bit == 5:
+            chars.append(_GEOHASH_BASE32[ch])
+            bit, ch = 0, 0
+    return ''.join(chars)
+
+
+def _geohash_cell_size(precision):
+    """(height, width) of a geohash cell in degrees"""
+    bits = precision * 5
+    return 180.0 / (1 << (bits // 2)), 360.0 / (1 << ((bits + 1) // 2))
+
+
+def geohash_cover(lat, lng, radius_miles):
+    """Geohash prefixes whose cells together cover the circle.
+
+    Uses the longest prefix whose cell is at least as large as the radius,
+    so the center cell and its eight neighbours always contain the circle.
+    """
+    _, _, max_lat, max_lng = bounding_box(lat, lng, radius_miles)
+    precision = 1
+    for candidate in range(GEOHASH_PRECISION, 0, -1):
+        height, width = _geohash_cell_size(candidate)
+        if height >= max_lat - lat and width >= max_lng - lng:
+            precision = candidate
+            break
+    height, width = _geohash_cell_size(precision)
+    cells = set()
+    for dlat in (-height, 0, height):
+        for dlng in (-width, 0, width):
+            cell_lat = max(min(lat + dlat, 89.999999), -89.999999)
+            cell_lng = (lng + dlng + 180.0) % 360.0 - 180.0
+            cells.add(geohash_encode(cell_lat, cell_lng, precision))
+    return sorted(cells)
+
+
+def bounding_box(lat, lng, radius_miles):
+    """(min_lat, min_lng, max_lat, max_lng) of a square around the circle"""
+    dlat = radius_miles / 69.0
+    dlng = radius_miles / max(69.0 * math.cos(math.radians(lat)), 0.01)
+    return lat - dlat, lng - dlng, lat + dlat, lng + dlng
+
+
+def ensure_schema(cursor):
+    """Create project_locations for the connected database if it is missing"""
+    if is_sqlite(cursor):
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS project_locations (
+                project_id INTEGER PRIMARY KEY,
+                latitude REAL NOT NULL,
+                longitude REAL NOT NULL,
+                geohash TEXT NOT NULL,
+                FOREIGN KEY (project_id) REFERENCES projects(id) ON DELETE CASCADE
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_project_locations_geohash ON project_locations (geohash)')
+        return
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS project_locations (
+            project_id INT PRIMARY KEY,
+            latitude DECIMAL(10, 8) NOT NULL,
+            longitude DECIMAL(11, 8) NOT NULL,
+            geohash CHAR(9) NOT NULL,
+            geo_point POINT NOT NULL SRID 4326,
+            FOREIGN KEY (project_id) REFERENCES projects(id) ON DELETE CASCADE,
+            SPATIAL INDEX idx_geo_point (geo_point),
+            INDEX idx_geohash (geohash)
+        )
+    ''')
+
+
+def index_project(cursor, project_id, *locations):
+    """Geocode a project from the first resolvable location and store its point.
+
+    Pass the project location first and the homeowner location as fallback.
+    Returns the (lat, lng) stored, or None if nothing could be resolved.
+    """
+    point = next((p for p in map(geocode, locations) if p), None)
+    if point is None:
+        ph = placeholder(cursor)
+        cursor.execute(f'DELETE FROM project_locations WHERE project_id = {ph}', (project_id,))
+        return None
+
+    lat, lng = point
+    geohash = geohash_encode(lat, lng)
+    if is_sqlite(cursor):
+        cursor.execute('''
+            INSERT OR REPLACE INTO project_locations (project_id, latitude, longitude, geohash)
+            VALUES (?, ?, ?, ?)
+        ''', (project_id, lat, lng, geohash))
+    else:
+        cursor.execute('''
+            INSERT INTO project_locations (project_id, latitude, longitude, geohash, geo_point)
+            VALUES (%s, %s, %s, %s, ST_SRID(POINT(%s, %s), 4326))
+            ON DUPLICATE KEY UPDATE
+                latitude = VALUES(latitude),
+                longitude = VALUES(longitude),
+                geohash = VALUES(geohash),
+                geo_point = VALUES(geo_point)
+        ''', (project_id, lat, lng, geohash, lng, lat))
+    return point
+
+
+def set_contractor_point(cursor, user_id, location):
+    """Geocode a contractor's location into service_area_lat/lng"""
+    point = geocode(location)
+    ph = placeholder(cursor)
+    cursor.execute(f'''
+        UPDATE contractors SET service_area_lat = {ph}, service_area_lng = {ph}
+        WHERE user_id = {ph}
+    ''', (point[0] if point else None, point[1] if point else None, user_id))
+    return point
+
+
+def radius_filter(cursor, lat, lng, radius_miles):
+    """SQL fragments restricting projects aliased as p to a radius in miles.
+
+    Returns a dict with 'join', 'where'/'where_params' and a 'distance'
+    expression (miles) with 'distance_params', in the same shape as
+    project_search.build_search.
+    """
+    min_lat, min_lng, max_lat, max_lng = bounding_box(lat, lng, radius_miles)
+
+    if is_sqlite(cursor):
+        cursor.connection.create_function('geo_distance_miles', 4, distance_miles, deterministic=True)
+        ranges = []
+        range_params = []
+        for prefix in geohash_cover(lat, lng, radius_miles):
+            ranges.append('(pl.geohash >= ? AND pl.geohash < ?)')
+            range_params.extend([prefix, prefix + '~'])
+        return {
+            'join': 'JOIN project_locations pl ON pl.project_id = p.id',
+            'where': f"({' OR '.join(ranges)}) AND geo_distance_miles(pl.latitude, pl.longitude, ?, ?) <= ?",
+            'where_params': range_params + [lat, lng, radius_miles],
+            'distance': 'geo_distance_miles(pl.latitude, pl.longitude, ?, ?)',
+            'distance_params': [lat, lng],
+        }
+
+    # The MBR test is answered by the SPATIAL index; the sphere distance trims its corners
+    box = (f'POLYGON(({min_lng} {min_lat}, {max_lng} {min_lat}, {max_lng} {max_lat}, '
+           f'{min_lng} {max_lat}, {min_lng} {min_lat}))')
+    distance = f'ST_Distance_Sphere(pl.geo_point, ST_SRID(POINT(%s, %s), 4326)) / {METERS_PER_MILE}'
+    return {
+        'join': 'JOIN project_locations pl ON pl.project_id = p.id',
+        'where': f"MBRContains(ST_GeomFromText(%s, 4326, 'axis-order=long-lat'), pl.geo_point) AND {distance} <= %s",
+        'where_params': [box, lng, lat, radius_miles],
+        'distance': distance,
+        'distance_params': [lng, lat],
+    }
+
+
+def backfill_projects(cursor, batch_size=1000):
+    """Geocode every project that has no project_locations row yet"""
+    ph = placeholder(cursor)
+    last_id, indexed = 0, 0
+    while True:
+        cursor.execute(f'''
+            SELECT p.id, p.location, h.location as homeowner_location
+            FROM projects p
+            JOIN homeowners h ON p.homeowner_id = h.id
+            LEFT JOIN project_locations pl ON pl.project_id = p.id
+            WHERE p.id > {ph} AND pl.project_id IS NULL
+            ORDER BY p.id
+            LIMIT {ph}
+        ''', (last_id, batch_size))
+        rows = cursor.fetchall()
+        if not rows:
+            return indexed
+        for row in rows:
+            if index_project(cursor, row['id'], row['location'], row['homeowner_location']):
+                indexed += 1
+        last_id = rows[-1]['id']
+
+
+def backfill_contractors(cursor):
+    """Geocode contractors that have a location but no service area point"""
+    cursor.execute('''
+        SELECT user_id, location FROM contractors
+        WHERE service_area_lat IS NULL AND location IS NOT NULL AND location <> ''
+    ''')
+    return sum(1 for row in cursor.fetchall() if set_contractor_point(cursor, row['user_id'], row['location']))
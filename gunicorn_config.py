@@ -0,0 +1,140 @@
+"""
+Gunicorn configuration for production.
+
+Usage: gunicorn -c gunicorn_config.py app:app   (see Procfile)
+
+Elastic Beanstalk used to start gunicorn with nothing but the WSGI path, so
+production ran the default sync workers: one request per process. Audio
+processing keeps a request waiting on Transcribe polls and Bedrock calls
+for minutes, and /api/events never finishes, so a few such requests were
+enough to leave no worker for anyone else.
+
+Worker class (GUNICORN_WORKER_CLASS):
+
+- gthread (default): GUNICORN_THREADS threads per worker. Requests waiting
+  on AWS or the database hold a thread, not a process.
+- gevent: GUNICORN_WORKER_CONNECTIONS greenlets per worker. Needs gevent
+  installed; the standard library is patched here, before the app is
+  imported, so pymysql and boto3 sockets yield while they wait. Request
+  budgets are enforced (see request_budgets). Falls back to gthread when
+  gevent is missing.
+- sync: one request per worker, kept for comparison in load tests.
+
+The app is preloaded in the master (GUNICORN_PRELOAD) so workers share its
+memory pages and boot fast; importing it makes no AWS or database calls.
+Whatever holds sockets, threads or pools is per process and rebuilt in the
+worker on first use: AWS clients and the image, PDF prerender and render
+pools check the pid they were created in, and the audit-log writer restarts
+its thread when it finds it gone. post_fork() also drops AWS clients
+eagerly. when_ready() warns if the master has started threads anyway, since
+a thread does not survive fork and a lock it held would stay locked in
+every worker.
+
+Each route is in a timeout class (request_budgets). The worker timeout is a
+heartbeat: gthread and gevent workers keep beating while requests run, so it
+stays short; sync workers block, so it must cover the longest budget.
+
+max_requests with jitter recycles workers one at a time rather than all
+together, bounding slow leaks in long-running workers.
+
+The worker, thread and connection counts below are starting points, not
+measured values: no instance type has been load tested yet (load_test.py
+has only been run against a local server). Run load_test.py against each
+instance type in use, record the results with --label, and adjust the
+defaults or override them with the GUNICORN_* variables.
+"""
+
+import multiprocessing
+import os
+import sys
+import threading
+import traceback
+
+# Before anything else imports socket or threading
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+if worker_class == 'gevent':
+    try:
+        from gevent import monkey
+        monkey.patch_all()
+    except ImportError:
+        print("gevent is not installed; using gthread workers")
+        worker_class = 'gthread'
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import request_budgets  # noqa: E402
+
+CPUS = multiprocessing.cpu_count()
+
+# Processes per instance: one per core for gthread/gevent, the usual 2n+1 for sync.
+# Unvalidated, like the thread and connection counts: see the module docstring.
+DEFAULT_WORKERS = 2 * CPUS + 1 if worker_class == 'sync' else max(2, CPUS)
+
+bind = os.environ.get('GUNICORN_BIND', f"0.0.0.0:{os.environ.get('PORT', '8000')}")
+workers = int(os.environ.get('GUNICORN_WORKERS', DEFAULT_WORKERS))
+threads = int(os.environ.get('GUNICORN_THREADS', 8)) if worker_class == 'gthread' else 1
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 500))
+
+# Each open /api/events stream holds a thread (gthread) or a greenlet (gevent); leave at
+# least half the threads for ordinary requests. A sync worker has one thread, so it gets
+# no streams: /api/events always answers 503 and pages poll every 60 s instead of being
+# pushed to. Read by config.py when the app is imported.
+os.environ.setdefault('EVENT_STREAM_MAX_STREAMS',
+                      str(max(1, threads // 2) if worker_class == 'gthread'
+                          else worker_connections // 2 if worker_class == 'gevent' else 0))
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') != '0'
+
+# Seconds a worker may go without a heartbeat before the master restarts it
+timeout = int(os.environ.get('GUNICORN_TIMEOUT',
+                             request_budgets.longest_budget() if worker_class == 'sync' else 60))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+
+# Longer than the load balancer's 60 s idle timeout, so the balancer closes idle connections first
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 75))
+
+# Recycle workers after this many requests, staggered by up to the jitter
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 200))
+
+# Heartbeat files in memory; a slow root volume can otherwise stall them
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+# %(D)s: microseconds spent on the request
+access_log_format = '%(h)s "%(r)s" %(s)s %(b)s %(D)sus "%(a)s"'
+
+
+def when_ready(server):
+    server.log.info(f"Serving with {workers} {worker_class} workers"
+                    f"{f' x {threads} threads' if worker_class == 'gthread' else ''}"
+                    f"{f' x {worker_connections} connections' if worker_class == 'gevent' else ''}, "
+                    f"preload {'on' if preload_app else 'off'}, timeout {timeout}s")
+    if preload_app and threading.active_count() > 1:
+        names = ', '.join(thread.name for thread in threading.enumerate() if thread is not threading.main_thread())
+        server.log.warning(f"Threads running in the master before fork: {names}")
+
+
+def post_fork(server, worker):
+    # Drop anything a preloaded module built in the master; it is rebuilt on first use
+    import aws_clients
+    aws_clients.reset_after_fork()
+
+
+def post_worker_init(worker):
+    budgets = request_budgets.BudgetMiddleware(worker.wsgi, enforce=worker_class == 'gevent')
+    extensions = getattr(worker.wsgi, 'extensions', None)
+    if extensions is not None:
+        extensions['request_budgets'] = budgets
+    worker.wsgi = budgets
+
+
+def worker_abort(worker):
+    # Sent when a worker missed its heartbeat: log where every thread was stuck
+    frames = sys._current_frames()
+    for thread in threading.enumerate():
+        frame = frames.get(thread.ident)
+        if frame is not None:
+            worker.log.warning(f"Thread {thread.name} of aborted worker {worker.pid}:\n"
+                               + ''.join(traceback.format_stack(frame)))
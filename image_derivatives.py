@@ -0,0 +1,384 @@
+"""
+Background image derivatives for project and evidence uploads.
+
+An upload request only persists the original and registers it (see
+file_registry); derivatives are generated afterwards by a small thread pool.
+Pillow releases the GIL while it resizes and encodes, so the threads run in
+parallel with each other and with request handling.
+
+For every image the pipeline:
+
+- applies the EXIF orientation (phone photos come in sideways otherwise)
+  and drops EXIF / XMP from the output, so GPS position and camera details
+  are not published. The ICC profile is kept. Originals are left untouched;
+  they are the evidence of record.
+- scales it to each of WIDTHS that is narrower than the original (plus the
+  original width when that is smaller than the largest size)
+- encodes every size as AVIF (when the installed Pillow can), WebP and a
+  JPEG fallback
+
+Derivatives are named after the original's SHA-256, so identical uploads
+share them and they are served as immutable (see file_serving).
+Derivatives of originals that are served publicly at /uploads/ (project
+images) are written under static/uploads/derivatives. Those of private
+originals (milestone evidence and dispute files in blobs/) are written to
+derivatives/, outside static/, and only reach a browser through a route
+that checks access, such as serve_evidence_file; they have no url_path.
+relocate_private() moves private derivatives made before this split. Each one is
+recorded in image_derivatives against the original's stored_files id.
+srcsets() turns those rows into <picture> sources for the pages.
+"""
+
+import os
+import shutil
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from PIL import Image, ImageOps
+
+from database import is_sqlite, placeholder
+import file_registry
+
+try:
+    # Registers AVIF on Pillow releases without built-in support
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pass
+
+Image.init()
+AVIF_AVAILABLE = 'AVIF' in Image.SAVE
+
+# Widths generated, smallest first (never upscaled)
+WIDTHS = (320, 640, 1280)
+
+# Output formats, preferred first: format -> (Pillow format, extension, MIME type, save options)
+FORMATS = {
+    'avif': ('AVIF', 'avif', 'image/avif', {'quality': 55}),
+    'webp': ('WEBP', 'webp', 'image/webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', 'image/jpeg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+# Extensions of uploads that get derivatives
+IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+
+# Derivatives of public originals live under static/uploads, so they are served at /uploads/derivatives/
+DERIVATIVE_DIR = os.path.join(file_registry.APP_ROOT, 'static', 'uploads', 'derivatives')
+
+# Derivatives of private originals, never served as static files
+PRIVATE_DERIVATIVE_DIR = os.path.join(file_registry.APP_ROOT, 'derivatives')
+
+# Images processed at once per gunicorn worker
+DEFAULT_WORKERS = 2
+
+# Finished jobs kept for the stats endpoint
+RECENT_JOBS = 100
+
+
+def ensure_schema(cursor):
+    """Create image_derivatives for the connected database if it is missing"""
+    if is_sqlite(cursor):
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS image_derivatives (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                stored_file_id INTEGER NOT NULL,
+                format TEXT NOT NULL,
+                width INTEGER NOT NULL,
+                height INTEGER NOT NULL,
+                storage_path TEXT NOT NULL,
+                url_path TEXT NOT NULL,
+                size_bytes INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE (stored_file_id, format, width)
+            )
+        ''')
+        return
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS image_derivatives (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            stored_file_id INT NOT NULL,
+            format VARCHAR(10) NOT NULL,
+            width INT NOT NULL,
+            height INT NOT NULL,
+            storage_path VARCHAR(500) NOT NULL,
+            url_path VARCHAR(500) NOT NULL,
+            size_bytes INT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE KEY uniq_derivative (stored_file_id, format, width)
+        )
+    ''')
+
+
+def is_image(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in IMAGE_EXTENSIONS
+
+
+def output_formats():
+    return [name for name in FORMATS if name != 'avif' or AVIF_AVAILABLE]
+
+
+def _widths(original_width):
+    widths = [width for width in WIDTHS if width < original_width]
+    if original_width < WIDTHS[-1]:
+        widths.append(original_width)
+    return widths or [WIDTHS[-1]]
+
+
+def _prepare(image):
+    # Upright, and in a mode every output format can encode
+    image = ImageOps.exif_transpose(image)
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+    return image
+
+
+def _flatten(image):
+    # JPEG has no alpha channel; composite onto white
+    if image.mode != 'RGBA':
+        return image
+    background = Image.new('RGB', image.size, (255, 255, 255))
+    background.paste(image, mask=image.getchannel('A'))
+    return background
+
+
+def derivative_dir(local_path):
+    """Where derivatives of an original go: public only if the original itself is served"""
+    return DERIVATIVE_DIR if file_registry.is_served(local_path) else PRIVATE_DERIVATIVE_DIR
+
+
+def generate(local_path, sha256):
+    """Write every derivative of one image; returns a dict per derivative"""
+    directory = os.path.join(derivative_dir(local_path), sha256[:2])
+    os.makedirs(directory, exist_ok=True)
+    derivatives = []
+    with Image.open(local_path) as original:
+        icc_profile = original.info.get('icc_profile')
+        image = _prepare(original)
+        for width in _widths(image.width):
+            height = max(1, round(image.height * width / image.width))
+            resized = image if width == image.width else image.resize((width, height), Image.Resampling.LANCZOS,
+                                                                     reducing_gap=3.0)
+            for name in output_formats():
+                pil_format, extension, _, options = FORMATS[name]
+                path = os.path.join(directory, f'{sha256}_{width}.{extension}')
+                if not os.path.isfile(path):
+                    output = _flatten(resized) if name == 'jpeg' else resized
+                    if icc_profile:
+                        options = dict(options, icc_profile=icc_profile)
+                    # No exif= is passed, so none is written
+                    temp_path = f'{path}.tmp'
+                    output.save(temp_path, pil_format, **options)
+                    os.replace(temp_path, path)
+                derivatives.append({
+                    'format': name,
+                    'width': width,
+                    'height': height,
+                    'path': path,
+                    'size': os.path.getsize(path),
+                })
+    return derivatives
+
+
+def record(cursor, stored_file_id, derivatives):
+    """Store derivative rows for a stored file, replacing earlier ones"""
+    ph = placeholder(cursor)
+    cursor.execute(f'DELETE FROM image_derivatives WHERE stored_file_id = {ph}', (stored_file_id,))
+    for derivative in derivatives:
+        cursor.execute(f'''
+            INSERT INTO image_derivatives (stored_file_id, format, width, height, storage_path, url_path, size_bytes)
+            VALUES ({ph}, {ph}, {ph}, {ph}, {ph}, {ph}, {ph})
+        ''', (stored_file_id, derivative['format'], derivative['width'], derivative['height'],
+              file_registry.storage_path(derivative['path']), file_registry.url_path(derivative['path']) or '',
+              derivative['size']))
+
+
+def relocate_private(cursor):
+    """Move derivatives of private originals out of static/; returns how many rows moved.
+
+    A public image with the same content keeps its copy under static/.
+    """
+    ph = placeholder(cursor)
+    cursor.execute('''
+        SELECT d.id, d.storage_path, s.storage_path AS original_path
+        FROM image_derivatives d
+        JOIN stored_files s ON s.id = d.stored_file_id
+        WHERE s.backend = 'local' AND d.url_path <> ''
+    ''')
+    moved = 0
+    sources = set()
+    for row in cursor.fetchall():
+        if file_registry.is_served(os.path.join(file_registry.APP_ROOT, row['original_path'])):
+            continue
+        source = os.path.join(file_registry.APP_ROOT, row['storage_path'])
+        target = os.path.join(PRIVATE_DERIVATIVE_DIR, os.path.relpath(source, DERIVATIVE_DIR))
+        if not os.path.isfile(target):
+            if not os.path.isfile(source):
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copy2(source, target)
+        cursor.execute(f"UPDATE image_derivatives SET storage_path = {ph}, url_path = '' WHERE id = {ph}",
+                       (file_registry.storage_path(target), row['id']))
+        sources.add(row['storage_path'])
+        moved += 1
+    for storage_path in sources:
+        cursor.execute(f'SELECT 1 FROM image_derivatives WHERE storage_path = {ph} LIMIT 1', (storage_path,))
+        if not cursor.fetchone():
+            try:
+                os.remove(os.path.join(file_registry.APP_ROOT, storage_path))
+            except FileNotFoundError:
+                pass
+    return moved
+
+
+def for_files(cursor, stored_file_ids):
+    """{stored_file_id: [derivative rows, narrowest first]}"""
+    stored_file_ids = [file_id for file_id in dict.fromkeys(stored_file_ids) if file_id]
+    if not stored_file_ids:
+        return {}
+    ph = placeholder(cursor)
+    cursor.execute(f'''
+        SELECT * FROM image_derivatives
+        WHERE stored_file_id IN ({', '.join([ph] * len(stored_file_ids))})
+        ORDER BY stored_file_id, width
+    ''', stored_file_ids)
+    derivatives = {}
+    for row in cursor.fetchall():
+        derivatives.setdefault(row['stored_file_id'], []).append(row)
+    return derivatives
+
+
+def find(cursor, stored_file_id, width, format_name):
+    """One derivative row, or None if it has not been generated"""
+    ph = placeholder(cursor)
+    cursor.execute(f'''
+        SELECT * FROM image_derivatives
+        WHERE stored_file_id = {ph} AND width = {ph} AND format = {ph}
+    ''', (stored_file_id, width, format_name))
+    return cursor.fetchone()
+
+
+def picture(rows, url):
+    """<picture> data for one image's derivatives, or None if there are none.
+
+    url(row) builds the URL of one derivative. Returns src (the widest JPEG),
+    width and height of that JPEG, and sources: [{'type', 'srcset'}] in
+    preference order, the last being the JPEG srcset for the <img> itself.
+    """
+    if not rows:
+        return None
+    by_format = {}
+    for row in rows:
+        by_format.setdefault(row['format'], []).append(row)
+    sources = [{
+        'type': FORMATS[name][2],
+        'srcset': ', '.join(f"{url(row)} {row['width']}w" for row in by_format[name]),
+    } for name in FORMATS if name in by_format]
+    fallback = by_format.get('jpeg') or rows
+    return {
+        'src': url(fallback[-1]),
+        'width': fallback[-1]['width'],
+        'height': fallback[-1]['height'],
+        'sources': sources,
+    }
+
+
+def srcsets(cursor, stored_file_ids, url):
+    """{stored_file_id: picture()} for the files that have derivatives"""
+    return {file_id: picture(rows, url) for file_id, rows in for_files(cursor, stored_file_ids).items()}
+
+
+class DerivativePipeline:
+    """Generate derivatives of uploaded images in a background thread pool"""
+
+    def __init__(self, get_db_connection, max_workers=DEFAULT_WORKERS):
+        self.get_db_connection = get_db_connection
+        self.max_workers = max_workers
+        self._pool = None
+        self._pool_pid = None
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=RECENT_JOBS)
+        self._totals = {'processed': 0, 'failed': 0, 'derivatives': 0, 'seconds': 0.0}
+
+    @classmethod
+    def from_config(cls, config, get_db_connection):
+        return cls(get_db_connection, max_workers=config.get('IMAGE_DERIVATIVE_WORKERS', DEFAULT_WORKERS))
+
+    def submit(self, stored_file_id):
+        """Queue one registered image; returns immediately"""
+        if not stored_file_id:
+            return
+        if self.max_workers <= 0:
+            self._process(stored_file_id)
+            return
+        with self._lock:
+            if stored_file_id in self._pending:
+                return
+            # A pool inherited through fork has no threads in the child
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='image-derivatives')
+                self._pool_pid = os.getpid()
+                self._pending = set()
+            self._pending.add(stored_file_id)
+            pool = self._pool
+        pool.submit(self._process, stored_file_id)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.max_workers,
+                'avif': AVIF_AVAILABLE,
+                'pending': len(self._pending),
+                'totals': dict(self._totals),
+                'recent': list(reversed(self._recent)),
+            }
+
+    def close(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None and self._pool_pid == os.getpid():
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _process(self, stored_file_id):
+        started = time.perf_counter()
+        conn = None
+        derivatives = []
+        error = None
+        try:
+            conn = self.get_db_connection()
+            cursor = conn.cursor()
+            row = file_registry.get(cursor, stored_file_id)
+            if row and row['backend'] == 'local':
+                path = file_registry.absolute_path(row)
+                sha256 = row['sha256'] or file_registry.file_sha256(path)
+                derivatives = generate(path, sha256)
+                record(cursor, stored_file_id, derivatives)
+                conn.commit()
+            cursor.close()
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            print(f"Error generating derivatives of stored file {stored_file_id}: {e}")
+        finally:
+            if conn:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+        seconds = time.perf_counter() - started
+        with self._lock:
+            self._pending.discard(stored_file_id)
+            self._recent.append({
+                'stored_file_id': stored_file_id,
+                'derivatives': len(derivatives),
+                'bytes': sum(derivative['size'] for derivative in derivatives),
+                'seconds': round(seconds, 3),
+                'finished_at': datetime.now().isoformat(),
+                'error': error,
+            })
+            self._totals['failed' if error else 'processed'] += 1
+            self._totals['derivatives'] += len(derivatives)
+            self._totals['seconds'] = round(self._totals['seconds'] + seconds, 3)
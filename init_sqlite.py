@@ -4,6 +4,18 @@ Initialize SQLite database with sample data for testing
 """
 import sqlite3
 import os
+import project_search
+import geo_location
+import project_facets
+import project_matching
+import blob_store
+import file_registry
+import image_derivatives
+import resumable_uploads
+import server_sessions
+import event_stream
+import job_status
+import evidence_routes
 from datetime import datetime
 
 def init_sqlite_db():
@@ -14,6 +26,7 @@ def init_sqlite_db():
         os.remove('homepro.db')
     
     conn = sqlite3.connect('homepro.db')
+    conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     
     # Create users table
@@ -74,6 +87,28 @@ def init_sqlite_db():
         )
     ''')
     
+    # Create projects_fts keyword search table and its sync triggers
+    project_search.ensure_index(cursor)
+    
+    # Create project_locations table (geohash-indexed) for radius search
+    geo_location.ensure_schema(cursor)
+    
+    # Create project_facet_counts rollup for dashboard filter counts
+    project_facets.ensure_schema(cursor)
+    
+    # Create contractor_recommendations for precomputed project matches
+    project_matching.ensure_schema(cursor)
+    
+    # Create stored_files registry of uploads
+    file_registry.ensure_schema(cursor)
+    image_derivatives.ensure_schema(cursor)
+    evidence_routes.ensure_schema(cursor)
+    blob_store.ensure_schema(cursor)
+    resumable_uploads.ensure_schema(cursor)
+    server_sessions.ensure_schema(cursor)
+    event_stream.ensure_schema(cursor)
+    job_status.ensure_schema(cursor)
+    
     # Create bids table
     cursor.execute('''
         CREATE TABLE bids (
@@ -115,6 +150,9 @@ def init_sqlite_db():
                 'uploads/sample_audio.mp3', 'AI processed description of kitchen renovation project', 1)
     ''')
     
+    geo_location.index_project(cursor, 1, 'San Francisco, CA')
+    project_facets.on_project_changed(cursor, 1)
+    
     # Sample contractor
     cursor.execute('''
         INSERT INTO users (email, password_hash, first_name, last_name, role)
@@ -0,0 +1,260 @@
+"""
+Status of background AI jobs, readable from every worker.
+
+/process_audio_async and the /async/... endpoints answer with a process_id
+and the client polls /processing_status/<process_id>. The status used to
+live in a dict in the worker that ran the job, so a poll the load balancer
+sent to another worker got a 404. JobStatusStore keeps the status in the
+processing_jobs table as well:
+
+- create() inserts the row before the process_id is handed out, so the
+  first poll finds it on any worker
+- update() and finish() change the worker's own copy at once; a background
+  thread writes the latest state of each changed job every WRITE_INTERVAL
+  seconds, so a job reporting progress many times costs one write per
+  interval, and the event loop of ai_async never waits on the database
+- get() answers from the worker's own copy when it holds the job (with
+  the live queue position of its admission ticket), otherwise from the table
+
+Queue positions of waiting jobs are written with the rest of the state, so
+other workers report them too, up to WRITE_INTERVAL seconds late. Finished
+jobs are kept for RESULT_RETENTION seconds and then deleted. When the
+database cannot be reached the worker still answers for its own jobs.
+"""
+
+import json
+import threading
+import time
+
+from database import is_sqlite, placeholder
+
+# Seconds a finished job's status is kept for polling
+RESULT_RETENTION = 900
+
+# Seconds between writes of changed job states
+WRITE_INTERVAL = 0.5
+
+# Seconds between deletions of expired rows
+PURGE_INTERVAL_SECONDS = 300
+
+# Fields kept in the state column; owner, ticket and finished_at are stored apart
+STATE_FIELDS = ('status', 'progress', 'message', 'result', 'error', 'queue_position')
+
+
+def ensure_schema(cursor):
+    """Create the processing_jobs table for the connected database if it is missing"""
+    if is_sqlite(cursor):
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS processing_jobs (
+                id TEXT PRIMARY KEY,
+                owner_id INTEGER,
+                state TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                finished_at REAL
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_processing_jobs_finished ON processing_jobs (finished_at)')
+        return
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS processing_jobs (
+            id CHAR(36) PRIMARY KEY,
+            owner_id INT NULL,
+            state MEDIUMTEXT NOT NULL,
+            updated_at DOUBLE NOT NULL,
+            finished_at DOUBLE NULL,
+            INDEX idx_finished (finished_at)
+        )
+    ''')
+
+
+class JobStatusStore:
+    """Job status kept in this worker and written through to processing_jobs"""
+
+    def __init__(self, get_db_connection, retention=RESULT_RETENTION, write_interval=WRITE_INTERVAL):
+        self.get_db_connection = get_db_connection
+        self.retention = retention
+        self.write_interval = write_interval
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._dirty = set()
+        self._wake = threading.Event()
+        self._thread = None
+        self._last_purge = 0
+        self._counters = {'created': 0, 'writes': 0, 'remote_reads': 0, 'errors': 0}
+
+    @classmethod
+    def from_config(cls, config, get_db_connection):
+        return cls(get_db_connection, retention=config.get('AI_JOB_STATUS_RETENTION', RESULT_RETENTION))
+
+    def _run_sql(self, work):
+        """Run work(cursor, ph) and commit; creates processing_jobs if it is missing"""
+        conn = self.get_db_connection()
+        try:
+            cursor = conn.cursor()
+            try:
+                result = work(cursor, placeholder(cursor))
+            except Exception as e:
+                if 'processing_jobs' not in str(e):
+                    raise
+                conn.rollback()
+                ensure_schema(cursor)
+                result = work(cursor, placeholder(cursor))
+            conn.commit()
+            return result
+        finally:
+            conn.close()
+
+    def create(self, process_id, owner=None, ticket=None, **fields):
+        """Record a new job; written to the table before this returns"""
+        self._prune()
+        entry = dict.fromkeys(STATE_FIELDS)
+        entry.update(fields, owner=owner, ticket=ticket)
+        with self._lock:
+            self._entries[process_id] = entry
+            self._counters['created'] += 1
+        self._write([process_id])
+        return entry
+
+    def update(self, process_id, **fields):
+        with self._lock:
+            entry = self._entries.get(process_id)
+            if entry is None:
+                return
+            entry.update(fields)
+            self._dirty.add(process_id)
+        self._ensure_started()
+
+    def finish(self, process_id, **fields):
+        """Update a job for the last time; its status is kept for retention seconds"""
+        fields['finished_at'] = time.time()
+        self.update(process_id, **fields)
+        self._wake.set()
+
+    def get(self, process_id):
+        """A copy of the job's status with owner and ticket (None on other workers), or None"""
+        with self._lock:
+            entry = self._entries.get(process_id)
+            if entry is not None:
+                return dict(entry)
+        try:
+            row = self._run_sql(lambda cursor, ph: self._select(cursor, ph, process_id))
+        except Exception as e:
+            self._count_error()
+            print(f"Error reading processing job {process_id}: {e}")
+            return None
+        if row is None:
+            return None
+        with self._lock:
+            self._counters['remote_reads'] += 1
+        status = json.loads(row['state'])
+        status.update(owner=row['owner_id'], ticket=None, finished_at=row['finished_at'])
+        return status
+
+    @staticmethod
+    def _select(cursor, ph, process_id):
+        cursor.execute(f'SELECT owner_id, state, finished_at FROM processing_jobs WHERE id = {ph}',
+                       (process_id,))
+        return cursor.fetchone()
+
+    def _ensure_started(self):
+        if self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            # A forked worker inherits the object but not the thread
+            self._thread = threading.Thread(target=self._run, name='job-status-writer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.write_interval)
+            self._wake.clear()
+            self._refresh_positions()
+            with self._lock:
+                dirty, self._dirty = self._dirty, set()
+            if dirty:
+                self._write(dirty)
+            if time.time() - self._last_purge > PURGE_INTERVAL_SECONDS:
+                self._purge()
+
+    def _refresh_positions(self):
+        # Positions change as other jobs finish, without an update() of this job
+        with self._lock:
+            waiting = [(process_id, entry['ticket']) for process_id, entry in self._entries.items()
+                       if entry.get('status') == 'queued' and entry.get('ticket') is not None]
+        for process_id, ticket in waiting:
+            position = ticket.position()
+            with self._lock:
+                entry = self._entries.get(process_id)
+                if entry is not None and entry.get('queue_position') != position:
+                    entry['queue_position'] = position
+                    self._dirty.add(process_id)
+
+    def _write(self, process_ids):
+        now = time.time()
+        with self._lock:
+            rows = [(process_id, entry.get('owner'),
+                     json.dumps({field: entry.get(field) for field in STATE_FIELDS}, default=str),
+                     now, entry.get('finished_at'))
+                    for process_id, entry in ((p, self._entries.get(p)) for p in process_ids)
+                    if entry is not None]
+        if not rows:
+            return
+
+        def upsert(cursor, ph):
+            values = f'({ph}, {ph}, {ph}, {ph}, {ph})'
+            if is_sqlite(cursor):
+                sql = f'INSERT OR REPLACE INTO processing_jobs (id, owner_id, state, updated_at, finished_at) VALUES {values}'
+            else:
+                sql = f'''
+                    INSERT INTO processing_jobs (id, owner_id, state, updated_at, finished_at) VALUES {values}
+                    ON DUPLICATE KEY UPDATE state = VALUES(state), updated_at = VALUES(updated_at),
+                                            finished_at = VALUES(finished_at)
+                '''
+            cursor.executemany(sql, rows)
+        try:
+            self._run_sql(upsert)
+            with self._lock:
+                self._counters['writes'] += len(rows)
+        except Exception as e:
+            self._count_error()
+            print(f"Error writing processing job status: {e}")
+
+    def _purge(self):
+        self._last_purge = time.time()
+        cutoff = time.time() - self.retention
+        try:
+            self._run_sql(lambda cursor, ph: cursor.execute(
+                f'DELETE FROM processing_jobs WHERE finished_at < {ph}', (cutoff,)))
+        except Exception as e:
+            self._count_error()
+            print(f"Error deleting expired processing jobs: {e}")
+
+    def _prune(self):
+        cutoff = time.time() - self.retention
+        with self._lock:
+            for process_id, entry in list(self._entries.items()):
+                if (entry.get('finished_at') or cutoff) < cutoff:
+                    del self._entries[process_id]
+                    self._dirty.discard(process_id)
+
+    def _count_error(self):
+        with self._lock:
+            self._counters['errors'] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['local_jobs'] = len(self._entries)
+            stats['pending_writes'] = len(self._dirty)
+        stats['writer_running'] = bool(self._thread and self._thread.is_alive())
+        return stats
+
+    def close(self):
+        """Write what is still pending"""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        if dirty:
+            self._write(dirty)
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Load test one app instance and record throughput per instance type.
+
+Drives GET requests over a mix of paths at each concurrency level for a
+fixed duration. Every client thread keeps its own keep-alive connection, as
+the load balancer does. For each level it reports requests per second,
+latency percentiles and errors.
+
+--hold N keeps N extra connections open on --hold-path for the whole run,
+e.g. N clients on /api/events or waiting on audio processing. Under sync
+workers each held connection takes a whole worker out of service.
+
+--spawn starts gunicorn locally with gunicorn_config.py and the given worker
+class, and stops it afterwards, so worker classes can be compared on one
+machine. Otherwise --url points at a running instance.
+
+Each level is appended as a JSON line to --output, labelled with --label
+(the instance type, e.g. t3.micro) and the worker class. --report prints
+those results side by side.
+
+No per-instance results have been recorded yet, so the defaults in
+gunicorn_config.py are not backed by measurements; run this on each
+instance type before relying on them.
+
+Usage:
+  python load_test.py --spawn gthread --label t3.small --concurrency 1,8,32,64
+  python load_test.py --url http://10.0.1.15:8000 --label c6i.large --worker-class gevent
+  python load_test.py --report
+"""
+
+import argparse
+import http.client
+import json
+import os
+import platform
+import signal
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlsplit
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Paths requested by default, in rotation
+DEFAULT_PATHS = '/health,/,/login'
+
+# Seconds to wait for a spawned server to answer /health
+SPAWN_TIMEOUT = 60
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Client(threading.Thread):
+    """Requests paths in rotation over one keep-alive connection until told to stop"""
+
+    def __init__(self, target, paths, stop, offset=0):
+        super().__init__(daemon=True)
+        self.target = target
+        self.paths = paths
+        self.stop = stop
+        self.offset = offset
+        self.latencies = []
+        self.errors = 0
+        self.statuses = {}
+
+    def _connect(self):
+        connection_class = http.client.HTTPSConnection if self.target.scheme == 'https' else http.client.HTTPConnection
+        return connection_class(self.target.hostname, self.target.port, timeout=30)
+
+    def run(self):
+        connection = self._connect()
+        i = self.offset
+        while not self.stop.is_set():
+            path = self.paths[i % len(self.paths)]
+            i += 1
+            started = time.perf_counter()
+            try:
+                connection.request('GET', path, headers={'Connection': 'keep-alive'})
+                response = connection.getresponse()
+                response.read()
+                elapsed = time.perf_counter() - started
+                self.statuses[response.status] = self.statuses.get(response.status, 0) + 1
+                if response.status >= 500:
+                    self.errors += 1
+                else:
+                    self.latencies.append(elapsed)
+                if response.getheader('Connection', '').lower() == 'close':
+                    connection.close()
+                    connection = self._connect()
+            except (OSError, http.client.HTTPException):
+                self.errors += 1
+                connection.close()
+                connection = self._connect()
+        connection.close()
+
+
+def hold_connections(target, path, count, stop):
+    """Open count requests on path and keep reading them until stop is set"""
+    def hold():
+        while not stop.is_set():
+            try:
+                connection = http.client.HTTPConnection(target.hostname, target.port, timeout=5)
+                connection.request('GET', path)
+                response = connection.getresponse()
+                while not stop.is_set():
+                    try:
+                        if not response.read(1):
+                            break
+                    except TimeoutError:
+                        continue
+                connection.close()
+            except (OSError, http.client.HTTPException):
+                time.sleep(0.5)
+    threads = [threading.Thread(target=hold, daemon=True) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def run_level(target, paths, concurrency, duration, warmup):
+    stop = threading.Event()
+    clients = [Client(target, paths, stop, offset=i) for i in range(concurrency)]
+    for client in clients:
+        client.start()
+    time.sleep(warmup)
+    for client in clients:
+        client.latencies.clear()
+        client.errors = 0
+        client.statuses.clear()
+    started = time.perf_counter()
+    time.sleep(duration)
+    stop.set()
+    elapsed = time.perf_counter() - started
+    for client in clients:
+        client.join(timeout=35)
+
+    latencies = sorted(latency for client in clients for latency in client.latencies)
+    statuses = {}
+    for client in clients:
+        for status, count in client.statuses.items():
+            statuses[str(status)] = statuses.get(str(status), 0) + count
+    return {
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': sum(client.errors for client in clients),
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 1) if latencies else 0.0,
+        'statuses': statuses,
+    }
+
+
+def spawn_server(worker_class, port, workers=None):
+    env = dict(os.environ, GUNICORN_WORKER_CLASS=worker_class, GUNICORN_BIND=f'127.0.0.1:{port}',
+               GUNICORN_ACCESS_LOG=os.environ.get('GUNICORN_ACCESS_LOG', '/dev/null'))
+    if workers:
+        env['GUNICORN_WORKERS'] = str(workers)
+    process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn_config.py', 'app:app'],
+                               cwd=APP_DIR, env=env)
+    deadline = time.time() + SPAWN_TIMEOUT
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'gunicorn exited with status {process.returncode}')
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            connection.request('GET', '/health')
+            connection.getresponse().read()
+            connection.close()
+            return process
+        except OSError:
+            time.sleep(0.5)
+    process.send_signal(signal.SIGTERM)
+    raise RuntimeError(f'gunicorn did not answer on port {port} within {SPAWN_TIMEOUT}s')
+
+
+def report(output):
+    try:
+        with open(output) as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        print(f'No results in {output}')
+        return
+    print(f"{'label':<14} {'workers':<16} {'conc':>5} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'errors':>7} {'held':>5}")
+    for row in sorted(rows, key=lambda r: (r['label'], r['worker_class'], r['concurrency'])):
+        print(f"{row['label']:<14} {row['worker_class']:<16} {row['concurrency']:>5} {row['rps']:>9.1f} "
+              f"{row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f} {row['errors']:>7} "
+              f"{row.get('held', 0):>5}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', default='http://127.0.0.1:8000', help='instance to test')
+    parser.add_argument('--spawn', metavar='WORKER_CLASS', choices=['gthread', 'gevent', 'sync'],
+                        help='start gunicorn locally with this worker class')
+    parser.add_argument('--workers', type=int, help='GUNICORN_WORKERS for --spawn')
+    parser.add_argument('--port', type=int, default=8765, help='port for --spawn')
+    parser.add_argument('--worker-class', help='worker class of the --url instance, for the record')
+    parser.add_argument('--label', default=platform.node(), help='instance type or host name')
+    parser.add_argument('--paths', default=DEFAULT_PATHS, help='comma-separated paths to request')
+    parser.add_argument('--concurrency', default='1,8,32,64', help='comma-separated client counts')
+    parser.add_argument('--duration', type=float, default=20, help='seconds measured per level')
+    parser.add_argument('--warmup', type=float, default=3, help='seconds before measuring each level')
+    parser.add_argument('--hold', type=int, default=0, help='long-lived connections kept open meanwhile')
+    parser.add_argument('--hold-path', default='/api/events')
+    parser.add_argument('--output', default='load_test_results.jsonl')
+    parser.add_argument('--report', action='store_true', help='print recorded results and exit')
+    args = parser.parse_args()
+
+    if args.report:
+        report(args.output)
+        return
+
+    process = None
+    if args.spawn:
+        process = spawn_server(args.spawn, args.port, args.workers)
+        target = urlsplit(f'http://127.0.0.1:{args.port}')
+        worker_class = args.spawn
+    else:
+        target = urlsplit(args.url)
+        worker_class = args.worker_class or 'unknown'
+
+    paths = [path.strip() for path in args.paths.split(',') if path.strip()]
+    stop_holding = threading.Event()
+    try:
+        if args.hold:
+            hold_connections(target, args.hold_path, args.hold, stop_holding)
+        print(f"{args.label}, {worker_class} workers, {args.duration:.0f}s per level"
+              f"{f', {args.hold} held on {args.hold_path}' if args.hold else ''}")
+        for concurrency in [int(level) for level in args.concurrency.split(',')]:
+            result = run_level(target, paths, concurrency, args.duration, args.warmup)
+            print(f"  {concurrency:>4} clients: {result['rps']:>8.1f} req/s   p50 {result['p50_ms']:>7.1f} ms   "
+                  f"p95 {result['p95_ms']:>7.1f} ms   p99 {result['p99_ms']:>7.1f} ms   errors {result['errors']}")
+            result.update({'label': args.label, 'worker_class': worker_class, 'held': args.hold,
+                           'paths': paths, 'recorded_at': datetime.now().isoformat()})
+            with open(args.output, 'a') as f:
+                f.write(json.dumps(result) + '\n')
+    finally:
+        stop_holding.set()
+        if process:
+            process.send_signal(signal.SIGTERM)
+            process.wait(timeout=35)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Cursor-paginated message history for bid and project threads.
+
+Clients load the latest page once, then ask only for messages after the
+newest id they hold (since_id) or before the oldest one (before_id). Sender
+names and roles are returned once per page in a 'senders' map instead of
+being repeated on every message, and messages are only marked read when the
+page actually contains unread messages for the caller.
+"""
+
+from database import placeholder
+
+# Messages returned when the client does not ask for a page size
+DEFAULT_PAGE_SIZE = 50
+
+# Upper bound on a single page
+MAX_PAGE_SIZE = 200
+
+# Thread tables and the column each thread is keyed by
+THREAD_TABLES = {
+    'bid_messages': 'bid_id',
+    'project_messages': 'project_id',
+}
+
+
+def parse_cursor(args):
+    """Read since_id, before_id and limit from request args"""
+    def _int_arg(name):
+        try:
+            value = int(args.get(name))
+        except (TypeError, ValueError):
+            return None
+        return value if value > 0 else None
+
+    limit = _int_arg('limit') or DEFAULT_PAGE_SIZE
+    return _int_arg('since_id'), _int_arg('before_id'), min(limit, MAX_PAGE_SIZE)
+
+
+def fetch_page(cursor, table, thread_id, user_id, since_id=None, before_id=None, limit=DEFAULT_PAGE_SIZE):
+    """Return one page of a thread in the compact response shape.
+
+    With since_id the page holds the oldest messages newer than since_id, so
+    a client that is behind can keep asking until has_more is false. Without
+    it the page holds the newest messages (older than before_id if given).
+    Messages are always returned in ascending id order.
+    """
+    thread_column = THREAD_TABLES[table]
+    ph = placeholder(cursor)
+
+    query = f'SELECT * FROM {table} WHERE {thread_column} = {ph}'
+    params = [thread_id]
+    if since_id:
+        query += f' AND id > {ph}'
+        params.append(since_id)
+    if before_id:
+        query += f' AND id < {ph}'
+        params.append(before_id)
+    query += ' ORDER BY id ASC' if since_id else ' ORDER BY id DESC'
+    query += f' LIMIT {ph}'
+    params.append(limit + 1)
+
+    cursor.execute(query, params)
+    messages = [dict(row) for row in cursor.fetchall()]
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    if not since_id:
+        messages.reverse()
+
+    senders = {}
+    sender_ids = sorted({m['sender_id'] for m in messages})
+    if sender_ids:
+        placeholders = ', '.join([ph] * len(sender_ids))
+        cursor.execute(f'''
+            SELECT id, first_name, last_name, role
+            FROM users
+            WHERE id IN ({placeholders})
+        ''', sender_ids)
+        for row in cursor.fetchall():
+            senders[row['id']] = {
+                'first_name': row['first_name'],
+                'last_name': row['last_name'],
+                'role': row['role'],
+            }
+
+    # Older pages were already read when they were first delivered
+    marked_read = 0
+    if not before_id and any(m['receiver_id'] == user_id and not m['is_read'] for m in messages):
+        cursor.execute(f'''
+            UPDATE {table}
+            SET is_read = TRUE
+            WHERE {thread_column} = {ph} AND receiver_id = {ph} AND is_read = FALSE AND id <= {ph}
+        ''', (thread_id, user_id, messages[-1]['id']))
+        marked_read = cursor.rowcount
+        for message in messages:
+            if message['receiver_id'] == user_id:
+                message['is_read'] = True
+
+    return {
+        'messages': messages,
+        'senders': senders,
+        'has_more': has_more,
+        'oldest_id': messages[0]['id'] if messages else before_id,
+        'newest_id': messages[-1]['id'] if messages else since_id,
+        'marked_read': marked_read,
+    }
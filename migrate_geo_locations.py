@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Database migration script for geo-indexed project discovery.
+Creates project_locations and geocodes existing projects and contractors
+against the offline gazetteer in data/.
+"""
+
+from database import get_db_connection
+import geo_location
+
+def migrate_geo_locations():
+    """Create project_locations and backfill project and contractor points"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        geo_location.ensure_schema(cursor)
+        print("✓ project_locations table ready")
+
+        projects = geo_location.backfill_projects(cursor)
+        conn.commit()
+        print(f"✓ Geocoded {projects} projects")
+
+        contractors = geo_location.backfill_contractors(cursor)
+        conn.commit()
+        print(f"✓ Geocoded {contractors} contractor service areas")
+
+        return True
+
+    except Exception as e:
+        print(f"❌ Error during migration: {e}")
+        conn.rollback()
+        return False
+    finally:
+        cursor.close()
+        conn.close()
+
+if __name__ == "__main__":
+    print("HomePro Geo Location Migration")
+    print("=" * 50)
+
+    success = migrate_geo_locations()
+
+    if success:
+        print("\n🎉 Migration completed successfully!")
+        print("Locations that did not match the gazetteer keep using text matching.")
+    else:
+        print("\n💥 Migration failed. Please check the error messages above.")
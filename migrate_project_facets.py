@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Database migration script for dashboard facet counts.
+Creates project_facet_counts / project_facet_members and counts every
+Active project by type, budget bucket and state.
+"""
+
+from database import get_db_connection
+import project_facets
+
+def migrate_project_facets():
+    """Create the facet rollup tables and count existing Active projects"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        project_facets.ensure_schema(cursor)
+        print("✓ project_facet_counts and project_facet_members tables ready")
+
+        counted = project_facets.rebuild(cursor)
+        conn.commit()
+        print(f"✓ Counted {counted} Active projects")
+
+        return True
+
+    except Exception as e:
+        print(f"❌ Error during migration: {e}")
+        conn.rollback()
+        return False
+    finally:
+        cursor.close()
+        conn.close()
+
+if __name__ == "__main__":
+    print("HomePro Project Facets Migration")
+    print("=" * 50)
+
+    success = migrate_project_facets()
+
+    if success:
+        print("\n🎉 Migration completed successfully!")
+        print("Re-run at any time to recount the rollup from scratch.")
+    else:
+        print("\n💥 Migration failed. Please check the error messages above.")
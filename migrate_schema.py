@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Database migration run on every deploy (.ebextensions/02_database.config).
+init_database() in app.py only runs from app.py's __main__, never under
+gunicorn, so the tables the app's modules keep beside the core tables
+(search index, locations, rollups, summaries, counters, file registry,
+upload and server sessions, stream events, job status) are created here
+before the new version serves requests. Every step creates only what is
+missing, so re-running it is harmless. Rollups created empty are filled
+once; contractor_recommendations and the admin analytics rollups are filled
+by their scheduled scripts (.ebextensions/03_cron.config).
+Local SQLite databases are built by init_sqlite.py instead.
+"""
+
+import sys
+
+from database import get_db_connection
+import admin_rollups
+import bid_conversations
+import blob_store
+import event_stream
+import evidence_routes
+import file_registry
+import geo_location
+import image_derivatives
+import job_status
+import notification_inbox
+import project_facets
+import project_matching
+import project_search
+import resumable_uploads
+import server_sessions
+
+# (what is created, function taking the cursor), in dependency order
+SCHEMA_STEPS = [
+    ('projects keyword search index', project_search.ensure_index),
+    ('project_locations', geo_location.ensure_schema),
+    ('project_facet_counts / project_facet_members', project_facets.ensure_schema),
+    ('contractor_recommendations', project_matching.ensure_schema),
+    ('stored_files', file_registry.ensure_schema),
+    ('image_derivatives', image_derivatives.ensure_schema),
+    ('evidence_files', evidence_routes.ensure_schema),
+    ('blobs', blob_store.ensure_schema),
+    ('upload_sessions', resumable_uploads.ensure_schema),
+    ('server_sessions', server_sessions.ensure_schema),
+    ('stream_events', event_stream.ensure_schema),
+    ('processing_jobs', job_status.ensure_schema),
+    ('analytics rollup tables', admin_rollups.ensure_schema),
+    ('bid_conversations', bid_conversations.ensure_schema),
+    ('notification_counters', notification_inbox.ensure_schema),
+]
+
+
+def _is_empty(cursor, table):
+    cursor.execute(f'SELECT 1 FROM {table} LIMIT 1')
+    return cursor.fetchone() is None
+
+
+def migrate_schema():
+    """Create the module tables that are missing and fill the new rollups"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        for name, ensure in SCHEMA_STEPS:
+            ensure(cursor)
+            conn.commit()
+            print(f"✓ {name} ready")
+
+        if _is_empty(cursor, 'project_locations'):
+            projects = geo_location.backfill_projects(cursor)
+            contractors = geo_location.backfill_contractors(cursor)
+            conn.commit()
+            print(f"✓ Geocoded {projects} projects and {contractors} contractor service areas")
+
+        if _is_empty(cursor, 'project_facet_counts'):
+            counted = project_facets.rebuild(cursor)
+            conn.commit()
+            print(f"✓ Counted {counted} Active projects for the dashboard filters")
+
+        rebuilt = bid_conversations.backfill(cursor)
+        conn.commit()
+        if rebuilt:
+            print(f"✓ Built {rebuilt} bid conversation summaries")
+
+        return True
+
+    except Exception as e:
+        print(f"❌ Error during migration: {e}")
+        conn.rollback()
+        return False
+    finally:
+        cursor.close()
+        conn.close()
+
+if __name__ == "__main__":
+    print("HomePro Schema Migration")
+    print("=" * 50)
+
+    success = migrate_schema()
+
+    if success:
+        print("\n🎉 Migration completed successfully!")
+    else:
+        print("\n💥 Migration failed. Please check the error messages above.")
+        sys.exit(1)
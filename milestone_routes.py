@@ -3,6 +3,8 @@ from functools import wraps
 from datetime import datetime, timedelta
 import json
 
+import blob_store
+
 def register_milestone_routes(app, get_db_connection, login_required):
     """Register all milestone-related routes with the Flask app"""
     
@@ -207,6 +209,14 @@ def register_milestone_routes(app, get_db_connection, login_required):
             if result[0] == 'completed':
                 return jsonify({'error': 'Cannot delete completed milestones'}), 400
             
+            # Evidence files go with the milestone (ON DELETE CASCADE); release their blobs
+            cursor.execute('''
+                SELECT ef.file_path FROM evidence_files ef
+                JOIN milestone_evidence me ON ef.evidence_id = me.id
+                WHERE me.milestone_id = ?
+            ''', (milestone_id,))
+            blob_store.release(cursor, [row[0] for row in cursor.fetchall()])
+            
             # Delete milestone
             cursor.execute('DELETE FROM project_milestones WHERE id = ?', (milestone_id,))
             conn.commit()
@@ -0,0 +1,188 @@
+"""
+Notification inbox for bid notifications.
+
+Keeps a per-user unread counter in the notification_counters table so the
+navbar badge is a single primary-key read, and caches each user's latest
+notifications in-process. Every write to bid_notifications should go through
+this module so the counter and the cache stay in step with the table.
+"""
+
+import threading
+import time
+
+# Number of notifications returned by the inbox (matches the old LIMIT 20)
+INBOX_SIZE = 20
+
+# Upper bound on how long a cached inbox is trusted. Invalidation is
+# per-process, so this bounds staleness across gunicorn workers.
+CACHE_TTL_SECONDS = 60
+
+_inbox_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _cache_get(user_id):
+    with _cache_lock:
+        entry = _inbox_cache.get(user_id)
+        if not entry:
+            return None
+        expires_at, notifications = entry
+        if expires_at < time.time():
+            _inbox_cache.pop(user_id, None)
+            return None
+        return [dict(n) for n in notifications]
+
+
+def _cache_put(user_id, notifications):
+    with _cache_lock:
+        _inbox_cache[user_id] = (time.time() + CACHE_TTL_SECONDS, [dict(n) for n in notifications])
+
+
+def invalidate(user_id):
+    """Drop the cached inbox for a user"""
+    with _cache_lock:
+        _inbox_cache.pop(user_id, None)
+
+
+def _mark_cached_read(user_id, notification_id=None):
+    """Apply a mark-read to the cached inbox instead of discarding it"""
+    with _cache_lock:
+        entry = _inbox_cache.get(user_id)
+        if not entry:
+            return
+        for notification in entry[1]:
+            if notification_id is None or notification['id'] == notification_id:
+                notification['is_read'] = True
+
+
+def ensure_schema(cursor):
+    """Create notification_counters if it is missing"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS notification_counters (
+            user_id INT PRIMARY KEY,
+            unread_count INT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+    ''')
+
+
+def create_notification(cursor, bid_id, user_id, notification_type, title, message):
+    """Insert a bid notification and bump the recipient's unread counter.
+
+    Runs on the caller's cursor so it commits (or rolls back) together with
+    the surrounding transaction. Returns the new notification id.
+    """
+    cursor.execute('''
+        INSERT INTO bid_notifications (bid_id, user_id, notification_type, title, message)
+        VALUES (%s, %s, %s, %s, %s)
+    ''', (bid_id, user_id, notification_type, title, message))
+    notification_id = cursor.lastrowid
+
+    # A user without a counter row yet may already have unread notifications (the
+    # counter is created lazily), so a new row is seeded from the table, this one included
+    cursor.execute('''
+        INSERT INTO notification_counters (user_id, unread_count)
+        SELECT %s, COUNT(*) FROM bid_notifications
+        WHERE user_id = %s AND is_read = FALSE
+        ON DUPLICATE KEY UPDATE unread_count = unread_count + 1
+    ''', (user_id, user_id))
+
+    invalidate(user_id)
+    return notification_id
+
+
+def get_unread_count(cursor, user_id):
+    """Return the unread notification count for a user without any joins"""
+    cursor.execute('SELECT unread_count FROM notification_counters WHERE user_id = %s', (user_id,))
+    row = cursor.fetchone()
+    if row:
+        return row['unread_count']
+
+    # First read for this user: seed the counter from bid_notifications
+    cursor.execute('''
+        SELECT COUNT(*) as unread FROM bid_notifications
+        WHERE user_id = %s AND is_read = FALSE
+    ''', (user_id,))
+    unread_count = cursor.fetchone()['unread']
+    cursor.execute('''
+        INSERT INTO notification_counters (user_id, unread_count)
+        VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE unread_count = VALUES(unread_count)
+    ''', (user_id, unread_count))
+    return unread_count
+
+
+def get_latest(cursor, user_id):
+    """Return the latest INBOX_SIZE notifications for a user, cached"""
+    notifications = _cache_get(user_id)
+    if notifications is not None:
+        return notifications
+
+    cursor.execute('''
+        SELECT bn.*, b.amount, p.title as project_title
+        FROM bid_notifications bn
+        JOIN bids b ON bn.bid_id = b.id
+        JOIN projects p ON b.project_id = p.id
+        WHERE bn.user_id = %s
+        ORDER BY bn.created_at DESC
+        LIMIT %s
+    ''', (user_id, INBOX_SIZE))
+    notifications = [dict(row) for row in cursor.fetchall()]
+
+    _cache_put(user_id, notifications)
+    return notifications
+
+
+def mark_read(cursor, user_id, notification_id):
+    """Mark one notification as read; returns True if it was unread"""
+    cursor.execute('''
+        UPDATE bid_notifications
+        SET is_read = TRUE
+        WHERE id = %s AND user_id = %s AND is_read = FALSE
+    ''', (notification_id, user_id))
+    if cursor.rowcount == 0:
+        return False
+
+    cursor.execute('''
+        UPDATE notification_counters
+        SET unread_count = GREATEST(unread_count - 1, 0)
+        WHERE user_id = %s
+    ''', (user_id,))
+    _mark_cached_read(user_id, notification_id)
+    return True
+
+
+def mark_all_read(cursor, user_id):
+    """Mark every unread notification for a user as read in one statement.
+
+    Returns the number of notifications that changed state.
+    """
+    cursor.execute('''
+        UPDATE bid_notifications
+        SET is_read = TRUE
+        WHERE user_id = %s AND is_read = FALSE
+    ''', (user_id,))
+    updated = cursor.rowcount
+
+    cursor.execute('UPDATE notification_counters SET unread_count = 0 WHERE user_id = %s', (user_id,))
+    _mark_cached_read(user_id)
+    return updated
+
+
+def recount_unread(cursor):
+    """Rebuild every counter from bid_notifications.
+
+    For maintenance jobs that delete notifications in bulk
+    (auto_expire_bids.cleanup_old_notifications).
+    """
+    cursor.execute('UPDATE notification_counters SET unread_count = 0')
+    cursor.execute('''
+        INSERT INTO notification_counters (user_id, unread_count)
+        SELECT user_id, COUNT(*) FROM bid_notifications
+        WHERE is_read = FALSE
+        GROUP BY user_id
+        ON DUPLICATE KEY UPDATE unread_count = VALUES(unread_count)
+    ''')
+    with _cache_lock:
+        _inbox_cache.clear()
@@ -0,0 +1,400 @@
+"""
+Cache of rendered quote and invoice PDFs, on local disk or in S3.
+
+A cached PDF is named after everything that shows up in it: the template,
+the document id and updated_at, a digest of the contractor's profile
+(contractors has no updated_at), the joined project/client fields and the
+template version. Any edit produces a new name, so entries never have to be
+invalidated on update. The part of the name after the document id doubles
+as the download's ETag.
+
+Both backends evict least recently used PDFs once the cache is over its
+size budget. On disk a hit touches the file's mtime. S3 cannot touch an
+object cheaply, so a hit re-copies the object onto itself at most once per
+S3_TOUCH_AFTER_SECONDS. Writes to disk go through a temporary file and
+os.replace, so workers sharing the directory never serve a partial PDF.
+
+Misses are rendered by a pdf_service.PDFRenderService. prerender_quote()
+queues that render from a small background thread pool when a quote is
+created or sent, so the first download is usually a hit.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from database import placeholder
+import pdf_documents
+
+# Total size of cached PDFs before the least recently used are evicted
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# Object key prefix in the S3 bucket
+S3_PREFIX = 'pdf-cache/'
+
+# Minimum age of an S3 object before a hit refreshes its LastModified
+S3_TOUCH_AFTER_SECONDS = 24 * 3600
+
+# S3 puts between eviction passes (each pass lists the prefix)
+S3_EVICT_EVERY_PUTS = 50
+
+# Background threads waiting on pre-renders per worker
+PRERENDER_WORKERS = 2
+
+# Contractor columns that make up the profile version
+PROFILE_FIELDS = ('company', 'location', 'business_info', 'license_number', 'license_state',
+                  'insurance_provider', 'insurance_policy', 'first_name', 'last_name', 'email')
+
+# Joined columns a document shows besides its own row's updated_at
+DOCUMENT_FIELDS = {
+    'quote': ('project_title', 'project_location', 'client_name', 'client_location', 'notes'),
+    'invoice': ('project_title', 'project_location', 'client_name', 'client_location', 'client_email'),
+}
+
+# Table each template's documents live in
+DOCUMENT_TABLES = {
+    'quote': 'quotes',
+    'invoice': 'invoices',
+}
+
+
+def _field(row, name):
+    return row[name] if name in row.keys() else None
+
+
+def _digest(values):
+    return hashlib.sha256('\x1f'.join('' if v is None else str(v) for v in values).encode('utf-8')).hexdigest()
+
+
+def profile_version(contractor):
+    """Digest of the contractor profile fields a document can show"""
+    return _digest(_field(contractor, name) for name in PROFILE_FIELDS)[:16]
+
+
+def cache_name(template, document, contractor):
+    """(file name, etag) of the PDF for this version of a document"""
+    etag = _digest([template, document['id'], document['updated_at'], profile_version(contractor),
+                    pdf_documents.TEMPLATE_VERSION] + [_field(document, name) for name in DOCUMENT_FIELDS[template]])[:32]
+    return f"{template}-{document['id']}-{etag}.pdf", etag
+
+
+def _document_query(template, where):
+    return f'''
+        SELECT d.*, p.title as project_title, p.description as project_description,
+               p.location as project_location,
+               CONCAT(u.first_name, ' ', u.last_name) as client_name,
+               u.email as client_email,
+               h.location as client_location
+        FROM {DOCUMENT_TABLES[template]} d
+        JOIN projects p ON d.project_id = p.id
+        JOIN homeowners h ON p.homeowner_id = h.id
+        JOIN users u ON h.user_id = u.id
+        WHERE {where}
+    '''
+
+
+def load_contractor(cursor, contractor_id):
+    """Contractor profile row (with name and email) documents are rendered with"""
+    cursor.execute(f'''
+        SELECT c.*, u.first_name, u.last_name, u.email
+        FROM contractors c
+        JOIN users u ON c.user_id = u.id
+        WHERE c.id = {placeholder(cursor)}
+    ''', (contractor_id,))
+    return cursor.fetchone()
+
+
+def load_document(cursor, template, document_id, contractor_id=None):
+    """(document, contractor) rows a PDF is rendered from, or (None, None)"""
+    ph = placeholder(cursor)
+    where = f'd.id = {ph}' + (f' AND d.contractor_id = {ph}' if contractor_id is not None else '')
+    cursor.execute(_document_query(template, where),
+                   (document_id,) if contractor_id is None else (document_id, contractor_id))
+    document = cursor.fetchone()
+    if not document:
+        return None, None
+    return document, load_contractor(cursor, document['contractor_id'])
+
+
+def load_quote(cursor, quote_id, contractor_id=None):
+    """(quote, contractor) rows a quote PDF is rendered from, or (None, None)"""
+    return load_document(cursor, 'quote', quote_id, contractor_id)
+
+
+def load_invoice(cursor, invoice_id, contractor_id=None):
+    """(invoice, contractor) rows an invoice PDF is rendered from, or (None, None)"""
+    return load_document(cursor, 'invoice', invoice_id, contractor_id)
+
+
+def load_invoices_for_month(cursor, contractor_id, year, month):
+    """A contractor's invoices created in one calendar month, oldest first"""
+    start = datetime(year, month, 1)
+    end = datetime(year + month // 12, month % 12 + 1, 1)
+    ph = placeholder(cursor)
+    cursor.execute(_document_query('invoice', f'd.contractor_id = {ph} AND d.created_at >= {ph} AND d.created_at < {ph}')
+                   + ' ORDER BY d.created_at, d.id', (contractor_id, start, end))
+    return cursor.fetchall()
+
+
+class PDFCache:
+    """LRU cache of rendered PDFs in a local directory or an S3 bucket"""
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES, s3_client=None, bucket=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.s3_client = s3_client if bucket else None
+        # Not truth-tested: a lazy client would look up credentials while the app is imported
+        self.bucket = bucket if s3_client is not None else None
+        self._lock = threading.Lock()
+        self._puts_since_evict = 0
+        self._counters = {'hits': 0, 'misses': 0, 'renders': 0, 'evictions': 0, 'errors': 0}
+        if not self.bucket:
+            os.makedirs(self.directory, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, config, s3_client=None):
+        """S3 when PDF_CACHE_S3_BUCKET is set and S3 is available, else PDF_CACHE_DIR"""
+        return cls(directory=config.get('PDF_CACHE_DIR'),
+                   max_bytes=config.get('PDF_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES),
+                   s3_client=s3_client,
+                   bucket=config.get('PDF_CACHE_S3_BUCKET'))
+
+    def get(self, name):
+        """File path (disk) or bytes (S3) of a cached PDF, or None"""
+        try:
+            found = self._s3_get(name) if self.bucket else self._disk_get(name)
+        except Exception as e:
+            self._count('errors')
+            print(f"Error reading cached PDF {name}: {e}")
+            found = None
+        self._count('hits' if found is not None else 'misses')
+        return found
+
+    def put(self, name, data):
+        """Store a PDF, replacing older versions of the same document"""
+        try:
+            if self.bucket:
+                self._s3_put(name, data)
+            else:
+                self._disk_put(name, data)
+        except Exception as e:
+            self._count('errors')
+            print(f"Error caching PDF {name}: {e}")
+
+    def invalidate(self, document_prefix):
+        """Drop every cached version of a document, e.g. 'quote-12-'"""
+        try:
+            if self.bucket:
+                for entry in self._s3_entries(S3_PREFIX + document_prefix):
+                    self.s3_client.delete_object(Bucket=self.bucket, Key=entry['Key'])
+            else:
+                for entry in os.scandir(self.directory):
+                    if entry.name.startswith(document_prefix) and entry.name.endswith('.pdf'):
+                        self._unlink(entry.path)
+        except Exception as e:
+            self._count('errors')
+            print(f"Error invalidating cached PDFs {document_prefix}*: {e}")
+
+    def get_or_render(self, name, render):
+        """Cached PDF for name, calling render() for the bytes on a miss"""
+        cached = self.get(name)
+        if cached is not None:
+            return cached
+        data = render()
+        self.put_rendered(name, data)
+        return data
+
+    def put_rendered(self, name, data):
+        """put() a freshly rendered PDF, counting the render"""
+        self._count('renders')
+        self.put(name, data)
+
+    def stats(self):
+        """Hit, miss, render and eviction counters for this worker"""
+        with self._lock:
+            stats = dict(self._counters)
+        stats['backend'] = 's3' if self.bucket else 'disk'
+        stats['max_bytes'] = self.max_bytes
+        return stats
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    @staticmethod
+    def _document_prefix(name):
+        return name.rsplit('-', 1)[0] + '-'
+
+    @staticmethod
+    def _unlink(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _disk_get(self, name):
+        path = os.path.join(self.directory, name)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def _disk_put(self, name, data):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, os.path.join(self.directory, name))
+        except Exception:
+            self._unlink(tmp_path)
+            raise
+        self._disk_evict(keep=name)
+
+    def _disk_evict(self, keep):
+        stale_prefix = self._document_prefix(keep)
+        entries = []
+        with self._lock:
+            for entry in os.scandir(self.directory):
+                if not entry.name.endswith('.pdf') or entry.name == keep:
+                    continue
+                if entry.name.startswith(stale_prefix):
+                    self._unlink(entry.path)
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            try:
+                total += os.path.getsize(os.path.join(self.directory, keep))
+            except OSError:
+                pass
+            evicted = 0
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                self._unlink(path)
+                total -= size
+                evicted += 1
+            self._counters['evictions'] += evicted
+
+    def _s3_entries(self, prefix):
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            yield from page.get('Contents', [])
+
+    def _s3_get(self, name):
+        key = S3_PREFIX + name
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket, Key=key)
+        except self.s3_client.exceptions.NoSuchKey:
+            return None
+        data = response['Body'].read()
+        age = (datetime.now(timezone.utc) - response['LastModified']).total_seconds()
+        if age > S3_TOUCH_AFTER_SECONDS:
+            self.s3_client.copy_object(Bucket=self.bucket, Key=key, CopySource={'Bucket': self.bucket, 'Key': key},
+                                       MetadataDirective='REPLACE', ContentType='application/pdf')
+        return data
+
+    def _s3_put(self, name, data):
+        self.s3_client.put_object(Bucket=self.bucket, Key=S3_PREFIX + name, Body=data,
+                                  ContentType='application/pdf')
+        for entry in self._s3_entries(S3_PREFIX + self._document_prefix(name)):
+            if entry['Key'] != S3_PREFIX + name:
+                self.s3_client.delete_object(Bucket=self.bucket, Key=entry['Key'])
+        with self._lock:
+            self._puts_since_evict += 1
+            if self._puts_since_evict < S3_EVICT_EVERY_PUTS:
+                return
+            self._puts_since_evict = 0
+        entries = sorted(self._s3_entries(S3_PREFIX), key=lambda entry: entry['LastModified'])
+        total = sum(entry['Size'] for entry in entries)
+        evicted = 0
+        for entry in entries:
+            if total <= self.max_bytes:
+                break
+            self.s3_client.delete_object(Bucket=self.bucket, Key=entry['Key'])
+            total -= entry['Size']
+            evicted += 1
+        self._count('evictions', evicted)
+
+
+def get_pdf(cache, service, template, document, contractor):
+    """(cached path or bytes, etag, render seconds or None on a hit) for one document"""
+    name, etag = cache_name(template, document, contractor)
+    timing = {}
+
+    def render():
+        pdf, timing['seconds'] = service.render(template, document, contractor)
+        return pdf
+
+    return cache.get_or_render(name, render), etag, timing.get('seconds')
+
+
+def get_pdfs(cache, service, template, documents, contractor):
+    """[(document, cached path or bytes, render seconds or None)] with misses rendered in parallel"""
+    results, jobs = [], {}
+    for index, document in enumerate(documents):
+        name, _ = cache_name(template, document, contractor)
+        cached = cache.get(name)
+        results.append((document, cached, None))
+        if cached is None:
+            jobs[index] = (name, service.submit(template, document, contractor))
+    for index, (name, job) in jobs.items():
+        pdf, seconds = job.result()
+        cache.put_rendered(name, pdf)
+        results[index] = (results[index][0], pdf, seconds)
+    return results
+
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_pending = set()
+
+
+def _prerender(cache, service, get_db_connection, quote_id):
+    # Reads the quote when it starts, so a change queued after this point
+    # needs (and gets) its own render
+    with _executor_lock:
+        _pending.discard(quote_id)
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        quote, contractor = load_quote(cursor, quote_id)
+        cursor.close()
+        conn.close()
+        conn = None
+        if quote and contractor:
+            get_pdf(cache, service, 'quote', quote, contractor)
+    except Exception as e:
+        print(f"Error pre-rendering quote {quote_id} PDF: {e}")
+    finally:
+        if conn:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+
+def prerender_quote(cache, service, get_db_connection, quote_id):
+    """Render a quote's PDF into the cache in the background"""
+    global _executor, _executor_pid
+    if not pdf_documents.REPORTLAB_AVAILABLE:
+        return
+    with _executor_lock:
+        if quote_id in _pending:
+            return
+        # An executor inherited through fork has no threads in the child
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=PRERENDER_WORKERS, thread_name_prefix='pdf-prerender')
+            _executor_pid = os.getpid()
+            _pending.clear()
+        _pending.add(quote_id)
+    _executor.submit(_prerender, cache, service, get_db_connection, quote_id)
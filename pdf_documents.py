@@ -0,0 +1,333 @@
+"""
+PDF documents (quotes and invoices) rendered with reportlab.
+
+reportlab is imported when this module loads, at worker start, rather than
+inside the first download request. preload() loads the fonts the templates
+use and builds the colour scheme and paragraph styles once; every render
+reuses them. Both documents share one layout: a title header, a
+client/business panel, a line item table, a details/totals panel, notes,
+terms and a footer. Renderers take plain rows (dicts) and return the PDF as
+bytes, so they need no database or Flask context and can run in the
+pdf_service process pool.
+"""
+
+from io import BytesIO
+from xml.sax.saxutils import escape
+
+try:
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.units import inch
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+    REPORTLAB_AVAILABLE = True
+except ImportError:
+    REPORTLAB_AVAILABLE = False
+    print("Warning: reportlab not installed. PDF downloads will be disabled.")
+
+# Bump when a template's layout changes so cached PDFs are re-rendered
+TEMPLATE_VERSION = 1
+
+# Standard fonts the templates use; their metrics are loaded by preload()
+FONTS = ('Helvetica', 'Helvetica-Bold')
+
+TERMS_TEXT = """
+1. This quotation is valid for the period specified above and subject to acceptance within that timeframe.<br/>
+2. All work will be performed in accordance with industry standards and applicable building codes.<br/>
+3. Payment terms: 50% deposit required upon acceptance, balance due upon completion.<br/>
+4. Any changes to the scope of work may result in additional charges.<br/>
+5. Contractor is licensed and insured. Proof of insurance available upon request.<br/>
+6. This quotation does not constitute a contract until formally accepted by both parties.
+"""
+
+FOOTER_TEXT = "Thank you for considering our professional services. We look forward to working with you."
+
+INVOICE_TERMS_TEXT = """
+1. Payment is due by the due date shown above.<br/>
+2. Please include the invoice number with your payment.<br/>
+3. Balances unpaid after the due date may be subject to a late fee.<br/>
+4. Questions about this invoice should be raised with the contractor before the due date.
+"""
+
+INVOICE_FOOTER_TEXT = "Thank you for your business."
+
+_styles = None
+
+
+def _xml_escape(s):
+    return escape(s or '')
+
+
+def _pdf_safe(s):
+    try:
+        return _xml_escape(s).encode('latin-1', 'replace').decode('latin-1')
+    except Exception:
+        return _xml_escape(str(s))
+
+
+def _br(s):
+    return _pdf_safe(s).replace('\n', '<br/>')
+
+
+def _money(value):
+    return f"${float(value or 0):,.2f}"
+
+
+def _date(value):
+    if not value:
+        return ''
+    if hasattr(value, 'strftime'):
+        return value.strftime('%m/%d/%Y')
+    return str(value)[:10]
+
+
+def preload():
+    """Load font metrics and build the shared styles (run once per process)"""
+    for font in FONTS:
+        pdfmetrics.getFont(font)
+    styles()
+
+
+def styles():
+    """Shared colours and paragraph styles, built on first use"""
+    global _styles
+    if _styles is not None:
+        return _styles
+    if not REPORTLAB_AVAILABLE:
+        raise RuntimeError('reportlab is not installed')
+
+    sample = getSampleStyleSheet()
+    palette = {
+        'primary': colors.HexColor('#2C3E50'),  # Dark blue-gray
+        'secondary': colors.HexColor('#34495E'),  # Lighter blue-gray
+        'accent': colors.HexColor('#3498DB'),  # Blue
+        'light_gray': colors.HexColor('#ECF0F1'),  # Light gray
+        'dark_gray': colors.HexColor('#7F8C8D'),  # Medium gray
+        'border': colors.HexColor('#BDC3C7'),
+    }
+    built = dict(palette)
+    built['normal'] = sample['Normal']
+    built['title'] = ParagraphStyle(
+        'CustomTitle', parent=sample['Heading1'], fontSize=32, spaceAfter=8,
+        alignment=0, textColor=palette['primary'], fontName='Helvetica-Bold', letterSpacing=3)
+    built['subtitle'] = ParagraphStyle(
+        'CustomSubtitle', parent=sample['Normal'], fontSize=16, spaceAfter=30,
+        alignment=0, textColor=palette['dark_gray'], fontName='Helvetica', letterSpacing=2)
+    built['project_title'] = ParagraphStyle(
+        'ProjectTitle', parent=sample['Heading2'], fontSize=16, leading=18, spaceAfter=0,
+        alignment=0, textColor=palette['dark_gray'], fontName='Helvetica-Bold')
+    built['header'] = ParagraphStyle(
+        'CustomHeader', parent=sample['Heading2'], fontSize=12, spaceAfter=8, spaceBefore=15,
+        textColor=palette['secondary'], fontName='Helvetica-Bold', letterSpacing=1)
+    built['info'] = ParagraphStyle(
+        'InfoStyle', parent=sample['Normal'], fontSize=11, spaceAfter=6,
+        textColor=palette['primary'], fontName='Helvetica')
+    built['bold_info'] = ParagraphStyle(
+        'BoldInfoStyle', parent=sample['Normal'], fontSize=11, spaceAfter=6,
+        textColor=palette['primary'], fontName='Helvetica-Bold')
+    built['logo'] = ParagraphStyle(
+        'LogoStyle', parent=sample['Normal'], fontSize=20, alignment=2,
+        textColor=palette['dark_gray'], fontName='Helvetica-Bold')
+    built['footer'] = ParagraphStyle(
+        'Footer', parent=sample['Normal'], fontSize=10, alignment=1,
+        textColor=colors.HexColor('#666666'))
+    _styles = built
+    return _styles
+
+
+def _build(elements):
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter, rightMargin=50, leftMargin=50, topMargin=50, bottomMargin=50)
+    doc.build(elements)
+    pdf_data = buffer.getvalue()
+    buffer.close()
+    return pdf_data
+
+
+def _header(s, title, subtitle, right_html):
+    # Big document title with a smaller subtitle below, logo block on the right.
+    # A plain list: KeepTogether inside a table cell wraps to an unbounded
+    # height and fails the layout
+    left_header = [
+        Paragraph(f'<b>{title}</b>', s['title']),
+        Spacer(1, 2),
+        Paragraph(_br(subtitle), s['project_title']),
+    ]
+    header_table = Table([[left_header, Paragraph(right_html, s['logo'])]], colWidths=[4*inch, 3*inch])
+    header_table.setStyle(TableStyle([
+        ('ALIGN', (0, 0), (0, 0), 'LEFT'),
+        ('ALIGN', (1, 0), (1, 0), 'RIGHT'),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 20),
+    ]))
+    return [header_table, Spacer(1, 20)]
+
+
+def _parties(s, client_html, business_html):
+    info_table = Table([[
+        Paragraph(client_html, s['info']),
+        Paragraph(business_html, s['info'])
+    ]], colWidths=[3.5*inch, 3.5*inch])
+    info_table.setStyle(TableStyle([
+        ('ALIGN', (0, 0), (0, 0), 'LEFT'),
+        ('ALIGN', (1, 0), (1, 0), 'RIGHT'),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 20),
+    ]))
+    return [info_table, Spacer(1, 30)]
+
+
+def _line_items(s, rows):
+    service_table = Table([['SERVICE', 'PRICE', 'QTY', 'TOTAL']] + rows,
+                          colWidths=[2.8*inch, 1.3*inch, 0.7*inch, 1.2*inch])
+    service_table.setStyle(TableStyle([
+        # Header row styling
+        ('BACKGROUND', (0, 0), (-1, 0), s['secondary']),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 11),
+        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+
+        # Data rows styling
+        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 1), (-1, -1), 10),
+        ('ALIGN', (0, 1), (0, -1), 'LEFT'),  # Service column left-aligned
+        ('ALIGN', (1, 1), (-1, -1), 'CENTER'),  # Price, Qty, Total centered
+
+        # Table styling
+        ('GRID', (0, 0), (-1, -1), 1, s['border']),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('TOPPADDING', (0, 0), (-1, -1), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
+        ('LEFTPADDING', (0, 0), (-1, -1), 8),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 8),
+    ] + [
+        # Alternating row colors
+        ('BACKGROUND', (0, row), (-1, row), s['light_gray']) for row in range(1, len(rows) + 1, 2)
+    ]))
+    return [service_table, Spacer(1, 25)]
+
+
+def _details(s, details_html, totals_html):
+    details_table = Table([[
+        Paragraph(details_html, s['info']),
+        Paragraph(totals_html, s['bold_info'])
+    ]], colWidths=[3*inch, 2*inch])
+    details_table.setStyle(TableStyle([
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('ALIGN', (0, 0), (0, 0), 'LEFT'),
+        ('ALIGN', (1, 0), (1, 0), 'RIGHT'),
+        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('LEFTPADDING', (0, 0), (-1, -1), 0),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 0),
+    ]))
+    return [details_table, Spacer(1, 30)]
+
+
+def _closing(s, notes, terms_html, footer_text):
+    elements = []
+    if notes:
+        elements.append(Paragraph('ADDITIONAL NOTES:', s['header']))
+        elements.append(Paragraph(_br(notes), s['normal']))
+        elements.append(Spacer(1, 20))
+
+    elements.append(Paragraph('TERMS AND CONDITIONS:', s['header']))
+    elements.append(Paragraph(terms_html, s['normal']))
+    elements.append(Spacer(1, 20))
+
+    elements.append(Spacer(1, 20))
+    elements.append(Paragraph(footer_text, s['footer']))
+    return elements
+
+
+def render_quote(quote, contractor):
+    """Render a quote (row joined with project and client) as PDF bytes"""
+    s = styles()
+    elements = _header(s, 'Quote', quote['project_title'],
+                       '<b>Your Company</b><br/><font size="10">LOGO HERE</font>')
+
+    client_info = f"""
+    <b>CLIENT NAME INFORMATION:</b><br/><br/>
+    Client Name: {_pdf_safe(quote['client_name'])}<br/><br/>
+    Address: {_pdf_safe((quote['client_location'] or quote['project_location']))}<br/><br/>
+    Phone: ___________________________
+    """
+    business_info = """
+    <b>YOUR BUSINESS NAME HERE</b><br/><br/>
+    Company Address Here<br/>
+    City, Province/State<br/>
+    Phone: 555-555-5555<br/>
+    www.yourbusinessnamehere.com
+    """
+    elements += _parties(s, client_info, business_info)
+
+    elements += _line_items(s, [
+        ['ITEM ONE', '$1000.00', '1', '$1000.00'],
+        ['ITEM TWO', '$1000.00', '1', '$1000.00'],
+        ['ITEM THREE', '$1000.00', '1', '$1000.00'],
+        ['ITEM FOUR', '$1000.00', '1', '$1000.00'],
+        ['ITEM FIVE', '$1000.00', '1', '$1000.00']
+    ])
+
+    elements += _details(
+        s,
+        'Quote Number: ___________________________<br/><br/>Quote Prepared By: ___________________________<br/><br/>Quote Date: ___________________________<br/><br/>Valid Until Date: ___________________________',
+        'SUBTOTAL<br/>TAXES<br/>TOTAL')
+
+    elements += _closing(s, quote['notes'], TERMS_TEXT, FOOTER_TEXT)
+    return _build(elements)
+
+
+def render_invoice(invoice, contractor):
+    """Render an invoice (row joined with project and client) as PDF bytes"""
+    s = styles()
+    company = contractor['company'] or f"{contractor['first_name']} {contractor['last_name']}"
+    elements = _header(s, 'Invoice', invoice['project_title'],
+                       f'<b>{_pdf_safe(company)}</b><br/><font size="10">{_pdf_safe(invoice["invoice_number"])}</font>')
+
+    client_info = f"""
+    <b>BILL TO:</b><br/><br/>
+    Client Name: {_pdf_safe(invoice['client_name'])}<br/><br/>
+    Address: {_pdf_safe((invoice['client_location'] or invoice['project_location']))}<br/><br/>
+    Email: {_pdf_safe(invoice['client_email'])}
+    """
+    business_info = f"""
+    <b>{_pdf_safe(company)}</b><br/><br/>
+    {_pdf_safe(contractor['location'])}<br/>
+    {_pdf_safe(contractor['email'])}<br/>
+    {('License: ' + _pdf_safe(contractor['license_number'])) if contractor['license_number'] else ''}
+    """
+    elements += _parties(s, client_info, business_info)
+
+    rows = [[f"{invoice['title']} - {label}", _money(invoice[column]), '1', _money(invoice[column])]
+            for label, column in (('Labor', 'labor_cost'), ('Materials', 'materials_cost'), ('Other', 'other_costs'))
+            if invoice[column]]
+    elements += _line_items(s, rows or [[invoice['title'], _money(invoice['total_amount']), '1',
+                                         _money(invoice['total_amount'])]])
+
+    elements += _details(
+        s,
+        f"Invoice Number: {_pdf_safe(invoice['invoice_number'])}<br/><br/>"
+        f"Invoice Date: {_date(invoice['created_at'])}<br/><br/>"
+        f"Due Date: {_date(invoice['due_date'])}<br/><br/>"
+        f"Status: {_pdf_safe((invoice['status'] or '').title())}",
+        f"SUBTOTAL {_money(invoice['total_amount'])}<br/>"
+        f"TAXES ({float(invoice['tax_rate'] or 0):g}%) {_money(invoice['tax_amount'])}<br/>"
+        f"TOTAL {_money(invoice['final_amount'])}")
+
+    elements += _closing(s, invoice['notes'], INVOICE_TERMS_TEXT, INVOICE_FOOTER_TEXT)
+    return _build(elements)
+
+
+# Template name -> renderer(document, contractor)
+TEMPLATES = {
+    'quote': render_quote,
+    'invoice': render_invoice,
+}
+
+
+def render(template, document, contractor):
+    """Render a document with one of TEMPLATES"""
+    return TEMPLATES[template](document, contractor)
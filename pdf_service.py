@@ -0,0 +1,175 @@
+"""
+PDF rendering service backed by a process pool.
+
+reportlab layout is CPU-bound. Run in the request thread, a burst of
+downloads holds the GIL and starves the rest of the gunicorn worker. The
+service hands renders to a ProcessPoolExecutor instead. Its processes are
+forked from a forkserver that has already imported pdf_documents (and with
+it reportlab), and each one runs pdf_documents.preload() once, so a render
+only pays for the layout itself.
+
+Every render reports how long the document took in the pool and how long it
+waited for a free process. The most recent renders and per-template totals
+are kept for stats().
+
+With PDF_RENDER_WORKERS = 0 (or no multiprocessing support) documents are
+rendered in the calling thread; the timing is still recorded.
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+import pdf_documents
+
+# Render processes per gunicorn worker
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+
+# Seconds a caller waits for one document before giving up
+RENDER_TIMEOUT_SECONDS = 30
+
+# Finished renders kept for the stats endpoint
+RECENT_RENDERS = 100
+
+# Modules the forkserver imports before forking render processes ('__main__'
+# keeps the children from each re-running the main script)
+PRELOAD_MODULES = ['__main__', 'pdf_documents']
+
+
+def _init_worker():
+    pdf_documents.preload()
+
+
+def _render_in_worker(template, document, contractor):
+    started = time.perf_counter()
+    pdf = pdf_documents.render(template, document, contractor)
+    return pdf, time.perf_counter() - started
+
+
+def _plain(row):
+    # sqlite3.Row cannot be pickled into the pool
+    return dict(row) if row is not None and not isinstance(row, dict) else row
+
+
+class PDFRenderService:
+    """Render pdf_documents templates in a pool of preloaded processes"""
+
+    def __init__(self, max_workers=DEFAULT_WORKERS, timeout=RENDER_TIMEOUT_SECONDS):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=RECENT_RENDERS)
+        self._totals = {}
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(max_workers=config.get('PDF_RENDER_WORKERS', DEFAULT_WORKERS),
+                   timeout=config.get('PDF_RENDER_TIMEOUT', RENDER_TIMEOUT_SECONDS))
+
+    def submit(self, template, document, contractor):
+        """Start rendering one document; returns a RenderJob"""
+        return RenderJob(self, template, _plain(document), _plain(contractor))
+
+    def render(self, template, document, contractor):
+        """(pdf bytes, render seconds) for one document"""
+        return self.submit(template, document, contractor).result()
+
+    def stats(self):
+        """Per-template totals and the most recent renders, newest first"""
+        with self._lock:
+            return {
+                'workers': self.max_workers,
+                'pool_running': self._pool is not None and self._pool_pid == os.getpid(),
+                'templates': {name: dict(totals) for name, totals in self._totals.items()},
+                'recent': list(reversed(self._recent)),
+            }
+
+    def close(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None and self._pool_pid == os.getpid():
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _executor(self):
+        if self.max_workers <= 0:
+            return None
+        with self._lock:
+            # A pool inherited through fork belongs to the parent
+            if self._pool is None or self._pool_pid != os.getpid():
+                try:
+                    context = multiprocessing.get_context('forkserver')
+                    context.set_forkserver_preload(PRELOAD_MODULES)
+                except ValueError:
+                    context = multiprocessing.get_context()
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context,
+                                                 initializer=_init_worker)
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def _reset(self, pool):
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _record(self, template, document, size, render_seconds, total_seconds, error):
+        entry = {
+            'template': template,
+            'document_id': document.get('id') if document else None,
+            'bytes': size,
+            'render_seconds': round(render_seconds, 3),
+            'wait_seconds': round(max(total_seconds - render_seconds, 0), 3),
+            'finished_at': datetime.now().isoformat(),
+            'error': error,
+        }
+        with self._lock:
+            self._recent.append(entry)
+            totals = self._totals.setdefault(template, {'rendered': 0, 'failed': 0, 'render_seconds': 0.0,
+                                                        'max_render_seconds': 0.0})
+            if error:
+                totals['failed'] += 1
+            else:
+                totals['rendered'] += 1
+                totals['render_seconds'] = round(totals['render_seconds'] + render_seconds, 3)
+                totals['max_render_seconds'] = round(max(totals['max_render_seconds'], render_seconds), 3)
+        print(f"PDF {template} {entry['document_id']}: {size} bytes, render {render_seconds:.2f}s, "
+              f"wait {entry['wait_seconds']:.2f}s{' - ' + error if error else ''}")
+
+
+class RenderJob:
+    """One submitted render; result() returns (pdf bytes, render seconds)"""
+
+    def __init__(self, service, template, document, contractor):
+        self._service = service
+        self.template = template
+        self.document = document
+        self._args = (template, document, contractor)
+        self._started = time.perf_counter()
+        self._pool = service._executor()
+        self._future = self._pool.submit(_render_in_worker, *self._args) if self._pool else None
+
+    def result(self):
+        try:
+            if self._future is None:
+                pdf, seconds = _render_in_worker(*self._args)
+            else:
+                try:
+                    pdf, seconds = self._future.result(timeout=self._service.timeout)
+                except BrokenProcessPool:
+                    # A render process died (e.g. OOM); start a fresh pool next time
+                    self._service._reset(self._pool)
+                    raise
+        except Exception as e:
+            self._service._record(self.template, self.document, 0, 0.0,
+                                  time.perf_counter() - self._started, str(e) or type(e).__name__)
+            raise
+        self._service._record(self.template, self.document, len(pdf), seconds,
+                              time.perf_counter() - self._started, None)
+        return pdf, seconds
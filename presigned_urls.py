@@ -0,0 +1,149 @@
+"""
+Cache of presigned S3 GET URLs.
+
+Signing a URL is local CPU work (an HMAC chain per request), and a freshly
+signed URL has a new query string, so the browser and any CDN in front of
+S3 see a different resource on every page view. The cache keeps one URL per
+(bucket, key) and hands it out until EXPIRY_MARGIN_SECONDS before it
+expires, so repeat views reuse the same URL (and the cached object) for
+most of its lifetime and the margin leaves the page time to use it.
+
+urls() signs everything a page needs at once: cached entries are taken in
+one pass under the lock and only the misses are signed.
+
+A presigned URL stops working when the credentials that signed it expire,
+whatever its own ExpiresIn. On an instance role those are temporary
+credentials, renewed every few hours, so a URL is never reused past the
+signing credentials' expiry less the margin, and the whole cache is dropped
+when the signing access key changes.
+
+The bucket of an object comes from the registry row when there is one;
+bucket_for_key() maps keys stored before the registry using the
+S3_KEY_BUCKETS prefix table from config, falling back to AWS_S3_BUCKET.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+# Lifetime of a signed URL
+DEFAULT_EXPIRES_SECONDS = 3600
+
+# A cached URL is re-signed once less than this much of its lifetime is left
+EXPIRY_MARGIN_SECONDS = 300
+
+# Signed URLs kept per worker (least recently used are dropped)
+DEFAULT_MAX_ENTRIES = 10000
+
+
+def bucket_for_key(config, key):
+    """Configured bucket for an S3 key that has no registry row"""
+    for prefix, bucket in config.get('S3_KEY_BUCKETS', {}).items():
+        if key.startswith(prefix):
+            return bucket
+    return config.get('AWS_S3_BUCKET', 'homepro-uploads')
+
+
+class PresignedURLCache:
+    """Reuse presigned GET URLs per (bucket, key) until shortly before they expire"""
+
+    def __init__(self, s3_client, expires_in=DEFAULT_EXPIRES_SECONDS, margin=EXPIRY_MARGIN_SECONDS,
+                 max_entries=DEFAULT_MAX_ENTRIES):
+        self.s3_client = s3_client
+        self.expires_in = expires_in
+        self.margin = min(margin, expires_in // 2)
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._signed = 0
+        self._errors = 0
+        self._access_key = None
+        self._credential_changes = 0
+
+    @classmethod
+    def from_config(cls, config, s3_client):
+        return cls(s3_client,
+                   expires_in=config.get('S3_PRESIGN_EXPIRES', DEFAULT_EXPIRES_SECONDS),
+                   margin=config.get('S3_PRESIGN_MARGIN', EXPIRY_MARGIN_SECONDS),
+                   max_entries=config.get('S3_PRESIGN_CACHE_ENTRIES', DEFAULT_MAX_ENTRIES))
+
+    def url(self, bucket, key):
+        """Presigned GET URL for one object, or None if it cannot be signed"""
+        return self.urls([(bucket, key)]).get((bucket, key))
+
+    def _credentials(self):
+        """(access key, expiry timestamp or None) of the credentials the client signs with"""
+        try:
+            credentials = self.s3_client._request_signer._credentials
+        except Exception:
+            return None, None
+        if credentials is None:
+            return None, None
+        # Reading the key first lets refreshable credentials renew themselves before the expiry is read
+        access_key = getattr(credentials, 'access_key', None)
+        expiry = getattr(credentials, '_expiry_time', None)
+        return access_key, expiry.timestamp() if expiry else None
+
+    def urls(self, objects):
+        """{(bucket, key): url} for many objects, signing only the ones not cached"""
+        now = time.time()
+        found = {}
+        missing = []
+        access_key, credentials_expire_at = self._credentials() if self.s3_client else (None, None)
+        with self._lock:
+            if access_key != self._access_key:
+                # URLs signed with the previous credentials die with them
+                if self._access_key is not None:
+                    self._entries.clear()
+                    self._credential_changes += 1
+                self._access_key = access_key
+            for obj in dict.fromkeys(objects):
+                entry = self._entries.get(obj)
+                if entry and entry[1] > now:
+                    self._entries.move_to_end(obj)
+                    found[obj] = entry[0]
+                    self._hits += 1
+                else:
+                    missing.append(obj)
+        if not missing or not self.s3_client:
+            return found
+
+        signed = {}
+        for bucket, key in missing:
+            try:
+                signed[(bucket, key)] = self.s3_client.generate_presigned_url(
+                    'get_object', Params={'Bucket': bucket, 'Key': key}, ExpiresIn=self.expires_in)
+            except Exception as e:
+                print(f"Error presigning s3://{bucket}/{key}: {e}")
+                with self._lock:
+                    self._errors += 1
+        reuse_until = now + self.expires_in - self.margin
+        if credentials_expire_at is not None:
+            reuse_until = min(reuse_until, credentials_expire_at - self.margin)
+        with self._lock:
+            for obj, url in signed.items():
+                self._entries[obj] = (url, reuse_until)
+                self._entries.move_to_end(obj)
+            self._signed += len(signed)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        found.update(signed)
+        return found
+
+    def invalidate(self, bucket, key):
+        """Forget the URL of an object that was replaced or deleted"""
+        with self._lock:
+            self._entries.pop((bucket, key), None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self._hits,
+                'signed': self._signed,
+                'errors': self._errors,
+                'credential_changes': self._credential_changes,
+                'expires_in': self.expires_in,
+                'margin': self.margin,
+            }
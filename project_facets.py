@@ -0,0 +1,230 @@
+"""
+Facet counts of Active projects for the contractor dashboard filters.
+
+project_facet_counts holds one row per (project_type, budget_bucket, region)
+cell, where region is the project's state. A project is counted in every
+budget bucket its range overlaps, using the same rules as the dashboard's
+budget filter. It is also counted in BUDGET_ANY, so per-type and per-region
+totals come from that bucket without double counting.
+
+project_facet_members records the cells each project was counted in. With
+it, on_project_changed() can move a project between cells, or drop it when
+it leaves Active, without the caller passing the previous status. Code that
+deletes projects calls remove() first: the members rows go with the project
+by cascade, but the counts would not.
+
+The counts cover the type, budget and state filters only. The dashboard's
+keyword, location and distance filters are not in the rollup, so with one
+of those set the numbers are totals for the other facets and the page says
+so.
+"""
+
+from database import is_sqlite, placeholder
+import geo_location
+
+# Dashboard budget filter values, in display order
+BUDGET_BUCKETS = ('0-5000', '5000-15000', '15000-50000', '50000+')
+
+# Bucket every counted project is in, whatever its budget
+BUDGET_ANY = 'any'
+
+# Region of projects whose location has no recognisable state
+UNKNOWN_REGION = ''
+
+
+def ensure_schema(cursor):
+    """Create the facet tables for the connected database if they are missing"""
+    if is_sqlite(cursor):
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS project_facet_counts (
+                project_type TEXT NOT NULL,
+                budget_bucket TEXT NOT NULL,
+                region TEXT NOT NULL,
+                project_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (project_type, budget_bucket, region)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS project_facet_members (
+                project_id INTEGER PRIMARY KEY,
+                project_type TEXT NOT NULL,
+                region TEXT NOT NULL,
+                budget_buckets TEXT NOT NULL
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_project_facet_members_region ON project_facet_members (region)')
+        return
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS project_facet_counts (
+            project_type VARCHAR(100) NOT NULL,
+            budget_bucket VARCHAR(20) NOT NULL,
+            region CHAR(2) NOT NULL,
+            project_count INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (project_type, budget_bucket, region)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS project_facet_members (
+            project_id INT PRIMARY KEY,
+            project_type VARCHAR(100) NOT NULL,
+            region CHAR(2) NOT NULL,
+            budget_buckets VARCHAR(100) NOT NULL,
+            FOREIGN KEY (project_id) REFERENCES projects(id) ON DELETE CASCADE,
+            INDEX idx_region (region)
+        )
+    ''')
+
+
+def budget_buckets(budget_min, budget_max):
+    """Budget filter values a project matches (mirrors the dashboard's SQL)"""
+    low = float(budget_min) if budget_min is not None else None
+    high = float(budget_max) if budget_max is not None else None
+    buckets = []
+    if (high is not None and high <= 5000) or (low is not None and high is None and low <= 5000):
+        buckets.append('0-5000')
+    for bucket, floor, ceiling in (('5000-15000', 5000, 15000), ('15000-50000', 15000, 50000)):
+        if low is not None and high is not None and (
+                (low >= floor and high <= ceiling) or (low <= ceiling and high >= floor)):
+            buckets.append(bucket)
+    if (low is not None and low >= 50000) or (high is not None and high >= 50000):
+        buckets.append('50000+')
+    return buckets
+
+
+def region(*locations):
+    """State of the first location that names one"""
+    return next((s for s in map(geo_location.state_code, locations) if s), UNKNOWN_REGION)
+
+
+def _add(cursor, project_type, buckets, project_region, delta):
+    ph = placeholder(cursor)
+    for bucket in [BUDGET_ANY] + buckets:
+        if is_sqlite(cursor):
+            cursor.execute(f'''
+                INSERT INTO project_facet_counts (project_type, budget_bucket, region, project_count)
+                VALUES ({ph}, {ph}, {ph}, {ph})
+                ON CONFLICT (project_type, budget_bucket, region)
+                DO UPDATE SET project_count = project_count + excluded.project_count
+            ''', (project_type, bucket, project_region, delta))
+        else:
+            cursor.execute('''
+                INSERT INTO project_facet_counts (project_type, budget_bucket, region, project_count)
+                VALUES (%s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE project_count = project_count + VALUES(project_count)
+            ''', (project_type, bucket, project_region, delta))
+
+
+def remove(cursor, project_id):
+    """Take one project out of the counts, whatever its status; returns whether it was counted"""
+    ph = placeholder(cursor)
+    lock = '' if is_sqlite(cursor) else ' FOR UPDATE'
+    cursor.execute(f'''
+        SELECT project_type, region, budget_buckets FROM project_facet_members
+        WHERE project_id = {ph}{lock}
+    ''', (project_id,))
+    member = cursor.fetchone()
+    if not member:
+        return False
+    old_buckets = member['budget_buckets'].split(',') if member['budget_buckets'] else []
+    _add(cursor, member['project_type'], old_buckets, member['region'], -1)
+    cursor.execute(f'DELETE FROM project_facet_members WHERE project_id = {ph}', (project_id,))
+    return True
+
+
+def on_project_changed(cursor, project_id):
+    """Move one project's counts to match its current status, type, budget and location"""
+    ph = placeholder(cursor)
+    remove(cursor, project_id)
+
+    cursor.execute(f'''
+        SELECT p.status, p.project_type, p.budget_min, p.budget_max, p.location,
+               h.location as homeowner_location
+        FROM projects p
+        JOIN homeowners h ON p.homeowner_id = h.id
+        WHERE p.id = {ph}
+    ''', (project_id,))
+    project = cursor.fetchone()
+    if not project or project['status'] != 'Active':
+        return False
+
+    buckets = budget_buckets(project['budget_min'], project['budget_max'])
+    project_region = region(project['location'], project['homeowner_location'])
+    _add(cursor, project['project_type'], buckets, project_region, 1)
+    cursor.execute(f'''
+        INSERT INTO project_facet_members (project_id, project_type, region, budget_buckets)
+        VALUES ({ph}, {ph}, {ph}, {ph})
+    ''', (project_id, project['project_type'], project_region, ','.join(buckets)))
+    return True
+
+
+def rebuild(cursor, batch_size=1000):
+    """Recount every Active project from scratch (backfill / repair)"""
+    cursor.execute('DELETE FROM project_facet_counts')
+    cursor.execute('DELETE FROM project_facet_members')
+    ph = placeholder(cursor)
+    last_id, counted = 0, 0
+    while True:
+        cursor.execute(f'''
+            SELECT id FROM projects
+            WHERE status = 'Active' AND id > {ph}
+            ORDER BY id
+            LIMIT {ph}
+        ''', (last_id, batch_size))
+        ids = [row['id'] for row in cursor.fetchall()]
+        if not ids:
+            return counted
+        for project_id in ids:
+            if on_project_changed(cursor, project_id):
+                counted += 1
+        last_id = ids[-1]
+
+
+def region_filter(cursor, project_region):
+    """SQL fragments restricting projects aliased as p to one region"""
+    return {
+        'join': 'JOIN project_facet_members pfm ON pfm.project_id = p.id',
+        'where': f'pfm.region = {placeholder(cursor)}',
+        'where_params': [project_region],
+    }
+
+
+def get_facets(cursor, project_type='', budget='', project_region=''):
+    """Facet counts for the dashboard from one read of project_facet_counts.
+
+    Each facet is counted under the other facets' current selections, so a
+    number next to an option is what the list shows after choosing it when
+    no keyword, location or distance filter is set; those are not counted.
+    Returns {'types', 'budgets', 'regions'} (value -> count) and 'total'.
+    """
+    cursor.execute('''
+        SELECT project_type, budget_bucket, region, project_count
+        FROM project_facet_counts
+        WHERE project_count > 0
+    ''')
+    types, budgets, regions, total = {}, {}, {}, 0
+    for row in cursor.fetchall():
+        count = int(row['project_count'])
+        type_ok = not project_type or row['project_type'] == project_type
+        region_ok = not project_region or row['region'] == project_region
+        if row['budget_bucket'] == BUDGET_ANY:
+            if region_ok and not budget:
+                types[row['project_type']] = types.get(row['project_type'], 0) + count
+            if type_ok and not budget:
+                regions[row['region']] = regions.get(row['region'], 0) + count
+            if type_ok and region_ok:
+                if not budget:
+                    total += count
+                budgets[BUDGET_ANY] = budgets.get(BUDGET_ANY, 0) + count
+            continue
+        if row['budget_bucket'] == budget:
+            if region_ok:
+                types[row['project_type']] = types.get(row['project_type'], 0) + count
+            if type_ok:
+                regions[row['region']] = regions.get(row['region'], 0) + count
+            if type_ok and region_ok:
+                total += count
+        if type_ok and region_ok:
+            budgets[row['budget_bucket']] = budgets.get(row['budget_bucket'], 0) + count
+    regions.pop(UNKNOWN_REGION, None)
+    return {'types': types, 'budgets': budgets, 'regions': regions, 'total': total}
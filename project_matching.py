@@ -0,0 +1,407 @@
+"""
+Contractor-project matching with precomputed recommendation lists.
+
+Each Active project is scored against each contractor on four signals:
+specialty match, distance within the service radius, calendar availability
+over the next few weeks, and historical win rate. The best TOP_N per
+contractor are stored in contractor_recommendations, so the dashboard reads
+one indexed list instead of ranking at request time.
+
+The lists are maintained incrementally:
+- on_project_changed() runs when a project is created or changes status.
+  A new project is scored against the contractors whose service area could
+  reach it or, without a geocoded location, against the contractors of its
+  trades. A project that leaves Active is removed from the lists it was in,
+  and those contractors are queued in recommendation_refresh_queue instead
+  of being refilled inside the request's transaction.
+- refresh_queued() refills the queued lists; refresh_recommendations.py
+  --queued runs it every few minutes.
+- refresh_contractor() runs when a contractor's profile or availability
+  changes.
+- refresh_all() is for backfills and periodic win-rate drift, and scores
+  the unlocated projects against every contractor.
+"""
+
+import re
+from datetime import date, timedelta
+
+from database import is_sqlite, placeholder
+import geo_location
+
+# Recommendations kept per contractor
+TOP_N = 20
+
+# Projects below this score are not recommended at all
+MIN_SCORE = 0.35
+
+# Signal weights (sum to 1)
+SPECIALTY_WEIGHT = 0.45
+DISTANCE_WEIGHT = 0.25
+AVAILABILITY_WEIGHT = 0.15
+WIN_RATE_WEIGHT = 0.15
+
+# Days of the availability calendar considered
+AVAILABILITY_WINDOW_DAYS = 30
+
+# Win rate is smoothed toward PRIOR_WINS / PRIOR_BIDS for contractors with few bids
+PRIOR_WINS = 1
+PRIOR_BIDS = 5
+
+# Largest service radius honoured when picking candidate contractors, in miles
+MAX_SERVICE_RADIUS = 100
+
+# Without a service-area point, a contractor is scored against this many recent projects
+CANDIDATE_LIMIT = 2000
+
+# Queued contractors refilled per refresh_queued() call
+QUEUE_BATCH = 500
+
+# Onboarding skill values and project type words that mean the same trade
+_TRADE_ALIASES = {
+    'kitchen_remodel': 'kitchen', 'bathroom_remodel': 'bathroom', 'bath': 'bathroom',
+    'handyman': 'general', 'electrician': 'electrical', 'plumber': 'plumbing',
+    'painter': 'painting', 'roofer': 'roofing', 'floors': 'flooring', 'floor': 'flooring',
+    'heating': 'hvac', 'cooling': 'hvac', 'carpenter': 'carpentry',
+}
+_GENERIC_WORDS = {'renovation', 'repair', 'repairs', 'remodel', 'remodeling', 'contracting',
+                  'services', 'service', 'installation', 'and', 'other'}
+
+
+def ensure_schema(cursor):
+    """Create contractor_recommendations for the connected database if it is missing"""
+    if is_sqlite(cursor):
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS contractor_recommendations (
+                contractor_id INTEGER NOT NULL,
+                project_id INTEGER NOT NULL,
+                score REAL NOT NULL,
+                distance_miles REAL,
+                computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (contractor_id, project_id),
+                FOREIGN KEY (contractor_id) REFERENCES contractors(id) ON DELETE CASCADE,
+                FOREIGN KEY (project_id) REFERENCES projects(id) ON DELETE CASCADE
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_recommendations_score ON contractor_recommendations (contractor_id, score)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_recommendations_project ON contractor_recommendations (project_id)')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS recommendation_refresh_queue (
+                contractor_id INTEGER PRIMARY KEY,
+                queued_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        return
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS contractor_recommendations (
+            contractor_id INT NOT NULL,
+            project_id INT NOT NULL,
+            score DECIMAL(6,4) NOT NULL,
+            distance_miles DECIMAL(7,2) NULL,
+            computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            PRIMARY KEY (contractor_id, project_id),
+            FOREIGN KEY (contractor_id) REFERENCES contractors(id) ON DELETE CASCADE,
+            FOREIGN KEY (project_id) REFERENCES projects(id) ON DELETE CASCADE,
+            INDEX idx_contractor_score (contractor_id, score),
+            INDEX idx_project (project_id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS recommendation_refresh_queue (
+            contractor_id INT PRIMARY KEY,
+            queued_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_queued (queued_at)
+        )
+    ''')
+
+
+def trades(text):
+    """Normalized trade keywords from specialties or a project type"""
+    words = set()
+    for word in re.split(r'[^a-z_]+', (text or '').lower()):
+        word = _TRADE_ALIASES.get(word, word)
+        for part in word.split('_'):
+            part = _TRADE_ALIASES.get(part, part)
+            if part and part not in _GENERIC_WORDS:
+                words.add(part)
+    return words
+
+
+def score(contractor, project):
+    """Score one contractor/project pair; returns (score, distance) or None if out of range"""
+    distance = None
+    if contractor['lat'] is not None and project['lat'] is not None:
+        distance = geo_location.distance_miles(contractor['lat'], contractor['lng'],
+                                               project['lat'], project['lng'])
+        if distance > contractor['radius']:
+            return None
+        distance_score = 1.0 - distance / max(contractor['radius'], 1)
+    else:
+        distance_score = 0.5
+
+    if not contractor['trades']:
+        specialty_score = 0.5
+    else:
+        specialty_score = 1.0 if contractor['trades'] & project['trades'] else 0.0
+
+    total = (SPECIALTY_WEIGHT * specialty_score +
+             DISTANCE_WEIGHT * distance_score +
+             AVAILABILITY_WEIGHT * contractor['availability'] +
+             WIN_RATE_WEIGHT * contractor['win_rate'])
+    if total < MIN_SCORE:
+        return None
+    return round(total, 4), distance
+
+
+def _trade_spellings(words):
+    """The trade words and the aliases that normalize to them, for matching raw specialties"""
+    return set(words) | {alias for alias, trade in _TRADE_ALIASES.items() if trade in words}
+
+
+def _load_contractors(cursor, contractor_ids=None, near=None, trade_words=None):
+    """Matching profiles: trades, service area, availability and win rate"""
+    ph = placeholder(cursor)
+    query = '''
+        SELECT c.id, c.specialties, c.service_area_lat, c.service_area_lng, c.service_radius,
+               COUNT(b.id) as bid_count,
+               COALESCE(SUM(CASE WHEN b.status = 'Accepted' THEN 1 ELSE 0 END), 0) as win_count
+        FROM contractors c
+        LEFT JOIN bids b ON b.contractor_id = c.id
+    '''
+    params = []
+    if contractor_ids is not None:
+        if not contractor_ids:
+            return []
+        query += f" WHERE c.id IN ({', '.join([ph] * len(contractor_ids))})"
+        params.extend(contractor_ids)
+    elif near is not None:
+        # Contractors whose service area could reach the point, plus those without a point
+        min_lat, min_lng, max_lat, max_lng = geo_location.bounding_box(near[0], near[1], MAX_SERVICE_RADIUS)
+        query += f'''
+            WHERE c.service_area_lat IS NULL
+               OR (c.service_area_lat BETWEEN {ph} AND {ph} AND c.service_area_lng BETWEEN {ph} AND {ph})
+        '''
+        params.extend([min_lat, max_lat, min_lng, max_lng])
+    elif trade_words is not None:
+        # Contractors listing one of the trades; the exact match is checked by score()
+        spellings = sorted(_trade_spellings(trade_words))
+        if not spellings:
+            return []
+        query += ' WHERE ' + ' OR '.join([f'LOWER(c.specialties) LIKE {ph}'] * len(spellings))
+        params.extend(f'%{word}%' for word in spellings)
+    query += ' GROUP BY c.id, c.specialties, c.service_area_lat, c.service_area_lng, c.service_radius'
+    cursor.execute(query, params)
+    rows = cursor.fetchall()
+    if not rows:
+        return []
+
+    # Share of the coming window not marked busy/unavailable (unmarked days count as free)
+    ids = [row['id'] for row in rows]
+    start = date.today()
+    cursor.execute(f'''
+        SELECT contractor_id, COUNT(*) as blocked
+        FROM contractor_availability
+        WHERE contractor_id IN ({', '.join([ph] * len(ids))})
+        AND available_date BETWEEN {ph} AND {ph}
+        AND status IN ('busy', 'unavailable')
+        GROUP BY contractor_id
+    ''', ids + [start, start + timedelta(days=AVAILABILITY_WINDOW_DAYS)])
+    blocked = {row['contractor_id']: row['blocked'] for row in cursor.fetchall()}
+
+    contractors = []
+    for row in rows:
+        contractors.append({
+            'id': row['id'],
+            'trades': trades(row['specialties']),
+            'lat': float(row['service_area_lat']) if row['service_area_lat'] is not None else None,
+            'lng': float(row['service_area_lng']) if row['service_area_lng'] is not None else None,
+            'radius': min(row['service_radius'] or 25, MAX_SERVICE_RADIUS),
+            'availability': max(0.0, 1.0 - blocked.get(row['id'], 0) / AVAILABILITY_WINDOW_DAYS),
+            'win_rate': (int(row['win_count']) + PRIOR_WINS) / (int(row['bid_count']) + PRIOR_BIDS),
+        })
+    return contractors
+
+
+def _project_profile(row):
+    return {
+        'id': row['id'],
+        'trades': trades(row['project_type']) | trades(row['title']),
+        'lat': float(row['latitude']) if row['latitude'] is not None else None,
+        'lng': float(row['longitude']) if row['longitude'] is not None else None,
+    }
+
+
+def _store(cursor, contractor_id, project_id, match):
+    ph = placeholder(cursor)
+    if is_sqlite(cursor):
+        cursor.execute(f'''
+            INSERT OR REPLACE INTO contractor_recommendations (contractor_id, project_id, score, distance_miles)
+            VALUES ({ph}, {ph}, {ph}, {ph})
+        ''', (contractor_id, project_id, match[0], match[1]))
+    else:
+        cursor.execute('''
+            INSERT INTO contractor_recommendations (contractor_id, project_id, score, distance_miles)
+            VALUES (%s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE score = VALUES(score), distance_miles = VALUES(distance_miles),
+                                    computed_at = CURRENT_TIMESTAMP
+        ''', (contractor_id, project_id, match[0], match[1]))
+
+
+def on_project_changed(cursor, project_id):
+    """Add, re-score or remove one project across every contractor's list"""
+    ph = placeholder(cursor)
+    cursor.execute(f'''
+        SELECT p.id, p.title, p.project_type, p.status, pl.latitude, pl.longitude
+        FROM projects p
+        LEFT JOIN project_locations pl ON pl.project_id = p.id
+        WHERE p.id = {ph}
+    ''', (project_id,))
+    row = cursor.fetchone()
+
+    if not row or row['status'] != 'Active':
+        # Drop it; the lists it was in are refilled by refresh_queued()
+        cursor.execute(f'SELECT contractor_id FROM contractor_recommendations WHERE project_id = {ph}', (project_id,))
+        affected = [r['contractor_id'] for r in cursor.fetchall()]
+        cursor.execute(f'DELETE FROM contractor_recommendations WHERE project_id = {ph}', (project_id,))
+        _queue_refresh(cursor, affected)
+        return 0
+
+    project = _project_profile(row)
+    if project['lat'] is not None:
+        candidates = _load_contractors(cursor, near=(project['lat'], project['lng']))
+    else:
+        # No location to narrow the candidates by; refresh_all() scores it for the other trades
+        candidates = _load_contractors(cursor, trade_words=project['trades'])
+    matches = {}
+    for contractor in candidates:
+        match = score(contractor, project)
+        if match:
+            matches[contractor['id']] = match
+
+    # Re-scored from scratch: contractors that no longer match lose the project
+    cursor.execute(f'DELETE FROM contractor_recommendations WHERE project_id = {ph}', (project_id,))
+    if not matches:
+        return 0
+
+    # Current list size and floor for each matching contractor
+    ids = list(matches)
+    cursor.execute(f'''
+        SELECT contractor_id, COUNT(*) as listed, MIN(score) as floor_score
+        FROM contractor_recommendations
+        WHERE contractor_id IN ({', '.join([ph] * len(ids))})
+        GROUP BY contractor_id
+    ''', ids)
+    lists = {r['contractor_id']: (r['listed'], float(r['floor_score'])) for r in cursor.fetchall()}
+
+    stored = 0
+    for contractor_id, match in matches.items():
+        listed, floor_score = lists.get(contractor_id, (0, 0.0))
+        if listed >= TOP_N and match[0] <= floor_score:
+            continue
+        _store(cursor, contractor_id, project_id, match)
+        stored += 1
+        if listed >= TOP_N:
+            _trim(cursor, contractor_id)
+    return stored
+
+
+def _trim(cursor, contractor_id):
+    """Drop the lowest-scored entries beyond TOP_N"""
+    ph = placeholder(cursor)
+    cursor.execute(f'''
+        SELECT project_id FROM contractor_recommendations
+        WHERE contractor_id = {ph}
+        ORDER BY score DESC
+    ''', (contractor_id,))
+    extra = [r['project_id'] for r in cursor.fetchall()[TOP_N:]]
+    if extra:
+        cursor.execute(f'''
+            DELETE FROM contractor_recommendations
+            WHERE contractor_id = {ph} AND project_id IN ({', '.join([ph] * len(extra))})
+        ''', [contractor_id] + extra)
+
+
+def refresh_contractor(cursor, contractor_id):
+    """Recompute one contractor's list from scratch"""
+    ph = placeholder(cursor)
+    contractors = _load_contractors(cursor, contractor_ids=[contractor_id])
+    cursor.execute(f'DELETE FROM contractor_recommendations WHERE contractor_id = {ph}', (contractor_id,))
+    if not contractors:
+        return 0
+    contractor = contractors[0]
+
+    # Candidates: Active projects inside the service radius, or the most recent ones
+    if contractor['lat'] is not None:
+        geo = geo_location.radius_filter(cursor, contractor['lat'], contractor['lng'], contractor['radius'])
+        join, condition, params = geo['join'], f"AND {geo['where']}", list(geo['where_params'])
+    else:
+        join, condition, params = 'LEFT JOIN project_locations pl ON pl.project_id = p.id', '', []
+    cursor.execute(f'''
+        SELECT p.id, p.title, p.project_type, p.status, pl.latitude, pl.longitude
+        FROM projects p
+        {join}
+        WHERE p.status = 'Active' {condition}
+        ORDER BY p.created_at DESC
+        LIMIT {ph}
+    ''', params + [CANDIDATE_LIMIT])
+
+    matches = []
+    for row in cursor.fetchall():
+        match = score(contractor, _project_profile(row))
+        if match:
+            matches.append((match, row['id']))
+    matches.sort(key=lambda m: m[0][0], reverse=True)
+    for match, project_id in matches[:TOP_N]:
+        _store(cursor, contractor_id, project_id, match)
+    return min(len(matches), TOP_N)
+
+
+def _queue_refresh(cursor, contractor_ids):
+    if not contractor_ids:
+        return
+    ph = placeholder(cursor)
+    insert = 'INSERT OR IGNORE' if is_sqlite(cursor) else 'INSERT IGNORE'
+    cursor.executemany(f'{insert} INTO recommendation_refresh_queue (contractor_id) VALUES ({ph})',
+                       [(contractor_id,) for contractor_id in contractor_ids])
+
+
+def refresh_queued(cursor, limit=QUEUE_BATCH):
+    """Refill the lists of queued contractors, oldest first; returns how many"""
+    ph = placeholder(cursor)
+    cursor.execute(f'SELECT contractor_id FROM recommendation_refresh_queue ORDER BY queued_at LIMIT {ph}',
+                   (limit,))
+    contractor_ids = [row['contractor_id'] for row in cursor.fetchall()]
+    for contractor_id in contractor_ids:
+        refresh_contractor(cursor, contractor_id)
+    if contractor_ids:
+        cursor.execute(f'''
+            DELETE FROM recommendation_refresh_queue
+            WHERE contractor_id IN ({', '.join([ph] * len(contractor_ids))})
+        ''', contractor_ids)
+    return len(contractor_ids)
+
+
+def refresh_all(cursor):
+    """Recompute every contractor's list (backfill / nightly)"""
+    cursor.execute('DELETE FROM recommendation_refresh_queue')
+    cursor.execute('SELECT id FROM contractors')
+    contractor_ids = [row['id'] for row in cursor.fetchall()]
+    for contractor_id in contractor_ids:
+        refresh_contractor(cursor, contractor_id)
+    return len(contractor_ids)
+
+
+def get_recommendations(cursor, contractor_id, limit=TOP_N):
+    """Stored recommendations for the dashboard, best first"""
+    ph = placeholder(cursor)
+    cursor.execute(f'''
+        SELECT p.*, r.score as match_score, r.distance_miles,
+               (SELECT COUNT(*) FROM bids b WHERE b.project_id = p.id) as bid_count,
+               (SELECT COUNT(*) FROM bids b WHERE b.project_id = p.id AND b.contractor_id = {ph}) as has_user_bid
+        FROM contractor_recommendations r
+        JOIN projects p ON r.project_id = p.id
+        WHERE r.contractor_id = {ph}
+        ORDER BY r.score DESC
+        LIMIT {ph}
+    ''', (contractor_id, contractor_id, limit))
+    return cursor.fetchall()
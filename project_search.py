@@ -0,0 +1,121 @@
+"""
+Keyword search over projects for the contractor feed.
+
+In MySQL, a FULLTEXT index on projects(title, description, ai_processed_text)
+is kept current by InnoDB on every insert and update. In SQLite (local
+development), an external-content FTS5 table, projects_fts, is kept in sync
+by triggers on projects. Both back ends are queried in boolean prefix mode:
+every term must match, and a term also matches longer words that start with
+it. Results come back with a relevance score the caller can sort by.
+"""
+
+import re
+
+from database import is_sqlite
+
+# Name of the MySQL FULLTEXT index and the SQLite FTS5 table
+FULLTEXT_INDEX = 'ft_projects_search'
+FTS_TABLE = 'projects_fts'
+
+# Shorter terms are dropped (InnoDB's default innodb_ft_min_token_size is 3)
+MIN_TERM_LENGTH = 3
+
+# Upper bound on terms taken from one query string
+MAX_TERMS = 8
+
+_TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def parse_terms(text):
+    """Lower-cased, de-duplicated search terms from free text"""
+    terms = []
+    for term in _TERM_RE.findall((text or '').lower()):
+        if len(term) >= MIN_TERM_LENGTH and term not in terms:
+            terms.append(term)
+    return terms[:MAX_TERMS]
+
+
+def build_search(cursor, text):
+    """SQL fragments for a ranked keyword search over projects aliased as p.
+
+    Returns None when the text has no usable terms. Otherwise returns a dict
+    with 'join' (added after FROM projects p ...), 'where' and 'where_params'
+    (ANDed into the filters) and 'score' and 'score_params' (a higher score
+    means a better match).
+    """
+    terms = parse_terms(text)
+    if not terms:
+        return None
+
+    if is_sqlite(cursor):
+        match = ' '.join(f'"{term}"*' for term in terms)
+        return {
+            # The unary + keeps the planner from driving the join from another index
+            # (e.g. status) and re-running the MATCH for every row it finds there
+            'join': f'JOIN {FTS_TABLE} ON +{FTS_TABLE}.rowid = p.id',
+            'where': f'{FTS_TABLE} MATCH ?',
+            'where_params': [match],
+            'score': f'-bm25({FTS_TABLE})',
+            'score_params': [],
+        }
+
+    match = ' '.join(f'+{term}*' for term in terms)
+    expression = 'MATCH(p.title, p.description, p.ai_processed_text) AGAINST (%s IN BOOLEAN MODE)'
+    return {
+        'join': '',
+        'where': expression,
+        'where_params': [match],
+        'score': expression,
+        'score_params': [match],
+    }
+
+
+def ensure_index(cursor):
+    """Create the search index for the connected database if it is missing"""
+    if is_sqlite(cursor):
+        cursor.execute(f"SELECT name FROM sqlite_master WHERE type = 'table' AND name = '{FTS_TABLE}'")
+        exists = cursor.fetchone()
+        cursor.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+                title, description, ai_processed_text,
+                content='projects', content_rowid='id',
+                prefix='2 3 4'
+            )
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON projects BEGIN
+                INSERT INTO {FTS_TABLE}(rowid, title, description, ai_processed_text)
+                VALUES (new.id, new.title, new.description, new.ai_processed_text);
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON projects BEGIN
+                INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description, ai_processed_text)
+                VALUES ('delete', old.id, old.title, old.description, old.ai_processed_text);
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au
+            AFTER UPDATE OF title, description, ai_processed_text ON projects BEGIN
+                INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description, ai_processed_text)
+                VALUES ('delete', old.id, old.title, old.description, old.ai_processed_text);
+                INSERT INTO {FTS_TABLE}(rowid, title, description, ai_processed_text)
+                VALUES (new.id, new.title, new.description, new.ai_processed_text);
+            END
+        ''')
+        if not exists:
+            rebuild(cursor)
+        return
+
+    cursor.execute(f"SHOW INDEX FROM projects WHERE Key_name = '{FULLTEXT_INDEX}'")
+    if not cursor.fetchone():
+        cursor.execute(f'''
+            ALTER TABLE projects
+            ADD FULLTEXT INDEX {FULLTEXT_INDEX} (title, description, ai_processed_text)
+        ''')
+
+
+def rebuild(cursor):
+    """Repopulate the FTS5 table from projects (InnoDB maintains FULLTEXT itself)"""
+    if is_sqlite(cursor):
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Refresh Admin Rollups Script
+Folds new and changed users, bids and projects into the admin analytics
+rollup tables. Run every few minutes as a cron job or scheduled task;
+run with --full nightly to recount from scratch and pick up profile
+location edits, which have no change watermark.
+"""
+
+import sys
+import os
+import time
+import logging
+
+# Add the project directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import admin_rollups
+
+def get_db_connection():
+    """Get database connection - the rollups use MySQL date functions"""
+    from database import get_db_connection as app_get_db_connection
+    return app_get_db_connection()
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler('refresh_admin_rollups.log'),
+        logging.StreamHandler()
+    ]
+)
+
+def refresh_admin_rollups(full=False):
+    """Bring the analytics rollups up to date"""
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+        start = time.time()
+        admin_rollups.ensure_schema(cursor)
+        if full:
+            admin_rollups.rebuild(cursor)
+        else:
+            admin_rollups.refresh(cursor)
+        conn.commit()
+
+        logging.info(f"{'Rebuilt' if full else 'Refreshed'} admin rollups in {time.time() - start:.2f}s")
+        return True
+
+    except Exception as e:
+        logging.error(f"Error refreshing admin rollups: {e}")
+        if conn:
+            conn.rollback()
+        return False
+    finally:
+        if conn:
+            conn.close()
+
+if __name__ == "__main__":
+    full = '--full' in sys.argv
+    logging.info(f"Starting admin rollup {'rebuild' if full else 'refresh'}")
+    refresh_admin_rollups(full=full)
+    logging.info("Admin rollup refresh completed")
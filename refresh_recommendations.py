@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Refresh Recommendations Script
+Recomputes every contractor's stored project matches. New projects, status
+changes and profile edits update recommendations as they happen; this
+nightly pass picks up the slower drift (win rates, availability windows
+rolling forward) and doubles as the initial backfill.
+With --queued it only refills the lists queued when a project left Active;
+that run is scheduled every few minutes.
+Can be run as a cron job or scheduled task.
+"""
+
+import sys
+import os
+import time
+import logging
+import sqlite3
+
+# Add the project directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import project_matching
+
+def get_db_connection():
+    """Get database connection - simplified version for standalone script"""
+    try:
+        # Try to import pymysql for MySQL connection
+        import pymysql
+        from database import get_db_connection as app_get_db_connection
+        return app_get_db_connection()
+    except ImportError:
+        # Fall back to SQLite
+        db_path = os.path.join(os.path.dirname(__file__), 'homepro.db')
+        conn = sqlite3.connect(db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler('refresh_recommendations.log'),
+        logging.StreamHandler()
+    ]
+)
+
+def refresh_recommendations(queued=False):
+    """Recompute top-N project matches for all contractors, or only the queued ones"""
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+        start = time.time()
+        if queued:
+            count = project_matching.refresh_queued(cursor)
+        else:
+            count = project_matching.refresh_all(cursor)
+        conn.commit()
+
+        logging.info(f"Refreshed recommendations for {count} contractors in {time.time() - start:.1f}s")
+        return count
+
+    except Exception as e:
+        logging.error(f"Error refreshing recommendations: {e}")
+        if conn:
+            conn.rollback()
+        return 0
+    finally:
+        if conn:
+            conn.close()
+
+if __name__ == "__main__":
+    queued = '--queued' in sys.argv
+    logging.info(f"Starting {'queued ' if queued else ''}recommendations refresh")
+    refresh_recommendations(queued=queued)
+    logging.info("Recommendations refresh completed")
@@ -0,0 +1,124 @@
+"""
+Time budgets for requests, by route class.
+
+Most pages answer in well under a second, but audio processing waits on
+Transcribe and Bedrock for minutes, resumable upload chunks and evidence
+zips move hundreds of megabytes, and /api/events holds its connection open
+by design. One server-wide timeout cannot fit all of them, so every path is
+put in a class (ROUTE_CLASSES, first match wins) with its own budget.
+
+BudgetMiddleware wraps the WSGI app (gunicorn_config installs it in each
+worker). It times every response until its body is fully sent, counts the
+requests of each class that ran over budget and logs them. Under gevent
+workers it also enforces the budget on the handler: a handler still running
+when the budget is spent is interrupted and answered with 504. Thread and
+sync workers cannot interrupt a handler safely, so there the budgets are
+only reported; the sync worker's own timeout (the longest finite budget)
+remains the hard limit.
+"""
+
+import json
+import re
+import sys
+import threading
+import time
+
+from werkzeug.wsgi import ClosingIterator
+
+# Seconds allowed per class (None: no limit, for long-lived streams)
+TIMEOUT_CLASSES = {
+    'default': 30,
+    'document': 120,
+    'ai': 300,
+    'transfer': 900,
+    'stream': None,
+}
+
+# (path pattern, class), first match wins; other paths are 'default'
+ROUTE_CLASSES = [
+    (re.compile(r'^/api/events$'), 'stream'),
+    (re.compile(r'^/process_(audio|audio_async|audio_transcript|transcript_ai)$'), 'ai'),
+    (re.compile(r'^/api/uploads(/|$)'), 'transfer'),
+    (re.compile(r'/evidence/bundle\.zip$'), 'transfer'),
+    (re.compile(r'^/admin/export/'), 'transfer'),
+    (re.compile(r'/pdf(_batch)?$'), 'document'),
+]
+
+# Over-budget requests kept for the stats endpoint
+RECENT_OVERRUNS = 50
+
+
+def timeout_class(path):
+    for pattern, name in ROUTE_CLASSES:
+        if pattern.search(path):
+            return name
+    return 'default'
+
+
+def longest_budget():
+    """The longest finite budget, which sync workers must allow every request"""
+    return max(seconds for seconds in TIMEOUT_CLASSES.values() if seconds)
+
+
+class BudgetMiddleware:
+    """Time requests against their class budget; interrupt overruns under gevent"""
+
+    def __init__(self, app, enforce=False):
+        self.app = app
+        self.enforce = enforce
+        self._lock = threading.Lock()
+        self._counters = {name: {'requests': 0, 'over_budget': 0, 'interrupted': 0, 'max_seconds': 0.0}
+                          for name in TIMEOUT_CLASSES}
+        self._overruns = []
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        name = timeout_class(path)
+        budget = TIMEOUT_CLASSES[name]
+        environ['homepro.timeout_class'] = name
+        started = time.monotonic()
+
+        def finished():
+            self._record(name, budget, environ.get('REQUEST_METHOD', ''), path, time.monotonic() - started)
+
+        if self.enforce and budget:
+            import gevent
+            try:
+                with gevent.Timeout(budget):
+                    app_iter = self.app(environ, start_response)
+            except gevent.Timeout:
+                with self._lock:
+                    self._counters[name]['interrupted'] += 1
+                finished()
+                print(f"Interrupted {environ.get('REQUEST_METHOD')} {path} after its {budget}s '{name}' budget")
+                body = json.dumps({'success': False, 'error': 'Request took too long'}).encode()
+                # exc_info lets the 504 replace headers the handler may have started
+                start_response('504 Gateway Timeout', [('Content-Type', 'application/json'),
+                                                       ('Content-Length', str(len(body)))], sys.exc_info())
+                return [body]
+        else:
+            app_iter = self.app(environ, start_response)
+        return ClosingIterator(app_iter, [finished])
+
+    def _record(self, name, budget, method, path, seconds):
+        with self._lock:
+            counters = self._counters[name]
+            counters['requests'] += 1
+            counters['max_seconds'] = round(max(counters['max_seconds'], seconds), 3)
+            over = budget is not None and seconds > budget
+            if over:
+                counters['over_budget'] += 1
+                self._overruns.append({'class': name, 'method': method, 'path': path,
+                                       'seconds': round(seconds, 3), 'budget': budget})
+                del self._overruns[:-RECENT_OVERRUNS]
+        if over:
+            print(f"Slow request: {method} {path} took {seconds:.1f}s, over its {budget}s '{name}' budget")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enforced': self.enforce,
+                'budgets': dict(TIMEOUT_CLASSES),
+                'classes': {name: dict(counters) for name, counters in self._counters.items()},
+                'recent_overruns': list(reversed(self._overruns)),
+            }
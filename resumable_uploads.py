@@ -0,0 +1,420 @@
+"""
+Resumable chunked uploads (upload_sessions table).
+
+A multipart form POST is spooled in full by Werkzeug before the view runs,
+is capped by MAX_CONTENT_LENGTH, and starts again from byte 0 when a
+mobile connection drops. Large audio recordings, project images and
+evidence can instead be sent as a session:
+
+1. initiate: the client declares the file name, size, purpose and
+   (optionally) the SHA-256 of the whole file, and gets an upload id and
+   the chunk size.
+2. PUT chunks in order, each with its offset and SHA-256. A chunk is
+   written at its offset and only counted once its checksum matches; after
+   a failure the client asks for the current offset and resumes there.
+   Every chunk is smaller than MAX_CONTENT_LENGTH and each PUT is short, so
+   no worker is tied up for the whole transfer.
+3. complete: the file is checked against the declared size and hash. S3
+   only keeps a checksum of the part checksums, so an S3 upload that
+   declared a hash is read back once to check it.
+
+The file is assembled on local disk (RESUMABLE_UPLOAD_DIR), or, with
+RESUMABLE_UPLOAD_S3_BUCKET set, as an S3 multipart upload with one part per
+chunk and S3 verifying each part's checksum.
+
+Session state lives in the database, so consecutive chunks may land on
+different gunicorn workers. A short lease taken with a conditional UPDATE
+keeps two requests from writing the same session at once.
+
+The forms that accept files take an upload id in place of the file: they
+look the session up with completed() while validating the request, then
+claim() it and either read it through open_upload() and discard() it, or
+move_to() a local path. A form that fails after claiming hands the session
+back with unclaim(), so the client can submit it again. Sessions not
+completed or claimed within SESSION_TTL_HOURS, and claimed sessions whose
+data was left behind by a failed discard() or move_to(), are removed by
+expire().
+"""
+
+import base64
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import uuid
+from datetime import datetime, timedelta
+
+from database import is_sqlite, placeholder
+
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Chunk size handed to clients (S3 needs parts of at least 5 MB except the last)
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Bytes read from the request body per block
+BLOCK_SIZE = 64 * 1024
+
+# Largest file accepted per purpose, and the extensions each purpose allows
+PURPOSES = {
+    'audio': (500 * 1024 * 1024, {'mp3', 'wav', 'm4a', 'aac', 'flac', 'ogg', 'wma', 'webm'}),
+    'project_image': (50 * 1024 * 1024, {'png', 'jpg', 'jpeg', 'gif'}),
+    'evidence': (200 * 1024 * 1024, {'png', 'jpg', 'jpeg', 'gif', 'pdf', 'doc', 'docx', 'txt'}),
+}
+
+# Unfinished sessions are removed after this long
+SESSION_TTL_HOURS = 24
+
+# Seconds one request may hold a session while it writes a chunk
+LEASE_SECONDS = 120
+
+
+class UploadError(Exception):
+    """A request the session cannot accept; carries the HTTP status for the response"""
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+def ensure_schema(cursor):
+    """Create upload_sessions for the connected database if it is missing"""
+    if is_sqlite(cursor):
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS upload_sessions (
+                id TEXT PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                purpose TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                size_bytes INTEGER NOT NULL,
+                received_bytes INTEGER NOT NULL DEFAULT 0,
+                chunk_size INTEGER NOT NULL,
+                sha256 TEXT,
+                backend TEXT NOT NULL DEFAULT 'local',
+                bucket TEXT,
+                storage_key TEXT NOT NULL,
+                s3_upload_id TEXT,
+                parts TEXT,
+                status TEXT NOT NULL DEFAULT 'uploading',
+                lease_until TIMESTAMP,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_upload_sessions_status ON upload_sessions (status, updated_at)')
+        return
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS upload_sessions (
+            id CHAR(36) PRIMARY KEY,
+            user_id INT NOT NULL,
+            purpose VARCHAR(20) NOT NULL,
+            filename VARCHAR(255) NOT NULL,
+            size_bytes BIGINT NOT NULL,
+            received_bytes BIGINT NOT NULL DEFAULT 0,
+            chunk_size INT NOT NULL,
+            sha256 CHAR(64) NULL,
+            backend VARCHAR(10) NOT NULL DEFAULT 'local',
+            bucket VARCHAR(255) NULL,
+            storage_key VARCHAR(500) NOT NULL,
+            s3_upload_id VARCHAR(1024) NULL,
+            parts MEDIUMTEXT NULL,
+            status VARCHAR(20) NOT NULL DEFAULT 'uploading',
+            lease_until DATETIME NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            INDEX idx_user (user_id),
+            INDEX idx_status (status, updated_at)
+        )
+    ''')
+
+
+class UploadStore:
+    """Where upload sessions are assembled: a local directory or S3 multipart uploads"""
+
+    def __init__(self, directory=None, s3_client=None, bucket=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.directory = directory or os.path.join(APP_ROOT, 'upload_sessions')
+        self.s3_client = s3_client if bucket else None
+        self.bucket = bucket if s3_client is not None else None
+        self.chunk_size = chunk_size
+
+    @classmethod
+    def from_config(cls, config, s3_client=None):
+        return cls(directory=config.get('RESUMABLE_UPLOAD_DIR'),
+                   s3_client=s3_client,
+                   bucket=config.get('RESUMABLE_UPLOAD_S3_BUCKET'),
+                   chunk_size=config.get('RESUMABLE_UPLOAD_CHUNK_SIZE', DEFAULT_CHUNK_SIZE))
+
+    def local_path(self, row):
+        return os.path.join(self.directory, row['storage_key'])
+
+    def initiate(self, cursor, user_id, purpose, filename, size, sha256=None):
+        """Start a session; returns its row"""
+        if purpose not in PURPOSES:
+            raise UploadError(f'Unknown upload purpose: {purpose}')
+        max_bytes, extensions = PURPOSES[purpose]
+        extension = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+        if extension not in extensions:
+            raise UploadError('Invalid file type for this upload')
+        if size <= 0 or size > max_bytes:
+            raise UploadError(f'File size must be between 1 byte and {max_bytes // (1024 * 1024)}MB', 413)
+        if sha256 and (len(sha256) != 64 or any(c not in '0123456789abcdef' for c in sha256.lower())):
+            raise UploadError('sha256 must be a hex SHA-256 digest')
+
+        upload_id = str(uuid.uuid4())
+        s3_upload_id = None
+        if self.s3_client:
+            storage_key = f'uploads/resumable/{upload_id}/{filename}'
+            s3_upload_id = self.s3_client.create_multipart_upload(
+                Bucket=self.bucket, Key=storage_key, ChecksumAlgorithm='SHA256')['UploadId']
+        else:
+            storage_key = upload_id
+            os.makedirs(self.directory, exist_ok=True)
+            open(os.path.join(self.directory, storage_key), 'wb').close()
+
+        ph = placeholder(cursor)
+        cursor.execute(f'''
+            INSERT INTO upload_sessions (id, user_id, purpose, filename, size_bytes, chunk_size, sha256,
+                                         backend, bucket, storage_key, s3_upload_id, parts)
+            VALUES ({ph}, {ph}, {ph}, {ph}, {ph}, {ph}, {ph}, {ph}, {ph}, {ph}, {ph}, {ph})
+        ''', (upload_id, user_id, purpose, filename, size, self.chunk_size, sha256.lower() if sha256 else None,
+              's3' if self.s3_client else 'local', self.bucket, storage_key, s3_upload_id, '[]'))
+        return get(cursor, upload_id, user_id)
+
+    def write_chunk(self, conn, row, offset, stream, length, chunk_sha256):
+        """Append one chunk at offset; returns the new offset.
+
+        Commits the session update itself, since the lease has to be visible
+        to other workers while the chunk is being written.
+        """
+        if row['status'] != 'uploading':
+            raise UploadError('Upload is not in progress', 409, row['received_bytes'])
+        if offset != row['received_bytes']:
+            raise UploadError('Chunk offset does not match the bytes received', 409, row['received_bytes'])
+        if length <= 0 or length > row['chunk_size'] or offset + length > row['size_bytes']:
+            raise UploadError('Invalid chunk length', 400, row['received_bytes'])
+        if offset + length < row['size_bytes'] and length != row['chunk_size']:
+            raise UploadError('Only the last chunk may be shorter than the chunk size', 400, row['received_bytes'])
+        if not chunk_sha256:
+            raise UploadError('Chunk SHA-256 is required', 400, row['received_bytes'])
+
+        cursor = conn.cursor()
+        _take_lease(cursor, row, offset)
+        conn.commit()
+        try:
+            if row['backend'] == 's3':
+                part = self._write_s3_part(row, offset, stream, length, chunk_sha256)
+                parts = json.loads(row['parts'] or '[]') + [part]
+            else:
+                self._write_local(row, offset, stream, length, chunk_sha256)
+                parts = None
+        except Exception:
+            _release_lease(cursor, row)
+            conn.commit()
+            raise
+
+        ph = placeholder(cursor)
+        cursor.execute(f'''
+            UPDATE upload_sessions
+            SET received_bytes = {ph}, parts = COALESCE({ph}, parts), lease_until = NULL, updated_at = {ph}
+            WHERE id = {ph}
+        ''', (offset + length, json.dumps(parts) if parts is not None else None, datetime.now(), row['id']))
+        conn.commit()
+        return offset + length
+
+    def _read_chunk(self, stream, length, chunk_sha256, out):
+        digest = hashlib.sha256()
+        remaining = length
+        while remaining:
+            block = stream.read(min(BLOCK_SIZE, remaining))
+            if not block:
+                raise UploadError('Chunk ended early', 400)
+            digest.update(block)
+            out.write(block)
+            remaining -= len(block)
+        if digest.hexdigest() != chunk_sha256.lower():
+            raise UploadError('Chunk SHA-256 does not match', 400)
+        return digest
+
+    def _write_local(self, row, offset, stream, length, chunk_sha256):
+        with open(self.local_path(row), 'r+b') as out:
+            out.seek(offset)
+            try:
+                self._read_chunk(stream, length, chunk_sha256, out)
+            except Exception:
+                # Drop the partial chunk so the file matches received_bytes again
+                out.truncate(offset)
+                raise
+
+    def _write_s3_part(self, row, offset, stream, length, chunk_sha256):
+        # S3 wants the part length up front; the chunk is staged (on disk past 1 MB)
+        with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as staged:
+            digest = self._read_chunk(stream, length, chunk_sha256, staged)
+            staged.seek(0)
+            part_number = offset // row['chunk_size'] + 1
+            response = self.s3_client.upload_part(
+                Bucket=row['bucket'], Key=row['storage_key'], UploadId=row['s3_upload_id'],
+                PartNumber=part_number, Body=staged, ContentLength=length,
+                ChecksumSHA256=base64.b64encode(digest.digest()).decode('ascii'))
+        return {'PartNumber': part_number, 'ETag': response['ETag'], 'ChecksumSHA256': response.get('ChecksumSHA256')}
+
+    def complete(self, cursor, row):
+        """Finish a fully received session; returns the updated row"""
+        if row['status'] == 'complete':
+            return row
+        if row['status'] != 'uploading':
+            raise UploadError('Upload is not in progress', 409, row['received_bytes'])
+        if row['received_bytes'] != row['size_bytes']:
+            raise UploadError('Upload is incomplete', 409, row['received_bytes'])
+
+        if row['backend'] == 's3':
+            parts = [{key: value for key, value in part.items() if value}
+                     for part in sorted(json.loads(row['parts'] or '[]'), key=lambda part: part['PartNumber'])]
+            self.s3_client.complete_multipart_upload(
+                Bucket=row['bucket'], Key=row['storage_key'], UploadId=row['s3_upload_id'],
+                MultipartUpload={'Parts': parts})
+        if row['sha256']:
+            digest = hashlib.sha256()
+            source = self.open_upload(row)
+            try:
+                for block in iter(lambda: source.read(1024 * 1024), b''):
+                    digest.update(block)
+            finally:
+                source.close()
+            if digest.hexdigest() != row['sha256']:
+                # The S3 object now exists, so abort() removes it rather than the multipart upload
+                self.abort(cursor, dict(row, status='complete') if row['backend'] == 's3' else row)
+                raise UploadError('File SHA-256 does not match; the upload was discarded', 422)
+
+        ph = placeholder(cursor)
+        cursor.execute(f'''
+            UPDATE upload_sessions SET status = 'complete', updated_at = {ph}
+            WHERE id = {ph} AND status = 'uploading'
+        ''', (datetime.now(), row['id']))
+        return get(cursor, row['id'], row['user_id'])
+
+    def claim(self, cursor, upload_id, user_id, purpose):
+        """Take a completed session for use by a form; returns its row, or None"""
+        ph = placeholder(cursor)
+        cursor.execute(f'''
+            UPDATE upload_sessions SET status = 'consumed', updated_at = {ph}
+            WHERE id = {ph} AND user_id = {ph} AND purpose = {ph} AND status = 'complete'
+        ''', (datetime.now(), upload_id, user_id, purpose))
+        if cursor.rowcount != 1:
+            return None
+        return get(cursor, upload_id, user_id)
+
+    def unclaim(self, cursor, row):
+        """Return a claimed session to 'complete' when the form that took it failed"""
+        ph = placeholder(cursor)
+        cursor.execute(f'''
+            UPDATE upload_sessions SET status = 'complete', updated_at = {ph}
+            WHERE id = {ph} AND status = 'consumed'
+        ''', (datetime.now(), row['id']))
+
+    def open_upload(self, row):
+        """Readable stream over an assembled upload"""
+        if row['backend'] == 's3':
+            return self.s3_client.get_object(Bucket=row['bucket'], Key=row['storage_key'])['Body']
+        return open(self.local_path(row), 'rb')
+
+    def move_to(self, row, path):
+        """Move an assembled upload to a local path (downloading it from S3)"""
+        if row['backend'] != 's3':
+            shutil.move(self.local_path(row), path)
+            return
+        source = self.open_upload(row)
+        try:
+            with open(path, 'wb') as out:
+                shutil.copyfileobj(source, out, BLOCK_SIZE)
+        finally:
+            source.close()
+        self.discard(row)
+
+    def discard(self, row):
+        """Remove the assembled data of a consumed session"""
+        try:
+            if row['backend'] == 's3':
+                self.s3_client.delete_object(Bucket=row['bucket'], Key=row['storage_key'])
+            else:
+                os.remove(self.local_path(row))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Error discarding upload {row['id']}: {e}")
+
+    def abort(self, cursor, row):
+        """Cancel a session and drop whatever was received"""
+        try:
+            if row['backend'] == 's3' and row['status'] == 'uploading':
+                self.s3_client.abort_multipart_upload(Bucket=row['bucket'], Key=row['storage_key'],
+                                                      UploadId=row['s3_upload_id'])
+            else:
+                self.discard(row)
+        except Exception as e:
+            print(f"Error aborting upload {row['id']}: {e}")
+        ph = placeholder(cursor)
+        cursor.execute(f"UPDATE upload_sessions SET status = 'aborted', updated_at = {ph} WHERE id = {ph}",
+                       (datetime.now(), row['id']))
+
+    def expire(self, cursor, ttl_hours=SESSION_TTL_HOURS):
+        """Abort sessions left unfinished, unclaimed or claimed; returns how many.
+
+        A claimed ('consumed') session has normally had its data removed
+        already, but not when discard() or move_to() failed; aborting it
+        removes whatever is left (a missing file is fine) and retires the row.
+        """
+        ph = placeholder(cursor)
+        cursor.execute(f'''
+            SELECT * FROM upload_sessions
+            WHERE status IN ('uploading', 'complete', 'consumed') AND updated_at < {ph}
+        ''', (datetime.now() - timedelta(hours=ttl_hours),))
+        rows = cursor.fetchall()
+        for row in rows:
+            self.abort(cursor, row)
+        return len(rows)
+
+
+def get(cursor, upload_id, user_id):
+    """A user's session row, or None"""
+    ph = placeholder(cursor)
+    cursor.execute(f'SELECT * FROM upload_sessions WHERE id = {ph} AND user_id = {ph}', (upload_id, user_id))
+    return cursor.fetchone()
+
+
+def completed(cursor, upload_id, user_id, purpose):
+    """A user's completed, unclaimed session for a purpose, or None"""
+    row = get(cursor, upload_id, user_id)
+    if not row or row['purpose'] != purpose or row['status'] != 'complete':
+        return None
+    return row
+
+
+def describe(row):
+    """JSON-safe summary of a session for the API"""
+    return {
+        'upload_id': row['id'],
+        'purpose': row['purpose'],
+        'filename': row['filename'],
+        'size': row['size_bytes'],
+        'offset': row['received_bytes'],
+        'chunk_size': row['chunk_size'],
+        'status': row['status'],
+    }
+
+
+def _take_lease(cursor, row, offset):
+    ph = placeholder(cursor)
+    now = datetime.now()
+    cursor.execute(f'''
+        UPDATE upload_sessions SET lease_until = {ph}
+        WHERE id = {ph} AND received_bytes = {ph} AND status = 'uploading'
+          AND (lease_until IS NULL OR lease_until < {ph})
+    ''', (now + timedelta(seconds=LEASE_SECONDS), row['id'], offset, now))
+    if cursor.rowcount != 1:
+        raise UploadError('Another chunk of this upload is being written', 409, row['received_bytes'])
+
+
+def _release_lease(cursor, row):
+    cursor.execute(f'UPDATE upload_sessions SET lease_until = NULL WHERE id = {placeholder(cursor)}', (row['id'],))
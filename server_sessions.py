@@ -0,0 +1,472 @@
+"""
+Server-side sessions behind a compact signed cookie.
+
+Flask's default session serialises the whole session (the user dict, the
+guest project id, pending flash messages) into the cookie, so every request,
+static files included, carries it. With ServerSessionInterface the cookie
+holds only a random session id signed with SECRET_KEY (about 70 bytes) and
+the data lives in a store:
+
+- SQLSessionStore: the server_sessions table of the app database, created
+  on first use if init_database() has not run
+- FileSessionStore: one JSON file per session under SESSION_FILE_DIR
+  (single-host deployments)
+
+Sessions are loaded lazily. open_session() only checks the cookie's
+signature; the store is read the first time a handler touches the session,
+so requests that never do (static files, health checks) cost nothing.
+Reads go through a per-worker LRU cache that trusts an entry for
+SESSION_CACHE_SECONDS, which bounds how long another worker can keep using
+a session after it was changed or revoked. Nothing is written unless the
+session was modified, or less than half of its lifetime is left.
+
+Because the data is on the server, sessions can be revoked: logout deletes
+the row, revoke_user() ends every session of a user (used when an account is
+deactivated), and a new session id is issued whenever the logged-in user
+changes, so an id obtained before login is useless afterwards. Store keys
+are SHA-256 hashes of the ids, so the table alone does not yield cookies.
+"""
+
+import hashlib
+import json
+import os
+import secrets
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer
+
+from database import is_sqlite, placeholder
+
+# Sessions kept in each worker's read cache (least recently used are dropped)
+DEFAULT_CACHE_ENTRIES = 10000
+
+# How long a cached session is used before the store is read again
+DEFAULT_CACHE_SECONDS = 30
+
+# Server-side lifetime of a session since it was last saved
+DEFAULT_LIFETIME = timedelta(hours=24)
+
+# Expired sessions are purged at most this often per worker
+PURGE_INTERVAL_SECONDS = 3600
+
+# Random bytes in a session id
+SID_BYTES = 32
+
+
+def ensure_schema(cursor):
+    """Create the server_sessions table for the connected database if it is missing"""
+    if is_sqlite(cursor):
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS server_sessions (
+                id TEXT PRIMARY KEY,
+                user_id INTEGER,
+                data TEXT NOT NULL,
+                expires_at TIMESTAMP NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_server_sessions_user ON server_sessions (user_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_server_sessions_expires ON server_sessions (expires_at)')
+        return
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS server_sessions (
+            id CHAR(64) PRIMARY KEY,
+            user_id INT NULL,
+            data MEDIUMTEXT NOT NULL,
+            expires_at DATETIME NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            INDEX idx_user (user_id),
+            INDEX idx_expires (expires_at)
+        )
+    ''')
+
+
+def _key(sid):
+    return hashlib.sha256(sid.encode()).hexdigest()
+
+
+def _as_datetime(value):
+    # SQLite hands timestamps back as text
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _user_id(data):
+    user = data.get('user')
+    return user.get('id') if isinstance(user, dict) else None
+
+
+class SQLSessionStore:
+    """Sessions in the server_sessions table"""
+
+    def __init__(self, get_db_connection):
+        self.get_db_connection = get_db_connection
+
+    def _run(self, work):
+        """Run work(cursor, ph) and commit; creates server_sessions if it is missing"""
+        conn = self.get_db_connection()
+        try:
+            cursor = conn.cursor()
+            try:
+                result = work(cursor, placeholder(cursor))
+            except Exception as e:
+                # init_database() only runs from app.py's __main__, so under gunicorn the
+                # table may not exist yet ("no such table" / "doesn't exist")
+                if 'server_sessions' not in str(e):
+                    raise
+                conn.rollback()
+                ensure_schema(cursor)
+                result = work(cursor, placeholder(cursor))
+            conn.commit()
+            return result
+        finally:
+            conn.close()
+
+    def load(self, key):
+        """(serialised data, expires_at) of a live session, or None"""
+        def work(cursor, ph):
+            cursor.execute(f'SELECT data, expires_at FROM server_sessions WHERE id = {ph} AND expires_at > {ph}',
+                           (key, datetime.now()))
+            row = cursor.fetchone()
+            return (row['data'], _as_datetime(row['expires_at'])) if row else None
+        return self._run(work)
+
+    def save(self, key, user_id, data, expires_at):
+        def work(cursor, ph):
+            if is_sqlite(cursor):
+                cursor.execute(f'''
+                    INSERT INTO server_sessions (id, user_id, data, expires_at, updated_at)
+                    VALUES ({ph}, {ph}, {ph}, {ph}, {ph})
+                    ON CONFLICT (id) DO UPDATE SET user_id = excluded.user_id, data = excluded.data,
+                        expires_at = excluded.expires_at, updated_at = excluded.updated_at
+                ''', (key, user_id, data, expires_at, datetime.now()))
+            else:
+                cursor.execute(f'''
+                    INSERT INTO server_sessions (id, user_id, data, expires_at)
+                    VALUES ({ph}, {ph}, {ph}, {ph})
+                    ON DUPLICATE KEY UPDATE user_id = VALUES(user_id), data = VALUES(data),
+                        expires_at = VALUES(expires_at)
+                ''', (key, user_id, data, expires_at))
+        self._run(work)
+
+    def delete(self, key):
+        self._run(lambda cursor, ph: cursor.execute(f'DELETE FROM server_sessions WHERE id = {ph}', (key,)))
+
+    def delete_user(self, user_id):
+        """Delete every session of a user; returns their keys"""
+        def work(cursor, ph):
+            cursor.execute(f'SELECT id FROM server_sessions WHERE user_id = {ph}', (user_id,))
+            keys = [row['id'] for row in cursor.fetchall()]
+            cursor.execute(f'DELETE FROM server_sessions WHERE user_id = {ph}', (user_id,))
+            return keys
+        return self._run(work)
+
+    def purge(self):
+        """Delete expired sessions; returns how many"""
+        def work(cursor, ph):
+            cursor.execute(f'DELETE FROM server_sessions WHERE expires_at <= {ph}', (datetime.now(),))
+            return cursor.rowcount
+        return self._run(work)
+
+
+class FileSessionStore:
+    """Sessions as JSON files, sharded by the first two characters of the key"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f'{key}.json')
+
+    def _read(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _files(self):
+        for directory, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith('.json'):
+                    yield os.path.join(directory, name)
+
+    def load(self, key):
+        record = self._read(self._path(key))
+        if not record or record['expires_at'] <= time.time():
+            return None
+        return record['data'], datetime.fromtimestamp(record['expires_at'])
+
+    def save(self, key, user_id, data, expires_at):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'user_id': user_id, 'data': data, 'expires_at': expires_at.timestamp()}, f)
+        os.replace(temp_path, path)
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def delete_user(self, user_id):
+        keys = []
+        for path in self._files():
+            record = self._read(path)
+            if record and record.get('user_id') == user_id:
+                os.remove(path)
+                keys.append(os.path.basename(path)[:-len('.json')])
+        return keys
+
+    def purge(self):
+        removed = 0
+        now = time.time()
+        for path in self._files():
+            record = self._read(path)
+            if record is None or record['expires_at'] <= now:
+                try:
+                    os.remove(path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+
+class ServerSession(SessionMixin):
+    """Session whose data is read from the store on first use"""
+
+    def __init__(self, interface, sid=None):
+        self.interface = interface
+        self.sid = sid
+        self.new = sid is None
+        self.modified = False
+        self.accessed = False
+        self.expires_at = None
+        self.loaded_user_id = None
+        self._data = None
+
+    @property
+    def loaded(self):
+        return self._data is not None
+
+    @property
+    def data(self):
+        if self._data is None:
+            self.accessed = True
+            found = self.interface.load(self.sid) if self.sid else None
+            if found is None:
+                # Unknown, expired or revoked: start over with a new id when saved
+                self.sid = None
+                self._data = {}
+            else:
+                self._data, self.expires_at = found
+            self.loaded_user_id = _user_id(self._data)
+        return self._data
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+        self.modified = True
+
+    def __delitem__(self, key):
+        del self.data[key]
+        self.modified = True
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def clear(self):
+        # Logging out needs no read of the old data
+        self._data = {}
+        self.accessed = True
+        self.modified = True
+
+
+class ServerSessionInterface(SessionInterface):
+    """Keep session data in a store and only a signed session id in the cookie"""
+
+    serializer = TaggedJSONSerializer()
+    salt = 'server-session'
+
+    def __init__(self, store, lifetime=DEFAULT_LIFETIME, cache_entries=DEFAULT_CACHE_ENTRIES,
+                 cache_seconds=DEFAULT_CACHE_SECONDS):
+        self.store = store
+        self.lifetime = lifetime
+        self.cache_entries = cache_entries
+        self.cache_seconds = cache_seconds
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._next_purge = 0
+        self._counters = {'cache_hits': 0, 'store_reads': 0, 'saves': 0, 'deletes': 0, 'revoked': 0,
+                          'rotated': 0, 'errors': 0}
+
+    @classmethod
+    def from_config(cls, config, get_db_connection):
+        if config.get('SESSION_BACKEND', 'sql') == 'file':
+            store = FileSessionStore(config['SESSION_FILE_DIR'])
+        else:
+            store = SQLSessionStore(get_db_connection)
+        return cls(store,
+                   lifetime=config.get('PERMANENT_SESSION_LIFETIME', DEFAULT_LIFETIME),
+                   cache_entries=config.get('SESSION_CACHE_ENTRIES', DEFAULT_CACHE_ENTRIES),
+                   cache_seconds=config.get('SESSION_CACHE_SECONDS', DEFAULT_CACHE_SECONDS))
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt=self.salt, key_derivation='hmac')
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def open_session(self, app, request):
+        if not app.secret_key:
+            return None
+        sid = None
+        value = request.cookies.get(self.get_cookie_name(app))
+        if value:
+            try:
+                sid = self._signer(app).unsign(value).decode()
+            except BadSignature:
+                # Includes cookies from before server-side sessions
+                sid = None
+        return ServerSession(self, sid)
+
+    def load(self, sid):
+        """(data dict, expires_at) of a session, or None"""
+        key = _key(sid)
+        now = time.time()
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry and entry[2] > now:
+                self._cache.move_to_end(key)
+                self._counters['cache_hits'] += 1
+                found = entry[:2]
+            else:
+                found = None
+        if found is None:
+            try:
+                found = self.store.load(key)
+            except Exception as e:
+                print(f"Error loading session: {e}")
+                self._count('errors')
+                return None
+            self._count('store_reads')
+            if found is None:
+                return None
+            self._remember(key, *found)
+        # Each request gets its own copy to mutate
+        return self.serializer.loads(found[0]), found[1]
+
+    def _remember(self, key, data, expires_at):
+        with self._lock:
+            self._cache[key] = (data, expires_at, time.time() + self.cache_seconds)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+
+    def _forget(self, keys):
+        with self._lock:
+            for key in keys:
+                self._cache.pop(key, None)
+
+    def save_session(self, app, session, response):
+        # Never read or written: the cookie, if any, stays as it is
+        if not session.loaded:
+            return
+        response.vary.add('Cookie')
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session.data:
+            if session.modified:
+                if session.sid:
+                    self.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path, secure=self.get_cookie_secure(app),
+                                       samesite=self.get_cookie_samesite(app),
+                                       httponly=self.get_cookie_httponly(app))
+            return
+
+        user_id = _user_id(session.data)
+        if session.sid and user_id != session.loaded_user_id:
+            # Logged in, out or as someone else: the old id stops working
+            self.delete(session.sid)
+            session.sid = None
+            self._count('rotated')
+
+        now = datetime.now()
+        refresh = session.expires_at is None or session.expires_at - now < self.lifetime / 2
+        if session.sid and not session.modified and not refresh:
+            return
+
+        new_sid = session.sid is None
+        if new_sid:
+            session.sid = secrets.token_urlsafe(SID_BYTES)
+        key = _key(session.sid)
+        data = self.serializer.dumps(dict(session.data))
+        expires_at = now + self.lifetime
+        try:
+            self.store.save(key, user_id, data, expires_at)
+        except Exception as e:
+            print(f"Error saving session: {e}")
+            self._count('errors')
+            return
+        self._remember(key, data, expires_at)
+        self._count('saves')
+        self._maybe_purge()
+
+        if new_sid or self.should_set_cookie(app, session):
+            response.set_cookie(name, self._signer(app).sign(session.sid).decode(),
+                                expires=self.get_expiration_time(app, session), httponly=self.get_cookie_httponly(app),
+                                domain=domain, path=path, secure=self.get_cookie_secure(app),
+                                samesite=self.get_cookie_samesite(app))
+
+    def delete(self, sid):
+        key = _key(sid)
+        self._forget([key])
+        try:
+            self.store.delete(key)
+            self._count('deletes')
+        except Exception as e:
+            print(f"Error deleting session: {e}")
+            self._count('errors')
+
+    def revoke_user(self, user_id):
+        """End every session of a user; returns how many were removed.
+
+        Other workers drop their cached copies within SESSION_CACHE_SECONDS.
+        """
+        keys = self.store.delete_user(user_id)
+        self._forget(keys)
+        self._count('revoked', len(keys))
+        return len(keys)
+
+    def _maybe_purge(self):
+        with self._lock:
+            if time.time() < self._next_purge:
+                return
+            self._next_purge = time.time() + PURGE_INTERVAL_SECONDS
+        try:
+            self.store.purge()
+        except Exception as e:
+            print(f"Error purging expired sessions: {e}")
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters,
+                        backend=type(self.store).__name__,
+                        cached=len(self._cache),
+                        cache_seconds=self.cache_seconds)
@@ -60,7 +60,7 @@ def test_database_tables():
         import sys
         import os
         sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-        from app import get_db_connection
+        from database import get_db_connection
         
         conn = get_db_connection()
         cursor = conn.cursor()
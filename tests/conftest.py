@@ -0,0 +1,30 @@
+"""
+Shared fixtures for the unit tests.
+
+The modules under test take a DB-API cursor and pick their SQL dialect from
+it (database.is_sqlite), so the tests run them against an in-memory SQLite
+database: no MySQL server, AWS account or running app is needed.
+
+Run from the repository root with: python -m pytest -q
+"""
+
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def conn():
+    connection = sqlite3.connect(':memory:')
+    connection.row_factory = sqlite3.Row
+    yield connection
+    connection.close()
+
+
+@pytest.fixture
+def cursor(conn):
+    return conn.cursor()
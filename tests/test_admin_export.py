@@ -0,0 +1,69 @@
+import csv
+import io
+import json
+import sqlite3
+
+import pytest
+
+import admin_export
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('=HYPERLINK("http://x")', '\'=HYPERLINK("http://x")'),
+    ('+1 555 0100', "'+1 555 0100"),
+    ('-2+3', "'-2+3"),
+    ('@SUM(A1)', "'@SUM(A1)"),
+    ('\tcmd', "'\tcmd"),
+    ('\rcmd', "'\rcmd"),
+    ('Plain name', 'Plain name'),
+    ('a=b', 'a=b'),
+    ('', ''),
+    (-5, -5),
+    (None, None),
+])
+def test_csv_value_escapes_formula_prefixes(value, expected):
+    assert admin_export._csv_value(value) == expected
+
+
+@pytest.fixture
+def get_db_connection(tmp_path):
+    """Connections to a file database with two users, one with a formula-like name"""
+    path = str(tmp_path / 'export.db')
+
+    def connect():
+        connection = sqlite3.connect(path)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    conn = connect()
+    conn.executescript('''
+        CREATE TABLE users (id INTEGER PRIMARY KEY, email TEXT, first_name TEXT, last_name TEXT,
+                            role TEXT, created_at TEXT);
+        CREATE TABLE admin_users (user_id INTEGER, admin_level TEXT, is_active BOOLEAN);
+        CREATE TABLE homeowners (id INTEGER PRIMARY KEY, user_id INTEGER, location TEXT);
+        CREATE TABLE contractors (id INTEGER PRIMARY KEY, user_id INTEGER, location TEXT, company TEXT);
+        INSERT INTO users VALUES (1, 'a@example.com', '=cmd|calc', 'Smith', 'homeowner', '2026-01-01');
+        INSERT INTO users VALUES (2, 'b@example.com', 'Bo', 'Jones', 'contractor', '2026-01-02');
+        INSERT INTO homeowners VALUES (1, 1, 'Austin, TX');
+        INSERT INTO contractors VALUES (1, 2, 'Denver, CO', '@Acme');
+    ''')
+    conn.commit()
+    conn.close()
+    return connect
+
+
+def test_csv_export_escapes_cells(get_db_connection):
+    body = b''.join(admin_export.stream(get_db_connection, 'users', 'csv', {})).decode('utf-8')
+    rows = list(csv.DictReader(io.StringIO(body)))
+    assert [row['id'] for row in rows] == ['1', '2']
+    assert rows[0]['first_name'] == "'=cmd|calc"
+    assert rows[0]['location'] == 'Austin, TX'
+    assert rows[1]['company'] == "'@Acme"
+
+
+def test_ndjson_export_keeps_values_as_stored(get_db_connection):
+    body = b''.join(admin_export.stream(get_db_connection, 'users', 'ndjson', {'role': 'homeowner'}))
+    rows = [json.loads(line) for line in body.decode('utf-8').splitlines()]
+    assert len(rows) == 1
+    assert rows[0]['first_name'] == '=cmd|calc'
+    assert admin_export.recent_exports()[0]['rows'] == 1
@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+
+from admission_control import AdmissionController, Overloaded
+
+
+@pytest.fixture
+def controller():
+    return AdmissionController('test', max_running=1, max_queued=3, max_per_user=3)
+
+
+def test_jobs_start_at_once_until_the_slots_are_taken(controller):
+    first = controller.admit('alice')
+    assert first.granted and first.position() == 0
+    second = controller.admit('bob')
+    assert not second.granted and second.position() == 1
+    first.release()
+    assert second.granted
+
+
+def test_waiting_jobs_start_round_robin_across_users(controller):
+    running = controller.admit('alice')
+    a2 = controller.admit('alice')
+    a3 = controller.admit('alice')
+    b1 = controller.admit('bob')
+    assert [a2.position(), b1.position(), a3.position()] == [1, 2, 3]
+
+    started = []
+    for ticket in (running, a2, b1):
+        ticket.release()
+        started.append(next(t for t in (a2, a3, b1) if t.granted and t not in started))
+    # bob's job runs before alice's second waiting one, although it arrived later
+    assert started == [a2, b1, a3]
+
+
+def test_per_user_limit_counts_running_and_waiting_jobs(controller):
+    tickets = [controller.admit('alice') for _ in range(3)]
+    with pytest.raises(Overloaded) as raised:
+        controller.admit('alice')
+    assert raised.value.reason == 'user_limit'
+    assert raised.value.queue_position == 1
+    assert raised.value.retry_after >= 1
+    # Other users are not held back by alice's limit, nor queued behind both her waiting jobs
+    assert controller.admit('bob').position() == 2
+    tickets[0].release()
+    controller.admit('alice')
+
+
+def test_full_queue_and_no_wait_requests_are_refused(controller):
+    controller.admit('alice')
+    for user in ('bob', 'carol', 'dave'):
+        controller.admit(user)
+    with pytest.raises(Overloaded) as raised:
+        controller.admit('erin')
+    assert raised.value.reason == 'queue_full'
+    assert raised.value.queue_depth == 3
+    assert raised.value.to_dict()['success'] is False
+
+    with pytest.raises(Overloaded) as raised:
+        controller.admit('frank', queue=False)
+    assert raised.value.reason == 'busy'
+    assert raised.value.queue_position == 4
+    assert controller.stats()['counters']['rejected'] == {
+        'queue_full': 1, 'user_limit': 0, 'wait_timeout': 0, 'busy': 1}
+
+
+def test_giving_up_leaves_the_queue(controller):
+    running = controller.admit('alice')
+    waiting = controller.admit('bob')
+    behind = controller.admit('carol')
+    with pytest.raises(Overloaded) as raised:
+        waiting.wait(timeout=0.01)
+    assert raised.value.reason == 'wait_timeout'
+    assert behind.position() == 1
+    # Releasing a ticket that gave up is a no-op
+    waiting.release()
+    running.release()
+    assert behind.granted
+    stats = controller.stats()
+    assert (stats['running'], stats['queue_depth']) == (1, 0)
+    assert stats['counters']['completed'] == 1
+
+
+def test_released_waiting_ticket_frees_its_place(controller):
+    running = controller.admit('alice')
+    waiting = controller.admit('bob')
+    with waiting:
+        pass
+    assert controller.stats()['queue_depth'] == 0
+    assert controller.stats()['counters']['gave_up'] == 1
+    running.release()
+    assert controller.stats()['running'] == 0
+
+
+def test_wait_async_resumes_when_granted(controller):
+    running = controller.admit('alice')
+    waiting = controller.admit('bob')
+
+    async def scenario():
+        task = asyncio.ensure_future(waiting.wait_async())
+        await asyncio.sleep(0)
+        assert not task.done()
+        running.release()
+        return await asyncio.wait_for(task, 1)
+
+    assert asyncio.run(scenario()) is waiting
+    assert waiting.granted
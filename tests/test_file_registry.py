@@ -0,0 +1,57 @@
+import os
+
+import pytest
+
+import file_registry
+
+
+@pytest.fixture
+def app_root(tmp_path, monkeypatch):
+    """An app directory with served files, a private file and a symlink out of uploads/"""
+    for directory in ('uploads', os.path.join('static', 'uploads', 'projects'), 'private'):
+        os.makedirs(tmp_path / directory)
+    (tmp_path / 'uploads' / 'audio.mp3').write_bytes(b'audio')
+    (tmp_path / 'static' / 'uploads' / 'projects' / 'kitchen.jpg').write_bytes(b'image')
+    (tmp_path / 'static' / 'logo.png').write_bytes(b'logo')
+    (tmp_path / 'private' / 'secret.txt').write_bytes(b'secret')
+    (tmp_path / 'homepro.db').write_bytes(b'db')
+    os.symlink(tmp_path / 'private' / 'secret.txt', tmp_path / 'uploads' / 'link.txt')
+    monkeypatch.setattr(file_registry, 'APP_ROOT', str(tmp_path))
+    return tmp_path
+
+
+def test_served_file_finds_files_in_the_served_directories(app_root):
+    assert file_registry.served_file('audio.mp3') == str(app_root / 'uploads' / 'audio.mp3')
+    assert file_registry.served_file('projects/kitchen.jpg') == \
+        str(app_root / 'static' / 'uploads' / 'projects' / 'kitchen.jpg')
+    assert file_registry.served_file('logo.png') == str(app_root / 'static' / 'logo.png')
+    assert file_registry.served_file('missing.mp3') is None
+
+
+@pytest.mark.parametrize('name', [
+    '../private/secret.txt',
+    '../homepro.db',
+    'projects/../../../homepro.db',
+    '/etc/passwd',
+    'link.txt',
+])
+def test_served_file_never_leaves_the_served_directories(app_root, name):
+    assert file_registry.served_file(name) is None
+
+
+def test_is_served_resolves_symlinks(app_root):
+    assert file_registry.is_served(app_root / 'uploads' / 'audio.mp3')
+    assert not file_registry.is_served(app_root / 'uploads' / 'link.txt')
+    assert not file_registry.is_served(app_root / 'private' / 'secret.txt')
+    # A sibling directory whose name starts with a served root's name
+    os.makedirs(app_root / 'uploads_old')
+    (app_root / 'uploads_old' / 'a.mp3').write_bytes(b'a')
+    assert not file_registry.is_served(app_root / 'uploads_old' / 'a.mp3')
+
+
+def test_url_path_and_storage_path(app_root):
+    image = app_root / 'static' / 'uploads' / 'projects' / 'kitchen.jpg'
+    assert file_registry.storage_path(image) == 'static/uploads/projects/kitchen.jpg'
+    assert file_registry.url_path(image) == 'uploads/projects/kitchen.jpg'
+    assert file_registry.url_path(app_root / 'uploads' / 'audio.mp3') == 'audio.mp3'
+    assert file_registry.url_path(app_root / 'private' / 'secret.txt') is None
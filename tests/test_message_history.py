@@ -0,0 +1,85 @@
+import pytest
+
+import message_history
+
+
+@pytest.fixture
+def thread(cursor):
+    """Bid 7: ten messages alternating between users 1 and 2, all unread"""
+    cursor.execute('CREATE TABLE users (id INTEGER PRIMARY KEY, first_name TEXT, last_name TEXT, role TEXT)')
+    cursor.execute('''
+        CREATE TABLE bid_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            bid_id INTEGER NOT NULL,
+            sender_id INTEGER NOT NULL,
+            receiver_id INTEGER NOT NULL,
+            message TEXT,
+            is_read BOOLEAN DEFAULT FALSE
+        )
+    ''')
+    cursor.executemany('INSERT INTO users VALUES (?, ?, ?, ?)',
+                       [(1, 'Hana', 'Owner', 'homeowner'), (2, 'Cal', 'Builder', 'contractor')])
+    for n in range(10):
+        sender = 1 if n % 2 == 0 else 2
+        cursor.execute('INSERT INTO bid_messages (bid_id, sender_id, receiver_id, message) VALUES (7, ?, ?, ?)',
+                       (sender, 3 - sender, f'message {n}'))
+    cursor.execute("INSERT INTO bid_messages (bid_id, sender_id, receiver_id, message) VALUES (8, 1, 2, 'other')")
+    return cursor
+
+
+def ids(page):
+    return [m['id'] for m in page['messages']]
+
+
+def test_parse_cursor_bounds_limit_and_ignores_bad_values():
+    assert message_history.parse_cursor({}) == (None, None, message_history.DEFAULT_PAGE_SIZE)
+    assert message_history.parse_cursor({'since_id': '5', 'limit': '100000'}) == (5, None, message_history.MAX_PAGE_SIZE)
+    assert message_history.parse_cursor({'before_id': 'x', 'since_id': '-3', 'limit': '0'}) == \
+        (None, None, message_history.DEFAULT_PAGE_SIZE)
+
+
+def test_latest_page_is_newest_messages_in_ascending_order(thread):
+    page = message_history.fetch_page(thread, 'bid_messages', 7, 2, limit=4)
+    assert ids(page) == [7, 8, 9, 10]
+    assert page['has_more'] is True
+    assert (page['oldest_id'], page['newest_id']) == (7, 10)
+    assert page['senders'][1] == {'first_name': 'Hana', 'last_name': 'Owner', 'role': 'homeowner'}
+    assert set(page['senders']) == {1, 2}
+
+
+def test_before_id_pages_back_to_the_start(thread):
+    page = message_history.fetch_page(thread, 'bid_messages', 7, 2, before_id=7, limit=4)
+    assert ids(page) == [3, 4, 5, 6]
+    assert page['has_more'] is True
+    page = message_history.fetch_page(thread, 'bid_messages', 7, 2, before_id=3, limit=4)
+    assert ids(page) == [1, 2]
+    assert page['has_more'] is False
+
+
+def test_since_id_returns_oldest_newer_messages_first(thread):
+    page = message_history.fetch_page(thread, 'bid_messages', 7, 2, since_id=2, limit=3)
+    assert ids(page) == [3, 4, 5]
+    assert page['has_more'] is True
+    page = message_history.fetch_page(thread, 'bid_messages', 7, 2, since_id=10, limit=3)
+    assert page['messages'] == [] and page['newest_id'] == 10 and page['has_more'] is False
+
+
+def test_latest_page_marks_callers_messages_read_up_to_newest(thread):
+    page = message_history.fetch_page(thread, 'bid_messages', 7, 2, limit=4)
+    # User 2 receives the even-numbered messages (ids 1, 3, ..., 9): all five are marked
+    assert page['marked_read'] == 5
+    assert all(m['is_read'] for m in page['messages'] if m['receiver_id'] == 2)
+    thread.execute('SELECT COUNT(*) FROM bid_messages WHERE receiver_id = 1 AND is_read')
+    assert thread.fetchone()[0] == 0
+    thread.execute('SELECT COUNT(*) FROM bid_messages WHERE bid_id = 8 AND is_read')
+    assert thread.fetchone()[0] == 0
+
+    again = message_history.fetch_page(thread, 'bid_messages', 7, 2, limit=4)
+    assert again['marked_read'] == 0
+
+
+def test_older_pages_do_not_mark_read(thread):
+    page = message_history.fetch_page(thread, 'bid_messages', 7, 2, before_id=5, limit=4)
+    assert page['marked_read'] == 0
+    thread.execute('SELECT COUNT(*) FROM bid_messages WHERE is_read')
+    assert thread.fetchone()[0] == 0
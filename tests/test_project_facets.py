@@ -0,0 +1,81 @@
+import pytest
+
+import project_facets
+
+
+@pytest.mark.parametrize('budget_min, budget_max, expected', [
+    (1000, 4000, ['0-5000']),
+    (3000, None, ['0-5000']),
+    (6000, 12000, ['5000-15000']),
+    (10000, 60000, ['5000-15000', '15000-50000', '50000+']),
+    (60000, None, ['50000+']),
+    (None, None, []),
+])
+def test_budget_buckets(budget_min, budget_max, expected):
+    assert project_facets.budget_buckets(budget_min, budget_max) == expected
+
+
+@pytest.fixture
+def projects(cursor):
+    cursor.execute('CREATE TABLE homeowners (id INTEGER PRIMARY KEY, location TEXT)')
+    cursor.execute('''
+        CREATE TABLE projects (
+            id INTEGER PRIMARY KEY, homeowner_id INTEGER, status TEXT, project_type TEXT,
+            budget_min REAL, budget_max REAL, location TEXT
+        )
+    ''')
+    project_facets.ensure_schema(cursor)
+    cursor.executemany('INSERT INTO homeowners VALUES (?, ?)', [(1, 'Austin, TX'), (2, 'Denver, Colorado')])
+    cursor.executemany('INSERT INTO projects VALUES (?, ?, ?, ?, ?, ?, ?)', [
+        (1, 1, 'Active', 'Plumbing', 1000, 4000, None),
+        (2, 1, 'Active', 'Plumbing', 6000, 12000, 'Dallas, TX'),
+        (3, 2, 'Active', 'Roofing', 10000, 60000, None),
+        (4, 2, 'Active', 'Plumbing', 2000, 3000, 'nowhere in particular'),
+        (5, 1, 'Completed', 'Roofing', 1000, 2000, None),
+    ])
+    assert project_facets.rebuild(cursor) == 4
+    return cursor
+
+
+def test_get_facets_without_selection(projects):
+    facets = project_facets.get_facets(projects)
+    assert facets['total'] == 4
+    assert facets['types'] == {'Plumbing': 3, 'Roofing': 1}
+    # Project 4's location has no state; it falls back to its homeowner's
+    assert facets['regions'] == {'TX': 2, 'CO': 2}
+    assert facets['budgets'] == {'any': 4, '0-5000': 2, '5000-15000': 2, '15000-50000': 1, '50000+': 1}
+
+
+def test_each_facet_is_counted_under_the_other_selections(projects):
+    facets = project_facets.get_facets(projects, project_type='Plumbing', budget='0-5000')
+    assert facets['total'] == 2
+    # Types ignore the type selection but honour the budget one
+    assert facets['types'] == {'Plumbing': 2}
+    assert facets['regions'] == {'TX': 1, 'CO': 1}
+    # Budgets ignore the budget selection but honour the type one
+    assert facets['budgets'] == {'any': 3, '0-5000': 2, '5000-15000': 1}
+
+    facets = project_facets.get_facets(projects, project_region='CO')
+    assert facets['total'] == 2
+    assert facets['types'] == {'Plumbing': 1, 'Roofing': 1}
+    assert facets['regions'] == {'TX': 2, 'CO': 2}
+
+
+def test_status_change_and_remove_keep_counts_in_step(projects):
+    projects.execute("UPDATE projects SET status = 'Completed' WHERE id = 3")
+    assert project_facets.on_project_changed(projects, 3) is False
+    assert project_facets.get_facets(projects)['types'] == {'Plumbing': 3}
+
+    projects.execute("UPDATE projects SET project_type = 'Electrical', budget_min = 70000, budget_max = NULL "
+                     "WHERE id = 1")
+    assert project_facets.on_project_changed(projects, 1) is True
+    facets = project_facets.get_facets(projects)
+    assert facets['types'] == {'Plumbing': 2, 'Electrical': 1}
+    assert facets['budgets']['50000+'] == 1
+
+    assert project_facets.remove(projects, 2) is True
+    assert project_facets.remove(projects, 2) is False
+    facets = project_facets.get_facets(projects)
+    assert facets['total'] == 2
+    assert facets['regions'] == {'TX': 1, 'CO': 1}
+    assert facets['budgets'] == {'any': 2, '0-5000': 1, '50000+': 1}
@@ -0,0 +1,73 @@
+import pytest
+
+import project_search
+
+
+def test_parse_terms():
+    assert project_search.parse_terms('Water HEATER, water leak!! a to') == ['water', 'heater', 'leak']
+    assert project_search.parse_terms('') == []
+    assert len(project_search.parse_terms(' '.join(f'term{n}' for n in range(20)))) == project_search.MAX_TERMS
+
+
+@pytest.fixture
+def projects(cursor):
+    cursor.execute('''
+        CREATE TABLE projects (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, title TEXT, description TEXT,
+            ai_processed_text TEXT, status TEXT
+        )
+    ''')
+    cursor.execute('CREATE INDEX idx_status ON projects (status)')
+    cursor.executemany('INSERT INTO projects (title, description, ai_processed_text, status) VALUES (?, ?, ?, ?)', [
+        ('Replace water heater', 'Old tank is leaking', None, 'Active'),
+        ('Kitchen remodel', 'New cabinets and a granite countertop', 'heater vent too', 'Active'),
+        ('Water heater flush', 'Yearly service', None, 'Completed'),
+        ('Paint bedroom', 'Two walls', None, 'Active'),
+    ])
+    project_search.ensure_index(cursor)
+    return cursor
+
+
+def search(cursor, text, active_only=False):
+    found = project_search.build_search(cursor, text)
+    where, params = [found['where']], list(found['where_params'])
+    if active_only:
+        # Written as the contractor dashboard writes it
+        where.append("p.status = 'Active'")
+    sql = (f"SELECT p.id, {found['score']} AS relevance FROM projects p {found['join']} "
+           f"WHERE {' AND '.join(where)} ORDER BY relevance DESC")
+    return sql, found['score_params'] + params
+
+
+def test_search_requires_every_term_as_a_prefix(projects):
+    sql, params = search(projects, 'wat heat')
+    projects.execute(sql, params)
+    assert sorted(row['id'] for row in projects.fetchall()) == [1, 3]
+    sql, params = search(projects, 'heater', active_only=True)
+    projects.execute(sql, params)
+    assert [row['id'] for row in projects.fetchall()] == [1, 2]
+    assert project_search.build_search(projects, 'a an') is None
+
+
+def test_index_follows_inserts_updates_and_deletes(projects):
+    projects.execute("UPDATE projects SET description = 'Two walls and a skylight' WHERE id = 4")
+    projects.execute("INSERT INTO projects (title, description, status) VALUES ('Skylight leak', '', 'Active')")
+    projects.execute('DELETE FROM projects WHERE id = 1')
+    sql, params = search(projects, 'skylight')
+    projects.execute(sql, params)
+    assert sorted(row['id'] for row in projects.fetchall()) == [4, 5]
+    sql, params = search(projects, 'tank')
+    projects.execute(sql, params)
+    assert projects.fetchall() == []
+
+
+def test_count_is_driven_by_the_full_text_index(projects):
+    # The dashboard's pagination COUNT; joined the other way round, the MATCH is
+    # re-run for every row the status index yields
+    found = project_search.build_search(projects, 'heater')
+    projects.execute(f"""
+        EXPLAIN QUERY PLAN SELECT COUNT(*) FROM projects p {found['join']}
+        WHERE {found['where']} AND p.status = 'Active'
+    """, found['where_params'])
+    plan = [row[3] for row in projects.fetchall()]
+    assert plan[0].startswith(f'SCAN {project_search.FTS_TABLE}')
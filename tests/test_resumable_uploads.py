@@ -0,0 +1,130 @@
+import hashlib
+import io
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+import resumable_uploads
+from resumable_uploads import UploadError
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+@pytest.fixture
+def store(conn, tmp_path):
+    resumable_uploads.ensure_schema(conn.cursor())
+    return resumable_uploads.UploadStore(directory=str(tmp_path / 'sessions'), chunk_size=4)
+
+
+def upload(conn, store, data, filename='memo.mp3', declared_sha256=None, user_id=1):
+    """Initiate a session and send data in chunk_size chunks; returns the row"""
+    cursor = conn.cursor()
+    row = store.initiate(cursor, user_id, 'audio', filename, len(data), declared_sha256)
+    for offset in range(0, len(data), store.chunk_size):
+        chunk = data[offset:offset + store.chunk_size]
+        store.write_chunk(conn, row, offset, io.BytesIO(chunk), len(chunk), sha256(chunk))
+        row = resumable_uploads.get(cursor, row['id'], user_id)
+    return row
+
+
+def age(conn, hours):
+    conn.execute('UPDATE upload_sessions SET updated_at = ?', (datetime.now() - timedelta(hours=hours),))
+
+
+def test_initiate_validates_the_declaration(conn, store):
+    cursor = conn.cursor()
+    with pytest.raises(UploadError):
+        store.initiate(cursor, 1, 'audio', 'memo.exe', 10)
+    with pytest.raises(UploadError):
+        store.initiate(cursor, 1, 'nonsense', 'memo.mp3', 10)
+    with pytest.raises(UploadError) as raised:
+        store.initiate(cursor, 1, 'project_image', 'kitchen.jpg', 51 * 1024 * 1024)
+    assert raised.value.status == 413
+    with pytest.raises(UploadError):
+        store.initiate(cursor, 1, 'audio', 'memo.mp3', 10, sha256='not-a-digest')
+
+
+def test_chunks_must_arrive_in_order_with_matching_checksums(conn, store):
+    cursor = conn.cursor()
+    row = store.initiate(cursor, 1, 'audio', 'memo.mp3', 6)
+    with pytest.raises(UploadError) as raised:
+        store.write_chunk(conn, row, 4, io.BytesIO(b'ef'), 2, sha256(b'ef'))
+    assert (raised.value.status, raised.value.offset) == (409, 0)
+    with pytest.raises(UploadError):
+        store.write_chunk(conn, row, 0, io.BytesIO(b'abcd'), 4, sha256(b'wxyz'))
+    # The failed chunk was dropped, so the client resumes from offset 0
+    assert os.path.getsize(store.local_path(row)) == 0
+    assert store.write_chunk(conn, row, 0, io.BytesIO(b'abcd'), 4, sha256(b'abcd')) == 4
+    with pytest.raises(UploadError):
+        store.complete(cursor, resumable_uploads.get(cursor, row['id'], 1))
+
+
+def test_complete_checks_the_declared_hash(conn, store):
+    cursor = conn.cursor()
+    row = upload(conn, store, b'abcdefg', declared_sha256=sha256(b'something else'))
+    with pytest.raises(UploadError) as raised:
+        store.complete(cursor, row)
+    assert raised.value.status == 422
+    assert resumable_uploads.get(cursor, row['id'], 1)['status'] == 'aborted'
+    assert not os.path.exists(store.local_path(row))
+
+    row = upload(conn, store, b'abcdefg', declared_sha256=sha256(b'abcdefg'))
+    assert store.complete(cursor, row)['status'] == 'complete'
+
+
+def test_claim_unclaim_lifecycle(conn, store):
+    cursor = conn.cursor()
+    row = store.complete(cursor, upload(conn, store, b'abcdefg'))
+    assert resumable_uploads.completed(cursor, row['id'], 1, 'audio')['id'] == row['id']
+    assert resumable_uploads.completed(cursor, row['id'], 1, 'evidence') is None
+    assert resumable_uploads.completed(cursor, row['id'], 2, 'audio') is None
+
+    assert store.claim(cursor, row['id'], 2, 'audio') is None
+    claimed = store.claim(cursor, row['id'], 1, 'audio')
+    assert claimed['status'] == 'consumed'
+    # A second form cannot take the same upload
+    assert store.claim(cursor, row['id'], 1, 'audio') is None
+    assert resumable_uploads.completed(cursor, row['id'], 1, 'audio') is None
+
+    # A form that fails after claiming hands the upload back
+    store.unclaim(cursor, claimed)
+    assert resumable_uploads.completed(cursor, row['id'], 1, 'audio') is not None
+
+    claimed = store.claim(cursor, row['id'], 1, 'audio')
+    with store.open_upload(claimed) as f:
+        assert f.read() == b'abcdefg'
+    target = os.path.join(os.path.dirname(store.local_path(claimed)), 'memo.mp3')
+    store.move_to(claimed, target)
+    with open(target, 'rb') as f:
+        assert f.read() == b'abcdefg'
+    assert not os.path.exists(store.local_path(claimed))
+
+
+def test_expire_removes_stale_sessions_in_every_live_state(conn, store):
+    cursor = conn.cursor()
+    uploading = store.initiate(cursor, 1, 'audio', 'partial.mp3', 10)
+    complete = store.complete(cursor, upload(conn, store, b'abcd', filename='done.mp3'))
+    # Claimed, but the form's discard() failed and left the data behind
+    consumed = store.claim(cursor, store.complete(cursor, upload(conn, store, b'wxyz', filename='used.mp3'))['id'],
+                           1, 'audio')
+
+    assert store.expire(cursor) == 0
+    age(conn, resumable_uploads.SESSION_TTL_HOURS + 1)
+    assert store.expire(cursor) == 3
+    for row in (uploading, complete, consumed):
+        assert resumable_uploads.get(cursor, row['id'], 1)['status'] == 'aborted'
+        assert not os.path.exists(store.local_path(row))
+    # Aborted sessions are not swept again
+    assert store.expire(cursor) == 0
+
+
+def test_expire_handles_claimed_sessions_whose_data_is_gone(conn, store):
+    cursor = conn.cursor()
+    row = store.claim(cursor, store.complete(cursor, upload(conn, store, b'abcd'))['id'], 1, 'audio')
+    store.discard(row)
+    age(conn, resumable_uploads.SESSION_TTL_HOURS + 1)
+    assert store.expire(cursor) == 1
+    assert resumable_uploads.get(cursor, row['id'], 1)['status'] == 'aborted'
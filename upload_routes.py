@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Resumable Upload Routes
+Chunked upload API for large audio, project image and evidence files
+(see resumable_uploads):
+
+    POST   /api/uploads                JSON {filename, size, purpose, sha256?} -> upload id, chunk size
+    GET    /api/uploads/<id>           current offset, to resume after a failure
+    PUT    /api/uploads/<id>           one chunk as the raw body, with Upload-Offset and
+                                       Upload-Checksum-SHA256 (hex) headers
+    POST   /api/uploads/<id>/complete  verify and finish
+    DELETE /api/uploads/<id>           cancel
+
+The finished upload id is then sent in place of the file: upload_id for
+/process_audio_async, upload_ids for milestone and dispute evidence, and
+project_image_<n>_upload_id for project submissions.
+"""
+
+from flask import request, jsonify, session
+from werkzeug.utils import secure_filename
+
+import resumable_uploads
+
+# login_required and get_db_connection will be passed as parameters from app.py
+
+def register_upload_routes(app, get_db_connection, login_required, upload_store):
+    """Register the resumable upload API"""
+    
+    def error_response(e):
+        response = jsonify({'success': False, 'message': str(e), 'offset': e.offset})
+        response.status_code = e.status
+        if e.offset is not None:
+            response.headers['Upload-Offset'] = str(e.offset)
+        return response
+    
+    def session_response(row, status=200):
+        response = jsonify({'success': True, **resumable_uploads.describe(row)})
+        response.status_code = status
+        response.headers['Upload-Offset'] = str(row['received_bytes'])
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+    
+    @app.route('/api/uploads', methods=['POST'])
+    @login_required
+    def initiate_upload():
+        """Start a resumable upload"""
+        data = request.get_json(silent=True) or {}
+        filename = secure_filename(data.get('filename') or '')
+        try:
+            size = int(data.get('size') or 0)
+        except (TypeError, ValueError):
+            size = 0
+        if not filename:
+            return jsonify({'success': False, 'message': 'filename is required'}), 400
+        
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            row = upload_store.initiate(cursor, session['user']['id'], data.get('purpose'), filename, size,
+                                        data.get('sha256'))
+            conn.commit()
+            return session_response(row, 201)
+        except resumable_uploads.UploadError as e:
+            return error_response(e)
+        except Exception as e:
+            print(f"Error starting upload: {e}")
+            return jsonify({'success': False, 'message': 'Could not start upload'}), 500
+        finally:
+            conn.close()
+    
+    @app.route('/api/uploads/<upload_id>', methods=['GET', 'HEAD'])
+    @login_required
+    def upload_status(upload_id):
+        """Offset to resume an upload from"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            row = resumable_uploads.get(cursor, upload_id, session['user']['id'])
+        finally:
+            conn.close()
+        if not row:
+            return jsonify({'success': False, 'message': 'Upload not found'}), 404
+        return session_response(row)
+    
+    @app.route('/api/uploads/<upload_id>', methods=['PUT', 'PATCH'])
+    @login_required
+    def upload_chunk(upload_id):
+        """Write one chunk at its offset"""
+        offset = request.headers.get('Upload-Offset', type=int)
+        chunk_sha256 = request.headers.get('Upload-Checksum-SHA256', '')
+        if offset is None or request.content_length is None:
+            return jsonify({'success': False, 'message': 'Upload-Offset and Content-Length are required'}), 400
+        
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            row = resumable_uploads.get(cursor, upload_id, session['user']['id'])
+            if not row:
+                return jsonify({'success': False, 'message': 'Upload not found'}), 404
+            new_offset = upload_store.write_chunk(conn, row, offset, request.stream, request.content_length,
+                                                  chunk_sha256)
+            response = jsonify({'success': True, 'offset': new_offset})
+            response.headers['Upload-Offset'] = str(new_offset)
+            return response
+        except resumable_uploads.UploadError as e:
+            return error_response(e)
+        except Exception as e:
+            print(f"Error writing upload chunk {upload_id}@{offset}: {e}")
+            return jsonify({'success': False, 'message': 'Could not store chunk; retry from the current offset'}), 500
+        finally:
+            conn.close()
+    
+    @app.route('/api/uploads/<upload_id>/complete', methods=['POST'])
+    @login_required
+    def complete_upload(upload_id):
+        """Finish an upload once every byte has arrived"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            row = resumable_uploads.get(cursor, upload_id, session['user']['id'])
+            if not row:
+                return jsonify({'success': False, 'message': 'Upload not found'}), 404
+            row = upload_store.complete(cursor, row)
+            conn.commit()
+            return session_response(row)
+        except resumable_uploads.UploadError as e:
+            # A checksum mismatch aborts the session; keep that
+            conn.commit()
+            return error_response(e)
+        except Exception as e:
+            print(f"Error completing upload {upload_id}: {e}")
+            return jsonify({'success': False, 'message': 'Could not complete upload'}), 500
+        finally:
+            conn.close()
+    
+    @app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+    @login_required
+    def cancel_upload(upload_id):
+        """Cancel an upload and drop what was received"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            row = resumable_uploads.get(cursor, upload_id, session['user']['id'])
+            if not row:
+                return jsonify({'success': False, 'message': 'Upload not found'}), 404
+            if row['status'] not in ('uploading', 'complete'):
+                return jsonify({'success': False, 'message': f"Upload is already {row['status']}"}), 409
+            upload_store.abort(cursor, row)
+            conn.commit()
+            return jsonify({'success': True, 'message': 'Upload cancelled'})
+        finally:
+            conn.close()